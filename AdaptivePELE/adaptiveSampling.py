@@ -10,13 +10,15 @@ import shutil
 import signal
 import errno
 import argparse
+import threading
 import numpy as np
 from builtins import range
+from six import reraise as raise_
 from contextlib import contextmanager
 import AdaptivePELE
 from AdaptivePELE.constants import blockNames, constants
 from AdaptivePELE.atomset import atomset
-from AdaptivePELE.utilities import utilities
+from AdaptivePELE.utilities import utilities, profiler
 from AdaptivePELE.utilities.synchronization import ProcessesManager
 from AdaptivePELE.validator import controlFileValidator
 from AdaptivePELE.spawning import spawning, spawningTypes
@@ -453,6 +455,299 @@ def clusterEpochTrajs(clusteringMethod, epoch, epochOutputPathTempletized, topol
     with suppress_stdout():
         clusteringMethod.cluster(paths, topology=topologies, epoch=epoch, outputPathConstants=outputPathConstants)
 
+
+def getFinishedTrajectory(outputDir, trajNum):
+    """
+        Return the trajectory file if the simulation has finished writing it,
+        None otherwise
+
+        :param outputDir: Folder of the epoch
+        :type outputDir: str
+        :param trajNum: Trajectory number
+        :type trajNum: int
+
+        :returns: str -- Trajectory file
+    """
+    try:
+        with open(os.path.join(outputDir, constants.finishedTrajectoryTemplate % trajNum)) as fr:
+            trajectory = fr.read().strip()
+    except IOError:
+        return None
+    if not trajectory:
+        # the mark is still being written
+        return None
+    return os.path.join(outputDir, trajectory)
+
+
+class PipelinedClustering(object):
+    """
+        Cluster the trajectories of an epoch while the simulation is running.
+        A background thread watches the epoch folder and clusters each
+        trajectory once the simulation has marked it as finished and all the
+        trajectories that precede it have been clustered, so that the clusters
+        are the same as with clusterEpochTrajs
+
+        :param clusteringMethod: Clustering object
+        :type clusteringMethod: :py:class:`.Clustering`
+        :param epoch: Number of the epoch to cluster
+        :type epoch: int
+        :param epochOutputPathTempletized: Path where to find the trajectories
+        :type epochOutputPathTempletized: str
+        :param topologies: Topology object containing the set of topologies needed for the simulation
+        :type topologies: :py:class:`.Topology`
+        :param nTrajectories: Number of trajectories of the epoch
+        :type nTrajectories: int
+        :param maxPollTime: Maximum time between two checks of the epoch folder (in seconds)
+        :type maxPollTime: float
+    """
+    def __init__(self, clusteringMethod, epoch, epochOutputPathTempletized, topologies, nTrajectories, maxPollTime=5.0):
+        self.clusteringMethod = clusteringMethod
+        self.epoch = epoch
+        self.epochOutputPathTempletized = epochOutputPathTempletized
+        self.outputDir = epochOutputPathTempletized % epoch
+        self.topologies = topologies
+        self.maxPollTime = maxPollTime
+        # the trajectories are clustered sorted by name (see
+        # getAllTrajectories), e.g. trajectory_10 goes before trajectory_2
+        self.pending = sorted(range(1, nTrajectories+1), key=lambda num: "%d." % num)
+        self.clustered = []
+        self.backgroundTime = 0.0
+        self.error = None
+        # the marks of a previous run would make the watcher cluster
+        # trajectories that are going to be overwritten
+        for mark in glob.glob(os.path.join(self.outputDir, constants.finishedTrajectoryTemplate.replace("%d", "*"))):
+            os.remove(mark)
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.clusteringMethod.startEpoch(epoch)
+        self.thread.start()
+
+    def run(self):
+        """
+            Cluster the finished trajectories until all have been clustered or
+            the simulation ends
+        """
+        pollTime = 0.01
+        try:
+            while self.pending and not self.stop.is_set():
+                trajectory = getFinishedTrajectory(self.outputDir, self.pending[0])
+                if trajectory is None:
+                    self.stop.wait(pollTime)
+                    pollTime = min(2*pollTime, self.maxPollTime)
+                    continue
+                startTime = time.time()
+                self.clusteringMethod.clusterTrajectory(trajectory, topology=self.topologies, profilePhases=False)
+                self.backgroundTime += time.time()-startTime
+                self.clustered.append(trajectory)
+                self.pending.pop(0)
+                pollTime = 0.01
+        except Exception:
+            self.error = sys.exc_info()
+
+    def finish(self):
+        """
+            Stop watching the epoch folder and cluster the trajectories that
+            were not clustered during the simulation
+
+            :returns: float -- Time spent clustering in the background (in seconds)
+        """
+        self.stop.set()
+        self.thread.join()
+        if self.error is not None:
+            raise_(*self.error)
+        paths = ast.literal_eval(generateTrajectorySelectionString(self.epoch, self.epochOutputPathTempletized))
+        trajectories = clustering.getAllTrajectories(paths)
+        if len(trajectories) == 0:
+            sys.exit("No trajectories to cluster! Matching path:%s" % paths[-1])
+        clustered = set(self.clustered)
+        with suppress_stdout():
+            self.clusteringMethod.clusterTrajectories([trajectory for trajectory in trajectories if trajectory not in clustered], topology=self.topologies)
+            self.clusteringMethod.finishEpoch()
+        return self.backgroundTime
+
+
+def getSpawningClusters(degeneracyOfRepresentatives):
+    """
+        Get the cluster from which each initial structure is taken, in the
+        same order as writeSpawningInitialStructures writes them
+
+        :param degeneracyOfRepresentatives: List with the degeneracy of
+            each cluster (number of processors that will start from that state)
+        :type degeneracyOfRepresentatives: list
+
+        :returns: list -- Index of the cluster of each initial structure
+    """
+    return [i for i, degeneracy in enumerate(degeneracyOfRepresentatives) for _ in range(int(degeneracy))]
+
+
+class AsynchronousSimulation(object):
+    """
+        Run the simulation without waiting for all the trajectories of an
+        epoch to finish. Each trajectory is clustered as soon as it finishes
+        and the spawning is calculated with the current clusters to choose the
+        structure from which the next trajectory of its processor starts, so
+        no processor waits for the slowest trajectory. The trajectories keep
+        the epoch folders, initial structures and processor mappings of the
+        synchronous mode, so the pathways can be reconstructed in the same way
+
+        :param simulationRunner: Simulation runner object
+        :type simulationRunner: :py:class:`.SimulationRunner`
+        :param spawningCalculator: Spawning calculator object
+        :type spawningCalculator: :py:class:`.SpawningCalculator`
+        :param clusteringMethod: Clustering object
+        :type clusteringMethod: :py:class:`.Clustering`
+        :param outputPathConstants: Contains outputPath-related constants
+        :type outputPathConstants: :py:class:`.OutputPathConstants`
+        :param topologies: Topology object containing the set of topologies needed for the simulation
+        :type topologies: :py:class:`.Topology`
+        :param writeAll: Wether to write pdb files for all cluster in addition
+            of the summary
+        :type writeAll: bool
+        :param pollTime: Time between two checks of the running trajectories (in seconds)
+        :type pollTime: float
+    """
+    def __init__(self, simulationRunner, spawningCalculator, clusteringMethod, outputPathConstants, topologies, writeAll, pollTime=1.0):
+        self.simulationRunner = simulationRunner
+        self.spawningCalculator = spawningCalculator
+        self.clusteringMethod = clusteringMethod
+        self.outputPathConstants = outputPathConstants
+        self.topologies = topologies
+        self.writeAll = writeAll
+        self.pollTime = pollTime
+        self.nTrajectories = simulationRunner.getWorkingProcessors()
+        self.iterations = simulationRunner.parameters.iterations
+        self.reportFilename = spawningCalculator.parameters.reportFilename
+        # structure from which each trajectory of the next epochs starts, in
+        # the order of the procMapping of the synchronous mode
+        self.procMappings = {}
+        self.clusteredTrajectories = {}
+        self.degeneracyOfRepresentatives = None
+        self.running = {}
+        self.pool = None
+
+    def run(self, firstRun, initialStructuresAsString):
+        """
+            Run the epochs from firstRun to the last iteration
+
+            :param firstRun: First epoch to run
+            :type firstRun: int
+            :param initialStructuresAsString: Initial structures of the first epoch
+            :type initialStructuresAsString: str
+        """
+        outputDir = self.outputPathConstants.epochOutputPathTempletized % firstRun
+        utilities.makeFolder(outputDir)
+        self.simulationRunner.writeMappingToDisk(outputDir)
+        self.topologies.writeMappingToDisk(outputDir, firstRun)
+        self.topologies.writeTopologyObject()
+        structures, checkpoints = self.simulationRunner.getStartingStructures(firstRun, self.outputPathConstants, initialStructuresAsString)
+        self.pool = mp.Pool(self.nTrajectories)
+        for trajNum in range(1, self.nTrajectories+1):
+            checkpoint = None
+            if checkpoints:
+                checkpoint = checkpoints[trajNum-1]
+            self.running[trajNum] = (firstRun, self.simulationRunner.startTrajectory(self.pool, firstRun, trajNum, structures[trajNum-1], self.outputPathConstants, self.topologies, self.reportFilename, checkpoint))
+        stop = False
+        while self.running:
+            finished = sorted(trajNum for trajNum, (_, result) in self.running.items() if result.ready())
+            if not finished:
+                time.sleep(self.pollTime)
+                continue
+            for trajNum in finished:
+                epoch, result = self.running.pop(trajNum)
+                # raise the exceptions of the trajectory, if any
+                result.get()
+                self.clusterTrajectory(epoch, trajNum)
+                if self.clusteredTrajectories[epoch] == self.nTrajectories:
+                    stop = self.finishEpoch(epoch) or stop
+                if not stop and epoch+1 < self.iterations:
+                    self.startNextTrajectory(epoch+1, trajNum)
+        self.pool.close()
+        self.pool.join()
+
+    def clusterTrajectory(self, epoch, trajNum):
+        """
+            Cluster a finished trajectory and calculate the spawning with the
+            current clusters
+
+            :param epoch: Epoch of the trajectory
+            :type epoch: int
+            :param trajNum: Number of the trajectory
+            :type trajNum: int
+        """
+        outputDir = self.outputPathConstants.epochOutputPathTempletized % epoch
+        trajectory = getFinishedTrajectory(outputDir, trajNum)
+        if trajectory is None:
+            raise ValueError("Trajectory %d of epoch %d finished without being marked as finished" % (trajNum, epoch))
+        self.clusteringMethod.startEpoch(epoch)
+        with suppress_stdout():
+            self.clusteringMethod.clusterTrajectory(trajectory, topology=self.topologies)
+            self.clusteringMethod.finishEpoch()
+        self.clusteredTrajectories[epoch] = self.clusteredTrajectories.get(epoch, 0) + 1
+        clustersList = self.clusteringMethod.getClusterListForSpawning()
+        self.degeneracyOfRepresentatives = self.spawningCalculator.calculate(clustersList, self.nTrajectories, epoch, outputPathConstants=self.outputPathConstants)
+
+    def startNextTrajectory(self, epoch, trajNum):
+        """
+            Write the initial structure of a trajectory according to the
+            current spawning and start it
+
+            :param epoch: Epoch of the new trajectory
+            :type epoch: int
+            :param trajNum: Number of the trajectory
+            :type trajNum: int
+        """
+        outputDir = self.outputPathConstants.epochOutputPathTempletized % epoch
+        utilities.makeFolder(outputDir)
+        # as in the synchronous mode, trajectory n starts from the initial
+        # structure n (and the last one from the initial structure 0)
+        structureNum = trajNum % self.nTrajectories
+        spawningClusters = getSpawningClusters(self.degeneracyOfRepresentatives)
+        cluster = self.clusteringMethod.clusters.clusters[spawningClusters[structureNum % len(spawningClusters)]]
+        initialStructure = self.outputPathConstants.tmpInitialStructuresTemplate % (epoch, structureNum)
+        procMapping = self.procMappings.setdefault(epoch, [None for _ in range(self.nTrajectories)])
+        procMapping[structureNum] = cluster.writeSpawningStructure(initialStructure)
+        originEpoch, originTrajectory, _ = procMapping[structureNum]
+        topologyMap = self.topologies.topologyMap.setdefault(epoch, [None for _ in range(self.nTrajectories)])
+        topologyMap[trajNum-1] = self.topologies.getTopologyIndex(originEpoch, originTrajectory)
+        if None not in procMapping:
+            # all the trajectories of the epoch have started
+            self.simulationRunner.updateMappingProcessors(procMapping)
+            self.simulationRunner.writeMappingToDisk(outputDir)
+            self.topologies.writeMappingToDisk(outputDir, epoch)
+            del self.procMappings[epoch]
+        self.running[trajNum] = (epoch, self.simulationRunner.startTrajectory(self.pool, epoch, trajNum, initialStructure, self.outputPathConstants, self.topologies, self.reportFilename))
+
+    def finishEpoch(self, epoch):
+        """
+            Write the output of an epoch once all its trajectories have been
+            clustered
+
+            :param epoch: Epoch number
+            :type epoch: int
+
+            :returns: bool -- Whether the exit condition has been met
+        """
+        outputDir = self.outputPathConstants.epochOutputPathTempletized % epoch
+        utilities.print_unbuffered("Epoch %d finished" % epoch)
+        self.spawningCalculator.log()
+        self.spawningCalculator.createPlots(self.outputPathConstants, epoch, self.clusteringMethod)
+        self.clusteringMethod.writeOutput(self.outputPathConstants.clusteringOutputDir % epoch,
+                                          self.degeneracyOfRepresentatives,
+                                          self.outputPathConstants.clusteringOutputObject % epoch, self.writeAll)
+        if epoch > 0:
+            try:
+                os.remove(self.outputPathConstants.clusteringOutputObject % (epoch - 1))
+            except OSError:
+                pass
+        self.simulationRunner.cleanCheckpointFiles(outputDir)
+        self.topologies.writeTopologyObject()
+        if self.simulationRunner.hasExitCondition() and self.simulationRunner.checkExitCondition(self.clusteringMethod, outputDir):
+            utilities.print_unbuffered("Simulation exit condition met at iteration %d, stopping" % epoch)
+            return True
+        return False
+
+
 def clusterPreviousEpochs(clusteringMethod, finalEpoch, epochOutputPathTempletized, simulationRunner, topologies, outputPathConstants=None):
     """
         Cluster all previous epochs using the clusteringMethod object
@@ -634,6 +929,23 @@ def getClusteringLigandInfo(clustering_block_json):
     resChain = str(paramsBlock.get(blockNames.ClusteringTypes.ligandChain, "")).upper()
     return resname, resnum, resChain
 
+
+def writeEpochProfile(outputPathConstants, epoch, processManager):
+    """
+        Write the profile of the phases of an epoch in the epoch folder, a
+        file for each replica
+
+        :param outputPathConstants: Contains outputPath-related constants
+        :type outputPathConstants: :py:class:`.OutputPathConstants`
+        :param epoch: Epoch number
+        :type epoch: int
+        :param processManager: Object to synchronize the possibly multiple processes
+        :type processManager: :py:class:`.ProcessesManager`
+    """
+    profileFilename = os.path.join(outputPathConstants.epochOutputPathTempletized % epoch, "profiling_%d.json" % processManager.id)
+    profiler.PROFILER.writeEpoch(profileFilename)
+
+
 def main(jsonParams, clusteringHook=None):
     """
         Main body of the adaptive sampling program.
@@ -657,6 +969,8 @@ def main(jsonParams, clusteringHook=None):
     outputPath = generalParams[blockNames.GeneralParams.outputPath]
     initialStructuresWildcard = generalParams[blockNames.GeneralParams.initialStructures]
     writeAll = generalParams.get(blockNames.GeneralParams.writeAllClustering, False)
+    pipelinedClustering = generalParams.get(blockNames.GeneralParams.pipelinedClustering, False)
+    profiling = generalParams.get(blockNames.GeneralParams.profiling, False)
     nativeStructure = generalParams.get(blockNames.GeneralParams.nativeStructure, '')
     resname, resnum, reschain = getClusteringLigandInfo(clusteringBlock)
 
@@ -678,7 +992,8 @@ def main(jsonParams, clusteringHook=None):
     utilities.makeFolder(outputPath)
     utilities.makeFolder(outputPathConstants.tmpFolder)
     utilities.makeFolder(outputPathConstants.topologies)
-    processManager = ProcessesManager(outputPath, simulationRunner.getNumReplicas())
+    processManager = ProcessesManager(outputPath, simulationRunner.getNumReplicas(), simulationRunner.getSynchronizationBackend())
+    profiler.PROFILER.enable(profiling)
     firstRun = findFirstRun(outputPath, outputPathConstants.clusteringOutputObject, simulationRunner, restart)
     if processManager.isMaster():
         printRunInfo(restart, debug, simulationRunner, spawningCalculator, clusteringBlock, outputPath, initialStructuresWildcard)
@@ -742,7 +1057,17 @@ def main(jsonParams, clusteringHook=None):
         clusteringMethod.setProcessors(simulationRunner.getWorkingProcessors())
     if simulationRunner.parameters.modeMovingBox is not None and simulationRunner.parameters.boxCenter is None:
         simulationRunner.parameters.boxCenter = simulationRunner.selectInitialBoxCenter(initialStructuresAsString, resname, reschain, resnum)
+    if simulationRunner.parameters.asynchronousSpawning:
+        if (not debug and simulationRunner.supportsAsynchronousSpawning() and clusteringMethod.supportsIncrementalClustering() and
+                spawningCalculator.type not in spawningTypes.SPAWNING_NO_DEGENERACY_TYPES and simulationRunner.parameters.modeMovingBox is None and
+                not spawningCalculator.parameters.filterByMetric and not simulationRunner.parameters.postprocessing):
+            asynchronousSimulation = AsynchronousSimulation(simulationRunner, spawningCalculator, clusteringMethod, outputPathConstants, topologies, writeAll)
+            asynchronousSimulation.run(firstRun, initialStructuresAsString)
+            processManager.close()
+            return
+        utilities.print_unbuffered("WARNING: asynchronousSpawning is not available with the chosen simulation, clustering and spawning options, running the epochs synchronously")
     for i in range(firstRun, simulationRunner.parameters.iterations):
+        profiler.PROFILER.startEpoch(i)
         if processManager.isMaster():
             utilities.print_unbuffered("Iteration", i)
             outputDir = outputPathConstants.epochOutputPathTempletized % i
@@ -752,14 +1077,20 @@ def main(jsonParams, clusteringHook=None):
             if i == 0:
                 # write the object to file at the start of the first epoch, so
                 # the topologies can always be loaded
-                topologies.writeTopologyObject()
+                with profiler.PROFILER.phase("topologyPickling"):
+                    topologies.writeTopologyObject()
+            if pipelinedClustering and clusteringMethod.supportsIncrementalClustering() and not simulationRunner.parameters.postprocessing:
+                pipeline = PipelinedClustering(clusteringMethod, i, outputPathConstants.epochOutputPathTempletized, topologies, simulationRunner.getWorkingProcessors())
+            else:
+                pipeline = None
         processManager.barrier()
         if processManager.isMaster():
             utilities.print_unbuffered("Production run...")
         if not debug:
             varprotstates, pH = varprot(simulationrunnerBlock) #this checks if varprotstates is used and pH to use PROPKA
-            simulationRunner.runSimulation(i, outputPathConstants, initialStructuresAsString, topologies,
-                                           spawningCalculator.parameters.reportFilename, processManager, varprotstates, restart, pH)
+            with profiler.PROFILER.phase("simulation"):
+                simulationRunner.runSimulation(i, outputPathConstants, initialStructuresAsString, topologies,
+                                               spawningCalculator.parameters.reportFilename, processManager, varprotstates, restart, pH)
         processManager.barrier()
 
         if processManager.isMaster():
@@ -767,9 +1098,18 @@ def main(jsonParams, clusteringHook=None):
                 simulationRunner.processTrajectories(outputPathConstants.epochOutputPathTempletized % i, topologies, i)
             utilities.print_unbuffered("Clustering...")
             startTime = time.time()
-            clusterEpochTrajs(clusteringMethod, i, outputPathConstants.epochOutputPathTempletized, topologies, outputPathConstants)
+            with profiler.PROFILER.phase("clustering"):
+                if pipeline is not None:
+                    backgroundTime = pipeline.finish()
+                else:
+                    clusterEpochTrajs(clusteringMethod, i, outputPathConstants.epochOutputPathTempletized, topologies, outputPathConstants)
             endTime = time.time()
             utilities.print_unbuffered("Clustering ligand: %s sec" % (endTime - startTime))
+            if pipeline is not None:
+                # while the master clusters all processors are idle, so each
+                # second of clustering done during the simulation saves one
+                # second per processor
+                utilities.print_unbuffered("Pipelined clustering: %d trajectories clustered during the simulation, saving %.2f processor-sec of idle time" % (len(pipeline.clustered), backgroundTime*simulationRunner.getWorkingProcessors()))
 
             if clusteringHook is not None:
                 clusteringHook(clusteringMethod, outputPathConstants, simulationRunner, i + 1)
@@ -785,12 +1125,13 @@ def main(jsonParams, clusteringHook=None):
             if spawningCalculator.parameters.filterByMetric:
                 clustersList, clustersFiltered = clusteringMethod.filterClustersAccordingToMetric(clustersFiltered, spawningCalculator.parameters.filter_value, spawningCalculator.parameters.condition, spawningCalculator.parameters.filter_col)
 
-            degeneracyOfRepresentatives = spawningCalculator.calculate(clustersList, simulationRunner.getWorkingProcessors(), i, outputPathConstants=outputPathConstants)
-            spawningCalculator.log()
-            # this method only does works with MSM-based spawning methods,
-            # creating a plot of the stationary distribution and the PMF, for
-            # the rest of methods it does nothing
-            spawningCalculator.createPlots(outputPathConstants, i, clusteringMethod)
+            with profiler.PROFILER.phase("spawning"):
+                degeneracyOfRepresentatives = spawningCalculator.calculate(clustersList, simulationRunner.getWorkingProcessors(), i, outputPathConstants=outputPathConstants)
+                spawningCalculator.log()
+                # this method only does works with MSM-based spawning methods,
+                # creating a plot of the stationary distribution and the PMF, for
+                # the rest of methods it does nothing
+                spawningCalculator.createPlots(outputPathConstants, i, clusteringMethod)
 
             if degeneracyOfRepresentatives is not None:
                 if simulationRunner.parameters.modeMovingBox is not None or spawningCalculator.parameters.filterByMetric:
@@ -801,9 +1142,10 @@ def main(jsonParams, clusteringHook=None):
                 # When using null or independent spawning the calculate method returns None
                 assert spawningCalculator.type in spawningTypes.SPAWNING_NO_DEGENERACY_TYPES, "calculate returned None with spawning type %s" % spawningTypes.SPAWNING_TYPE_TO_STRING_DICTIONARY[spawningCalculator.type]
 
-            clusteringMethod.writeOutput(outputPathConstants.clusteringOutputDir % i,
-                                         degeneracyOfRepresentatives,
-                                         outputPathConstants.clusteringOutputObject % i, writeAll)
+            with profiler.PROFILER.phase("outputWriting"):
+                clusteringMethod.writeOutput(outputPathConstants.clusteringOutputDir % i,
+                                             degeneracyOfRepresentatives,
+                                             outputPathConstants.clusteringOutputObject % i, writeAll)
 
             if i > 0:
                 # Remove old clustering object, since we already have a newer one
@@ -819,12 +1161,13 @@ def main(jsonParams, clusteringHook=None):
             # methods
             if spawningCalculator.shouldWriteStructures():
                 if processManager.isMaster():
-                    _, procMapping = spawningCalculator.writeSpawningInitialStructures(outputPathConstants,
-                                                                                       degeneracyOfRepresentatives,
-                                                                                       clusteringMethod,
-                                                                                       i + 1,
-                                                                                       topologies=topologies)
-                    utilities.writeProcessorMappingToDisk(outputPathConstants.tmpFolder, "processMapping.txt", procMapping)
+                    with profiler.PROFILER.phase("outputWriting"):
+                        _, procMapping = spawningCalculator.writeSpawningInitialStructures(outputPathConstants,
+                                                                                           degeneracyOfRepresentatives,
+                                                                                           clusteringMethod,
+                                                                                           i + 1,
+                                                                                           topologies=topologies)
+                        utilities.writeProcessorMappingToDisk(outputPathConstants.tmpFolder, "processMapping.txt", procMapping)
                     epoch = outputDir.split("/")[1]
                     if varprotstates and int(epoch) != 0:
                         makeprotreport(procemapping, epoch) #this makes prot report at the end of every epoch
@@ -840,7 +1183,8 @@ def main(jsonParams, clusteringHook=None):
                 simulationRunner.cleanCheckpointFiles(outputPathConstants.epochOutputPathTempletized % i)
 
         if processManager.isMaster():
-            topologies.writeTopologyObject()
+            with profiler.PROFILER.phase("topologyPickling"):
+                topologies.writeTopologyObject()
             if clusteringMethod.symmetries and nativeStructure:
                 fixReportsSymmetry(outputPathConstants.epochOutputPathTempletized % i, resname, reschain, resnum,
                                    nativeStructure, clusteringMethod.symmetries, topologies)
@@ -853,10 +1197,18 @@ def main(jsonParams, clusteringHook=None):
                     for pid in processManager.lockInfo:
                         if pid != processManager.pid:
                             os.kill(pid, signal.SIGTERM)
+                    if profiling:
+                        writeEpochProfile(outputPathConstants, i, processManager)
                     break
                 else:
                     utilities.print_unbuffered("Simulation exit condition not met at iteration %d, continuing..." % i)
         processManager.barrier()
+        if profiling:
+            writeEpochProfile(outputPathConstants, i, processManager)
+    if len(processManager) > 1:
+        barrierTime, maxBarrierTime = processManager.getBarrierTimes()
+        utilities.print_unbuffered("Time spent waiting for the other replicas: %.2f s (longest barrier %.2f s)" % (barrierTime, maxBarrierTime))
+    processManager.close()
 
 
 if __name__ == '__main__':
@@ -1,5 +1,4 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
-import pickle
 import argparse
 import numpy as np
 import matplotlib.pyplot as plt
@@ -103,8 +102,7 @@ def plotClusteringData(pklObjectFilename, resname, titlemetric, titlepopulation,
                        metricFlag=False, populationFlag=False,
                        contactsFlag=False, inputFile=None, topology=None):
 
-    with open(pklObjectFilename, "r") as f:
-        clObject = pickle.load(f)
+    clObject = utilities.readClusteringObject(pklObjectFilename)
 
     comCoord, metrics, totalElements, population, contacts = extractCOMMatrix(clObject.clusters.clusters, resname, topology=topology)
 
@@ -5,7 +5,7 @@ import glob
 import argparse
 import numpy as np
 from AdaptivePELE.freeEnergies import cluster
-from AdaptivePELE.freeEnergies import utils
+from AdaptivePELE.freeEnergies import utilitiesFreeEnergies
 from AdaptivePELE.utilities import utilities
 import matplotlib.pyplot as plt
 plt.style.use('ggplot')
@@ -52,37 +52,6 @@ def __cleanupFiles(trajWildcard, cleanupClusterCenters=True):
         __rmFiles("discretized/clusterCenter*")
 
 
-def calculateAutoCorrelation(lagtimes, dtrajs, nclusters, nLags):
-    C = np.zeros((nclusters, nLags))
-    Ci = np.zeros((nclusters, nLags))
-    Cf = np.zeros((nclusters, nLags))
-    autoCorr = np.zeros((nclusters, nLags))
-    N = 0
-    M = np.zeros(nLags)
-    for trajectory in dtrajs:
-        traj = utilities.loadtxtfile(trajectory, dtype=int)
-        Nt = traj.size
-        N += Nt
-        for il, lagtime in enumerate(lagtimes):
-            M[il] += Nt-lagtime
-            for i in range(Nt-lagtime):
-                autoCorr[traj[i], il] += (traj[i] == traj[i+lagtime])
-                C[traj[i], il] += 1
-                Ci[traj[i], il] += 1
-                if i > lagtime:
-                    Cf[traj[i], il] += 1
-            for j in range(Nt-lagtime, Nt):
-                C[traj[j], il] += 1
-                Cf[traj[j], il] += 1
-
-    mean = C/float(N)
-    var = (N*C-(C**2))/float(N*(N-1))
-    autoCorr += M*mean**2-(Ci+Cf)*mean
-    autoCorr /= N
-    autoCorr /= var
-    return autoCorr
-
-
 def create_plots(autoCorr, plots_path, save_plot, show_plot, nclusters, lagtimes, threshold=2, title=""):
 
     def update_annot(ind, pos, index):
@@ -144,7 +113,6 @@ def create_plots(autoCorr, plots_path, save_plot, show_plot, nclusters, lagtimes
 
 def main(lagtime, clusters_file, disctraj, trajs, n_clusters, plots_path, save_plot, show_plot, lagtime_resolution=20):
     lagtimes = list(range(1, lagtime, lagtime_resolution))
-    n_lags = len(lagtimes)
     if disctraj is None:
         clusteringObject = cluster.Cluster(n_clusters, trajs, "traj*", alwaysCluster=False)
         if clusters_file is not None:
@@ -160,9 +128,8 @@ def main(lagtime, clusters_file, disctraj, trajs, n_clusters, plots_path, save_p
         raise ValueError("Number of clusters specified in the -n parameter does not match the provided clusters")
     print("Calculating autocorrelation...")
     dtrajs = glob.glob(os.path.join(disctraj, "traj*"))
-    dtrajs_loaded = [np.loadtxt(dtraj, dtype=int) for dtraj in dtrajs]
-
-    autoCorr = utils.calculateAutoCorrelation(lagtimes, dtrajs_loaded, n_clusters, n_lags)
+    # the discretized trajectories are read one at a time
+    autoCorr = utilitiesFreeEnergies.calculateAutoCorrelation(lagtimes, dtrajs, n_clusters)
     np.save("autoCorr.npy", autoCorr)
     # __cleanupFiles(parameters.trajWildcard, False)
 
@@ -179,7 +179,7 @@ def parse_values(reports, n_structs, criteria, sort_order, steps):
     min_values = pd.DataFrame.from_items(INITIAL_DATA)
     for file in reports:
         report_number = os.path.basename(file).split("_")[-1]
-        data = pd.read_csv(file, sep='    ', engine='python')
+        data = utilities.readReportDataFrame(file)
         selected_data = data.loc[:, [steps, criteria]]
         if sort_order == "min":
                 report_values = selected_data.nsmallest(n_structs, criteria)
@@ -210,7 +210,7 @@ def filter_non_numerical_folders(reports, numfolders):
 
 
 def get_column_names(reports, steps, criteria):
-    data = pd.read_csv(reports[0], sep='    ', engine='python')
+    data = utilities.getReportColumns(reports[0])
     data = list(data)
     if criteria.isdigit():
         return data[int(steps)-1], data[int(criteria)-1]
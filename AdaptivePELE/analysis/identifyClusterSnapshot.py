@@ -43,8 +43,9 @@ def main(epoch_num, trajectory, snapshot_num, resname, clustering_object, topolo
         raise IndexError("Snapshot number %d not found in trajectory %d for epoch %d, please check that the arguments provided are correct" % (snapshot_num, trajectory, epoch_num))
     pdb = atomset.PDB()
     pdb.initialise(snapshots, resname=resname, topology=topology_contents)
-    for i, cluster in enumerate(clustering_object[:n_clusters]):
-        dist = calc.computeRMSD(pdb, cluster.pdb)
+    clusters = clustering_object[:n_clusters]
+    distances = calc.computeRMSDToMany(pdb, [cluster.pdb for cluster in clusters])
+    for i, (cluster, dist) in enumerate(zip(clusters, distances)):
         if dist < cluster.threshold:
             print("Snapshot belongs to cluster", i)
             return
@@ -17,6 +17,7 @@ import sklearn.metrics as mt
 import hdbscan
 import AdaptivePELE.analysis.splitTrajectory as st
 import AdaptivePELE.analysis.backtrackAdaptiveTrajectory as bk
+from AdaptivePELE.utilities import utilities
 matplotlib.use('TkAgg')
 
 """
@@ -385,9 +386,8 @@ def retrieve_report_data(report):
     #Get report
     report_number = os.path.basename(report).split("_")[-1]
     #Read data
-    try:
-        data = pd.read_csv(report, sep='    ', engine='python')
-    except pd.errors.EmptyDataError:
+    data = utilities.readReportDataFrame(report)
+    if not len(data.columns):
         warnings.warn("Report {} corrupted".format(report), UserWarning)
         return pd.DataFrame()
     #Skip first line if asked
@@ -410,8 +410,7 @@ def filter_non_numerical_folders(reports, numfolders):
         return reports
 
 def get_column_names(reports, steps, criteria1, criteria2, criteria3):
-    data = pd.read_csv(reports[0], sep='    ', engine='python')
-    data = list(data)
+    data = utilities.getReportColumns(reports[0])
     return data[int(steps)-1], data[criteria1-1], data[criteria2-1], data[criteria3-1]
 
 def mkdir_p(path):
@@ -53,7 +53,7 @@ def writeConnectionsPDB(network, f):
 def readClustering(clusteringPath, metricCol):
     print("Reading clustering object...")
     clustering = utilities.readClusteringObject(clusteringPath)
-    network = clustering.conformationNetwork.network
+    network = clustering.conformationNetwork.toNetworkx()
     metrics = [cl.metrics[metricCol] for cl in clustering.clusterIterator()]
     return clustering, network, metrics
 
@@ -2,6 +2,7 @@ import pandas as pd
 import argparse
 import os
 import glob
+from AdaptivePELE.utilities import utilities
 
 EPOCH = 'Epoch'
 TRAJ = 'Traj'
@@ -14,8 +15,7 @@ def arg_parse():
     return args
 
 def retrieve_fields(report):
-    data = pd.read_csv(report, sep='    ', engine='python')
-    return list(data)[2:]
+    return utilities.getReportColumns(report)[2:]
 
 def gather_reports():
     reports = utilities.getReportList(os.path.join(path, "*/*report*"))
@@ -55,7 +55,7 @@ def fill_data(reports, df, pool):
 
 
 def extract_data(report):
-       data = pd.read_csv(report, sep='    ', engine='python')
+       data = utilities.readReportDataFrame(report)
        data = data.drop(data.columns[0], axis=1)
        data = data.drop(data.columns[0], axis=1)
        size = data.shape[0]
@@ -1,3 +1,11 @@
+cimport AdaptivePELE.atomset.atomset as atomset
+
 cdef class RMSDCalculator:
     cdef public list symmetries
     cdef public set nonSymmetricalAtomsSet
+    cdef public list referenceAtomList
+    cdef dict _matchingAtomLists
+    cdef object _symmetryRows, _permutedRows, _groupOffsets, _nonSymmetricalRows
+    cdef tuple _resolveRows(self, dict atomIndex)
+    cdef tuple _getRows(self, atomset.PDB PDB)
+    cdef double _squaredDeviation(self, atomset.PDB PDB1, tuple rows1, atomset.PDB PDB2, tuple rows2)
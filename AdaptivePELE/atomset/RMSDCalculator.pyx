@@ -4,15 +4,55 @@ cimport cython
 cimport numpy as np
 cimport AdaptivePELE.atomset.atomset as atomset
 
+# maximum number of atom lists known to have the reference ordering that an
+# RMSDCalculator keeps
+_MAX_MATCHING_ATOM_LISTS = 100
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline double pairSquaredDistance(double[:, ::1] coords1, Py_ssize_t row1, double[:, ::1] coords2, Py_ssize_t row2) nogil:
+    cdef double dx, dy, dz
+    dx = coords1[row1, 0] - coords2[row2, 0]
+    dy = coords1[row1, 1] - coords2[row2, 1]
+    dz = coords1[row1, 2] - coords2[row2, 2]
+    return dx*dx + dy*dy + dz*dz
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double symmetricSquaredDistanceSum(double[:, ::1] coords1, Py_ssize_t[::1] rows1, Py_ssize_t[::1] permutedRows1, double[:, ::1] coords2, Py_ssize_t[::1] rows2, Py_ssize_t[::1] permutedRows2, Py_ssize_t[::1] groupOffsets) nogil:
+    """
+        Sum, for every symmetry group, the minimum of the squared distances
+        obtained with the identity and the swapped permutation of the group
+    """
+    cdef Py_ssize_t igroup, i
+    cdef double d2, d2sm, total = 0.0
+    for igroup in range(groupOffsets.shape[0]-1):
+        d2 = 0.0
+        d2sm = 0.0
+        for i in range(groupOffsets[igroup], groupOffsets[igroup+1]):
+            d2 += pairSquaredDistance(coords1, rows1[i], coords2, rows2[i]) + pairSquaredDistance(coords1, permutedRows1[i], coords2, permutedRows2[i])
+            d2sm += pairSquaredDistance(coords1, permutedRows1[i], coords2, rows2[i]) + pairSquaredDistance(coords1, rows1[i], coords2, permutedRows2[i])
+        total += min(d2, d2sm)
+    return total
+
 
 cdef class RMSDCalculator:
     def __init__(self, symmetries=[]):
         """
             :param symmetries: List of dictionaries with gropus of symmetric atoms atomId:symmetricalAtomId corresponding with the symmetrical atoms
             :type symmetries: list
+
+            The symmetry groups are resolved into integer row arrays against
+            the atom ordering of the first structure used (the reference
+            ordering), so structures sharing that ordering are compared
+            without any lookup by atom id
         """
         self.nonSymmetricalAtomsSet = None
         self.symmetries = symmetries
+        self.referenceAtomList = None
+        self._matchingAtomLists = {}
 
     def __getstate__(self):
         state = {u'nonSymmetricalAtomsSet': self.nonSymmetricalAtomsSet,
@@ -22,57 +62,99 @@ cdef class RMSDCalculator:
     def __setstate__(self, state):
         self.nonSymmetricalAtomsSet = state[u'nonSymmetricalAtomsSet']
         self.symmetries = state[u'symmetries']
+        self.referenceAtomList = None
+        self._matchingAtomLists = {}
 
     def computeNonSymmAtoms(self, atomset.PDB PDB):
         cdef set allAtomsSet
-        allAtomsSet = set(PDB.atoms.keys())
+        allAtomsSet = set(PDB.atomIndex.keys())
         for group in self.symmetries:
             symmetriesSet = set(group.keys()).union(set(group.values()))
             allAtomsSet -= symmetriesSet
         self.nonSymmetricalAtomsSet = allAtomsSet
 
-    def computeRMSD2(self, atomset.PDB PDB1, atomset.PDB PDB2):
+    def setReferenceOrdering(self, atomset.PDB PDB):
         """
-            Compute the squared RMSD between two PDB
+            Resolve the symmetry groups and the non-symmetrical atoms into
+            row indices of the coordinates of PDB. Any structure with the same
+            atomList will reuse these indices
 
-            :param PDB1: First PDB with which the RMSD will be calculated
-            :type PDB1: PDB
-            :param PDB2: First PDB with which the RMSD will be calculated
-            :type PDB2: PDB
-            :returns: float -- The squared RMSD between two PDB
+            :param PDB: Structure whose atom ordering will be used as reference
+            :type PDB: PDB
+            :raises: KeyError if an atom of the symmetries is not found in the PDB
         """
-        cdef double rmsd, d2, d2sm
-        cdef basestring atom1Id, atom2Id, atomId
-        cdef atomset.Atom atom11, atom12, atom21, atom22, atom1, atom2
-        cdef dict group
-        cdef int n
-        rmsd = 0.0
         if self.nonSymmetricalAtomsSet is None:
-            self.computeNonSymmAtoms(PDB1)
+            self.computeNonSymmAtoms(PDB)
+        self._symmetryRows, self._permutedRows, self._groupOffsets, self._nonSymmetricalRows = self._resolveRows(PDB.atomIndex)
+        self.referenceAtomList = PDB.atomList
+        self._matchingAtomLists = {}
 
+    cdef tuple _resolveRows(self, dict atomIndex):
+        cdef list symmetryRows = [], permutedRows = [], groupOffsets = [0]
+        cdef dict group
+        cdef basestring atom1Id, atom2Id, atomId
         for group in self.symmetries:
-            d2 = 0.0
-            d2sm = 0.0
             for atom1Id, atom2Id in group.iteritems():
                 try:
-                    atom11 = PDB1.getAtom(atom1Id)
-                    atom12 = PDB1.getAtom(atom2Id)
-                    atom21 = PDB2.getAtom(atom1Id)
-                    atom22 = PDB2.getAtom(atom2Id)
+                    symmetryRows.append(atomIndex[atom1Id])
+                    permutedRows.append(atomIndex[atom2Id])
                 except KeyError as err:
                     raise KeyError("Atom %s not found in PDB" % str(err))
-                d2 += atom11.squaredDistance(atom21) + atom12.squaredDistance(atom22)
-                d2sm += atom12.squaredDistance(atom21) + atom11.squaredDistance(atom22)
-            rmsd += min(d2, d2sm)
-        for atomId in self.nonSymmetricalAtomsSet:#this nonsymmetricalatomset contains
-            try:
-                atom1 = PDB1.getAtom(atomId)
-                atom2 = PDB2.getAtom(atomId)
-            except KeyError:
-                pass
-            rmsd += atom1.squaredDistance(atom2)
-        n = len(PDB1.atoms.items())
-        return rmsd/n
+            groupOffsets.append(len(symmetryRows))
+        return (np.array(symmetryRows, dtype=np.intp), np.array(permutedRows, dtype=np.intp),
+                np.array(groupOffsets, dtype=np.intp),
+                np.array([atomIndex[atomId] for atomId in self.nonSymmetricalAtomsSet if atomId in atomIndex], dtype=np.intp))
+
+    cdef tuple _getRows(self, atomset.PDB PDB):
+        # structures sharing the reference ordering use the precomputed rows.
+        # The structures built from the same template share their atomList
+        # object, so the atom ids of each atomList are compared with the
+        # reference only the first time it is found
+        cdef list atomList = PDB.atomList
+        if atomList is self.referenceAtomList or self._matchingAtomLists.get(id(atomList)) is atomList:
+            return self._symmetryRows, self._permutedRows, self._groupOffsets, self._nonSymmetricalRows
+        if atomList == self.referenceAtomList:
+            if len(self._matchingAtomLists) >= _MAX_MATCHING_ATOM_LISTS:
+                self._matchingAtomLists.clear()
+            # the list is kept so that its id is not reused
+            self._matchingAtomLists[id(atomList)] = atomList
+            return self._symmetryRows, self._permutedRows, self._groupOffsets, self._nonSymmetricalRows
+        return self._resolveRows(PDB.atomIndex)
+
+    cdef double _squaredDeviation(self, atomset.PDB PDB1, tuple rows1, atomset.PDB PDB2, tuple rows2):
+        cdef double[:, ::1] coords1 = PDB1.coords
+        cdef double[:, ::1] coords2 = PDB2.coords
+        cdef np.ndarray[Py_ssize_t, ndim=1] nonSymmetricalRows1, nonSymmetricalRows2
+        cdef dict index1, index2
+        cdef basestring atomId
+        cdef double rmsd
+        rmsd = symmetricSquaredDistanceSum(coords1, rows1[0], rows1[1], coords2, rows2[0], rows2[1], rows1[2])
+        if rows1 is rows2 or (len(rows1[3]) == len(rows2[3]) == len(self.nonSymmetricalAtomsSet)):
+            nonSymmetricalRows1 = rows1[3]
+            nonSymmetricalRows2 = rows2[3]
+        else:
+            # atoms not present in both structures are skipped
+            index1 = PDB1.atomIndex
+            index2 = PDB2.atomIndex
+            nonSymmetricalAtoms = [atomId for atomId in self.nonSymmetricalAtomsSet if atomId in index1 and atomId in index2]
+            nonSymmetricalRows1 = np.array([index1[atomId] for atomId in nonSymmetricalAtoms], dtype=np.intp)
+            nonSymmetricalRows2 = np.array([index2[atomId] for atomId in nonSymmetricalAtoms], dtype=np.intp)
+        rmsd += atomset.squaredDistanceSum(coords1, nonSymmetricalRows1, coords2, nonSymmetricalRows2)
+        return rmsd/len(PDB1)
+
+    def computeRMSD2(self, atomset.PDB PDB1, atomset.PDB PDB2):
+        """
+            Compute the squared RMSD between two PDB
+
+            :param PDB1: First PDB with which the RMSD will be calculated
+            :type PDB1: PDB
+            :param PDB2: First PDB with which the RMSD will be calculated
+            :type PDB2: PDB
+            :returns: float -- The squared RMSD between two PDB
+        """
+        if self.referenceAtomList is None:
+            self.setReferenceOrdering(PDB1)
+        return self._squaredDeviation(PDB1, self._getRows(PDB1), PDB2, self._getRows(PDB2))
 
     def computeRMSD(self, atomset.PDB PDB1, atomset.PDB PDB2):
         """
@@ -85,3 +167,58 @@ cdef class RMSDCalculator:
             :returns: float -- The squared RMSD between two PDB
         """
         return np.sqrt(self.computeRMSD2(PDB1, PDB2))
+
+    def computeRMSDToMany(self, atomset.PDB PDB, list PDBs):
+        """
+            Compute the RMSD between a PDB and a list of PDB (e.g. the
+            centers of the clusters) in a single call. The RMSD to each
+            structure is the same as computeRMSD(PDBs[i], PDB)
+
+            :param PDB: PDB to compare
+            :type PDB: PDB
+            :param PDBs: List of PDB against which PDB will be compared
+            :type PDBs: list
+            :returns: numpy.Array -- Array with the RMSD between PDB and each element of PDBs
+        """
+        cdef np.ndarray[double, ndim=1] rmsds = np.zeros(len(PDBs))
+        cdef atomset.PDB otherPDB
+        cdef tuple rows
+        cdef int i
+        if not PDBs:
+            return rmsds
+        if self.referenceAtomList is None:
+            self.setReferenceOrdering(PDBs[0])
+        rows = self._getRows(PDB)
+        for i in range(len(PDBs)):
+            otherPDB = PDBs[i]
+            rmsds[i] = self._squaredDeviation(otherPDB, self._getRows(otherPDB), PDB, rows)
+        return np.sqrt(rmsds)
+
+    def computeRMSDToCoordinates(self, atomset.PDB PDB, double[:, :, ::1] coordinates):
+        """
+            Compute the RMSD between a PDB and a set of structures with its
+            same atom ordering, given as a single array of coordinates (e.g.
+            the alternative structures of a cluster). The RMSD to each
+            structure is the same as computeRMSD with a PDB of those
+            coordinates
+
+            :param PDB: PDB to compare
+            :type PDB: PDB
+            :param coordinates: Array of shape (structures, atoms, 3) with the
+                coordinates of the structures
+            :type coordinates: numpy.Array
+            :returns: numpy.Array -- Array with the RMSD between PDB and each structure
+        """
+        cdef Py_ssize_t i, n = coordinates.shape[0]
+        cdef np.ndarray[double, ndim=1] rmsds = np.zeros(n)
+        cdef double[:, ::1] coords = PDB.coords
+        cdef Py_ssize_t[::1] symmetryRows, permutedRows, groupOffsets, nonSymmetricalRows
+        if n == 0:
+            return rmsds
+        if self.referenceAtomList is None:
+            self.setReferenceOrdering(PDB)
+        symmetryRows, permutedRows, groupOffsets, nonSymmetricalRows = self._getRows(PDB)
+        for i in range(n):
+            rmsds[i] = symmetricSquaredDistanceSum(coordinates[i], symmetryRows, permutedRows, coords, symmetryRows, permutedRows, groupOffsets)
+            rmsds[i] += atomset.squaredDistanceSum(coordinates[i], nonSymmetricalRows, coords, nonSymmetricalRows)
+        return np.sqrt(rmsds/coords.shape[0])
@@ -1,4 +1,8 @@
+cimport AdaptivePELE.atomset.atomset as atomset
+
+
 cdef class SymmetryContactMapEvaluator:
     cdef public list symmetries, proteinList, ligandList
     cdef public set symmetricAtoms
     cdef public dict symToRowMap
+    cdef tuple _computeContactMap(self, atomset.PDB PDBobj, basestring ligandResname, int contactThresholdDistance, int ligandResnum, basestring ligandResChain)
@@ -4,6 +4,7 @@ import numpy as np
 cimport cython
 cimport numpy as np
 cimport AdaptivePELE.atomset.atomset as atomset
+from AdaptivePELE.atomset.atomset import computeContactMap
 
 
 cdef class SymmetryContactMapEvaluator:
@@ -81,46 +82,7 @@ cdef class SymmetryContactMapEvaluator:
             :returns: numpy.Array -- The contact map of the ligand and the protein
             :returns: int -- The number of alpha carbons in contact with the ligand
         """
-        cdef int contactThresholdDistance2, rowind, colind
-        contactThresholdDistance2 = contactThresholdDistance**2
-        cdef atomset.PDB ligandPDB, alphaCarbonsPDB
-        cdef np.ndarray[char, ndim=2] contactMap
-        cdef basestring ligandAtomID, proteinAtomID
-        cdef atomset.Atom proteinAtom, ligandAtom
-        cdef set contacts
-        cdef double dist2
-
-        ligandPDB = atomset.PDB()
-        ligandPDB.initialise(PDBobj.pdb, resname=ligandResname, resnum=ligandResnum,
-                             chain=ligandResChain, heavyAtoms=True)
-        alphaCarbonsPDB = atomset.PDB()
-        alphaCarbonsPDB.initialise(PDBobj.pdb, type=u"CM")
-        if not self.ligandList:
-            self.ligandList = ligandPDB.atomList
-        if not self.proteinList:
-            self.proteinList = alphaCarbonsPDB.atomList
-        # empty contact map, rows are atoms of the ligand, columns are protein
-        # alpha carbons
-        contactMap = np.zeros((len(ligandPDB.atomList),
-                               len(alphaCarbonsPDB.atomList)), dtype=np.uint8)
-        contacts = set([])
-        for rowind in range(len(ligandPDB.atomList)):
-            ligandAtomID = ligandPDB.atomList[rowind]
-            ligandAtom = ligandPDB.atoms[ligandAtomID]
-            if ligandAtomID in self.symmetricAtoms:
-                self.symToRowMap[ligandAtomID] = rowind
-            for colind in range(len(alphaCarbonsPDB.atomList)):
-                proteinAtomID = alphaCarbonsPDB.atomList[colind]
-                proteinAtom = alphaCarbonsPDB.atoms[proteinAtomID]
-                dist2 = ligandAtom.squaredDistance(proteinAtom)
-                if (dist2 - contactThresholdDistance2) < 0.1:
-                    contactMap[rowind, colind] = True
-                if proteinAtom.name == u"CA" and (dist2 - 64.0) < 0.1:
-                    # Contact ratio will be always calculated using a contact
-                    # threshold of 8, so that tresholds and densities are
-                    # independent of the contact threshold of the contactMap
-                    contacts.update([proteinAtomID])
-        return contactMap.view(np.bool), len(contacts)
+        return self._computeContactMap(PDBobj, ligandResname, contactThresholdDistance, ligandResnum, ligandResChain)
 
     def buildContactMap(self, atomset.PDB PDBobj, basestring ligandResname, int contactThresholdDistance, int ligandResnum=0, basestring ligandResChain=u""):
         """
@@ -143,51 +105,44 @@ cdef class SymmetryContactMapEvaluator:
             :returns: numpy.Array -- The contact map of the ligand and the protein
             :returns: int -- The number of alpha carbons in contact with the ligand
         """
-        cdef int contactThresholdDistance2, rowind, colind
+        return self._computeContactMap(PDBobj, ligandResname, contactThresholdDistance, ligandResnum, ligandResChain)
+
+    cdef tuple _computeContactMap(self, atomset.PDB PDBobj, basestring ligandResname, int contactThresholdDistance, int ligandResnum, basestring ligandResChain):
+        cdef int contactThresholdDistance2, rowind
         contactThresholdDistance2 = contactThresholdDistance**2
         cdef atomset.PDB ligandPDB, alphaCarbonsPDB
-        cdef np.ndarray[char, ndim=2] contactMap
-        cdef basestring ligandAtomID, proteinAtomID
-        cdef atomset.Atom proteinAtom, ligandAtom
-        cdef set contacts
-        cdef double dist2
-        ligandPDB = atomset.PDB()
-        ligandPDB.initialise(PDBobj.pdb, resname=ligandResname, resnum=ligandResnum,
-                             chain=ligandResChain, heavyAtoms=True)
-        alphaCarbonsPDB = atomset.PDB()
-        alphaCarbonsPDB.initialise(PDBobj.pdb, type=u"CM")
+        cdef basestring ligandAtomID
+        cdef object contactMap, contactsMask
+
+        # the selections are resolved for the first structure, the following
+        # ones only parse the coordinates of the selected atoms
+        ligandPDB = PDBobj.extractSelection(resname=ligandResname, resnum=ligandResnum,
+                                            chain=ligandResChain, heavyAtoms=True)
+        alphaCarbonsPDB = PDBobj.extractSelection(type=u"CM")
         if not self.ligandList:
             self.ligandList = ligandPDB.atomList
         if not self.proteinList:
             self.proteinList = alphaCarbonsPDB.atomList
-        # empty contact map, rows are atoms of the ligand, columns are protein
-        # alpha carbons
-        contactMap = np.zeros((len(ligandPDB.atomList),
-                               len(alphaCarbonsPDB.atomList)), dtype=np.uint8)
-        contacts = set([])
         for rowind in range(len(ligandPDB.atomList)):
             ligandAtomID = ligandPDB.atomList[rowind]
-            ligandAtom = ligandPDB.atoms[ligandAtomID]
             if ligandAtomID in self.symmetricAtoms:
                 self.symToRowMap[ligandAtomID] = rowind
-            for colind in range(len(alphaCarbonsPDB.atomList)):
-                proteinAtomID = alphaCarbonsPDB.atomList[colind]
-                proteinAtom = alphaCarbonsPDB.atoms[proteinAtomID]
-                dist2 = ligandAtom.squaredDistance(proteinAtom)
-                if (dist2 - contactThresholdDistance2) < 0.1:
-                    contactMap[rowind, colind] = True
-                if proteinAtom.name == u"CA" and (dist2 - 64.0) < 0.1:
-                    # Contact ratio will be always calculated using a contact
-                    # threshold of 8, so that tresholds and denisities are
-                    # independent of the contact threshold of the contactMap
-                    contacts.update([proteinAtomID])
-        return contactMap.view(np.bool), len(contacts)
+        # rows of the contact map are atoms of the ligand, columns are protein
+        # alpha carbons. Contact ratio will be always calculated using a
+        # contact threshold of 8, so that tresholds and densities are
+        # independent of the contact threshold of the contactMap
+        contactMap, contactsMask = computeContactMap(ligandPDB.coords, alphaCarbonsPDB.coords, contactThresholdDistance2, 64.0)
+        contactsMask &= np.array([atomName == u"CA" for atomName in alphaCarbonsPDB.atomNames], dtype=bool)
+        # the atom ids of a structure are unique, so each alpha carbon in
+        # contact is counted once
+        return contactMap.view(bool), int(contactsMask.sum())
 
     def evaluateJaccard(self, contactMap, clusterContactMap):
-        permContactMap = self.buildOptimalPermutationContactMap(contactMap,
-                                                                clusterContactMap)
-        intersectContactMaps = (permContactMap & clusterContactMap).sum()
-        unionContactMaps = permContactMap.sum() + clusterContactMap.sum() - intersectContactMaps
+        contactMap = asPackedContactMap(contactMap)
+        clusterContactMap = asPackedContactMap(clusterContactMap)
+        rows = self.buildOptimalPermutationRows(contactMap, clusterContactMap)
+        intersectContactMaps = contactMap.countIntersection(clusterContactMap, rows)
+        unionContactMaps = contactMap.nContacts + clusterContactMap.nContacts - intersectContactMaps
         if unionContactMaps < 1e-7:
             # both contactMaps have zero contacts
             return 0.0
@@ -196,19 +151,21 @@ cdef class SymmetryContactMapEvaluator:
         return distance
 
     def evaluateCorrelation(self, contactMap, clusterContactMap):
-        permContactMap = self.buildOptimalPermutationContactMap(contactMap,
-                                                                clusterContactMap)
-        similarity = calculateCorrelationContactMaps(permContactMap, clusterContactMap)
+        contactMap = asPackedContactMap(contactMap)
+        clusterContactMap = asPackedContactMap(clusterContactMap)
+        rows = self.buildOptimalPermutationRows(contactMap, clusterContactMap)
+        similarity = calculatePackedCorrelation(contactMap, clusterContactMap, rows)
         similarity += 1  # Necessary to omit negative correlations
         similarity /= 2.0  # Correlation values need to be higher now
         distance = 1-similarity
         return distance
 
     def evaluateDifferenceDistance(self, contactMap, clusterContactMap):
-        permContactMap = self.buildOptimalPermutationContactMap(contactMap,
-                                                                clusterContactMap)
-        differenceContactMaps = np.abs(permContactMap^clusterContactMap).sum()
-        averageContacts = (0.5*(permContactMap.sum()+clusterContactMap.sum()))
+        contactMap = asPackedContactMap(contactMap)
+        clusterContactMap = asPackedContactMap(clusterContactMap)
+        rows = self.buildOptimalPermutationRows(contactMap, clusterContactMap)
+        differenceContactMaps = contactMap.countDifference(clusterContactMap, rows)
+        averageContacts = (0.5*(contactMap.nContacts+clusterContactMap.nContacts))
         if not averageContacts:
             # The only way the denominator can be 0 is if both contactMaps are
             # all zeros, thus being equal and belonging to the same cluster
@@ -217,36 +174,203 @@ cdef class SymmetryContactMapEvaluator:
             distance = differenceContactMaps/averageContacts
             return distance
 
-    def buildOptimalPermutationContactMap(self, contactMap, clusterContactMap):
+    def buildOptimalPermutationRows(self, contactMap, clusterContactMap):
         """
-            Build a permutated version of the contactMap which maximizes the
-            similarity between the two contactMaps
+            Find the permutation of the rows of the contactMap (swapping the
+            rows of symmetric atoms) which maximizes the similarity between
+            the two contactMaps, without building the permutated contact map
+
             :param contactMap: contactMap of the conformation to compare
-            :type contactMap: numpy.Array
+            :type contactMap: :py:class:`.PackedContactMap`
             :param clusterContactMap: cluster contactMap to which we are comparing
-            :type cluster: numpy.Array
-            :returns: numpy.Array -- The permutated contact map
+            :type cluster: :py:class:`.PackedContactMap`
+            :returns: numpy.Array -- Row of the contactMap that corresponds to
+                each row of the clusterContactMap
         """
+        cdef np.ndarray[Py_ssize_t, ndim=1] rows = np.arange(contactMap.shape[0], dtype=np.intp)
+        cdef Py_ssize_t atom1Row, atom2Row
+        if contactMap.shape != clusterContactMap.shape:
+            raise ValueError("Contact maps of shapes %s and %s can not be compared" % (contactMap.shape, clusterContactMap.shape))
         if not self.symmetries and not self.symToRowMap:
-            return contactMap
-        permContactMap = np.array(contactMap)
+            return rows
         for group in self.symmetries:
             for atom1Id, atom2Id in group.iteritems():
                 try:
                     atom1Row = self.symToRowMap[atom1Id]
                     atom2Row = self.symToRowMap[atom2Id]
-                    line11 = clusterContactMap[atom1Row]
-                    line12 = clusterContactMap[atom2Row]
-                    line21 = contactMap[atom1Row]
-                    line22 = contactMap[atom2Row]
                 except KeyError as err:
                     raise KeyError(u"Atom %s not found in symmetries" % err.message)
-                d2 = (line11 == line21).sum() + (line12 == line22).sum()
-                d2sm = (line12 == line21).sum() + (line11 == line22).sum()
-                if d2sm > d2:
-                    # swap rows using advanced slicing from numpy
-                    permContactMap[[atom1Row, atom2Row], :] = contactMap[[atom2Row, atom1Row], :]
-        return permContactMap
+                # the rows are equal where they do not differ, so the swap
+                # maximizes the equal elements if it minimizes the differences
+                d2 = clusterContactMap.countRowDifference(atom1Row, contactMap, atom1Row) + clusterContactMap.countRowDifference(atom2Row, contactMap, atom2Row)
+                d2sm = clusterContactMap.countRowDifference(atom2Row, contactMap, atom1Row) + clusterContactMap.countRowDifference(atom1Row, contactMap, atom2Row)
+                if d2sm < d2:
+                    rows[atom1Row] = atom2Row
+                    rows[atom2Row] = atom1Row
+        return rows
+
+    def buildOptimalPermutationContactMap(self, contactMap, clusterContactMap):
+        """
+            Build a permutated version of the contactMap which maximizes the
+            similarity between the two contactMaps
+            :param contactMap: contactMap of the conformation to compare
+            :type contactMap: numpy.Array
+            :param clusterContactMap: cluster contactMap to which we are comparing
+            :type cluster: numpy.Array
+            :returns: numpy.Array -- The permutated contact map
+        """
+        rows = self.buildOptimalPermutationRows(asPackedContactMap(contactMap), asPackedContactMap(clusterContactMap))
+        if isinstance(contactMap, PackedContactMap):
+            contactMap = contactMap.unpack()
+        return np.asarray(contactMap)[rows]
+
+
+cdef extern from *:
+    """
+    static CYTHON_INLINE int popcount64(unsigned PY_LONG_LONG word) {
+    #if defined(__GNUC__) || defined(__clang__)
+        return __builtin_popcountll(word);
+    #else
+        word = word - ((word >> 1) & 0x5555555555555555ULL);
+        word = (word & 0x3333333333333333ULL) + ((word >> 2) & 0x3333333333333333ULL);
+        word = (word + (word >> 4)) & 0x0F0F0F0F0F0F0F0FULL;
+        return (int)((word * 0x0101010101010101ULL) >> 56);
+    #endif
+    }
+    """
+    int popcount64(unsigned long long word) nogil
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef Py_ssize_t countBits(np.uint64_t[:, ::1] words1, Py_ssize_t[::1] rows1, np.uint64_t[:, ::1] words2, Py_ssize_t[::1] rows2, bint difference) nogil:
+    """
+        Count the bits set in both rows (or only in one of them, if
+        difference) for each pair of rows (words1[rows1[i]], words2[rows2[i]])
+    """
+    cdef Py_ssize_t i, j, total = 0
+    for i in range(rows1.shape[0]):
+        for j in range(words1.shape[1]):
+            if difference:
+                total += popcount64(words1[rows1[i], j] ^ words2[rows2[i], j])
+            else:
+                total += popcount64(words1[rows1[i], j] & words2[rows2[i], j])
+    return total
+
+
+class PackedContactMap(object):
+    """
+        Boolean contact map stored as a bitset, with the elements of each row
+        packed in 64-bit words, so that contact maps are compared by counting
+        the bits of the words
+    """
+    def __init__(self, contactMap):
+        """
+            :param contactMap: Boolean contact map
+            :type contactMap: numpy.Array
+        """
+        contactMap = np.asarray(contactMap, dtype=bool)
+        self.shape = contactMap.shape
+        packed = np.zeros((self.shape[0], 8*((self.shape[1]+63)//64)), dtype=np.uint8)
+        packed[:, :(self.shape[1]+7)//8] = np.packbits(contactMap, axis=1, bitorder="little")
+        self.words = packed.view(np.uint64)
+        self.nContacts = int(contactMap.sum())
+
+    def __getstate__(self):
+        state = {"shape": self.shape, "words": self.words, "nContacts": self.nContacts}
+        return state
+
+    def __setstate__(self, state):
+        self.shape = state["shape"]
+        self.words = state["words"]
+        self.nContacts = state["nContacts"]
+
+    def unpack(self):
+        """
+            Get the contact map as a boolean array
+
+            :returns: numpy.Array -- The contact map
+        """
+        return np.unpackbits(self.words.view(np.uint8), axis=1, count=self.shape[1], bitorder="little").astype(bool)
+
+    def countIntersection(self, other, rows):
+        """
+            Count the contacts present in both contact maps, with the rows of
+            this contact map permutated
+
+            :param other: Contact map to compare
+            :type other: :py:class:`.PackedContactMap`
+            :param rows: Row of this contact map that corresponds to each row of other
+            :type rows: numpy.Array
+            :returns: int -- Number of contacts in both contact maps
+        """
+        return countBits(self.words, rows, other.words, np.arange(other.shape[0], dtype=np.intp), False)
+
+    def countDifference(self, other, rows):
+        """
+            Count the contacts present in only one of the contact maps, with
+            the rows of this contact map permutated
+
+            :param other: Contact map to compare
+            :type other: :py:class:`.PackedContactMap`
+            :param rows: Row of this contact map that corresponds to each row of other
+            :type rows: numpy.Array
+            :returns: int -- Number of contacts in only one of the contact maps
+        """
+        return countBits(self.words, rows, other.words, np.arange(other.shape[0], dtype=np.intp), True)
+
+    def countRowDifference(self, Py_ssize_t row, other, Py_ssize_t otherRow):
+        """
+            Count the elements that differ between a row of this contact map
+            and a row of other
+
+            :param row: Row of this contact map
+            :type row: int
+            :param other: Contact map to compare
+            :type other: :py:class:`.PackedContactMap`
+            :param otherRow: Row of other
+            :type otherRow: int
+            :returns: int -- Number of different elements
+        """
+        return countBits(self.words, np.array([row], dtype=np.intp), other.words, np.array([otherRow], dtype=np.intp), True)
+
+
+def asPackedContactMap(contactMap):
+    """
+        Get a contact map as a :py:class:`.PackedContactMap`, packing it if
+        it is a boolean array
+
+        :param contactMap: Contact map
+        :type contactMap: numpy.Array or :py:class:`.PackedContactMap`
+        :returns: :py:class:`.PackedContactMap` -- The packed contact map
+    """
+    if contactMap is None or isinstance(contactMap, PackedContactMap):
+        return contactMap
+    return PackedContactMap(contactMap)
+
+
+def calculatePackedCorrelation(contactMap, clusterContactMap, rows):
+    """
+        Calculate the correlation of two packed contactMaps, with the rows of
+        the first one permutated, from the number of contacts of each one and
+        of their intersection
+    """
+    total1 = contactMap.nContacts
+    total2 = clusterContactMap.nContacts
+    if not total1 or not total2:
+        # if any array is all zeros the correlation will be NaN
+        # if both are zero, correlation is perfect (i.e 1) else it is different
+        # and will be in different clusters
+        return total1 == total2
+    size = float(contactMap.shape[0]*contactMap.shape[1])
+    intersection = contactMap.countIntersection(clusterContactMap, rows)
+    covariance = intersection/size - (total1/size)*(total2/size)
+    variance1 = total1/size - (total1/size)**2
+    variance2 = total2/size - (total2/size)**2
+    if not variance1 or not variance2:
+        # contact maps full of contacts, as in numpy.corrcoef
+        return np.nan
+    return covariance/np.sqrt(variance1*variance2)
 
 
 def calculateCorrelationContactMaps(contactMap, clusterContactMap):
@@ -4,8 +4,19 @@ cdef class Atom:
     cdef public bint protein
 
 cdef class PDB:
-    cdef public dict atoms
-    cdef public list atomList, com, centroid
+    cdef dict _atoms
+    cdef list _atomList
+    cdef public dict atomIndex
+    cdef public list atomSerials, atomNames, resnames, resChains, resnums, atomTypes
+    cdef public object coords, masses, heavyFlags, proteinFlags
+    cdef public list com, centroid
     cdef public double totalMass
-    cdef public object pdb
+    cdef object _pdb, _topology, _frame, _renames
     cdef public bint ispdb
+    cdef Atom _buildAtom(self, int index)
+    cdef void _appendAtom(self, bint isProtein, basestring atomSerial, basestring atomName, basestring resName, basestring resNum, basestring resChain, basestring atomType, list coordinates, double x, double y, double z)
+    cdef void _setArrays(self, list coordinates)
+    cdef void _setFrame(self, list topology, object frame)
+    cdef void _copyAtoms(self, PDB template, object coordinates)
+
+cdef double squaredDistanceSum(double[:, ::1] coords1, Py_ssize_t[::1] rows1, double[:, ::1] coords2, Py_ssize_t[::1] rows2) nogil
@@ -4,7 +4,7 @@ import re
 from io import StringIO, open
 cimport cython
 cimport numpy as np
-from libc.math cimport abs
+from libc.math cimport abs, floor, sqrt
 # try:
 #     # Check if the basestring type if available, this will fail in python3
 #     basestring
@@ -142,6 +142,16 @@ _AMINO_ACID_CODES =  {'ACE': None, 'NME':  None, '00C': 'C', '01W':  'X', '02K':
 'Y', 'YTH':  'T', 'Z01': 'A',  'ZAL': 'A', 'ZCL':  'F', 'ZFB': 'X',  'ZU0': 'T',
 'ZZJ': 'A'}
 
+# selection templates of the structures loaded from non-pdb trajectories, for
+# each topology (by identity) a dictionary with the PDB holding the selected
+# atoms and their indices in the topology, keyed by the selection parameters
+_selectionTemplates = {}
+_MAX_TEMPLATE_TOPOLOGIES = 20
+# selection templates of the structures loaded from pdb contents, keyed by the
+# selection parameters: the PDB with the selected atoms, the number of lines
+# of the contents, the line of each selected atom and its first 27 columns
+_contentsSelectionTemplates = {}
+
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
@@ -415,6 +425,284 @@ cdef class Atom:
         return (self.x - atom2.x)**2 + (self.y - atom2.y)**2 + (self.z - atom2.z)**2
 
 
+cdef double getAtomMass(basestring atomType, basestring atomName):
+    """
+        Get the mass of an atom from its type, guessing it from its name if
+        the type is not known
+
+        :param atomType: Element of the atom
+        :type atomType: basestring
+        :param atomName: Name of the atom
+        :type atomName: basestring
+        :returns: float -- Mass of the atom
+    """
+    if atomType in Atom._ATOM_WEIGHTS:
+        return Atom._ATOM_WEIGHTS[atomType]
+    print("WARNING!: Information about atom type not available, trying to guess from its name, mass properties might be wrong.")
+    return Atom._ATOM_WEIGHTS[atomName[0]]
+
+
+cdef dict getSelectionTemplates(list topology):
+    """
+        Get the selection templates cached for a topology
+
+        :param topology: Topology of the structures
+        :type topology: list
+        :returns: dict -- Templates of the topology, keyed by the selection parameters
+    """
+    cached = _selectionTemplates.get(id(topology))
+    # the topology is kept in the cache so its id can not be reused
+    if cached is None or cached[0] is not topology:
+        if len(_selectionTemplates) >= _MAX_TEMPLATE_TOPOLOGIES:
+            _selectionTemplates.clear()
+        cached = (topology, {})
+        _selectionTemplates[id(topology)] = cached
+    return cached[1]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef double squaredDistanceSum(double[:, ::1] coords1, Py_ssize_t[::1] rows1, double[:, ::1] coords2, Py_ssize_t[::1] rows2) nogil:
+    """
+        Sum the squared distances between the pairs of atoms
+        (coords1[rows1[i]], coords2[rows2[i]])
+    """
+    cdef Py_ssize_t i, j, k
+    cdef double dx, dy, dz, total = 0.0
+    for i in range(rows1.shape[0]):
+        j = rows1[i]
+        k = rows2[i]
+        dx = coords1[j, 0] - coords2[k, 0]
+        dy = coords1[j, 1] - coords2[k, 1]
+        dz = coords1[j, 2] - coords2[k, 2]
+        total += dx*dx + dy*dy + dz*dz
+    return total
+
+
+cdef tuple buildCellList(object coords, double cutoff):
+    """
+        Sort the atoms in the cells of a uniform grid whose cells are at least
+        cutoff wide, so that the atoms closer than cutoff to a point are in
+        the cell of the point or in its neighbouring cells
+
+        :param coords: Coordinates of the atoms
+        :type coords: numpy.Array
+        :param cutoff: Minimum size of the cells
+        :type cutoff: float
+        :returns: numpy.Array, float, numpy.Array, numpy.Array, numpy.Array --
+            Origin of the grid, size of the cells, number of cells in each
+            dimension, atoms sorted by cell and offset of the first atom of
+            each cell in the sorted atoms
+    """
+    cdef double cellSize = cutoff
+    origin = coords.min(axis=0)
+    extent = coords.max(axis=0)-origin
+    dims = (extent/cellSize).astype(np.intp)+1
+    # avoid sparse grids when the atoms are spread over a large region
+    while dims.prod() > 8*len(coords)+512:
+        cellSize *= 2
+        dims = (extent/cellSize).astype(np.intp)+1
+    cells = ((coords-origin)/cellSize).astype(np.intp)
+    flatCells = (cells[:, 0]*dims[1]+cells[:, 1])*dims[2]+cells[:, 2]
+    order = np.argsort(flatCells, kind="mergesort").astype(np.intp)
+    cellStarts = np.searchsorted(flatCells[order], np.arange(dims.prod()+1)).astype(np.intp)
+    return origin, cellSize, dims, order, cellStarts
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cdef void cellListContacts(double[:, ::1] ligandCoords, double[:, ::1] proteinCoords, double[::1] origin, double cellSize, Py_ssize_t[::1] dims, Py_ssize_t[::1] order, Py_ssize_t[::1] cellStarts, double contactThresholdDistance2, double countThresholdDistance2, bint buildMap, np.uint8_t[:, ::1] contactMap, np.uint8_t[::1] countMask) nogil:
+    """
+        Check the ligand atoms against the protein atoms of their neighbouring
+        cells, filling the contact map (if buildMap) and flagging the protein
+        atoms within the count threshold
+    """
+    cdef Py_ssize_t i, j, k, cx, cy, cz, ix, iy, iz, cell
+    cdef double dx, dy, dz, d2
+    for i in range(ligandCoords.shape[0]):
+        cx = <Py_ssize_t>floor((ligandCoords[i, 0]-origin[0])/cellSize)
+        cy = <Py_ssize_t>floor((ligandCoords[i, 1]-origin[1])/cellSize)
+        cz = <Py_ssize_t>floor((ligandCoords[i, 2]-origin[2])/cellSize)
+        for ix in range(max(cx-1, 0), min(cx+2, dims[0])):
+            for iy in range(max(cy-1, 0), min(cy+2, dims[1])):
+                for iz in range(max(cz-1, 0), min(cz+2, dims[2])):
+                    cell = (ix*dims[1]+iy)*dims[2]+iz
+                    for k in range(cellStarts[cell], cellStarts[cell+1]):
+                        j = order[k]
+                        dx = ligandCoords[i, 0] - proteinCoords[j, 0]
+                        dy = ligandCoords[i, 1] - proteinCoords[j, 1]
+                        dz = ligandCoords[i, 2] - proteinCoords[j, 2]
+                        d2 = dx*dx + dy*dy + dz*dz
+                        if buildMap and (d2 - contactThresholdDistance2) < 0.1:
+                            contactMap[i, j] = 1
+                        if (d2 - countThresholdDistance2) < 0.1:
+                            countMask[j] = 1
+
+
+def computeContactMap(double[:, ::1] ligandCoords, double[:, ::1] proteinCoords, double contactThresholdDistance2, double countThresholdDistance2):
+    """
+        Compute the contact map of the ligand and protein atoms and find the
+        protein atoms in contact with the ligand at a second threshold, in a
+        single pass over a cell list of the protein atoms. Two atoms are in
+        contact if their squared distance is less than the squared threshold
+        (with a tolerance of 0.1)
+
+        :param ligandCoords: Coordinates of the ligand atoms
+        :type ligandCoords: numpy.Array
+        :param proteinCoords: Coordinates of the protein atoms
+        :type proteinCoords: numpy.Array
+        :param contactThresholdDistance2: Squared distance at which two atoms are considered in contact in the contact map
+        :type contactThresholdDistance2: float
+        :param countThresholdDistance2: Squared distance at which the protein atoms are considered in contact with the ligand
+        :type countThresholdDistance2: float
+        :returns: numpy.Array, numpy.Array -- Contact map (ligand atoms as
+            rows, protein atoms as columns) and boolean array flagging the
+            protein atoms in contact with the ligand
+    """
+    cdef np.ndarray[np.uint8_t, ndim=2] contactMap = np.zeros((ligandCoords.shape[0], proteinCoords.shape[0]), dtype=np.uint8)
+    cdef np.ndarray[np.uint8_t, ndim=1] countMask = np.zeros(proteinCoords.shape[0], dtype=np.uint8)
+    cdef np.uint8_t[:, ::1] contactMapView = contactMap
+    cdef np.uint8_t[::1] countMaskView = countMask
+    cdef double[::1] origin
+    cdef double cellSize
+    cdef Py_ssize_t[::1] dims, order, cellStarts
+    if ligandCoords.shape[0] and proteinCoords.shape[0]:
+        cellList = buildCellList(np.asarray(proteinCoords), sqrt(max(contactThresholdDistance2, countThresholdDistance2)+0.1))
+        origin, cellSize, dims, order, cellStarts = cellList
+        with nogil:
+            cellListContacts(ligandCoords, proteinCoords, origin, cellSize, dims, order, cellStarts, contactThresholdDistance2, countThresholdDistance2, True, contactMapView, countMaskView)
+    return contactMap, countMask.view(bool)
+
+
+def computeContactsMask(double[:, ::1] ligandCoords, double[:, ::1] proteinCoords, double contactThresholdDistance2):
+    """
+        Find which protein atoms are in contact with any of the ligand atoms
+
+        :param ligandCoords: Coordinates of the ligand atoms
+        :type ligandCoords: numpy.Array
+        :param proteinCoords: Coordinates of the protein atoms
+        :type proteinCoords: numpy.Array
+        :param contactThresholdDistance2: Squared distance at which two atoms are considered in contact
+        :type contactThresholdDistance2: float
+        :returns: numpy.Array -- Boolean array flagging the protein atoms in contact with the ligand
+    """
+    cdef np.ndarray[np.uint8_t, ndim=2] contactMap = np.zeros((1, 1), dtype=np.uint8)
+    cdef np.ndarray[np.uint8_t, ndim=1] mask = np.zeros(proteinCoords.shape[0], dtype=np.uint8)
+    cdef np.uint8_t[:, ::1] contactMapView = contactMap
+    cdef np.uint8_t[::1] maskView = mask
+    cdef double[::1] origin
+    cdef double cellSize
+    cdef Py_ssize_t[::1] dims, order, cellStarts
+    if ligandCoords.shape[0] and proteinCoords.shape[0]:
+        cellList = buildCellList(np.asarray(proteinCoords), sqrt(contactThresholdDistance2+0.1))
+        origin, cellSize, dims, order, cellStarts = cellList
+        with nogil:
+            cellListContacts(ligandCoords, proteinCoords, origin, cellSize, dims, order, cellStarts, contactThresholdDistance2, contactThresholdDistance2, False, contactMapView, maskView)
+    return mask.view(bool)
+
+
+cdef list getAtomLines(basestring contents):
+    """
+        Split the pdb contents in lines from its first atom record on, so that
+        the lines of structures with the same atoms are numbered the same
+        regardless of their headers
+
+        :param contents: Contents of a pdb
+        :type contents: basestring
+        :returns: list -- Lines of the contents from the first atom record
+    """
+    cdef Py_ssize_t firstAtom = len(contents), position
+    for record in (u"ATOM", u"HETATM"):
+        if contents.startswith(record):
+            firstAtom = 0
+            break
+        position = contents.find(u"\n" + record)
+        if position != -1:
+            firstAtom = min(firstAtom, position+1)
+    return contents[firstAtom:].split(u"\n")
+
+
+cdef basestring renameAtomSerials(basestring contents, list serials, list newSerials):
+    """
+        Rename the atom serials of the atom records of the pdb contents
+
+        :param contents: Contents of a pdb
+        :type contents: basestring
+        :param serials: Serials of the atoms to rename, in the order of the records
+        :type serials: list
+        :param newSerials: New serial of each atom
+        :type newSerials: list
+        :returns: basestring -- The renamed contents
+    """
+    cdef list lines = contents.split(u"\n")
+    cdef basestring line
+    cdef int lineNum, i = 0
+    for lineNum in range(len(lines)):
+        if i == len(serials):
+            break
+        line = lines[lineNum]
+        if (line.startswith(u"ATOM") or line.startswith(u"HETATM")) and line[6:11].strip() == serials[i]:
+            lines[lineNum] = line[:6] + newSerials[i].rjust(5) + line[11:]
+            i += 1
+    return u"\n".join(lines)
+
+
+cdef tuple buildContentsTemplate(PDB selection, list lines):
+    """
+        Find the lines of the pdb contents that hold the atoms of a selection
+
+        :param selection: PDB with the selected atoms of the contents
+        :type selection: PDB
+        :param lines: Lines of the pdb contents (see getAtomLines)
+        :type lines: list
+        :returns: tuple -- Selection template, None if the lines of the atoms
+            can not be univocally identified
+    """
+    cdef list selectedLines = [-1 for _ in range(len(selection))]
+    cdef basestring line
+    cdef int lineNum
+    cdef PDB template
+    for lineNum in range(len(lines)):
+        line = lines[lineNum]
+        if not line.startswith(u"ATOM") and not line.startswith(u"HETATM"):
+            continue
+        row = selection.atomIndex.get(line[6:11].strip() + u":" + line[12:16].strip() + u":" + line[17:20].strip())
+        if row is None:
+            continue
+        if selectedLines[row] != -1:
+            # repeated atom identifiers
+            return None
+        selectedLines[row] = lineNum
+    if -1 in selectedLines:
+        return None
+    template = PDB()
+    template.initialiseFromTemplate(selection, selection.coords, None, True)
+    return template, len(lines), selectedLines, [lines[lineNum][:27] for lineNum in selectedLines]
+
+
+cdef object getTemplateCoordinates(tuple template, list lines):
+    """
+        Parse the coordinates of the selected atoms of a selection template,
+        None if the lines do not hold the same atoms
+    """
+    cdef list selectedLines = template[2], identifiers = template[3]
+    cdef basestring line
+    cdef int i
+    cdef np.ndarray[double, ndim=2] coordinates
+    if len(lines) != template[1]:
+        return None
+    coordinates = np.empty((len(selectedLines), 3))
+    for i in range(len(selectedLines)):
+        line = lines[selectedLines[i]]
+        if line[:27] != identifiers[i]:
+            return None
+        coordinates[i, 0] = float(line[30:38])
+        coordinates[i, 1] = float(line[38:46])
+        coordinates[i, 2] = float(line[46:54])
+    return coordinates
+
+
 cdef class PDB:
     _typeProtein = u"PROTEIN"
     _typeHetero = u"HETERO"
@@ -430,24 +718,145 @@ cdef class PDB:
                u"ASP": u"OD1", u"GLU": u"OE1", u"GLY": u"empty"}
     ATOM_LINE_TEMPLATE = u"%s%s %s %s %s%s%s   %.3f%.3f%.3f%.2f%.2f          %s   "
 
-    
+
     def __init__(self):
         """
             Object that will contain the information of a PDB file. Has to call
             the initialise method to load the file
+
+            The atoms are stored as parallel arrays, one row per atom in the
+            order of atomList: the coordinates in a contiguous (n_atoms, 3)
+            float64 array (coords), the masses and the heavy/protein flags in
+            numpy arrays and the rest of the atom information in lists of
+            strings. The Atom objects (atoms attribute) are only built when
+            requested
         """
-        self.atoms = {}
+        self._atoms = None
         # {atomId: atom, ...}
         # Where atomId := serial:atomName:resName
+        self._atomList = []
+        # {atomId: row, ...} index of each atom in the arrays
+        self.atomIndex = {}
+        self.atomSerials = []
+        self.atomNames = []
+        self.resnames = []
+        self.resChains = []
+        self.resnums = []
+        self.atomTypes = []
+        self.coords = np.zeros((0, 3))
+        self.masses = np.zeros(0)
+        self.heavyFlags = np.zeros(0, dtype=bool)
+        self.proteinFlags = np.zeros(0, dtype=bool)
         self.totalMass = 0
         # ensure every string is unicode
-        self.pdb = None
+        self._pdb = None
+        # topology and frame of the structures loaded from non-pdb
+        # trajectories, used to build the pdb contents when needed
+        self._topology = None
+        self._frame = None
+        # serials of the atoms in the pdb contents and row of each atom in
+        # the contents, for structures whose atoms have been renamed (see
+        # alignToReference)
+        self._renames = None
         self.com = None
         self.centroid = None
         self.ispdb = False
 
-        # Necessary for contactMaps
-        self.atomList = []
+    property atoms:
+        """
+            Dictionary of Atom objects keyed by atom id, built from the
+            coordinates arrays the first time it is accessed
+        """
+        def __get__(self):
+            cdef int i
+            if self._atoms is None:
+                self._atoms = {}
+                for i in range(len(self._atomList)):
+                    self._atoms[self._atomList[i]] = self._buildAtom(i)
+            return self._atoms
+
+        def __set__(self, dict atoms):
+            self._atoms = atoms
+
+    property pdb:
+        """
+            Contents of the structure in pdb format. For structures loaded
+            from non-pdb trajectories it is built from the topology the first
+            time it is accessed, the same as the renaming of the atoms
+        """
+        def __get__(self):
+            cdef list newSerials
+            cdef int i
+            if self._pdb is None and self._frame is not None:
+                self._pdb = self.join_PDB_lines(self._topology, self._frame)
+                self._topology = None
+                self._frame = None
+            if self._renames is not None:
+                # atoms left out by the renaming keep their serials
+                newSerials = list(self._renames[0])
+                for i in range(len(self._renames[1])):
+                    newSerials[self._renames[1][i]] = self.atomSerials[i]
+                self._pdb = renameAtomSerials(self._pdb, self._renames[0], newSerials)
+                self._renames = None
+            return self._pdb
+
+        def __set__(self, object PDBContent):
+            self._pdb = PDBContent
+            self._topology = None
+            self._frame = None
+            self._renames = None
+
+    property atomList:
+        """
+            List of the atom ids, in the same order as the rows of the
+            coordinates arrays
+        """
+        def __get__(self):
+            return self._atomList
+
+        def __set__(self, list atomList):
+            # renaming the atoms does not modify the order of the rows
+            if len(atomList) != len(self._atomList):
+                raise ValueError("The new atom list has %d atoms, while the PDB has %d" % (len(atomList), len(self._atomList)))
+            self._atomList = atomList
+            self.atomIndex = {atomId: i for i, atomId in enumerate(atomList)}
+
+    cdef Atom _buildAtom(self, int index):
+        cdef Atom atom = Atom()
+        atom.atomSerial = self.atomSerials[index]
+        atom.name = self.atomNames[index]
+        atom.resname = self.resnames[index]
+        atom.resChain = self.resChains[index]
+        atom.resnum = self.resnums[index]
+        atom.type = self.atomTypes[index]
+        atom.mass = self.masses[index]
+        atom.protein = self.proteinFlags[index]
+        atom.x = self.coords[index, 0]
+        atom.y = self.coords[index, 1]
+        atom.z = self.coords[index, 2]
+        atom.id = self._atomList[index]
+        return atom
+
+    cdef void _appendAtom(self, bint isProtein, basestring atomSerial, basestring atomName, basestring resName, basestring resNum, basestring resChain, basestring atomType, list coordinates, double x, double y, double z):
+        cdef basestring atomId = atomSerial + u":" + atomName + u":" + resName
+        self.atomIndex[atomId] = len(self._atomList)
+        self._atomList.append(atomId)
+        self.atomSerials.append(atomSerial)
+        self.atomNames.append(atomName)
+        self.resnames.append(resName)
+        self.resChains.append(resChain)
+        self.resnums.append(resNum)
+        self.atomTypes.append(atomType)
+        self.masses.append(getAtomMass(atomType, atomName))
+        self.proteinFlags.append(isProtein)
+        coordinates.append((x, y, z))
+
+    cdef void _setArrays(self, list coordinates):
+        # masses and flags are accumulated in lists while parsing
+        self.coords = np.array(coordinates, dtype=np.float64).reshape((-1, 3))
+        self.masses = np.array(self.masses, dtype=np.float64)
+        self.proteinFlags = np.array(self.proteinFlags, dtype=bool)
+        self.heavyFlags = np.array([atomType != u"H" for atomType in self.atomTypes], dtype=bool)
 
     def __richcmp__(self, object other, int op):
         """
@@ -480,21 +889,63 @@ cdef class PDB:
 
     def __getstate__(self):
         # Copy the object's state from
-        state = {u"atoms": self.atoms, u"atomList": self.atomList,
+        state = {u"atomList": self._atomList, u"atomSerials": self.atomSerials,
+                 u"atomNames": self.atomNames, u"resnames": self.resnames,
+                 u"resChains": self.resChains, u"resnums": self.resnums,
+                 u"atomTypes": self.atomTypes, u"coords": self.coords,
+                 u"masses": self.masses, u"heavyFlags": self.heavyFlags,
+                 u"proteinFlags": self.proteinFlags,
                  u"com": self.com, u"centroid": self.centroid,
-                 u"totalMass": self.totalMass, u"pdb": self.pdb,
-                 u"ispdb": self.ispdb}
+                 u"totalMass": self.totalMass, u"pdb": self._pdb,
+                 u"topology": self._topology, u"frame": self._frame,
+                 u"renames": self._renames, u"ispdb": self.ispdb}
         return state
 
     def __setstate__(self, state):
         # Restore instance attributes
-        self.atoms = state[u'atoms']
-        self.atomList = state[u'atomList']
+        cdef Atom atom
+        cdef list coordinates
+        self._atoms = None
         self.com = state.get(u'com')
         self.centroid = state.get(u'centroid')
         self.totalMass = state[u'totalMass']
-        self.pdb = state[u'pdb']
+        self._pdb = state[u'pdb']
+        self._topology = state.get(u'topology')
+        self._frame = state.get(u'frame')
+        self._renames = state.get(u'renames')
         self.ispdb = state.get(u'ispdb', True)
+        if u'coords' in state:
+            self._atomList = state[u'atomList']
+            self.atomIndex = {atomId: i for i, atomId in enumerate(self._atomList)}
+            self.atomSerials = state[u'atomSerials']
+            self.atomNames = state[u'atomNames']
+            self.resnames = state[u'resnames']
+            self.resChains = state[u'resChains']
+            self.resnums = state[u'resnums']
+            self.atomTypes = state[u'atomTypes']
+            self.coords = np.ascontiguousarray(state[u'coords'], dtype=np.float64)
+            self.masses = state[u'masses']
+            self.heavyFlags = state[u'heavyFlags']
+            self.proteinFlags = state[u'proteinFlags']
+        else:
+            # objects pickled before the array-based storage, rebuild the
+            # arrays from the Atom objects
+            self._atomList = []
+            self.atomIndex = {}
+            self.atomSerials = []
+            self.atomNames = []
+            self.resnames = []
+            self.resChains = []
+            self.resnums = []
+            self.atomTypes = []
+            self.masses = []
+            self.proteinFlags = []
+            coordinates = []
+            for atomId in state[u'atomList']:
+                atom = state[u'atoms'][atomId]
+                self._appendAtom(atom.protein, atom.atomSerial, atom.name, atom.resname, atom.resnum, atom.resChain, atom.type, coordinates, atom.x, atom.y, atom.z)
+                self.masses[-1] = atom.mass
+            self._setArrays(coordinates)
 
     def isfromPDBFile(self):
         return self.ispdb
@@ -521,10 +972,10 @@ cdef class PDB:
             :raises: ValueError if the pdb contained no atoms
         """
         cdef object PDBContent
-        cdef list stringWithPDBContent
+        cdef list stringWithPDBContent, coordinates
         cdef int atomLineNum, pdb_lines
-        cdef basestring atomName, resName, atomLine, resnumStr
-        cdef Atom atom
+        cdef basestring atomName, resName, atomLine, resnumStr, atomType
+        cdef bint isProtein
         if resnum == 0:
             resnumStr = u""
         else:
@@ -545,6 +996,9 @@ cdef class PDB:
             # path which does not exist
             raise ValueError("Input file not found!!")
         pdb_lines = 0
+        coordinates = []
+        self.masses = []
+        self.proteinFlags = []
         for atomLine in stringWithPDBContent:
             if not atomLine.startswith(u"ATOM") and not atomLine.startswith(u"HETATM"):
                 continue
@@ -569,19 +1023,20 @@ cdef class PDB:
                 if element != u"" and not atomLine[76:78].strip() == element:
                     continue
 
-            atom = Atom(atomLine)
-            # Here atom will be not null, empty or not.
-            # With "try", we prune empty atoms
-            try:
-                if (not heavyAtoms or atom.isHeavyAtom()) and\
-                   (type == self._typeAll or type == self._typeCM or (type == self._typeProtein and atom.isProtein()) or (type == self._typeHetero and atom.isHeteroAtom())):
-                        self.atoms.update({atom.id: atom})
-                        self.atomList.append(atom.id)
-            except:
-                pass
+            isProtein = atomLine.startswith(u'ATOM')
+            atomType = re.sub(REGEX_PATTERN, u"", atomLine[76:80]).strip().upper()
+            if heavyAtoms and atomType == u"H":
+                continue
+            if (type == self._typeProtein and not isProtein) or (type == self._typeHetero and isProtein):
+                continue
+            self._appendAtom(isProtein, atomLine[6:11].strip(), atomLine[12:16].strip(),
+                             atomLine[17:20].strip(), atomLine[22:26].strip(), atomLine[21],
+                             atomType, coordinates, float(atomLine[30:38]),
+                             float(atomLine[38:46]), float(atomLine[46:54]))
+        self._setArrays(coordinates)
         if pdb_lines == 0:
             raise ValueError("Input pdb was malformed or empty!!")
-        if self.atoms == {}:
+        if not self._atomList:
             raise ValueError('Nothing found in the input coordinates, please check your selection!')
 
     def _initialiseXTC(self, np.ndarray[float, ndim=2] frame, bint heavyAtoms=True, basestring resname=u"", basestring atomname=u"", basestring type=u"ALL", basestring chain=u"", int resnum = 0, basestring element=u"", list topology=None, dict extra_atoms={}):
@@ -605,22 +1060,35 @@ cdef class PDB:
             :raises: ValueError if the pdb contained no atoms
         """
         cdef int atomLineNum, atomIndex
-        cdef basestring atomName, resName, atomLine, resnumStr, selection_string, element_atom, atomSerial, resChain
-        cdef Atom atom
+        cdef basestring atomName, resName, atomLine, resnumStr, selection_string, element_atom
         cdef bint isProtein
-        cdef float x, y, z
         cdef int iatom
+        cdef list coordinates, selectedAtoms
+        cdef dict templates
+        cdef PDB template
+        if len(frame) != len(topology):
+            raise ValueError("Input coordinates and topology do not match!!!")
+        # the selection is resolved only once for each topology, the
+        # following frames just take the coordinates of the selected atoms
+        templates = getSelectionTemplates(topology)
+        selectionKey = (heavyAtoms, resname, atomname, type, chain, resnum, element, tuple(sorted(extra_atoms.items())))
+        if selectionKey in templates:
+            template, selectedAtomsArray = templates[selectionKey]
+            self.initialiseFromTemplate(template, frame[selectedAtomsArray], None, False)
+            self._setFrame(topology, frame)
+            return
         if resnum == 0:
             resnumStr = u""
         else:
             resnumStr = u"%d" % (resnum)
-        self.pdb = self.join_PDB_lines(topology, frame)  # in case one wants to write it
-        if len(frame) != len(topology):
-            raise ValueError("Input coordinates and topology do not match!!!")
         if extra_atoms != {}:
             CMAtoms = extra_atoms
         else:
             CMAtoms = self.CMAtoms
+        coordinates = []
+        selectedAtoms = []
+        self.masses = []
+        self.proteinFlags = []
         for iatom in range(len(topology)):
             atomLine = topology[iatom]
             if not atomLine.startswith(u"ATOM") and not atomLine.startswith(u"HETATM"):
@@ -645,26 +1113,40 @@ cdef class PDB:
                 if element != u"" and not atomLine[58:60].strip() == element:
                     continue
             isProtein = atomLine[:4] == u"ATOM"
-            atomSerial = atomLine[6:11].strip()
-            atomName = atomLine[12:16].strip()
-            resName = atomLine[17:20].strip()
-            resNum = atomLine[22:26].strip()
-            resChain = atomLine[21]
-            x = frame[iatom, 0]
-            y = frame[iatom, 1]
-            z = frame[iatom, 2]
             # due to the way the topology object is extracted the positions of
             # the element in 58-60
             element_atom = atomLine[58:60].strip().upper()
-            atom = Atom()
-            atom.set_properties(isProtein, atomSerial, atomName, resName, resNum, x, y, z, element_atom, resChain)
-            if (not heavyAtoms or atom.isHeavyAtom()) and\
-                (type == self._typeAll or type == self._typeCM or (type == self._typeProtein and atom.isProtein()) or (type == self._typeHetero and atom.isHeteroAtom())):
-
-                self.atoms.update({atom.id: atom})
-                self.atomList.append(atom.id)
-        if self.atoms == {}:
+            if heavyAtoms and element_atom == u"H":
+                continue
+            if (type == self._typeProtein and not isProtein) or (type == self._typeHetero and isProtein):
+                continue
+            self._appendAtom(isProtein, atomLine[6:11].strip(), atomLine[12:16].strip(),
+                             atomLine[17:20].strip(), atomLine[22:26].strip(), atomLine[21],
+                             element_atom, coordinates, frame[iatom, 0], frame[iatom, 1],
+                             frame[iatom, 2])
+            selectedAtoms.append(iatom)
+        self._setArrays(coordinates)
+        if not self._atomList:
             raise ValueError('Nothing found in the input coordinates, please check your selection!')
+        self._setFrame(topology, frame)
+        template = PDB()
+        template.initialiseFromTemplate(self, self.coords, None, False)
+        templates[selectionKey] = (template, np.array(selectedAtoms, dtype=np.intp))
+
+    cdef void _setFrame(self, list topology, object frame):
+        # keep the whole frame, it is needed to build the pdb contents if they
+        # are requested. Frames that are views (e.g. of the whole trajectory)
+        # are copied, so that the structure does not keep the trajectory
+        # alive, otherwise they are shared since they are never modified in
+        # place. The float64 coordinates of the selected atoms are a
+        # separate copy
+        self._pdb = None
+        self._renames = None
+        self._topology = topology
+        if frame.base is None:
+            self._frame = frame
+        else:
+            self._frame = np.array(frame)
 
     def initialise(self, object coordinates, bint heavyAtoms=True, basestring resname=u"", basestring atomname=u"", basestring type=u"ALL", basestring chain=u"", int resnum = 0, basestring element=u"", list topology=None, dict extra_atoms={}):
         """
@@ -677,15 +1159,151 @@ cdef class PDB:
             self.ispdb = False
             self._initialiseXTC(coordinates, heavyAtoms, resname, atomname, type, chain, resnum, element, topology=topology, extra_atoms=extra_atoms)
 
+    def initialiseFromTemplate(self, PDB template, object coordinates, object PDBContent, bint ispdb=True):
+        """
+            Load a structure with the same atoms as template (e.g. another
+            snapshot of the same trajectory and selection), reusing its atom
+            information and setting only the coordinates
+
+            :param template: PDB with the selected atoms
+            :type template: PDB
+            :param coordinates: Coordinates of the atoms, in the order of the atomList of template
+            :type coordinates: numpy.Array
+            :param PDBContent: Contents of the structure (stored in the pdb attribute)
+            :type PDBContent: basestring
+            :param ispdb: Whether the structure comes from a pdb file
+            :type ispdb: bool
+            :raises: ValueError if the number of coordinates does not match the atoms of template
+        """
+        coordinates = np.ascontiguousarray(coordinates, dtype=np.float64).reshape((-1, 3))
+        if len(coordinates) != len(template._atomList):
+            raise ValueError("Input coordinates and template do not match!!!")
+        self._copyAtoms(template, coordinates)
+        self.pdb = PDBContent
+        self.ispdb = ispdb
+
+    def alignToReference(self, PDB reference, object rows):
+        """
+            Rename the atoms of the structure after the atoms of reference
+            (e.g. a cluster representative with a different atom numbering),
+            reordering the rows so that each atom of the structure takes the
+            information of its matching atom of reference. If the structure
+            has more atoms than reference, the atoms not in rows are left out.
+            The atom serials of the pdb contents are only renamed when the
+            contents are requested
+
+            :param reference: PDB whose atom information will be used
+            :type reference: PDB
+            :param rows: Row of the structure that matches each atom of reference
+            :type rows: numpy.Array
+            :raises: ValueError if the rows do not match the atoms of reference
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        if len(rows) != len(reference._atomList) or len(rows) > len(self._atomList):
+            raise ValueError("The structure has %d atoms, while the reference has %d" % (len(self._atomList), len(reference._atomList)))
+        if self._renames is None:
+            self._renames = (list(self.atomSerials), rows)
+        else:
+            self._renames = (self._renames[0], self._renames[1][rows])
+        self._copyAtoms(reference, self.coords[rows])
+
+    cdef void _copyAtoms(self, PDB template, object coordinates):
+        # the atom information is never modified in place (adding or removing
+        # atoms builds new lists), so it is shared with the template. The
+        # structures with the same template then share the atomList object,
+        # which lets the RMSD calculator and the atom alignments of the
+        # clustering recognise the same atom ordering without comparing the
+        # atom ids
+        self._atoms = None
+        self._atomList = template._atomList
+        self.atomIndex = template.atomIndex
+        self.atomSerials = template.atomSerials
+        self.atomNames = template.atomNames
+        self.resnames = template.resnames
+        self.resChains = template.resChains
+        self.resnums = template.resnums
+        self.atomTypes = template.atomTypes
+        self.masses = template.masses
+        self.heavyFlags = template.heavyFlags
+        self.proteinFlags = template.proteinFlags
+        self.coords = coordinates
+        self.totalMass = 0
+        self.com = None
+        self.centroid = None
+
+    def extractSelection(self, bint heavyAtoms=True, basestring resname=u"", basestring atomname=u"", basestring type=u"ALL", basestring chain=u"", int resnum=0, basestring element=u"", dict extra_atoms={}):
+        """
+            Build a PDB with another selection of the atoms of the structure,
+            (e.g. the alpha carbons of a structure loaded with only the ligand
+            atoms). The selection is resolved once and reused while the
+            structures hold the same atoms in the same lines (or share the
+            topology, for non-pdb structures), so only the coordinates of the
+            selected atoms are parsed
+
+            :param heavyAtoms: wether to consider only heavy atoms (True if onl y heavy atoms have to be considered)
+            :type heavyAtoms: bool
+            :param resname: Residue name to select from the pdb (will only select the residues with that name)
+            :type resname: basestring
+            :param atomname: Residue name to select from the pdb (will only select the atoms with that name)
+            :type atomname: basestring
+            :param type: type of atoms to select: may be ALL, PROTEIN, HETERO or CM
+            :type type: basestring
+            :param chain: Chain name to select from the pdb (will only select the atoms with that name)
+            :type chain: basestring
+            :param resnum: Residue number to select from the pdb (will only select the atoms with that name)
+            :type resnum: int
+            :returns: PDB -- Structure with the selected atoms
+        """
+        cdef PDB selection = PDB()
+        if self._pdb is None and self._frame is not None and self._renames is None:
+            selection.initialise(self._frame, heavyAtoms, resname, atomname, type, chain, resnum, element, topology=self._topology, extra_atoms=extra_atoms)
+        else:
+            selection.initialiseFromContents(self.pdb, heavyAtoms, resname, atomname, type, chain, resnum, element, extra_atoms=extra_atoms)
+        return selection
+
+    def initialiseFromContents(self, basestring PDBContent, bint heavyAtoms=True, basestring resname=u"", basestring atomname=u"", basestring type=u"ALL", basestring chain=u"", int resnum=0, basestring element=u"", dict extra_atoms={}):
+        """
+            Load the selected atoms of pdb contents, as initialise does. The
+            lines that hold the selected atoms are found once for each
+            selection, the following contents with the same atoms in the same
+            lines (e.g. the snapshots of a trajectory) only parse the
+            coordinates of those lines
+
+            :param PDBContent: Contents of the pdb
+            :type PDBContent: basestring
+            :param heavyAtoms: wether to consider only heavy atoms (True if onl y heavy atoms have to be considered)
+            :type heavyAtoms: bool
+            :param resname: Residue name to select from the pdb (will only select the residues with that name)
+            :type resname: basestring
+            :param atomname: Residue name to select from the pdb (will only select the atoms with that name)
+            :type atomname: basestring
+            :param type: type of atoms to select: may be ALL, PROTEIN, HETERO or CM
+            :type type: basestring
+            :param chain: Chain name to select from the pdb (will only select the atoms with that name)
+            :type chain: basestring
+            :param resnum: Residue number to select from the pdb (will only select the atoms with that name)
+            :type resnum: int
+        """
+        cdef list lines
+        cdef tuple template
+        selectionKey = (heavyAtoms, resname, atomname, type, chain, resnum, element, tuple(sorted(extra_atoms.items())))
+        lines = getAtomLines(PDBContent)
+        template = _contentsSelectionTemplates.get(selectionKey)
+        if template is not None:
+            coordinates = getTemplateCoordinates(template, lines)
+            if coordinates is not None:
+                self.initialiseFromTemplate(template[0], coordinates, PDBContent, True)
+                return
+        self.initialise(PDBContent, heavyAtoms, resname, atomname, type, chain, resnum, element, extra_atoms=extra_atoms)
+        template = buildContentsTemplate(self, lines)
+        if template is not None:
+            _contentsSelectionTemplates[selectionKey] = template
+
     def computeTotalMass(self):
         """
             Calculate the total mass of the PDB
         """
-        cdef int atomNum
-        self.totalMass = 0.0
-        for atomNum in range(len(self.atomList)):
-            atom = self.atoms[self.atomList[atomNum]]
-            self.totalMass += atom.mass
+        self.totalMass = self.masses.sum()
 
     def printAtoms(self):
         """
@@ -701,7 +1319,7 @@ cdef class PDB:
 
             :returns: int -- Number of atoms in the PDB
         """
-        return len(self.atoms)
+        return len(self._atomList)
 
     def getAtom(self, atomId):
         """
@@ -714,30 +1332,99 @@ cdef class PDB:
         """
         return self.atoms[atomId]
 
+    def getAtomCoords(self, atomId):
+        """
+            Get the coordinates of an Atom in the PDB by its id, without
+            building the Atom object
+
+            :param atomId: Id of the Atom (in the format "atomserial:atomName:resname")
+            :type atomId: basestring
+            :returns: numpy.Array -- Array with the coordinates of the atom
+            :raises: KeyError if the id is not in the PDB
+        """
+        return self.coords[self.atomIndex[atomId]]
+
     def __len__(self):
-        return len(self.atomList)
+        return len(self._atomList)
 
 
     def __getitem__(self, atomId):
         return self.atoms[atomId]
 
     def __setitem__(self, atomId, atom):
+        cdef int index
+        cdef Atom atomObj
+        if atomId not in self.atomIndex:
+            if not isinstance(atom, Atom):
+                raise KeyError(atomId)
+            # new atoms are added at the end of the arrays, so that the
+            # length, coordinates and atom information stay consistent
+            # (the lists may be shared with other structures, see _copyAtoms)
+            atomObj = atom
+            self.atomIndex = dict(self.atomIndex)
+            self.atomIndex[atomId] = len(self._atomList)
+            self._atomList = self._atomList + [atomId]
+            self.atomSerials = self.atomSerials + [atomObj.atomSerial]
+            self.atomNames = self.atomNames + [atomObj.name]
+            self.resnames = self.resnames + [atomObj.resname]
+            self.resChains = self.resChains + [atomObj.resChain]
+            self.resnums = self.resnums + [atomObj.resnum]
+            self.atomTypes = self.atomTypes + [atomObj.type]
+            self.coords = np.append(self.coords, [[atomObj.x, atomObj.y, atomObj.z]], axis=0)
+            self.masses = np.append(self.masses, atomObj.mass)
+            self.heavyFlags = np.append(self.heavyFlags, atomObj.type != u"H")
+            self.proteinFlags = np.append(self.proteinFlags, bool(atomObj.protein))
+            self.totalMass = 0
+            self.com = None
+            self.centroid = None
+        elif isinstance(atom, Atom):
+            atomObj = atom
+            index = self.atomIndex[atomId]
+            self.coords[index] = (atomObj.x, atomObj.y, atomObj.z)
         self.atoms[atomId] = atom
 
     def __delitem__(self, atomId):
+        cdef int index = self.atomIndex[atomId]
         self.atoms.pop(atomId)
-        self.atomList.remove(atomId)
+        # the lists may be shared with other structures, see _copyAtoms
+        self._atomList = self._atomList[:index] + self._atomList[index+1:]
+        self.atomSerials = self.atomSerials[:index] + self.atomSerials[index+1:]
+        self.atomNames = self.atomNames[:index] + self.atomNames[index+1:]
+        self.resnames = self.resnames[:index] + self.resnames[index+1:]
+        self.resChains = self.resChains[:index] + self.resChains[index+1:]
+        self.resnums = self.resnums[:index] + self.resnums[index+1:]
+        self.atomTypes = self.atomTypes[:index] + self.atomTypes[index+1:]
+        self.coords = np.delete(self.coords, index, axis=0)
+        self.masses = np.delete(self.masses, index)
+        self.heavyFlags = np.delete(self.heavyFlags, index)
+        self.proteinFlags = np.delete(self.proteinFlags, index)
+        self.atomIndex = {atomId: i for i, atomId in enumerate(self._atomList)}
+        self.totalMass = 0
 
     def __iter__(self):
         for atomId in self.atomList:
             yield self.atoms[atomId]
 
     def updateCoords(self, newCoords):
-        for atom, coords in zip(self.atomList, newCoords):
-            atomObj = self.atoms[atom]
-            atomObj.x = coords[0]
-            atomObj.y = coords[1]
-            atomObj.z = coords[2]
+        """
+            Update the coordinates of the atoms, in the order of atomList
+
+            :param newCoords: Array with the new coordinates
+            :type newCoords: numpy.Array
+        """
+        cdef int i, natoms
+        cdef Atom atomObj
+        newCoords = np.asarray(newCoords, dtype=np.float64)
+        natoms = min(len(self._atomList), len(newCoords))
+        self.coords[:natoms] = newCoords[:natoms]
+        self.com = None
+        self.centroid = None
+        if self._atoms is not None:
+            for i in range(natoms):
+                atomObj = self._atoms[self._atomList[i]]
+                atomObj.x = self.coords[i, 0]
+                atomObj.y = self.coords[i, 1]
+                atomObj.z = self.coords[i, 2]
 
     def extractCOM(self):
         """
@@ -747,20 +1434,8 @@ cdef class PDB:
         """
         if not self.totalMass:
             self.computeTotalMass()
-        cdef list COM
-        cdef int atomNum
-        COM = [0., 0., 0.]
-        for atomName in self.atoms:
-            atom = self.atoms[atomName]
-            COM[0] += atom.mass * atom.x
-            COM[1] += atom.mass * atom.y
-            COM[2] += atom.mass * atom.z
-
-        COM[0] /= self.totalMass
-        COM[1] /= self.totalMass
-        COM[2] /= self.totalMass
-        self.com = COM
-        return COM
+        self.com = (np.dot(self.masses, self.coords)/self.totalMass).tolist()
+        return self.com
 
     def getCOM(self):
         """
@@ -779,22 +1454,8 @@ cdef class PDB:
 
             :returns: List -- List with the centroid coordinates
         """
-        cdef list centroid
-        cdef double n
-        cdef int atomNum
-        centroid = [0., 0., 0.]
-        for atomNum in range(len(self.atomList)):
-            atom = self.atoms[self.atomList[atomNum]]
-            centroid[0] += atom.x
-            centroid[1] += atom.y
-            centroid[2] += atom.z
-
-        n = float(len(self.atoms))
-        centroid[0] /= n
-        centroid[1] /= n
-        centroid[2] /= n
-        self.centroid = centroid
-        return centroid
+        self.centroid = self.coords.mean(axis=0).tolist()
+        return self.centroid
 
     def getCentroid(self):
         """
@@ -865,38 +1526,19 @@ cdef class PDB:
             :type contactThresholdDistance: int
             :returns: int -- The number of alpha carbons in contact with the ligand
         """
-        cdef double contactThresholdDistance2,dist2
+        cdef double contactThresholdDistance2
         contactThresholdDistance2= contactThresholdDistance**2
 
         cdef PDB ligandPDB, alphaCarbonsPDB
 
-        ligandPDB = PDB()
-        ligandPDB.initialise(self.pdb, resname=ligandResname, resnum=ligandResnum, chain=ligandChain, heavyAtoms=True)
-
-        alphaCarbonsPDB = PDB()
-        alphaCarbonsPDB.initialise(self.pdb, element=u"C",
-                                   atomname=u"CA")
-        # count contacts
-        cdef set contacts = set([])
-        cdef int rowind, colind
-        cdef basestring proteinAtomId
-        cdef Atom ligandAtom, proteinAtom
-        # can be optimised with cell list
-        for rowind in range(len(ligandPDB.atomList)):
-            ligandAtom = ligandPDB.atoms[ligandPDB.atomList[rowind]]
-            for colind in range(len(alphaCarbonsPDB.atomList)):
-                proteinAtomId = alphaCarbonsPDB.atomList[colind]
-                if proteinAtomId in ligandPDB.atoms:
-                    # skip CA atoms that are present in the ligand, useful when
-                    # working with protein-protein complexes and using one of
-                    # the proteins as ligand
-                    continue
-                proteinAtom = alphaCarbonsPDB.atoms[proteinAtomId]
-                dist2 = ligandAtom.squaredDistance(proteinAtom)
-                if (dist2 - contactThresholdDistance2) < 0.1:
-                    contacts.update([proteinAtomId])
-
-        return len(contacts)
+        ligandPDB = self.extractSelection(resname=ligandResname, resnum=ligandResnum, chain=ligandChain, heavyAtoms=True)
+        alphaCarbonsPDB = self.extractSelection(element=u"C", atomname=u"CA")
+        # skip CA atoms that are present in the ligand, useful when working
+        # with protein-protein complexes and using one of the proteins as
+        # ligand
+        proteinRows = [i for i, proteinAtomId in enumerate(alphaCarbonsPDB.atomList) if proteinAtomId not in ligandPDB.atomIndex]
+        contactsMask = computeContactsMask(ligandPDB.coords, np.ascontiguousarray(alphaCarbonsPDB.coords[proteinRows]), contactThresholdDistance2)
+        return len(set([alphaCarbonsPDB.atomList[proteinRows[i]] for i in np.flatnonzero(contactsMask)]))
 
 
 def computeCOMDifference(PDB1, PDB2):
@@ -3,18 +3,19 @@ import os
 import sys
 import ast
 import glob
-import heapq
 import numpy as np
 import subprocess #
-from scipy import stats
+import scipy.sparse
 from builtins import range
 from six import reraise as raise_
 from AdaptivePELE.constants import blockNames
 from AdaptivePELE.utilities import utilities
+from AdaptivePELE.utilities import profiler
 from AdaptivePELE.atomset import SymmetryContactMapEvaluator as sym
 from AdaptivePELE.atomset import RMSDCalculator
 from AdaptivePELE.atomset import atomset
 from AdaptivePELE.clustering import clusteringTypes
+from AdaptivePELE.clustering import kmeans
 from AdaptivePELE.clustering import thresholdcalculator
 from AdaptivePELE.freeEnergies import extractCoords as coord
 from AdaptivePELE.freeEnergies import getRepresentativeStructures as getRepr
@@ -31,28 +32,133 @@ except ImportError:
     PARALELLIZATION = False
 
 try:
-    from AdaptivePELE.freeEnergies import cluster as pyemma_cluster
-    from AdaptivePELE.freeEnergies.estimateDG import getCentersInfo
     import pyemma.coordinates as coor
     PYEMMA = True
 except ImportError:
     PYEMMA = False
 
+# alignments between the atoms of the snapshots and those of the clusters
+# representatives (see getAtomAlignment), keyed by the identity of the
+# atomList objects of both, which are shared by the structures built from the
+# same template
+_atomAlignments = {}
+_MAX_ATOM_ALIGNMENTS = 100
+
+# parent of the nodes of the conformation network discovered from no other
+# node, and of the positions of the arrays that do not correspond to a node
+ROOT_NODE = -1
+MISSING_NODE = -2
+# number of transitions buffered before merging them with the edges of the
+# conformation network
+PENDING_EDGES_SIZE = 100000
+
+
+class CentroidCellList(object):
+    """
+        Cell list over the centroids of the clusters representative
+        structures. Each cluster is stored with its inner limit (the maximum
+        squared centroid distance for a structure to be compared with the
+        cluster), so that only the clusters whose inner limit can be satisfied
+        are returned as candidates
+    """
+    def __init__(self, cellSize=4.0):
+        """
+            :param cellSize: Length of the side of the cells (in Angstroms)
+            :type cellSize: float
+        """
+        self.cellSize = cellSize
+        self.cells = {}
+        self.centroids = []
+        self.innerLimits = []
+        self.maxInnerLimit = 0.0
+
+    def __getstate__(self):
+        state = {"cellSize": self.cellSize, "cells": self.cells,
+                 "centroids": self.centroids, "innerLimits": self.innerLimits,
+                 "maxInnerLimit": self.maxInnerLimit}
+        return state
+
+    def __setstate__(self, state):
+        # Restore instance attributes
+        self.cellSize = state.get('cellSize', 4.0)
+        self.cells = state.get('cells', {})
+        self.centroids = state.get('centroids', [])
+        self.innerLimits = state.get('innerLimits', [])
+        self.maxInnerLimit = state.get('maxInnerLimit', 0.0)
+
+    def __len__(self):
+        return len(self.centroids)
+
+    def getCell(self, centroid):
+        """
+            Get the cell that contains a point
+
+            :param centroid: Coordinates of the point
+            :type centroid: list
+            :returns: tuple -- Indices of the cell
+        """
+        return tuple(int(np.floor(coord/self.cellSize)) for coord in centroid)
+
+    def addCentroid(self, centroid, innerLimit):
+        """
+            Add the centroid of a new cluster, the clusters are indexed in
+            order of insertion
+
+            :param centroid: Coordinates of the centroid of the cluster
+            :type centroid: list
+            :param innerLimit: Maximum squared centroid distance for a structure to be compared with the cluster
+            :type innerLimit: float
+        """
+        self.cells.setdefault(self.getCell(centroid), []).append(len(self.centroids))
+        self.centroids.append(centroid)
+        self.innerLimits.append(innerLimit)
+        self.maxInnerLimit = max(self.maxInnerLimit, innerLimit)
+
+    def getCandidates(self, centroid):
+        """
+            Get the clusters that might be closer than their inner limit to a
+            centroid. The returned set is a superset of the clusters that pass
+            the centroid filter, sorted by cluster index
+
+            :param centroid: Coordinates of the centroid
+            :type centroid: list
+            :returns: list -- Sorted indices of the candidate clusters
+        """
+        if not self.centroids:
+            return []
+        # pad the search radius to be robust to rounding errors
+        reach = int(np.ceil((np.sqrt(self.maxInnerLimit)+1e-6)/self.cellSize))
+        cx, cy, cz = self.getCell(centroid)
+        candidates = []
+        if (2*reach+1)**3 > len(self.cells):
+            for (ix, iy, iz), cellClusters in self.cells.items():
+                if abs(ix-cx) <= reach and abs(iy-cy) <= reach and abs(iz-cz) <= reach:
+                    candidates.extend(cellClusters)
+        else:
+            for ix in range(cx-reach, cx+reach+1):
+                for iy in range(cy-reach, cy+reach+1):
+                    for iz in range(cz-reach, cz+reach+1):
+                        candidates.extend(self.cells.get((ix, iy, iz), []))
+        candidates.sort()
+        return candidates
+
 
 class Clusters(object):
     def __init__(self):
         self.clusters = []
+        self.centroidIndex = CentroidCellList()
 
     def __getstate__(self):
         # Defining pickling interface to avoid problems when working with old
         # simulations if the properties of the clustering-related classes have
         # changed
-        state = {"clusters": self.clusters}
+        state = {"clusters": self.clusters, "centroidIndex": self.centroidIndex}
         return state
 
     def __setstate__(self, state):
         # Restore instance attributes
         self.clusters = state['clusters']
+        self.centroidIndex = state.get('centroidIndex', CentroidCellList())
 
     def __len__(self):
         return len(self.clusters)
@@ -76,6 +182,35 @@ class Clusters(object):
             :type cluster: :py:class:`.Cluster`
         """
         self.clusters.insert(index, cluster)
+        self.resetCentroidIndex()
+
+    def resetCentroidIndex(self):
+        """
+            Discard the centroid index, it will be rebuilt the next time it is
+            needed
+        """
+        self.centroidIndex = CentroidCellList(self.centroidIndex.cellSize)
+
+    def getCandidateClusters(self, pdb, getInnerLimit):
+        """
+            Get the indices of the clusters whose centroid might be within
+            their inner limit from the centroid of pdb, in the same order as
+            they are stored. Clusters not yet in the centroid index are added
+            to it
+
+            :param pdb: Structure to compare
+            :type pdb: :py:class:`.PDB`
+            :param getInnerLimit: Function that returns the inner limit of a cluster
+            :type getInnerLimit: function
+            :returns: list -- Sorted indices of the candidate clusters
+        """
+        if len(self.centroidIndex) > len(self.clusters):
+            # some clusters were removed without going through the Clusters
+            # interface
+            self.resetCentroidIndex()
+        for cluster in self.clusters[len(self.centroidIndex):]:
+            self.centroidIndex.addCentroid(cluster.pdb.getCentroid(), getInnerLimit(cluster))
+        return self.centroidIndex.getCandidates(pdb.getCentroid())
 
     def getNumberClusters(self):
         """
@@ -114,9 +249,11 @@ class Clusters(object):
 
     def __setitem__(self, key, value):
         self.clusters[key] = value
+        self.resetCentroidIndex()
 
     def __delitem__(self, key):
         del self.clusters[key]
+        self.resetCentroidIndex()
 
     def __eq__(self, other):
         return self.clusters == other.clusters
@@ -129,73 +266,197 @@ class Clusters(object):
 class ConformationNetwork(object):
     """
         Object that contains the conformation network, a network with clusters as
-        nodes and edges representing trantions between clusters. The network is
-        stored using the networkx package[1]
+        nodes and edges representing trantions between clusters. The parent
+        and epoch of discovery of each node are stored in arrays indexed by
+        the node, and the edges as arrays of sources, targets and number of
+        transitions. The new transitions are buffered and merged with the
+        stored edges in batches. The network can be exported to the networkx
+        package[1] when needed
 
         References
         ----------
         .. [1] Networkx python package https://networkx.github.io
     """
     def __init__(self):
-        if NETWORK:
-            self.network = nx.DiGraph()
-        else:
-            self.network = None
+        self.parents = np.full(0, MISSING_NODE, dtype=np.int32)
+        self.epochs = np.full(0, -1, dtype=np.int32)
+        self.numberOfNodes = 0
+        self.sources = np.zeros(0, dtype=np.int32)
+        self.targets = np.zeros(0, dtype=np.int32)
+        self.transitions = np.zeros(0, dtype=np.int64)
+        self.pendingSources = []
+        self.pendingTargets = []
 
     def __getstate__(self):
         # Defining pickling interface to avoid problems when working with old
         # simulations if the properties of the clustering-related classes have
         # changed
-        state = {"network": self.network}
+        self.mergePendingEdges()
+        state = {"parents": self.parents[:self.numberOfNodes], "epochs": self.epochs[:self.numberOfNodes],
+                 "sources": self.sources, "targets": self.targets, "transitions": self.transitions}
         return state
 
     def __setstate__(self, state):
         # Restore instance attributes
-        self.network = state['network']
-        if NETWORK and int(nx.__version__.split(".")[0]) > 1 and 'adj' in self.network.__dict__:
-            for attr in ['node', 'adj', 'graph', 'pred', 'succ']:
-                self.network.__dict__["_"+attr] = self.network.__dict__.pop(attr)
+        self.__init__()
+        if "network" in state:
+            # old simulations stored a networkx DiGraph
+            self.addNetworkxGraph(state['network'])
+            return
+        self.parents = np.array(state['parents'], dtype=np.int32)
+        self.epochs = np.array(state.get('epochs', np.full(self.parents.size, -1)), dtype=np.int32)
+        self.numberOfNodes = self.parents.size
+        self.sources = np.array(state['sources'], dtype=np.int32)
+        self.targets = np.array(state['targets'], dtype=np.int32)
+        self.transitions = np.array(state['transitions'], dtype=np.int64)
 
-    def add_node(self, node, **kwargs):
+    def addNetworkxGraph(self, network):
         """
-            Add a node to the network (wrapper for networkx method)
+            Add the nodes and edges of a networkx graph, as stored by
+            previous versions of the conformation network. The dictionaries
+            of the graph are read directly, since their names depend on the
+            version of networkx that pickled it
+
+            :param network: Conformation network
+            :type network: networkx.DiGraph
+        """
+        if network is None:
+            return
+        attributes = network.__dict__
+        nodes = attributes.get('_node', attributes.get('node', {}))
+        successors = attributes.get('_succ', attributes.get('succ', {}))
+        for node, data in nodes.items():
+            # with networkx 2 the attributes were stored in attr_dict
+            data = data.get('attr_dict', data)
+            self.add_node(node, parent=data.get('parent', 'root'), epoch=data.get('epoch', -1))
+        sources, targets, transitions = [], [], []
+        for source, neighbours in successors.items():
+            for target, data in neighbours.items():
+                sources.append(source)
+                targets.append(target)
+                transitions.append(data.get('transition', 1))
+        self.mergeEdges(np.array(sources, dtype=np.int32), np.array(targets, dtype=np.int32), np.array(transitions, dtype=np.int64))
+
+    def add_node(self, node, parent='root', epoch=-1):
+        """
+            Add a node to the network
 
             :param node: Name of the node
             :type node: int
-            :param kwargs: Set or change attributes using key=value.
-            :type kwargs: keyword arguments, optional
+            :param parent: Node from which the node was discovered, or 'root'
+                for the nodes that were not discovered from another node
+            :type parent: int
+            :param epoch: Epoch in which the node was discovered
+            :type epoch: int
         """
-        if not NETWORK:
-            return
-        self.network.add_node(node, attr_dict=kwargs)
+        if node >= self.parents.size:
+            # the arrays grow geometrically so that adding the nodes one by
+            # one has amortized constant cost
+            size = max(node+1, 2*self.parents.size, 16)
+            self.parents = np.concatenate((self.parents, np.full(size-self.parents.size, MISSING_NODE, dtype=np.int32)))
+            self.epochs = np.concatenate((self.epochs, np.full(size-self.epochs.size, -1, dtype=np.int32)))
+        if parent == 'root':
+            parent = ROOT_NODE
+        self.parents[node] = parent
+        self.epochs[node] = epoch
+        self.numberOfNodes = max(self.numberOfNodes, node+1)
 
     def add_edge(self, source, target):
         """
-            Add an edge to the network (wrapper for networkx method)
+            Add a transition between two nodes to the network
 
             :param source: Name of the source node
             :type source: int
             :param target: Name of the target node
             :type target: int
         """
-        if not NETWORK:
+        self.pendingSources.append(source)
+        self.pendingTargets.append(target)
+        if len(self.pendingSources) >= PENDING_EDGES_SIZE:
+            self.mergePendingEdges()
+
+    def mergeEdges(self, sources, targets, transitions):
+        """
+            Add the transitions of a set of edges to the stored ones
+
+            :param sources: Source node of each edge
+            :type sources: np.ndarray
+            :param targets: Target node of each edge
+            :type targets: np.ndarray
+            :param transitions: Number of transitions of each edge
+            :type transitions: np.ndarray
+        """
+        if sources.size == 0:
             return
-        if self.network.has_edge(source, target):
-            self.network[source][target]['transition'] += 1
-        else:
-            self.network.add_edge(source, target, transition=1)
+        sources = np.concatenate((self.sources, sources))
+        targets = np.concatenate((self.targets, targets))
+        transitions = np.concatenate((self.transitions, transitions))
+        size = max(sources.max(), targets.max())+1
+        # the duplicated edges are summed when converting to csr
+        countMatrix = scipy.sparse.coo_matrix((transitions, (sources, targets)), shape=(size, size)).tocsr()
+        countMatrix.sort_indices()
+        edges = countMatrix.tocoo()
+        self.sources = edges.row.astype(np.int32)
+        self.targets = edges.col.astype(np.int32)
+        self.transitions = edges.data.astype(np.int64)
+
+    def mergePendingEdges(self):
+        """
+            Add the buffered transitions to the stored edges
+        """
+        if not self.pendingSources:
+            return
+        sources = np.array(self.pendingSources, dtype=np.int32)
+        targets = np.array(self.pendingTargets, dtype=np.int32)
+        self.pendingSources = []
+        self.pendingTargets = []
+        self.mergeEdges(sources, targets, np.ones(sources.size, dtype=np.int64))
+
+    def getEdges(self):
+        """
+            Get the edges of the network
+
+            :returns: np.ndarray, np.ndarray, np.ndarray -- Source and target
+                nodes and number of transitions of each edge, sorted by
+                source and target
+        """
+        self.mergePendingEdges()
+        return self.sources, self.targets, self.transitions
+
+    def getTransitionMatrix(self):
+        """
+            Get the number of transitions between each pair of nodes
+
+            :returns: scipy.sparse.csr_matrix -- Matrix with the number of
+                transitions from each node (rows) to each node (columns)
+        """
+        sources, targets, transitions = self.getEdges()
+        size = max(self.numberOfNodes, sources.max()+1 if sources.size else 0, targets.max()+1 if targets.size else 0)
+        return scipy.sparse.csr_matrix((transitions, (sources, targets)), shape=(size, size))
+
+    def getFDT(self):
+        """
+            Get the edges of the first discovery tree, that join each node
+            with the node from which it was discovered
+
+            :returns: np.ndarray, np.ndarray -- Parent and child of each edge
+        """
+        parents = self.parents[:self.numberOfNodes]
+        children = np.flatnonzero(parents >= 0)
+        return parents[children], children
 
     def writeConformationNetwork(self, path):
         """
-            Write the conformational network to file to visualize it
+            Write the conformational network to file to visualize it, in the
+            edgelist format of networkx
 
             :param path: Path where to write the network
             :type path: str
         """
-        if not NETWORK:
-            sys.stderr.write("Package networkx not found! Could not write network\n")
-            return
-        nx.write_edgelist(self.network, path)
+        sources, targets, transitions = self.getEdges()
+        with open(path, "w") as fw:
+            for source, target, transition in zip(sources.tolist(), targets.tolist(), transitions.tolist()):
+                fw.write("%d %d {'transition': %d}\n" % (source, target, transition))
 
     def writeFDT(self, path):
         """
@@ -205,13 +466,10 @@ class ConformationNetwork(object):
             :param path: Path where to write the network
             :type path: str
         """
-        if not NETWORK:
-            sys.stderr.write("Package networkx not found! Could not write network\n")
-            return
+        parents, children = self.getFDT()
         with open(path, "w") as fw:
-            for node, data in self.network.nodes(data=True):
-                if data['parent'] != 'root':
-                    fw.write("%d\t%d\n" % (data['parent'], node))
+            for parent, child in zip(parents.tolist(), children.tolist()):
+                fw.write("%d\t%d\n" % (parent, child))
 
     def createPathwayToCluster(self, clusterLeave):
         """
@@ -224,20 +482,51 @@ class ConformationNetwork(object):
         """
         pathway = []
         nodeLabel = clusterLeave
-        while nodeLabel != "root":
+        while nodeLabel != ROOT_NODE:
+            if nodeLabel == MISSING_NODE:
+                raise ValueError("Cluster %d is not connected to a root of the network" % clusterLeave)
             pathway.append(nodeLabel)
-            nodeLabel = self.network.node[nodeLabel]['parent']
+            nodeLabel = int(self.parents[nodeLabel])
         return pathway[::-1]
 
+    def toNetworkx(self):
+        """
+            Build a networkx graph with the conformation network, with the
+            parent and epoch of each node and the number of transitions of
+            each edge as attributes
+
+            :returns: networkx.DiGraph -- Conformation network
+        """
+        if not NETWORK:
+            sys.stderr.write("Package networkx not found! Could not build network\n")
+            return None
+        network = nx.DiGraph()
+        for node in np.flatnonzero(self.parents[:self.numberOfNodes] != MISSING_NODE).tolist():
+            parent = int(self.parents[node])
+            network.add_node(node, parent='root' if parent == ROOT_NODE else parent, epoch=int(self.epochs[node]))
+        sources, targets, transitions = self.getEdges()
+        for source, target, transition in zip(sources.tolist(), targets.tolist(), transitions.tolist()):
+            network.add_edge(source, target, transition=transition)
+        return network
+
 
 class AltStructures(object):
     """
         Helper class, each cluster will have an instance of AltStructures that
-        will maintain a priority queue (pq) of alternative structures to spawn
-        from encoded as tuples (priority, PDB).
+        will maintain a bounded priority queue of sub-clusters (alternative
+        structures) to spawn from. The sub-clusters are kept in the order in
+        which they were created, and an indexed max-heap over their priorities
+        (population, index) allows to update the priority of a sub-cluster in
+        O(log n) and to evict the sub-clusters with the highest priority
+        values from its root. The coordinates of the representatives of the
+        sub-clusters are kept in a preallocated array, in the same order
     """
     def __init__(self):
-        self.altStructPQ = []
+        self.subClusters = []
+        self.priorities = []
+        self.heap = []
+        self.heapPositions = []
+        self.coordinates = None
         self.limitSize = 10
         self.index = -1
 
@@ -245,14 +534,122 @@ class AltStructures(object):
         # Defining pickling interface to avoid problems when working with old
         # simulations if the properties of the clustering-related classes have
         # changed
-        state = {"altStructPQ": self.altStructPQ, "limitSize": self.limitSize, "index": self.index}
+        state = {"subClusters": self.subClusters, "priorities": self.priorities,
+                 "limitSize": self.limitSize, "index": self.index}
         return state
 
     def __setstate__(self, state):
         # Restore instance attributes
         self.limitSize = state['limitSize']
-        self.altStructPQ = [(el[0], i, el[-1]) for i, el in enumerate(state['altStructPQ'])]
-        self.index = state.get('index', len(self.altStructPQ)-1)
+        if "subClusters" in state:
+            self.subClusters = state['subClusters']
+            self.priorities = [tuple(priority) for priority in state['priorities']]
+        else:
+            # old simulations stored a list of (population, [index], cluster)
+            self.subClusters = [el[-1] for el in state['altStructPQ']]
+            self.priorities = [(el[0], i) for i, el in enumerate(state['altStructPQ'])]
+        self.index = state.get('index', len(self.subClusters)-1)
+        self.buildHeap()
+        self.buildCoordinates()
+
+    def buildHeap(self):
+        """
+            Build the heap of priorities of the sub-clusters
+        """
+        # a list sorted by decreasing priority is a valid max-heap
+        self.heap = sorted(range(len(self.subClusters)), key=self.priorities.__getitem__, reverse=True)
+        self.heapPositions = [0 for _ in self.heap]
+        for position, slot in enumerate(self.heap):
+            self.heapPositions[slot] = position
+
+    def buildCoordinates(self):
+        """
+            Build the array with the coordinates of the representatives of the
+            sub-clusters, with room for the sub-clusters that can be added
+            before the queue is cleaned. It is None if the representatives have
+            different number of atoms
+        """
+        self.coordinates = None
+        shapes = set(subCluster.pdb.coords.shape for subCluster in self.subClusters)
+        if len(shapes) != 1:
+            return
+        self.coordinates = np.empty((max(2*self.limitSize, len(self.subClusters))+1,)+shapes.pop())
+        for slot, subCluster in enumerate(self.subClusters):
+            self.coordinates[slot] = subCluster.pdb.coords
+
+    def getCoordinates(self):
+        """
+            Get the coordinates of the representatives of the sub-clusters
+
+            :returns: numpy.Array -- Array of shape (sub-clusters, atoms, 3),
+                None if the representatives have different number of atoms
+        """
+        if self.coordinates is None:
+            return None
+        return self.coordinates[:len(self.subClusters)]
+
+    def swapHeapPositions(self, position1, position2):
+        """
+            Swap two elements of the heap
+
+            :param position1: Position of the first element in the heap
+            :type position1: int
+            :param position2: Position of the second element in the heap
+            :type position2: int
+        """
+        slot1, slot2 = self.heap[position1], self.heap[position2]
+        self.heap[position1], self.heap[position2] = slot2, slot1
+        self.heapPositions[slot1], self.heapPositions[slot2] = position2, position1
+
+    def siftUp(self, position):
+        """
+            Move an element of the heap towards the root until its parent
+            has a higher priority
+
+            :param position: Position of the element in the heap
+            :type position: int
+        """
+        while position > 0:
+            parent = (position-1) // 2
+            if self.priorities[self.heap[parent]] >= self.priorities[self.heap[position]]:
+                return
+            self.swapHeapPositions(parent, position)
+            position = parent
+
+    def siftDown(self, position):
+        """
+            Move an element of the heap towards the leaves until its children
+            have a lower priority
+
+            :param position: Position of the element in the heap
+            :type position: int
+        """
+        size = len(self.heap)
+        while True:
+            child = 2*position+1
+            if child >= size:
+                return
+            if child+1 < size and self.priorities[self.heap[child+1]] > self.priorities[self.heap[child]]:
+                child += 1
+            if self.priorities[self.heap[position]] >= self.priorities[self.heap[child]]:
+                return
+            self.swapHeapPositions(position, child)
+            position = child
+
+    def popHeap(self):
+        """
+            Remove the sub-cluster with the highest priority value from the
+            heap
+
+            :returns: int -- Slot of the removed sub-cluster
+        """
+        slot = self.heap[0]
+        last = self.heap.pop()
+        if self.heap:
+            self.heap[0] = last
+            self.heapPositions[last] = 0
+            self.siftDown(0)
+        return slot
 
     def altSpawnSelection(self, centerPair):
         """
@@ -265,37 +662,49 @@ class AltStructures(object):
                 consisting of (epoch, trajectory, snapshot)
 
         """
-        subpopulations = [i[0] for i in self.altStructPQ]
-        totalSubpopulation = sum(subpopulations)
+        subpopulations = np.array([subCluster.elements for subCluster in self.subClusters], dtype=float)
         # Create a list of the population distributed between the cluster
         # center and the alternative structures
-        weights = 1.0/np.array([centerPair[0]-totalSubpopulation]+subpopulations)
-        weights /= weights.sum()
-        # This function only works on numpy >= 1.7, on life we have 1.6
-        # ind = np.random.choice(range(len(self.altStructPQ)), p=weights)
-        # Add one to account for the cluster representative
-        r = stats.rv_discrete(values=(range(self.sizePQ()+1), weights))
-        ind = r.rvs(size=10)[0]
-        # The first value of the distribution is always the cluster center
+        weights = 1.0/np.concatenate(([centerPair[0]-subpopulations.sum()], subpopulations))
+        cumulativeWeights = np.cumsum(weights)
+        # sample the inverse of the cumulative distribution with a single
+        # random number, the first value is always the cluster center
+        ind = np.searchsorted(cumulativeWeights, np.random.random_sample()*cumulativeWeights[-1], side="right")
+        ind = min(ind, self.sizePQ())
         if ind == 0:
             print("cluster center")
             return centerPair[1], None
         else:
-            # pick an alternative structure from the priority queue
-            # The first element corresponds to the cluster center
-            ind -= 1
+            # pick an alternative structure, the first element corresponds to
+            # the cluster center
+            subCluster = self.subClusters[ind-1]
             print("alternative structure")
-            return self.altStructPQ[ind][2].pdb, self.altStructPQ[ind][2].trajPosition
+            return subCluster.pdb, subCluster.trajPosition
 
     def cleanPQ(self):
         """
             Ensure that the alternative structures priority queue has no more
-            elements than the limit in order to ensure efficiency
+            elements than the limit in order to ensure efficiency, the
+            sub-clusters with the lowest priority values are kept
         """
-        if len(self.altStructPQ) < self.limitSize:
+        if len(self.subClusters) <= self.limitSize:
             return
-        limit = len(self.altStructPQ)
-        del self.altStructPQ[self.limitSize-limit:]
+        evicted = set()
+        while len(self.heap) > self.limitSize:
+            evicted.add(self.popHeap())
+        # the remaining sub-clusters keep their order, the heap is renumbered
+        kept = [slot for slot in range(len(self.subClusters)) if slot not in evicted]
+        newSlots = {slot: newSlot for newSlot, slot in enumerate(kept)}
+        self.subClusters = [self.subClusters[slot] for slot in kept]
+        self.priorities = [self.priorities[slot] for slot in kept]
+        self.heap = [newSlots[slot] for slot in self.heap]
+        self.heapPositions = [0 for _ in self.heap]
+        for position, slot in enumerate(self.heap):
+            self.heapPositions[slot] = position
+        if self.coordinates is None:
+            self.buildCoordinates()
+        else:
+            self.coordinates[:len(kept)] = self.coordinates[kept]
 
     def addStructure(self, PDB, threshold, resname, resnum, resChain, contactThreshold, similarityEvaluator, trajPosition):
         """
@@ -320,20 +729,31 @@ class AltStructures(object):
             :type trajPosition: int, int, int
 
         """
-        i = 0
-        for _, _, subCluster in self.altStructPQ:
-            _, distance = similarityEvaluator.isElement(PDB, subCluster, resname, resnum, resChain, contactThreshold)
-            if distance < subCluster.threshold/2.0:
+        if self.subClusters:
+            distances = similarityEvaluator.computeDistances(PDB, self.subClusters, resname, resnum, resChain, contactThreshold, coordinates=self.getCoordinates())
+            for slot, subCluster in enumerate(self.subClusters):
+                if distances[slot] >= subCluster.threshold/2.0:
+                    continue
                 subCluster.addElement([])
-                del self.altStructPQ[i]
-                heapq.heappush(self.altStructPQ, (subCluster.elements, self.updateIndex(), subCluster))
-                if len(self.altStructPQ) > 2*self.limitSize:
-                    self.cleanPQ()
+                # the priority can only increase, so the sub-cluster moves
+                # towards the root of the heap
+                self.priorities[slot] = (subCluster.elements, self.updateIndex())
+                self.siftUp(self.heapPositions[slot])
                 return
-            i += 1
         newCluster = Cluster(PDB, thresholdRadius=threshold, contactThreshold=contactThreshold, contactMap=similarityEvaluator.contactMap, trajPosition=trajPosition)
-        heapq.heappush(self.altStructPQ, (1, self.updateIndex(), newCluster))
-        if len(self.altStructPQ) > 2*self.limitSize:
+        self.subClusters.append(newCluster)
+        self.priorities.append((1, self.updateIndex()))
+        self.heapPositions.append(len(self.heap))
+        self.heap.append(len(self.subClusters)-1)
+        self.siftUp(len(self.heap)-1)
+        slot = len(self.subClusters)-1
+        if self.coordinates is None or slot >= len(self.coordinates):
+            self.buildCoordinates()
+        elif self.coordinates.shape[1:] == PDB.coords.shape:
+            self.coordinates[slot] = PDB.coords
+        else:
+            self.coordinates = None
+        if len(self.subClusters) > 2*self.limitSize:
             self.cleanPQ()
 
     def updateIndex(self):
@@ -352,7 +772,7 @@ class AltStructures(object):
 
             :returns: int -- Number of sub-clusters stored in the priority queue
         """
-        return len(self.altStructPQ)
+        return len(self.subClusters)
 
 
 class Cluster(object):
@@ -370,7 +790,7 @@ class Cluster(object):
             :param thresholdRadius: Threshold of the cluster
             :type thresholdRadius: float
             :param contactMap:  The contact map of the ligand and the protein
-            :type contactMap: numpy.Array
+            :type contactMap: numpy.Array or :py:class:`.PackedContactMap`
             :param contacts: Ratio of the number of alpha carbons in contact with the ligand
             :type contacts: float
             :param metrics: Array of the metrics corresponding to the cluster
@@ -394,7 +814,7 @@ class Cluster(object):
         self.threshold = thresholdRadius
         self.density = density
         self.contacts = contacts
-        self.contactMap = contactMap
+        self.contactMap = sym.asPackedContactMap(contactMap)
         if metrics is None:
             metrics = []
         self.metrics = metrics
@@ -432,7 +852,8 @@ class Cluster(object):
         self.threshold = state.get('threshold')
         self.density = state.get('density')
         self.contacts = state.get('contacts')
-        self.contactMap = state.get('contactMap')
+        # contact maps of old simulations are stored as boolean arrays
+        self.contactMap = sym.asPackedContactMap(state.get('contactMap'))
         self.metrics = state.get('metrics', [])
         self.originalMetrics = state.get('originalMetrics', [])
         self.metricCol = state.get('metricCol')
@@ -522,6 +943,24 @@ class Cluster(object):
         """
         return self.contacts
 
+    def getSpawningStructure(self):
+        """
+            Choose the structure to spawn from, either the cluster center or
+            one of the alternative structures
+
+            :returns :py:class:`.PDB`, (int, int, int): The chosen structure
+                and the tuple of (epoch, trajectory, snapshot) that permit
+                identifying it
+        """
+        if not self.altSelection or self.altStructure.sizePQ() == 0:
+            print("cluster center")
+            return self.pdb, self.trajPosition
+        else:
+            spawnStruct, trajPosition = self.altStructure.altSpawnSelection((self.elements, self.pdb))
+            if trajPosition is None:
+                trajPosition = self.trajPosition
+            return spawnStruct, trajPosition
+
     def writeSpawningStructure(self, path):
         """
             Write the pdb of the chosen structure to spawn
@@ -532,16 +971,10 @@ class Cluster(object):
             :returns int, int, int: Tuple of (epoch, trajectory, snapshot) that permit
                 identifying the structure added
         """
-        if not self.altSelection or self.altStructure.sizePQ() == 0:
-            print("cluster center")
-            self.pdb.writePDB(path)
-            return self.trajPosition
-        else:
-            spawnStruct, trajPosition = self.altStructure.altSpawnSelection((self.elements, self.pdb))
-            spawnStruct.writePDB(path)
-            if trajPosition is None:
-                trajPosition = self.trajPosition
-            return trajPosition
+        spawnStruct, trajPosition = self.getSpawningStructure()
+        # the file might be a hard link to other initial structures
+        utilities.writeStructureCopies(spawnStruct, [path])
+        return trajPosition
 
     def __eq__(self, other):
         return (self.pdb, self.elements, self.threshold, self.contacts) == (other.pdb, other.elements, other.threshold, other.contacts) and np.allclose(self.metrics, other.metrics)
@@ -551,6 +984,7 @@ class ClusteringEvaluator(object):
     def __init__(self):
         self.contactMap = None
         self.contacts = None
+        self.precomputedAttributes = None
 
     def cleanContactMap(self):
         """
@@ -558,6 +992,61 @@ class ClusteringEvaluator(object):
         """
         self.contactMap = None
         self.contacts = None
+        self.precomputedAttributes = None
+
+    def setPrecomputedAttributes(self, pdb, contacts, contactMap):
+        """
+            Set the contacts and contact map of a structure computed in
+            advance (e.g. by another process)
+
+            :param pdb: Structure to which the attributes correspond
+            :type pdb: :py:class:`.PDB`
+            :param contacts: Number of contacts of the structure
+            :type contacts: int
+            :param contactMap: Contact map of the structure
+            :type contactMap: :py:class:`.PackedContactMap`
+        """
+        self.precomputedAttributes = (pdb.atomList, contacts, contactMap)
+
+    def getPrecomputedAttributes(self, pdb):
+        """
+            Get the precomputed contacts and contact map of a structure, they
+            are discarded if the structure has been modified since they were
+            computed
+
+            :param pdb: Structure to which the attributes correspond
+            :type pdb: :py:class:`.PDB`
+            :returns: int, numpy.Array -- Number of contacts and contact map of
+                the structure, None if they are not available
+        """
+        # renaming the atoms of the structure (see alignToCluster) replaces its atomList
+        if self.precomputedAttributes is None or self.precomputedAttributes[0] is not pdb.atomList:
+            return None
+        return self.precomputedAttributes[1:]
+
+    def computeDistances(self, pdb, clusters, resname, resnum, resChain, contactThresholdDistance, coordinates=None):
+        """
+            Compute the distance between a conformation and several clusters
+
+            :param pdb: Structure to compare
+            :type pdb: :py:class:`.PDB`
+            :param clusters: Clusters to compare
+            :type clusters: list
+            :param resname: String containing the three letter name of the ligand in the pdb
+            :type resname: str
+            :param resnum: Integer containing the residue number of the ligand in the pdb
+            :type resnum: int
+            :param resChain: String containing the chain name of the ligand in the pdb
+            :type resChain: str
+            :param contactThreshold: Distance between two atoms to be considered in contact (default 8)
+            :type contactThreshold: float
+            :param coordinates: Coordinates of the representatives of the
+                clusters, stacked in an array (see AltStructures), only used
+                by the evaluators that compare coordinates
+            :type coordinates: numpy.Array
+            :returns: numpy.Array -- Distance between the structure and each cluster
+        """
+        return np.array([self.isElement(pdb, cluster, resname, resnum, resChain, contactThresholdDistance)[1] for cluster in clusters])
 
 
 class ContactsClusteringEvaluator(ClusteringEvaluator):
@@ -588,6 +1077,7 @@ class ContactsClusteringEvaluator(ClusteringEvaluator):
         self.RMSDCalculator = state.get('RMSDCalculator', RMSDCalculator.RMSDCalculator())
         self.contacts = state.get('contacts')
         self.contactMap = state.get('contactMap')
+        self.precomputedAttributes = None
 
     def isElement(self, pdb, cluster, resname, resnum, resChain, contactThresholdDistance):
         """
@@ -607,13 +1097,43 @@ class ContactsClusteringEvaluator(ClusteringEvaluator):
             :type contactThreshold: float
             :returns: bool, float -- Whether the structure belong to the cluster and the distance between them
         """
-        #here we have to modify the dictionary of the atoms so that an error is not raised
-        if pdb.atoms != cluster.pdb.atoms: #rename the dictionary
-            pdb.atoms, pdb.atomList = modify2(cluster.pdb, pdb)
-            #cluster.pdb.atoms, cluster.pdb.atomList = modify2(cluster.pdb, pdb)
+        # rename the atoms so that an error is not raised
+        if pdb.atomList is not cluster.pdb.atomList and pdb.atomList != cluster.pdb.atomList:
+            alignToCluster(cluster.pdb, pdb)
         dist = self.RMSDCalculator.computeRMSD(cluster.pdb, pdb)
         return dist >= cluster.threshold, dist
 
+    def computeDistances(self, pdb, clusters, resname, resnum, resChain, contactThresholdDistance, coordinates=None):
+        """
+            Compute the RMSD between a conformation and several clusters in a
+            single call over the stacked coordinates of their representatives
+
+            :param pdb: Structure to compare
+            :type pdb: :py:class:`.PDB`
+            :param clusters: Clusters to compare
+            :type clusters: list
+            :param resname: String containing the three letter name of the ligand in the pdb
+            :type resname: str
+            :param resnum: Integer containing the residue number of the ligand in the pdb
+            :type resnum: int
+            :param resChain: String containing the chain name of the ligand in the pdb
+            :type resChain: str
+            :param contactThreshold: Distance between two atoms to be considered in contact (default 8)
+            :type contactThreshold: float
+            :param coordinates: Coordinates of the representatives of the
+                clusters, stacked in an array (if None they are stacked here)
+            :type coordinates: numpy.Array
+            :returns: numpy.Array -- RMSD between the structure and each cluster
+        """
+        if not clusters:
+            return np.zeros(0)
+        if any(pdb.atomList is not cluster.pdb.atomList and pdb.atomList != cluster.pdb.atomList for cluster in clusters):
+            # the structure has to be renamed for each cluster
+            return ClusteringEvaluator.computeDistances(self, pdb, clusters, resname, resnum, resChain, contactThresholdDistance)
+        if coordinates is None:
+            coordinates = np.array([cluster.pdb.coords for cluster in clusters])
+        return self.RMSDCalculator.computeRMSDToCoordinates(pdb, coordinates)
+
     def checkAttributes(self, pdb, resname, resnum, resChain, contactThresholdDistance):
         """
             Check wether all attributes are set for this iteration
@@ -630,7 +1150,31 @@ class ContactsClusteringEvaluator(ClusteringEvaluator):
             :type contactThreshold: float
         """
         if self.contacts is None:
-            self.contacts = pdb.countContacts(resname, contactThresholdDistance, resnum, resChain)
+            precomputed = self.getPrecomputedAttributes(pdb)
+            if precomputed is None:
+                self.contacts = pdb.countContacts(resname, contactThresholdDistance, resnum, resChain)
+            else:
+                self.contacts = precomputed[0]
+
+    def computeAttributes(self, pdb, resname, resnum, resChain, contactThresholdDistance):
+        """
+            Compute the attributes needed to cluster a structure, so that they
+            can be calculated in advance
+
+            :param pdb: Structure to compare
+            :type pdb: :py:class:`.PDB`
+            :param resname: String containing the three letter name of the ligand in the pdb
+            :type resname: str
+            :param resnum: Integer containing the residue number of the ligand in the pdb
+            :type resnum: int
+            :param resChain: String containing the chain name of the ligand in the pdb
+            :type resChain: str
+            :param contactThreshold: Distance between two atoms to be considered in contact (default 8)
+            :type contactThreshold: float
+            :returns: int, numpy.Array -- Number of contacts and contact map of
+                the structure (None for this evaluator)
+        """
+        return pdb.countContacts(resname, contactThresholdDistance, resnum, resChain), None
 
     def getInnerLimit(self, cluster):
         """
@@ -679,6 +1223,7 @@ class CMClusteringEvaluator(ClusteringEvaluator):
         self.symmetryEvaluator = state.get('symmetryEvaluator')
         self.contacts = state.get('contacts')
         self.contactMap = state.get('contactMap')
+        self.precomputedAttributes = None
 
     def isElement(self, pdb, cluster, resname, resnum, resChain, contactThresholdDistance):
         """
@@ -699,12 +1244,58 @@ class CMClusteringEvaluator(ClusteringEvaluator):
             :returns: bool, float -- Whether the structure belong to the cluster and the distance between them
         """
         if self.contactMap is None:
-            self.contactMap, self.contacts = self.symmetryEvaluator.createContactMap(pdb, resname, contactThresholdDistance, resnum, resChain)
+            self.setContactMap(pdb, resname, resnum, resChain, contactThresholdDistance)
             # self.contactMap, foo = self.symmetryEvaluator.createContactMap(pdb, resname, contactThresholdDistance)
             # self.contacts = pdb.countContacts(resname, 8)  # contactThresholdDistance)
         distance = self.similarityEvaluator.isSimilarCluster(self.contactMap, cluster.contactMap, self.symmetryEvaluator)
         return distance < cluster.threshold, distance
 
+    def setContactMap(self, pdb, resname, resnum, resChain, contactThresholdDistance):
+        """
+            Set the contact map and contacts of the structure, using the
+            precomputed ones if available
+
+            :param pdb: Structure to compare
+            :type pdb: :py:class:`.PDB`
+            :param resname: String containing the three letter name of the ligand in the pdb
+            :type resname: str
+            :param resnum: Integer containing the residue number of the ligand in the pdb
+            :type resnum: int
+            :param resChain: String containing the chain name of the ligand in the pdb
+            :type resChain: str
+            :param contactThreshold: Distance between two atoms to be considered in contact (default 8)
+            :type contactThreshold: float
+        """
+        precomputed = self.getPrecomputedAttributes(pdb)
+        if precomputed is None or not self.symmetryEvaluator.ligandList:
+            # the first contact map has to be built here to initialise the
+            # symmetry evaluator
+            contactMap, self.contacts = self.symmetryEvaluator.createContactMap(pdb, resname, contactThresholdDistance, resnum, resChain)
+            self.contactMap = sym.PackedContactMap(contactMap)
+        else:
+            self.contacts, self.contactMap = precomputed
+
+    def computeAttributes(self, pdb, resname, resnum, resChain, contactThresholdDistance):
+        """
+            Compute the attributes needed to cluster a structure, so that they
+            can be calculated in advance
+
+            :param pdb: Structure to compare
+            :type pdb: :py:class:`.PDB`
+            :param resname: String containing the three letter name of the ligand in the pdb
+            :type resname: str
+            :param resnum: Integer containing the residue number of the ligand in the pdb
+            :type resnum: int
+            :param resChain: String containing the chain name of the ligand in the pdb
+            :type resChain: str
+            :param contactThreshold: Distance between two atoms to be considered in contact (default 8)
+            :type contactThreshold: float
+            :returns: int, :py:class:`.PackedContactMap` -- Number of contacts
+                and contact map of the structure
+        """
+        contactMap, contacts = self.symmetryEvaluator.createContactMap(pdb, resname, contactThresholdDistance, resnum, resChain)
+        return contacts, sym.PackedContactMap(contactMap)
+
     def checkAttributes(self, pdb, resname, resnum, resChain, contactThresholdDistance):
         """
             Check wether all attributes are set for this iteration
@@ -721,7 +1312,7 @@ class CMClusteringEvaluator(ClusteringEvaluator):
             :type contactThreshold: float
         """
         if self.contactMap is None:
-            self.contactMap, self.contacts = self.symmetryEvaluator.createContactMap(pdb, resname, contactThresholdDistance, resnum, resChain)
+            self.setContactMap(pdb, resname, resnum, resChain, contactThresholdDistance)
             # self.contactMap, foo = self.symmetryEvaluator.createContactMap(pdb, resname, contactThresholdDistance)
             # self.contacts = pdb.countContacts(resname, 8)  # contactThresholdDistance)
 
@@ -765,7 +1356,7 @@ class CMClusteringEvaluator(ClusteringEvaluator):
 class Clustering(object):
     def __init__(self, resname="", resnum=0, resChain="", reportBaseFilename=None,
                  columnOfReportFile=None, contactThresholdDistance=8,
-                 altSelection=False):
+                 altSelection=False, parallelPreprocessing=False):
         """
             Base class for clustering methods, it defines a cluster method that
             contacts and accumulative inherit and use
@@ -783,6 +1374,12 @@ class Clustering(object):
             :param contactThresholdDistance: Distance at wich a ligand atom and a protein atom are
                 considered in contact(default 8)
             :type contactThresholdDistance: float
+            :param altSelection: Flag that controls wether to use the alternative structures
+            :type altSelection: bool
+            :param parallelPreprocessing: Flag that controls wether to parse the
+                trajectories in a pool of processes when more than one processor
+                is available (default False)
+            :type parallelPreprocessing: bool
         """
         self.type = "BaseClass"
 
@@ -800,6 +1397,10 @@ class Clustering(object):
         self.altSelection = altSelection
         self.conformationNetwork = ConformationNetwork()
         self.epoch = -1
+        self.nprocessors = None
+        self.parallelPreprocessing = parallelPreprocessing
+        # structures written by the previous checkpoints of the object
+        self.checkpointStore = utilities.CheckpointStore()
 
     def __getstate__(self):
         # Defining pickling interface to avoid problems when working with old
@@ -812,7 +1413,9 @@ class Clustering(object):
                  "epoch": self.epoch, "symmetries": self.symmetries,
                  "conformationNetwork": self.conformationNetwork,
                  "contactThresholdDistance": self.contactThresholdDistance,
-                 "altSelection": self.altSelection}
+                 "altSelection": self.altSelection,
+                 "nprocessors": self.nprocessors,
+                 "parallelPreprocessing": self.parallelPreprocessing}
         return state
 
     def __setstate__(self, state):
@@ -829,6 +1432,9 @@ class Clustering(object):
         self.altSelection = state.get('altSelection', False)
         self.conformationNetwork = state.get('conformationNetwork', ConformationNetwork())
         self.epoch = state.get('epoch', -1)
+        self.nprocessors = state.get('nprocessors')
+        self.parallelPreprocessing = state.get('parallelPreprocessing', False)
+        self.checkpointStore = utilities.CheckpointStore()
 
     def __str__(self):
         return "Clustering: nClusters: %d" % len(self.clusters)
@@ -889,7 +1495,15 @@ class Clustering(object):
         return self.clusters.getCluster(clusterNum)
 
     def setProcessors(self, processors):
-        pass
+        """
+            Set the number of processors available for clustering, with more
+            than one and parallelPreprocessing the snapshots are preprocessed
+            in parallel
+
+            :param processors: Number of processors
+            :type processors: int
+        """
+        self.nprocessors = processors
 
     def emptyClustering(self):
         """
@@ -1010,42 +1624,139 @@ class Clustering(object):
             :param outputPathConstants: Contains outputPath-related constants
             :type outputPathConstants: :py:class:`.OutputPathConstants`
         """
+        self.startEpoch(epoch)
+        self.clusterTrajectories(getAllTrajectories(paths), ignoreFirstRow=ignoreFirstRow, topology=topology)
+        self.finishEpoch()
+
+    def clusterTrajectories(self, trajectories, ignoreFirstRow=False, topology=None):
+        """
+            Cluster several trajectories of the current epoch, in the order
+            given
+
+            :param trajectories: Trajectory files
+            :type trajectories: list
+            :param ignoreFirstRow: Flag wether to ignore the first snapshot of a trajectory
+            :type ignoreFirstRow: bool
+            :param topology: Topology object containing the set of topologies needed for the simulation
+            :type topology: :py:class:`.Topology`
+        """
+        if not (PARALELLIZATION and self.parallelPreprocessing and self.nprocessors is not None and self.nprocessors > 1 and len(trajectories) > 1):
+            for trajectory in trajectories:
+                self.clusterTrajectory(trajectory, ignoreFirstRow=ignoreFirstRow, topology=topology)
+            return
+        # parse the snapshots and compute their contacts in parallel, the
+        # assignment to clusters is done serially in trajectory order so the
+        # results are the same as in the serial version. The trajectories are
+        # submitted in windows so that only a few preprocessed trajectories
+        # are kept in memory
+        window = 2*self.nprocessors
+        pool = mp.Pool(self.nprocessors)
+        try:
+            for start in range(0, len(trajectories), window):
+                tasks = []
+                for trajectory in trajectories[start:start+window]:
+                    if topology is not None:
+                        top = topology.getTopology(self.epoch, utilities.getTrajNum(trajectory))
+                    else:
+                        top = None
+                    tasks.append((trajectory, self.clusteringEvaluator, self.resname, self.resnum, self.resChain, self.contactThresholdDistance, ignoreFirstRow, top))
+                for task, snapshots in zip(tasks, pool.imap(preprocessTrajectoryTask, tasks, chunksize=1)):
+                    self.clusterTrajectory(task[0], ignoreFirstRow=ignoreFirstRow, topology=topology, snapshots=snapshots)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def supportsIncrementalClustering(self):
+        """
+            Return whether the trajectories of an epoch can be clustered one
+            at a time with clusterTrajectory
+
+            :returns: bool -- Whether the clustering can be done incrementally
+        """
+        return True
+
+    def startEpoch(self, epoch=None):
+        """
+            Set the epoch whose trajectories are going to be clustered
+
+            :param epoch: Epoch number (None to use the one following the last
+                clustered)
+            :type epoch: int
+        """
         if epoch is None:
             self.epoch += 1
         else:
             self.epoch = epoch
-        trajectories = getAllTrajectories(paths)
-        for trajectory in trajectories:
-            trajNum = utilities.getTrajNum(trajectory)
-            # origCluster = processorsToClusterMapping[trajNum-1]
-            origCluster = None
-            snapshots = utilities.getSnapshots(trajectory, True)
-            if topology is not None:
-                top = topology.getTopology(self.epoch, trajNum)
-            else:
-                top = None
-            if self.reportBaseFilename:
-                reportFilename = os.path.join(os.path.split(trajectory)[0],
-                                              self.reportBaseFilename % trajNum)
-                metrics = loadReportFile(reportFilename)
 
-                for num, snapshot in enumerate(snapshots):
-                    if ignoreFirstRow and num == 0:
-                        continue
-                    try:
-                        origCluster = self.addSnapshotToCluster(trajNum, snapshot, origCluster, num, metrics[num], self.col, topology=top)
-                    except IndexError as e:
-                        message = (" in trajectory %d. This is usually caused by a mismatch between report files and trajectory files"
-                                   " which in turn is usually caused by some problem in writing the files, e.g. quota")
-
-                        # raise a new exception of the same type, with the same
-                        # traceback but with an added message
-                        raise_(IndexError, (str(e) + message % trajNum), sys.exc_info()[2])
-            else:
-                for num, snapshot in enumerate(snapshots):
-                    if ignoreFirstRow and num == 0:
-                        continue
-                    origCluster = self.addSnapshotToCluster(trajNum, snapshot, origCluster, num, topology=top)
+    def clusterTrajectory(self, trajectory, ignoreFirstRow=False, topology=None, snapshots=None, profilePhases=True):
+        """
+            Cluster the snapshots of a trajectory of the current epoch, the
+            trajectories must be clustered in the order of getAllTrajectories
+            to obtain the same clusters as with the cluster method
+
+            :param trajectory: Trajectory file
+            :type trajectory: str
+            :param ignoreFirstRow: Flag wether to ignore the first snapshot of a trajectory
+            :type ignoreFirstRow: bool
+            :param topology: Topology object containing the set of topologies needed for the simulation
+            :type topology: :py:class:`.Topology`
+            :param snapshots: Snapshots already processed by preprocessTrajectory
+                (if None they are read from the trajectory)
+            :type snapshots: list
+            :param profilePhases: Whether to profile the parsing and the
+                comparison of the snapshots, only meaningful if the trajectory
+                is read here and no other phase runs concurrently
+            :type profilePhases: bool
+        """
+        trajNum = utilities.getTrajNum(trajectory)
+        # origCluster = processorsToClusterMapping[trajNum-1]
+        origCluster = None
+        if topology is not None:
+            top = topology.getTopology(self.epoch, trajNum)
+        else:
+            top = None
+        # the time spent reading and parsing the snapshots is profiled
+        # separately from the time spent comparing them with the clusters,
+        # the same phase object is reused for all the snapshots. Snapshots
+        # preprocessed in a pool were parsed in the workers and the pipelined
+        # clustering overlaps the simulation, so they are not profiled
+        comparePhase = profiler.NULL_PHASE
+        if snapshots is None:
+            # the snapshots are read and parsed lazily, one at a time
+            snapshots = ((pdb, None) for pdb in utilities.iterSnapshotPDBs(trajectory, resname=self.resname, resnum=self.resnum, chain=self.resChain, topology=top))
+            if profilePhases:
+                snapshots = profiler.PROFILER.timeIterator("clustering.parse", snapshots)
+                comparePhase = profiler.PROFILER.phase("clustering.compare", resources=False)
+        if self.reportBaseFilename:
+            reportFilename = os.path.join(os.path.split(trajectory)[0],
+                                          self.reportBaseFilename % trajNum)
+            metrics = loadReportFile(reportFilename)
+
+            for num, (snapshot, precomputed) in enumerate(snapshots):
+                if ignoreFirstRow and num == 0:
+                    continue
+                try:
+                    with comparePhase:
+                        origCluster = self.addSnapshotToCluster(trajNum, snapshot, origCluster, num, metrics[num], self.col, topology=top, precomputed=precomputed)
+                except IndexError as e:
+                    message = (" in trajectory %d. This is usually caused by a mismatch between report files and trajectory files"
+                               " which in turn is usually caused by some problem in writing the files, e.g. quota")
+
+                    # raise a new exception of the same type, with the same
+                    # traceback but with an added message
+                    raise_(IndexError, (str(e) + message % trajNum), sys.exc_info()[2])
+        else:
+            for num, (snapshot, precomputed) in enumerate(snapshots):
+                if ignoreFirstRow and num == 0:
+                    continue
+                with comparePhase:
+                    origCluster = self.addSnapshotToCluster(trajNum, snapshot, origCluster, num, topology=top, precomputed=precomputed)
+
+    def finishEpoch(self):
+        """
+            Finish the clustering of an epoch once all its trajectories have
+            been clustered
+        """
         for cluster in self.clusters.clusters:
             cluster.altStructure.cleanPQ()
 
@@ -1095,16 +1806,34 @@ class Clustering(object):
                                                                 metric)
                 summaryFile.write(writeString)
 
-        utilities.writeObject(outputObject, self, protocol=2)
+        self.writeClusteringObject(outputObject)
 
-    def addSnapshotToCluster(self, trajNum, snapshot, origCluster, snapshotNum, metrics=None, col=None, topology=None):
+    def writeClusteringObject(self, outputObject):
+        """
+            Write the clustering object as a checkpoint, the contents and
+            coordinates of the structures of the clusters are only written by
+            the first checkpoint that finds them (see
+            :py:class:`.CheckpointStore`), so each epoch only writes the
+            structures of its new clusters
+
+            :param outputObject: Output name for the pickle object
+            :type outputObject: str
+        """
+        structures = []
+        for cluster in self.clusters.clusters:
+            structures.append(cluster)
+            structures.extend(cluster.altStructure.subClusters)
+        self.checkpointStore.write(outputObject, self, [(cluster.trajPosition, cluster.pdb) for cluster in structures if cluster.trajPosition is not None], protocol=2)
+
+    def addSnapshotToCluster(self, trajNum, snapshot, origCluster, snapshotNum, metrics=None, col=None, topology=None, precomputed=None):
         """
             Cluster a snapshot using the leader algorithm
 
             :param trajNum: Trajectory number
             :type trajNum: int
-            :param snapshot: Snapshot to add
-            :type snapshot: str
+            :param snapshot: Snapshot to add, either its contents or the
+                already parsed structure
+            :type snapshot: str or :py:class:`.PDB`
             :param origCluster: Cluster found in the previos snapshot
             :type origCluster: int
             :param snapshotNum: Number of snapshot in its trajectory
@@ -1116,16 +1845,29 @@ class Clustering(object):
             :returns: int -- Cluster to which the snapshot belongs
             :param topology: Topology for non-pdb trajectories
             :type topology: list
+            :param precomputed: Tuple with the contacts and the contact map
+                of the snapshot, as returned by :py:func:`.preprocessTrajectory`
+            :type precomputed: tuple
         """
         if metrics is None:
             metrics = []
-        pdb = atomset.PDB()
-        pdb.initialise(snapshot, resname=self.resname, resnum=self.resnum, chain=self.resChain, topology=topology)
         self.clusteringEvaluator.cleanContactMap()
-        for clusterNum, cluster in enumerate(self.clusters.clusters):
-            if pdb.atoms != cluster.pdb.atoms:  # rename the dictionary
-                pdb.atoms, pdb.atomList = modify2(cluster.pdb, pdb) #this line modifies pdb so it matches prior cluster (use first commented lines in modify2)
-                #cluster.pdb.atoms, cluster.pdb.atomList = modify2(cluster.pdb, pdb) #this line modifies cluster so it matches actual pdb
+        if isinstance(snapshot, atomset.PDB):
+            pdb = snapshot
+        else:
+            pdb = atomset.PDB()
+            pdb.initialise(snapshot, resname=self.resname, resnum=self.resnum, chain=self.resChain, topology=topology)
+        if precomputed is not None:
+            contacts, contactMap = precomputed
+            self.clusteringEvaluator.setPrecomputedAttributes(pdb, contacts, contactMap)
+        # only the clusters whose centroid is close enough can pass the
+        # centroid filter, they are returned in the same order as stored
+        clusterNum = None
+        for clusterNum in self.clusters.getCandidateClusters(pdb, self.clusteringEvaluator.getInnerLimit):
+            cluster = self.clusters.clusters[clusterNum]
+            if pdb.atomList is not cluster.pdb.atomList and pdb.atomList != cluster.pdb.atomList:
+                # rename the atoms of pdb so that they match the cluster
+                alignToCluster(cluster.pdb, pdb)
             scd = atomset.computeSquaredCentroidDifference(cluster.pdb, pdb)
             if scd > self.clusteringEvaluator.getInnerLimit(cluster):
                 continue
@@ -1142,6 +1884,9 @@ class Clustering(object):
                 return clusterNum
 
         # if made it here, the snapshot was not added into any cluster
+        if self.clusters.clusters and clusterNum != len(self.clusters.clusters)-1 and pdb.atomList is not self.clusters.clusters[-1].pdb.atomList and pdb.atomList != self.clusters.clusters[-1].pdb.atomList:
+            # keep the atom naming of the last cluster for the new one
+            alignToCluster(self.clusters.clusters[-1].pdb, pdb)
         # Check if contacts and contactMap are set (depending on which kind
         # of clustering)
         self.clusteringEvaluator.checkAttributes(pdb, self.resname, self.resnum,
@@ -1270,14 +2015,15 @@ class Clustering(object):
             :type filename: str
         """
         optimalCluster = self.getOptimalMetric()
-        pathway = self.createPathwayToCluster(optimalCluster)
+        pathway = self.conformationNetwork.createPathwayToCluster(optimalCluster)
         self.writePathwayTrajectory(pathway, filename)
 
 
 class ContactsClustering(Clustering):
     def __init__(self, thresholdCalculator, resname="", resnum=0, resChain="",
                  reportBaseFilename=None, columnOfReportFile=None,
-                 contactThresholdDistance=8, symmetries=None, altSelection=False):
+                 contactThresholdDistance=8, symmetries=None, altSelection=False,
+                 parallelPreprocessing=False):
         """
             Cluster together all snapshots that are closer to the cluster center
             than certain threshold. This threshold is assigned according to the
@@ -1305,12 +2051,16 @@ class ContactsClustering(Clustering):
             :type symmetries: list
             :param altSelection: Flag that controls wether to use the alternative structures (default 8)
             :type altSelection: bool
+            :param parallelPreprocessing: Flag that controls wether to parse the
+                trajectories in a pool of processes (default False)
+            :type parallelPreprocessing: bool
         """
         Clustering.__init__(self, resname=resname, resnum=resnum, resChain=resChain,
                             reportBaseFilename=reportBaseFilename,
                             columnOfReportFile=columnOfReportFile,
                             contactThresholdDistance=contactThresholdDistance,
-                            altSelection=altSelection)
+                            altSelection=altSelection,
+                            parallelPreprocessing=parallelPreprocessing)
         self.type = clusteringTypes.CLUSTERING_TYPES.rmsd
         self.thresholdCalculator = thresholdCalculator
         if symmetries is None:
@@ -1332,7 +2082,9 @@ class ContactsClustering(Clustering):
                  "contactThresholdDistance": self.contactThresholdDistance,
                  "altSelection": self.altSelection,
                  "thresholdCalculator": self.thresholdCalculator,
-                 "clusteringEvaluator": self.clusteringEvaluator}
+                 "clusteringEvaluator": self.clusteringEvaluator,
+                 "nprocessors": self.nprocessors,
+                 "parallelPreprocessing": self.parallelPreprocessing}
         return state
 
     def __setstate__(self, state):
@@ -1353,13 +2105,17 @@ class ContactsClustering(Clustering):
         if isinstance(self.symmetries, dict):
             self.symmetries = [self.symmetries]
         self.clusteringEvaluator = state.get('clusteringEvaluator', ContactsClusteringEvaluator(RMSDCalculator.RMSDCalculator(self.symmetries)))
+        self.nprocessors = state.get('nprocessors')
+        self.parallelPreprocessing = state.get('parallelPreprocessing', False)
+        self.checkpointStore = utilities.CheckpointStore()
 
 
 class ContactMapAccumulativeClustering(Clustering):
     def __init__(self, thresholdCalculator, similarityEvaluator, resname="",
                  resnum=0, resChain="",
                  reportBaseFilename=None, columnOfReportFile=None,
-                 contactThresholdDistance=8, symmetries=None, altSelection=False):
+                 contactThresholdDistance=8, symmetries=None, altSelection=False,
+                 parallelPreprocessing=False):
         """ Cluster together all snapshots that have similar enough contactMaps.
             This similarity can be calculated with different methods (see similariyEvaluator documentation)
 
@@ -1388,6 +2144,9 @@ class ContactMapAccumulativeClustering(Clustering):
             :type symmetries: list
             :param altSelection: Flag that controls wether to use the alternative structures (default 8)
             :type altSelection: bool
+            :param parallelPreprocessing: Flag that controls wether to parse the
+                trajectories in a pool of processes (default False)
+            :type parallelPreprocessing: bool
         """
         if symmetries is None:
             symmetries = []
@@ -1395,7 +2154,8 @@ class ContactMapAccumulativeClustering(Clustering):
                             reportBaseFilename=reportBaseFilename,
                             columnOfReportFile=columnOfReportFile,
                             contactThresholdDistance=contactThresholdDistance,
-                            altSelection=altSelection)
+                            altSelection=altSelection,
+                            parallelPreprocessing=parallelPreprocessing)
         self.type = clusteringTypes.CLUSTERING_TYPES.contactMap
         self.thresholdCalculator = thresholdCalculator
         self.similarityEvaluator = similarityEvaluator
@@ -1417,7 +2177,9 @@ class ContactMapAccumulativeClustering(Clustering):
                  "thresholdCalculator": self.thresholdCalculator,
                  "similariyEvaluator": self.similarityEvaluator,
                  "symmetryEvaluator": self.symmetryEvaluator,
-                 "clusteringEvaluator": self.clusteringEvaluator}
+                 "clusteringEvaluator": self.clusteringEvaluator,
+                 "nprocessors": self.nprocessors,
+                 "parallelPreprocessing": self.parallelPreprocessing}
         return state
 
     def __setstate__(self, state):
@@ -1438,6 +2200,9 @@ class ContactMapAccumulativeClustering(Clustering):
         self.similarityEvaluator = state.get('similariyEvaluator', CMSimilarityEvaluator(blockNames.ClusteringTypes.Jaccard))
         self.symmetryEvaluator = state.get('symmetryEvaluator', sym.SymmetryContactMapEvaluator(self.symmetries))
         self.clusteringEvaluator = state.get('clusteringEvaluator', CMClusteringEvaluator(self.similarityEvaluator, self.symmetryEvaluator))
+        self.nprocessors = state.get('nprocessors')
+        self.parallelPreprocessing = state.get('parallelPreprocessing', False)
+        self.checkpointStore = utilities.CheckpointStore()
 
 
 class SequentialLastSnapshotClustering(Clustering):
@@ -1455,6 +2220,15 @@ class SequentialLastSnapshotClustering(Clustering):
                             altSelection=altSelection)
         self.type = clusteringTypes.CLUSTERING_TYPES.lastSnapshot
 
+    def supportsIncrementalClustering(self):
+        """
+            Return whether the trajectories of an epoch can be clustered one
+            at a time with clusterTrajectory
+
+            :returns: bool -- Whether the clustering can be done incrementally
+        """
+        return False
+
     def cluster(self, paths, topology=None, epoch=None, outputPathConstants=None):
         """
             Cluster the snaptshots contained in the paths folder
@@ -1532,6 +2306,15 @@ class NullClustering(Clustering):
         Clustering.__init__(self)
         self.type = clusteringTypes.CLUSTERING_TYPES.null
 
+    def supportsIncrementalClustering(self):
+        """
+            Return whether the trajectories of an epoch can be clustered one
+            at a time with clusterTrajectory
+
+            :returns: bool -- Whether the clustering can be done incrementally
+        """
+        return False
+
     def cluster(self, paths, topology=None, epoch=None, outputPathConstants=None):
         """
             Cluster the snaptshots contained in the paths folder
@@ -1570,7 +2353,7 @@ class NullClustering(Clustering):
             summaryFile.write("#cluster size degeneracy contacts threshold density metric\n")
             summaryFile.write("Using null clustering, no clusters available\n")
 
-        utilities.writeObject(outputObject, self, protocol=2)
+        self.writeClusteringObject(outputObject)
 
 
 class MSMClustering(Clustering):
@@ -1578,14 +2361,14 @@ class MSMClustering(Clustering):
         Cluster the trajectories to estimate a Markov State Model (MSM)
     """
     def __init__(self, n_clusters, tica=False, resname="", resnum=0, resChain="", symmetries=None, atom_Ids="", writeCA=False, sidechains=False, tica_lagtime=10, tica_nICs=3, tica_kinetic_map=True, tica_commute_map=False):
-        if not PYEMMA:
-            raise utilities.UnsatisfiedDependencyException("No installation of PyEMMA found. Please, install PyEMMA to use MSMClustering option.")
+        if tica and not PYEMMA:
+            raise utilities.UnsatisfiedDependencyException("No installation of PyEMMA found. Please, install PyEMMA to use the tica option of MSMClustering.")
         Clustering.__init__(self, resname=resname, resnum=resnum, resChain=resChain)
         self.type = clusteringTypes.CLUSTERING_TYPES.MSMClustering
         self.nprocessors = None
         self.n_clusters = n_clusters
         self.tica = tica
-        self.constantsExtract = coord.Constants()
+        self.constantsExtract = coord.Constants(binaryFormat=True)
         self.indexes = None
         self.atom_Ids = atom_Ids
         self.writeCA = writeCA
@@ -1594,8 +2377,11 @@ class MSMClustering(Clustering):
         self.tica_nICs = tica_nICs
         self.tica_kinetic_map = tica_kinetic_map
         self.tica_commute_map = tica_commute_map
-        self.pyemma_clustering = None
-        self.extract_params = coord.ParamsHandler("", self.atom_Ids, self.resname, 0, False, False, 0, self.writeCA, True, self.nprocessors, False, "", self.sidechains, "", False, False, "", False, False)
+        self.kmeans = None
+        self.coordinateStore = None
+        # coordinates and position of the snapshot closest to each center
+        self.representatives = []
+        self.extract_params = coord.ParamsHandler("", self.atom_Ids, self.resname, 0, False, False, 0, self.writeCA, True, self.nprocessors, False, "", self.sidechains, "", False, False, "", False, False, True)
 
     def __getstate__(self):
         # Defining pickling interface to avoid problems when working with old
@@ -1613,7 +2399,8 @@ class MSMClustering(Clustering):
                  "tica_lagtime": self.tica_lagtime, "tica_nICs": self.tica_nICs,
                  "tica_kinetic_map": self.tica_kinetic_map,
                  "tica_commute_map": self.tica_commute_map,
-                 "pyemma_clustering": self.pyemma_clustering,
+                 "kmeans": self.kmeans, "coordinateStore": self.coordinateStore,
+                 "representatives": self.representatives,
                  "extract_params": self.extract_params}
         return state
 
@@ -1631,6 +2418,8 @@ class MSMClustering(Clustering):
         if isinstance(self.symmetries, dict):
             self.symmetries = [self.symmetries]
         self.nprocessors = state.get('nprocessors')
+        self.parallelPreprocessing = state.get('parallelPreprocessing', False)
+        self.checkpointStore = utilities.CheckpointStore()
         self.n_clusters = state['n_clusters']
         self.tica = state.get('tica', False)
         self.constantsExtract = state.get('constantsExtract', coord.Constants())
@@ -1642,8 +2431,17 @@ class MSMClustering(Clustering):
         self.tica_nICs = state.get('tica_nICs', 3)
         self.tica_kinetic_map = state.get('tica_kinetic_map', True)
         self.tica_commute_map = state.get('tica_commute_map', False)
-        self.pyemma_clustering = state.get('pyemma_clustering')
+        # clusterings of older versions are not loaded, they will be
+        # computed again in the next epoch
+        self.kmeans = state.get('kmeans')
+        self.coordinateStore = state.get('coordinateStore')
+        self.representatives = state.get('representatives', [])
         self.extract_params = state.get('extract_params', coord.ParamsHandler("", self.atom_Ids, self.resname, 0, False, False, 0, self.writeCA, True, self.nprocessors, False, "", self.sidechains, "", False, False, "", False, False))
+        # objects of previous versions extracted the coordinates as text
+        if not hasattr(self.constantsExtract, "extension"):
+            self.constantsExtract.extension = ".dat"
+        if not hasattr(self.extract_params, "binaryFormat"):
+            self.extract_params.binaryFormat = False
 
     def updateRepeatParameters(self, repeat, steps):
         """
@@ -1661,13 +2459,23 @@ class MSMClustering(Clustering):
         """
             Return the clusters object to be used in the spawning
 
-            :returns: :py:class:`.Clusters` -- Container object for the clusters
+            :returns: :py:class:`.MiniBatchKMeans` -- K-means clustering with the
+                cluster centers and the discretized trajectories
         """
-        return self.pyemma_clustering
+        return self.kmeans
 
     def setProcessors(self, processors):
         self.nprocessors = processors
 
+    def supportsIncrementalClustering(self):
+        """
+            Return whether the trajectories of an epoch can be clustered one
+            at a time with clusterTrajectory
+
+            :returns: bool -- Whether the clustering can be done incrementally
+        """
+        return False
+
     def cluster(self, paths, topology=None, epoch=None, outputPathConstants=None):
         """
             Cluster the snaptshots contained in the paths folder
@@ -1692,8 +2500,8 @@ class MSMClustering(Clustering):
         utilities.makeFolder(os.path.join(outputPathConstants.allTrajsPath, "extractedCoordinates"))
         extractedFolder = self.constantsExtract.extractedTrajectoryFolder % outputPathConstants.epochOutputPathTempletized % self.epoch
         repeatedFolder = self.constantsExtract.outputTrajectoryFolder % outputPathConstants.epochOutputPathTempletized % self.epoch
-        self.constantsExtract.gatherTrajsFilename = os.path.join(outputPathConstants.allTrajsPath, "traj_%s_%s.dat")
-        self.constantsExtract.gatherNonRepeatedTrajsFilename = os.path.join(outputPathConstants.allTrajsPath, "extractedCoordinates", "traj_%s_%s.dat")
+        self.constantsExtract.gatherTrajsFilename = os.path.join(outputPathConstants.allTrajsPath, "traj_%s_%s" + self.constantsExtract.extension)
+        self.constantsExtract.gatherNonRepeatedTrajsFilename = os.path.join(outputPathConstants.allTrajsPath, "extractedCoordinates", "traj_%s_%s" + self.constantsExtract.extension)
         utilities.makeFolder(extractedFolder)
         if not self.extract_params.non_Repeat:
             utilities.makeFolder(repeatedFolder)
@@ -1750,7 +2558,7 @@ class MSMClustering(Clustering):
             for trajectory in trajs:
                 if "tica" in trajectory:
                     continue
-                trajectories.append(utilities.loadtxtfile(trajectory))
+                trajectories.append(utilities.loadExtractedCoordinates(trajectory))
             tica = coor.tica(data=trajectories, lag=self.tica_lagtime, kinetic_map=self.tica_kinetic_map, commute_map=self.tica_commute_map)
             projected = tica.get_output(dimensions=range(self.tica_nICs))
             for traj_name, projected_traj in zip(trajs, projected):
@@ -1760,26 +2568,31 @@ class MSMClustering(Clustering):
         else:
             base_traj_names = self.constantsExtract.baseGatheredFilename
 
-        # cluster the coordinates
-        self.pyemma_clustering = pyemma_cluster.Cluster(self.n_clusters, outputPathConstants.allTrajsPath, base_traj_names, discretizedPath=os.path.join(outputPathConstants.allTrajsPath, "discretized"))
-        self.pyemma_clustering.cleanDiscretizedFolder()
-        self.pyemma_clustering.clusterTrajectories()
-
-        # create Adaptive clusters from the kmeans result
-        trajectory_files = glob.glob(os.path.join(outputPathConstants.allTrajsPath, "extractedCoordinates", base_traj_names))
-        trajectories = [utilities.loadtxtfile(f)[:, 1:] for f in trajectory_files]
-        # assign non-repeated trajectories to the clusters, in order to properly
-        # assing the corresponding structures
-        nonRepeatedDtrajs = self.pyemma_clustering.assignNewTrajectories(trajectories)
-        centersInfo = getCentersInfo(self.pyemma_clustering.clusterCenters, trajectories, trajectory_files, nonRepeatedDtrajs)
+        # cluster the coordinates, updating the clustering of the previous
+        # epoch with the new trajectories
+        if self.tica or self.kmeans is None:
+            # the tica projection changes every epoch, so the trajectories
+            # have to be clustered from scratch
+            self.kmeans = kmeans.MiniBatchKMeans(self.n_clusters)
+            self.coordinateStore = kmeans.CoordinateStore(os.path.join(outputPathConstants.allTrajsPath, "coordinateStore"))
+            self.representatives = [None for _ in range(self.n_clusters)]
+        firstNewTrajectory = len(self.coordinateStore)
+        for trajectoryFile in sorted(glob.glob(os.path.join(outputPathConstants.allTrajsPath, base_traj_names)), key=getGatheredTrajectoryPosition):
+            epoch_num, traj_num = getGatheredTrajectoryPosition(trajectoryFile)
+            if not self.coordinateStore.hasTrajectory(epoch_num, traj_num):
+                self.coordinateStore.addTrajectory(epoch_num, traj_num, utilities.loadExtractedCoordinates(trajectoryFile)[:, 1:])
+        self.kmeans.update(self.coordinateStore)
+
+        # create Adaptive clusters from the kmeans result, using the
+        # non-repeated trajectories to properly assign the corresponding
+        # structures
+        newTrajectories = [self.constantsExtract.gatherNonRepeatedTrajsFilename % entry[:2] for entry in self.coordinateStore.index[firstNewTrajectory:]]
+        self.updateRepresentatives(newTrajectories)
         centersInfo_processed = []
-        for cluster in centersInfo:
-            try:
-                epoch_num, traj_num, snapshot_num = centersInfo[cluster]["structure"]
-            except TypeError:
-                print("Structure not found for cluster %d" % cluster)
-                raise
-            centersInfo_processed.append([cluster, int(epoch_num), int(traj_num), int(snapshot_num)])
+        for cluster, representative in enumerate(self.representatives):
+            if representative is None:
+                raise ValueError("Structure not found for cluster %d" % cluster)
+            centersInfo_processed.append([cluster]+list(representative[1]))
         extractInfo = getRepr.getExtractInfo(centersInfo_processed)
         # extractInfo is a dictionary organized as {[epoch, traj]: [cluster, snapshot]}
 
@@ -1807,6 +2620,35 @@ class MSMClustering(Clustering):
                 cluster = Cluster(pdb, trajPosition=(trajFile[0], trajFile[1], pair[1]))
                 self.clusters[pair[0]] = cluster
 
+    def updateRepresentatives(self, trajectoryFiles):
+        """
+            Update the snapshot closest to each cluster center with the
+            snapshots of the new trajectories. The distances of the previous
+            representatives are computed again since the centers may have
+            moved
+
+            :param trajectoryFiles: Files with the non-repeated coordinates of
+                the new trajectories
+            :type trajectoryFiles: list
+        """
+        centers = self.kmeans.clusterCenters
+        minDistances = np.full(self.n_clusters, np.inf)
+        for cluster, representative in enumerate(self.representatives):
+            if representative is not None:
+                minDistances[cluster] = np.sum((representative[0]-centers[cluster])**2)
+        for trajectoryFile in trajectoryFiles:
+            epoch_num, traj_num = getGatheredTrajectoryPosition(trajectoryFile)
+            coordinates = utilities.loadExtractedCoordinates(trajectoryFile)[:, 1:]
+            labels, distances = self.kmeans.assign(coordinates)
+            # closest snapshot of the trajectory to each of its clusters
+            order = np.lexsort((distances, labels))
+            closest = order[np.concatenate(([True], labels[order][1:] != labels[order][:-1]))]
+            for snapshot in closest:
+                cluster = labels[snapshot]
+                if distances[snapshot] < minDistances[cluster]:
+                    minDistances[cluster] = distances[snapshot]
+                    self.representatives[cluster] = (coordinates[snapshot].copy(), (epoch_num, traj_num, int(snapshot)))
+
     def writeOutput(self, outputPath, degeneracy, outputObject, writeAll):
         """
             Writes all the clustering information in outputPath
@@ -1839,11 +2681,11 @@ class MSMClustering(Clustering):
                 if degeneracy is not None:
                     # degeneracy will be None if null spawning is used
                     degeneracy_cluster = degeneracy[i]
-                center_str = " ".join(["%.3f" for _ in self.pyemma_clustering.clusterCenters[i]])
-                writeString = "%d %d %d %d %d %s\n" % ((i, degeneracy_cluster) + cluster.trajPosition + (center_str % tuple(self.pyemma_clustering.clusterCenters[i]),))
+                center_str = " ".join(["%.3f" for _ in self.kmeans.clusterCenters[i]])
+                writeString = "%d %d %d %d %d %s\n" % ((i, degeneracy_cluster) + cluster.trajPosition + (center_str % tuple(self.kmeans.clusterCenters[i]),))
                 summaryFile.write(writeString)
 
-        utilities.writeObject(outputObject, self, protocol=2)
+        self.writeClusteringObject(outputObject)
 
     def filterClustersAccordingToBox(self, simulationRunnerParams):
         """
@@ -1901,6 +2743,7 @@ class ClusteringBuilder(object):
             raise KeyError(err.message)
         contactThresholdDistance = paramsBlock.get(blockNames.ClusteringTypes.contactThresholdDistance, 8)
         altSelection = paramsBlock.get(blockNames.ClusteringTypes.alternativeStructure, False)
+        parallelPreprocessing = paramsBlock.get(blockNames.ClusteringTypes.parallelPreprocessing, False)
         resname = str(paramsBlock.get(blockNames.ClusteringTypes.ligandResname, "")).upper()
         resnum = int(paramsBlock.get(blockNames.ClusteringTypes.ligandResnum, 0))
         resChain = str(paramsBlock.get(blockNames.ClusteringTypes.ligandChain, "")).upper()
@@ -1912,7 +2755,7 @@ class ClusteringBuilder(object):
             return ContactsClustering(thresholdCalculator, resname=resname, resnum=resnum, resChain=resChain,
                                       reportBaseFilename=reportBaseFilename, columnOfReportFile=columnOfReportFile,
                                       contactThresholdDistance=contactThresholdDistance, symmetries=symmetries,
-                                      altSelection=altSelection)
+                                      altSelection=altSelection, parallelPreprocessing=parallelPreprocessing)
         elif clusteringType == blockNames.ClusteringTypes.lastSnapshot:
 
             return SequentialLastSnapshotClustering(resname=resname, resnum=resnum, resChain=resChain,
@@ -1932,7 +2775,8 @@ class ClusteringBuilder(object):
             return ContactMapAccumulativeClustering(thresholdCalculator, similarityEvaluator, resname=resname,
                                                     resnum=resnum, resChain=resChain,
                                                     reportBaseFilename=reportBaseFilename, columnOfReportFile=columnOfReportFile,
-                                                    contactThresholdDistance=contactThresholdDistance, symmetries=symmetries, altSelection=altSelection)
+                                                    contactThresholdDistance=contactThresholdDistance, symmetries=symmetries, altSelection=altSelection,
+                                                    parallelPreprocessing=parallelPreprocessing)
         elif clusteringType == blockNames.ClusteringTypes.null:
             return NullClustering()
         elif clusteringType == blockNames.ClusteringTypes.MSMClustering:
@@ -1983,9 +2827,9 @@ class CMSimilarityEvaluator(object):
             False otherwise
 
             :param contactMap: contactMap of the structure to compare
-            :type contactMap: numpy.Array
-            :param contactMap: contactMap of the structure to compare
-            :type contactMap: numpy.Array
+            :type contactMap: :py:class:`.PackedContactMap`
+            :param clusterContactMap: contactMap of the cluster to compare
+            :type clusterContactMap: :py:class:`.PackedContactMap`
             :param symContactMapEvaluator: Contact Map symmetry evaluator object
             :type symContactMapEvaluator: :py:class:`.SymmetryContactMapEvaluator`
             :returns: float -- distance between contact maps
@@ -2016,6 +2860,19 @@ def getAllTrajectories(paths):
     return sorted(files)
 
 
+def getGatheredTrajectoryPosition(filename):
+    """
+        Get the epoch and trajectory number of a file of gathered extracted
+        coordinates (named as traj_epoch_trajectory.dat)
+
+        :param filename: Name of the file
+        :type filename: str
+        :returns: tuple -- Epoch and trajectory number
+    """
+    _, epoch_num, traj_num = os.path.splitext(os.path.basename(filename))[0].rsplit("_", 2)
+    return int(epoch_num), int(traj_num)
+
+
 def filterRepeatedReports(metrics, column=2):
     """
         Filter the matrix containing the report information to avoid rejected
@@ -2027,80 +2884,116 @@ def filterRepeatedReports(metrics, column=2):
         :type column: int
         :returns: np.ndarray -- Contents of the report file filtered
     """
-    new_metrics = []
-    accepted_steps = set()
-    for row in metrics:
-        if row[2] in accepted_steps:
-            continue
-        else:
-            accepted_steps.add(row[2])
-            new_metrics.append(row.tolist())
-    return np.array(new_metrics)
+    return utilities.filterRepeatedSteps(metrics, column)
 
 
 def loadReportFile(reportFile):
     """
-        Load a report file and filter it
+        Load a report file and filter it, the report is parsed only once (see
+        :py:func:`.readReportFile`)
 
         :param reportFile: Name of the report file
         :type reportFile: str
-        :returns: np.ndarray -- Contents of the report file
+        :returns: np.ndarray -- Read-only contents of the report file
     """
-    metrics = utilities.loadtxtfile(reportFile)
-    return filterRepeatedReports(metrics)
+    return utilities.readReportFile(reportFile, filterRepeated=True)
 
-def modify2(cluster, pdb):
+
+def preprocessTrajectory(trajectory, clusteringEvaluator, resname, resnum, resChain, contactThresholdDistance, ignoreFirstRow=False, topology=None):
+    """
+        Parse the snapshots of a trajectory and compute the attributes needed
+        to cluster them, so that it can be run in parallel for several
+        trajectories
+
+        :param trajectory: Trajectory filename
+        :type trajectory: str
+        :param clusteringEvaluator: Evaluator used in the clustering
+        :type clusteringEvaluator: :py:class:`.ClusteringEvaluator`
+        :param resname: String containing the three letter name of the ligand in the pdb
+        :type resname: str
+        :param resnum: Integer containing the residue number of the ligand in the pdb
+        :type resnum: int
+        :param resChain: String containing the chain name of the ligand in the pdb
+        :type resChain: str
+        :param contactThresholdDistance: Distance between two atoms to be considered in contact
+        :type contactThresholdDistance: float
+        :param ignoreFirstRow: Flag wether to ignore the first snapshot of a trajectory
+        :type ignoreFirstRow: bool
+        :param topology: Topology for non-pdb trajectories
+        :type topology: list
+        :returns: list -- List with a tuple (PDB, (contacts, contactMap)) for
+            each snapshot ((None, None) for the ignored snapshots)
     """
-    This function modifies takes 2 arguments, and modifies them so that the pdb matches that in the cluster. Cluster and
-    pdb are 2 objects, which contain a dictionary, a list and a string. If the heavy atom names of the ligand in the pdb
-    do not match those in the cluster, the simulation would stop, so all three are modified.
+    processed = []
+    for num, pdb in enumerate(utilities.iterSnapshotPDBs(trajectory, resname=resname, resnum=resnum, chain=resChain, topology=topology)):
+        if ignoreFirstRow and num == 0:
+            processed.append((None, None))
+            continue
+        processed.append((pdb, clusteringEvaluator.computeAttributes(pdb, resname, resnum, resChain, contactThresholdDistance)))
+    return processed
+
 
+def preprocessTrajectoryTask(args):
     """
-    oldkeys = list(pdb.atoms.keys())
-    newkeys = list(cluster.atoms.keys())
-    #we have to modify the pdb values of the dictionary such as they are only modify the numbers (not coordinates)
-    oldvalues = list(pdb.atoms.values())
-    pdbcoordinates = [] #we retrieve the pdb coordinates
-    for i in oldvalues:
-        i = str(i)
-        line = i.split("[")
-        line = line[1].split("]")
-        line = line[0]
-        pdbcoordinates.append(line)
-    clustervalues = list(cluster.atoms.values())
-    clustercoordinates = [] #we retrieve the cluster coordinates
-    for i in clustervalues:
-        i = str(i)
-        line = i.split("[")
-        line = line[1].split("]")
-        line = line[0] #these are cluster coordinates that need to be replaced
-        clustercoordinates.append(line)
-    newvalues = []  # new values for pdb based on cluster numbers but pdb coordinates
-    j = 0
-    for i in clustervalues:
-        i = str(i)
-        line = i.replace(str(clustercoordinates[j]), str(pdbcoordinates[j]))
-        newvalues.append(line)
-        j += 1
-    newdic = dict(zip(newkeys, newvalues)) #we create a new dictionary with cluster keys and cluster values (with pdb coordinates)
-    newlist = newkeys
-    #we also modify the string containing pdb
-    pdbstring = pdb.pdb.split("\n")
-    i = 0
-    newstring = []
-    for line in pdbstring:
-        elements = line.split()
-        lenghtline = len(elements)
-        if i < len(newkeys):
-            keytoreplace = oldkeys[i].split(":")
-            newkey = newkeys[i].split(":")
-        if lenghtline > 1 and elements[1] == keytoreplace[0]:
-            n = line.replace(str(keytoreplace[0]), str(newkey[0]))
-            i += 1
-            newstring.append(str(n))
-        else:
-            newstring.append(str(line))
+        Run :py:func:`.preprocessTrajectory` with a tuple of arguments, to be
+        used with Pool.imap
+
+        :param args: Arguments of preprocessTrajectory
+        :type args: tuple
+        :returns: list -- Preprocessed snapshots of the trajectory
+    """
+    return preprocessTrajectory(*args)
 
-    pdb.pdb = "\n".join(str(e) for e in newstring)
 
-    return newdic, newlist
+def getAtomAlignment(pdb, reference):
+    """
+        Match the atoms of a structure with those of a reference structure
+        with a different atom naming (e.g. after a change of the protonation
+        states). The atoms are matched by chain, residue number and atom name
+        if these identify all of them, otherwise they are matched by their
+        order. As with the previous renaming of the atoms, a structure with
+        more atoms than the reference keeps only the atoms matched with it.
+        The alignment is computed once for each pair of atomList objects, the
+        structures with the same template (e.g. the snapshots of a trajectory)
+        share the same atomList
+
+        :param pdb: Structure to align
+        :type pdb: :py:class:`.PDB`
+        :param reference: Structure whose atom naming will be used
+        :type reference: :py:class:`.PDB`
+        :returns: numpy.Array -- Row of pdb that matches each atom of reference
+        :raises: ValueError if the structure has less atoms than the reference
+    """
+    key = (id(pdb.atomList), id(reference.atomList))
+    alignment = _atomAlignments.get(key)
+    if alignment is not None and alignment[0] is pdb.atomList and alignment[1] is reference.atomList:
+        return alignment[2]
+    if len(pdb.atomList) < len(reference.atomList):
+        raise ValueError("Structure with %d atoms can not be aligned to a structure with %d atoms" % (len(pdb.atomList), len(reference.atomList)))
+    atomRows = {atomKey: i for i, atomKey in enumerate(zip(pdb.resChains, pdb.resnums, pdb.atomNames))}
+    referenceKeys = list(zip(reference.resChains, reference.resnums, reference.atomNames))
+    if len(atomRows) == len(pdb.atomList) and len(referenceKeys) == len(set(referenceKeys)) and all(atomKey in atomRows for atomKey in referenceKeys):
+        rows = np.array([atomRows[atomKey] for atomKey in referenceKeys], dtype=np.intp)
+    else:
+        rows = np.arange(len(referenceKeys), dtype=np.intp)
+    if len(_atomAlignments) >= _MAX_ATOM_ALIGNMENTS:
+        _atomAlignments.clear()
+    # the atom lists are kept so that their ids are not reused
+    _atomAlignments[key] = (pdb.atomList, reference.atomList, rows)
+    return rows
+
+
+def alignToCluster(clusterPDB, pdb):
+    """
+        Rename the atoms of a structure so that they match the atoms of a
+        cluster representative. If the atom names of the structure do not
+        match those of the cluster the simulation would stop, so the atoms of
+        the structure take the names of the cluster atoms and keep their
+        coordinates
+
+        :param clusterPDB: Representative structure of the cluster
+        :type clusterPDB: :py:class:`.PDB`
+        :param pdb: Structure to rename
+        :type pdb: :py:class:`.PDB`
+    """
+    pdb.alignToReference(clusterPDB, getAtomAlignment(pdb, clusterPDB))
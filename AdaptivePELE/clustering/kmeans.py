@@ -0,0 +1,339 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import numpy as np
+import scipy.sparse
+from AdaptivePELE.utilities import utilities
+
+# number of snapshots processed at once when assigning or fitting, it bounds
+# the memory used independently of the number of trajectories
+CHUNK_SIZE = 10000
+
+
+def assignCenters(coordinates, centers, chunkSize=CHUNK_SIZE):
+    """
+        Assign each snapshot to its nearest center
+
+        :param coordinates: Coordinates of the snapshots
+        :type coordinates: np.ndarray
+        :param centers: Coordinates of the centers
+        :type centers: np.ndarray
+        :param chunkSize: Number of snapshots assigned at once
+        :type chunkSize: int
+
+        :returns: np.ndarray, np.ndarray -- Index of the nearest center and
+            squared distance to it of each snapshot
+    """
+    nSnapshots = coordinates.shape[0]
+    labels = np.empty(nSnapshots, dtype=int)
+    distances = np.empty(nSnapshots)
+    centersNorm = np.sum(centers**2, axis=1)
+    for start in range(0, nSnapshots, chunkSize):
+        chunk = np.asarray(coordinates[start:start+chunkSize], dtype=float)
+        # ||x-c||^2 = ||x||^2 - 2x*c + ||c||^2, the term ||x||^2 does not
+        # change the nearest center
+        chunkLabels = np.argmin(centersNorm-2*chunk.dot(centers.T), axis=1)
+        labels[start:start+chunk.shape[0]] = chunkLabels
+        # the expansion loses precision for close points, so the distances
+        # are computed again for the nearest centers
+        distances[start:start+chunk.shape[0]] = np.sum((chunk-centers[chunkLabels])**2, axis=1)
+    return labels, distances
+
+
+def sumByCenter(coordinates, labels, nClusters):
+    """
+        Sum the coordinates of the snapshots assigned to each center
+
+        :param coordinates: Coordinates of the snapshots
+        :type coordinates: np.ndarray
+        :param labels: Index of the center of each snapshot
+        :type labels: np.ndarray
+        :param nClusters: Number of centers
+        :type nClusters: int
+
+        :returns: np.ndarray -- Sum of the coordinates of each center
+    """
+    nSnapshots = labels.size
+    membership = scipy.sparse.csr_matrix((np.ones(nSnapshots), (labels, np.arange(nSnapshots))), shape=(nClusters, nSnapshots))
+    return membership.dot(coordinates)
+
+
+def kmeansPlusPlus(coordinates, nClusters, randomState):
+    """
+        Choose the initial centers with the k-means++ algorithm
+
+        :param coordinates: Coordinates of the snapshots
+        :type coordinates: np.ndarray
+        :param nClusters: Number of centers
+        :type nClusters: int
+        :param randomState: Random number generator
+        :type randomState: np.random.RandomState
+
+        :returns: np.ndarray -- Coordinates of the centers
+    """
+    nSnapshots = coordinates.shape[0]
+    centers = np.empty((nClusters, coordinates.shape[1]))
+    centers[0] = coordinates[randomState.randint(nSnapshots)]
+    distances = np.sum((coordinates-centers[0])**2, axis=1)
+    for i in range(1, nClusters):
+        total = distances.sum()
+        if total > 0:
+            chosen = np.searchsorted(np.cumsum(distances), randomState.rand()*total, side="right")
+            chosen = min(chosen, nSnapshots-1)
+        else:
+            # all the snapshots coincide with some center
+            chosen = randomState.randint(nSnapshots)
+        centers[i] = coordinates[chosen]
+        distances = np.minimum(distances, np.sum((coordinates-centers[i])**2, axis=1))
+    return centers
+
+
+def lloydIterations(iterChunks, centers, maxIterations, tolerance):
+    """
+        Refine a set of centers with Lloyd iterations, reading the
+        snapshots in chunks
+
+        :param iterChunks: Function that returns an iterator over the chunks
+            of snapshots
+        :type iterChunks: callable
+        :param centers: Coordinates of the initial centers
+        :type centers: np.ndarray
+        :param maxIterations: Maximum number of iterations
+        :type maxIterations: int
+        :param tolerance: Maximum displacement of the centers for the
+            iterations to be considered converged
+        :type tolerance: float
+
+        :returns: np.ndarray, np.ndarray -- Coordinates of the centers and
+            number of snapshots assigned to each of them
+    """
+    nClusters = centers.shape[0]
+    counts = np.zeros(nClusters)
+    for _ in range(maxIterations):
+        sums = np.zeros_like(centers)
+        counts = np.zeros(nClusters)
+        for chunk in iterChunks():
+            labels, _ = assignCenters(chunk, centers)
+            counts += np.bincount(labels, minlength=nClusters)
+            sums += sumByCenter(chunk, labels, nClusters)
+        # empty clusters keep their center
+        populated = counts > 0
+        newCenters = centers.copy()
+        newCenters[populated] = sums[populated]/counts[populated, np.newaxis]
+        shift = np.max(np.abs(newCenters-centers))
+        centers = newCenters
+        if shift < tolerance:
+            break
+    return centers, counts
+
+
+class CoordinateStore(object):
+    """
+        Append-only store of the coordinates of the trajectories, each saved
+        in a binary numpy file that is memory-mapped when read, so that
+        the trajectories are loaded in chunks and only once as text
+    """
+    def __init__(self, folder):
+        """
+            :param folder: Folder where the coordinates are stored
+            :type folder: str
+        """
+        self.folder = folder
+        # (epoch, trajectory, number of snapshots) of each trajectory, in the
+        # order they were added
+        self.index = []
+        # (epoch, trajectory) of the trajectories in the index
+        self.trajectories = set()
+
+    def __getstate__(self):
+        state = {"folder": self.folder, "index": self.index}
+        return state
+
+    def __setstate__(self, state):
+        self.folder = state['folder']
+        self.index = state.get('index', [])
+        self.trajectories = set((entry[0], entry[1]) for entry in self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def getFilename(self, epoch, trajNum):
+        """
+            Get the file where the coordinates of a trajectory are stored
+
+            :param epoch: Epoch of the trajectory
+            :type epoch: int
+            :param trajNum: Number of the trajectory
+            :type trajNum: int
+
+            :returns: str -- Path of the binary file
+        """
+        return os.path.join(self.folder, "traj_%d_%d.npy" % (epoch, trajNum))
+
+    def hasTrajectory(self, epoch, trajNum):
+        """
+            Check whether a trajectory is in the store
+
+            :param epoch: Epoch of the trajectory
+            :type epoch: int
+            :param trajNum: Number of the trajectory
+            :type trajNum: int
+
+            :returns: bool -- Whether the trajectory has been added
+        """
+        return (epoch, trajNum) in self.trajectories
+
+    def addTrajectory(self, epoch, trajNum, coordinates):
+        """
+            Add the coordinates of a trajectory to the store
+
+            :param epoch: Epoch of the trajectory
+            :type epoch: int
+            :param trajNum: Number of the trajectory
+            :type trajNum: int
+            :param coordinates: Coordinates of the snapshots of the trajectory
+            :type coordinates: np.ndarray
+        """
+        utilities.makeFolder(self.folder)
+        np.save(self.getFilename(epoch, trajNum), np.asarray(coordinates, dtype=float))
+        self.index.append((epoch, trajNum, coordinates.shape[0]))
+        self.trajectories.add((epoch, trajNum))
+
+    def getTrajectory(self, i):
+        """
+            Get the coordinates of a trajectory, memory-mapped
+
+            :param i: Position of the trajectory in the store
+            :type i: int
+
+            :returns: np.ndarray -- Coordinates of the trajectory
+        """
+        epoch, trajNum, _ = self.index[i]
+        return np.load(self.getFilename(epoch, trajNum), mmap_mode="r")
+
+    def iterChunks(self, start=0, chunkSize=CHUNK_SIZE):
+        """
+            Iterate over the snapshots of the trajectories in chunks
+
+            :param start: Position of the first trajectory to read
+            :type start: int
+            :param chunkSize: Maximum number of snapshots of each chunk
+            :type chunkSize: int
+
+            :returns: iterator -- Arrays with the coordinates of each chunk
+        """
+        for i in range(start, len(self.index)):
+            trajectory = self.getTrajectory(i)
+            for begin in range(0, trajectory.shape[0], chunkSize):
+                yield np.asarray(trajectory[begin:begin+chunkSize], dtype=float)
+
+
+class MiniBatchKMeans(object):
+    """
+        K-means clustering over the trajectories of a :py:class:`.CoordinateStore`.
+        The first centers are obtained with Lloyd iterations over chunks of
+        the stored coordinates, afterwards each update starts from the
+        previous centers and processes only the new trajectories in
+        mini-batches, moving each center to the mean of all the snapshots
+        assigned to it. The discretized trajectories already computed are
+        kept, so the cost of an update depends only on the new data
+    """
+    def __init__(self, n_clusters, maxIterations=500, tolerance=1e-5, seed=None):
+        """
+            :param n_clusters: Number of clusters
+            :type n_clusters: int
+            :param maxIterations: Maximum number of Lloyd iterations of the
+                initial clustering
+            :type maxIterations: int
+            :param tolerance: Maximum displacement of the centers for the
+                initial clustering to be considered converged
+            :type tolerance: float
+            :param seed: Seed of the random number generator
+            :type seed: int
+        """
+        self.n_clusters = n_clusters
+        self.maxIterations = maxIterations
+        self.tolerance = tolerance
+        self.seed = seed
+        self.clusterCenters = None
+        # number of snapshots that have contributed to each center
+        self.counts = np.zeros(n_clusters)
+        self.dtrajs = []
+
+    def __getstate__(self):
+        state = {"n_clusters": self.n_clusters, "maxIterations": self.maxIterations,
+                 "tolerance": self.tolerance, "seed": self.seed,
+                 "clusterCenters": self.clusterCenters, "counts": self.counts,
+                 "dtrajs": self.dtrajs}
+        return state
+
+    def __setstate__(self, state):
+        self.n_clusters = state['n_clusters']
+        self.maxIterations = state.get('maxIterations', 500)
+        self.tolerance = state.get('tolerance', 1e-5)
+        self.seed = state.get('seed')
+        self.clusterCenters = state.get('clusterCenters')
+        self.counts = state.get('counts', np.zeros(self.n_clusters))
+        self.dtrajs = state.get('dtrajs', [])
+
+    def fit(self, store):
+        """
+            Cluster all the trajectories of the store with Lloyd iterations,
+            reading the coordinates in chunks
+
+            :param store: Store with the coordinates of the trajectories
+            :type store: :py:class:`.CoordinateStore`
+        """
+        # the initial centers are chosen among a sample of the snapshots
+        randomState = np.random.RandomState(self.seed)
+        sample = np.concatenate([chunk[::max(1, chunk.shape[0]//self.n_clusters)] for chunk in store.iterChunks()])
+        centers = kmeansPlusPlus(sample, self.n_clusters, randomState)
+        centers, counts = lloydIterations(store.iterChunks, centers, self.maxIterations, self.tolerance)
+        self.clusterCenters = centers
+        self.counts = counts
+        self.dtrajs = []
+
+    def partialFit(self, coordinates):
+        """
+            Update the centers with a mini-batch of snapshots, each center
+            moves to the mean of all the snapshots assigned to it so far
+
+            :param coordinates: Coordinates of the snapshots
+            :type coordinates: np.ndarray
+        """
+        labels, _ = assignCenters(coordinates, self.clusterCenters)
+        batchCounts = np.bincount(labels, minlength=self.n_clusters)
+        sums = sumByCenter(coordinates, labels, self.n_clusters)
+        populated = batchCounts > 0
+        self.counts += batchCounts
+        learningRate = batchCounts[populated]/self.counts[populated]
+        batchMeans = sums[populated]/batchCounts[populated, np.newaxis]
+        self.clusterCenters[populated] += learningRate[:, np.newaxis]*(batchMeans-self.clusterCenters[populated])
+
+    def update(self, store):
+        """
+            Update the clustering with the trajectories of the store that
+            have not been discretized yet, and discretize them
+
+            :param store: Store with the coordinates of the trajectories
+            :type store: :py:class:`.CoordinateStore`
+        """
+        if self.clusterCenters is None:
+            self.fit(store)
+        else:
+            for chunk in store.iterChunks(start=len(self.dtrajs)):
+                self.partialFit(chunk)
+        for i in range(len(self.dtrajs), len(store)):
+            labels, _ = assignCenters(store.getTrajectory(i), self.clusterCenters)
+            self.dtrajs.append(labels)
+
+    def assign(self, coordinates):
+        """
+            Assign a set of snapshots to the current centers
+
+            :param coordinates: Coordinates of the snapshots
+            :type coordinates: np.ndarray
+
+            :returns: np.ndarray, np.ndarray -- Index of the nearest center and
+                squared distance to it of each snapshot
+        """
+        return assignCenters(coordinates, self.clusterCenters)
@@ -11,6 +11,7 @@ class ClusteringTypes:
     ligandResnum = "ligandResnum"
     ligandChain = "ligandChain"
     alternativeStructure = "alternativeStructure"
+    parallelPreprocessing = "parallelPreprocessing"
     contactThresholdDistance = "contactThresholdDistance"
     nclusters = "nclusters"
     similarityEvaluator = "similarityEvaluator"
@@ -184,6 +185,8 @@ class SimulationParams:
     forcefield = "forcefield"
     customparamspath = "customparamspath"
     maxDevicesPerReplica = "maxDevicesPerReplica"
+    synchronizationBackend = "synchronizationBackend"
+    asynchronousSpawning = "asynchronousSpawning"
     format = "format"
     ligandName = "ligandName"
     cofactors = "cofactors"
@@ -218,6 +221,8 @@ class GeneralParams:
     debug = "debug"
     writeAllClustering = "writeAllClusteringStructures"
     nativeStructure = "nativeStructure"
+    pipelinedClustering = "pipelinedClustering"
+    profiling = "profiling"
 
 class CofactorTemplateNames:
     fadh = "fadh-"
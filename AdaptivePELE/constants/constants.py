@@ -43,6 +43,9 @@ else:
 
 inputFileTemplate = "{ \"files\" : [ { \"path\" : \"%s\" } ] }"
 trajectoryBasename = "*traj*"
+# hidden file written once a trajectory of an epoch is completely written, it
+# contains the name of the trajectory file
+finishedTrajectoryTemplate = ".finished_%d"
 
 
 class AmberTemplates:
@@ -0,0 +1,270 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import glob
+import numpy as np
+from AdaptivePELE.utilities import utilities
+from AdaptivePELE.clustering import kmeans
+from AdaptivePELE.spawning import markovModel
+from AdaptivePELE.freeEnergies import computeDeltaG
+from AdaptivePELE.freeEnergies import utilitiesFreeEnergies
+PARALELLIZATION = True
+try:
+    import multiprocessing as mp
+except ImportError:
+    PARALELLIZATION = False
+
+# data of the bootstrap, set in each process of the pool when it starts so
+# that it is not sent with every replicate
+_bootstrapData = None
+
+
+def loadTrajectories(fileWildcard, length=None, skipFirstSteps=0):
+    """
+        Load the extracted coordinates of the trajectories, trimmed as in
+        :py:func:`.estimateDG.copyWorkingTrajectories` and without the
+        column of the steps
+
+        :param fileWildcard: Wildcard to match the trajectory files
+        :type fileWildcard: str
+        :param length: Trajectory length to consider, if None the full
+            trajectory is considered
+        :type length: int
+        :param skipFirstSteps: Skip first trajectory steps
+        :type skipFirstSteps: int
+
+        :returns: list, list -- Coordinates of the trajectories and names of
+            their files
+    """
+    trajectories = []
+    filenames = []
+    for trajFile in glob.glob(fileWildcard):
+        traj = utilities.loadExtractedCoordinates(trajFile)
+        if length is None:
+            trajLength = len(traj)
+        else:
+            trajLength = length
+        trimmedTraj = np.array(traj[skipFirstSteps:trajLength+1, 1:], dtype=float)
+        if len(trimmedTraj) > 0:
+            trajectories.append(trimmedTraj)
+            filenames.append(trajFile)
+    if not trajectories:
+        raise ValueError("Didn't find any trajectory files in the specified path!!!")
+    return trajectories, filenames
+
+
+class BootstrapData(object):
+    """
+        Trajectories of a bootstrap estimation of the binding free energy,
+        loaded once and shared by all the replicates, with a clustering of
+        all of them that is the starting point of the clustering of each
+        replicate and the voxels occupied by each trajectory in a box that
+        contains all of them
+    """
+    def __init__(self, trajectories, nclusters, d=0.75, maxIterations=500, tolerance=1e-5, seed=None):
+        """
+            :param trajectories: Coordinates of the trajectories
+            :type trajectories: list
+            :param nclusters: Number of clusters
+            :type nclusters: int
+            :param d: Side of the voxels used to estimate the volumes
+            :type d: float
+            :param maxIterations: Maximum number of Lloyd iterations of the
+                clustering of all the trajectories
+            :type maxIterations: int
+            :param tolerance: Maximum displacement of the centers for the
+                clustering to be considered converged
+            :type tolerance: float
+            :param seed: Seed of the random number generator of the clustering
+            :type seed: int
+        """
+        self.trajectories = trajectories
+        self.nclusters = nclusters
+        self.d = d
+        self.tolerance = tolerance
+        randomState = np.random.RandomState(seed)
+        sample = np.concatenate([traj[::max(1, traj.shape[0]//nclusters)] for traj in trajectories])
+        centers = kmeans.kmeansPlusPlus(sample, nclusters, randomState)
+        self.clusterCenters, _ = kmeans.lloydIterations(lambda: iter(trajectories), centers, maxIterations, tolerance)
+        self.dtrajs = [kmeans.assignCenters(traj, self.clusterCenters)[0] for traj in trajectories]
+        # create_box only uses the centers to get the number of dimensions
+        self.bins = computeDeltaG.create_box(self.clusterCenters, trajectories, d)
+        self.voxels = [computeDeltaG.get_occupied_voxels([traj], self.bins) for traj in trajectories]
+
+
+def getBootstrapSamples(ntrajectories, nruns, ntrajs=None, useAllTrajInFirstRun=True, seed=None):
+    """
+        Resample the indices of the trajectories used in each replicate
+
+        :param ntrajectories: Number of trajectories available
+        :type ntrajectories: int
+        :param nruns: Number of replicates
+        :type nruns: int
+        :param ntrajs: Number of trajectories of each replicate, if None
+            the number of trajectories available
+        :type ntrajs: int
+        :param useAllTrajInFirstRun: Use all the trajectories, without
+            resampling, in the first replicate
+        :type useAllTrajInFirstRun: bool
+        :param seed: Seed of the random number generator
+        :type seed: int
+
+        :returns: list -- Indices of the trajectories of each replicate
+    """
+    if ntrajs is None:
+        ntrajs = ntrajectories
+    randomState = np.random.RandomState(seed)
+    samples = []
+    for i in range(nruns):
+        if useAllTrajInFirstRun and i == 0:
+            samples.append(np.arange(ntrajectories))
+        else:
+            samples.append(randomState.randint(ntrajectories, size=ntrajs))
+    return samples
+
+
+def removeLowPopulatedClusters(trajectories, centers, dtrajs, clusterCountsThreshold):
+    """
+        Remove the clusters with less snapshots than a threshold, and those
+        without snapshots, and assign the trajectories to the remaining ones
+
+        :param trajectories: Coordinates of the trajectories
+        :type trajectories: list
+        :param centers: Coordinates of the centers
+        :type centers: np.ndarray
+        :param dtrajs: Discretized trajectories
+        :type dtrajs: list
+        :param clusterCountsThreshold: Minimum number of snapshots of a cluster
+        :type clusterCountsThreshold: int
+
+        :returns: np.ndarray, list -- Coordinates of the remaining centers and
+            discretized trajectories
+    """
+    counts = np.bincount(np.concatenate(dtrajs), minlength=centers.shape[0])
+    keep = counts >= max(1, clusterCountsThreshold)
+    if keep.all():
+        return centers, dtrajs
+    centers = centers[keep]
+    return centers, [kmeans.assignCenters(traj, centers)[0] for traj in trajectories]
+
+
+def getAsymmetricFlux(dtrajs, lagtime, nclusters):
+    """
+        Compute the deviation from detailed balance of a discretization as
+        :py:func:`.checkDetailedBalance.main` with no counts threshold
+
+        :param dtrajs: Discretized trajectories
+        :type dtrajs: list
+        :param lagtime: Lagtime of the transitions
+        :type lagtime: int
+        :param nclusters: Number of clusters
+        :type nclusters: int
+
+        :returns: float -- Average asymmetric flux
+    """
+    populations = np.bincount(np.concatenate(dtrajs), minlength=nclusters).astype(float)
+    countMatrix = markovModel.countTransitions(dtrajs, lagtime, nclusters).toarray()
+    countMatrix += 1./nclusters
+    populations /= populations.sum()
+    transitions = countMatrix/countMatrix.sum(axis=1)[:, np.newaxis]
+    return utilitiesFreeEnergies.computeAsymmetricFlux(populations, transitions)[-1]
+
+
+def _setBootstrapData(data):
+    global _bootstrapData
+    _bootstrapData = data
+
+
+def runReplicate(indices, lagtime, clusteringIterations=10, clusterCountsThreshold=0, computeDetailedBalance=False):
+    """
+        Estimate the binding free energy of a bootstrap replicate from the
+        trajectories loaded in the current process. The centers of the
+        clustering of all the trajectories are refined with a few Lloyd
+        iterations over the trajectories of the replicate, and only the
+        count matrix of the replicate is computed again
+
+        :param indices: Indices of the trajectories of the replicate
+        :type indices: np.ndarray
+        :param lagtime: Lagtime of the MSM
+        :type lagtime: int
+        :param clusteringIterations: Maximum number of Lloyd iterations to
+            refine the centers, with 0 the discretization of all the
+            trajectories is reused
+        :type clusteringIterations: int
+        :param clusterCountsThreshold: Minimum number of snapshots of a cluster
+        :type clusterCountsThreshold: int
+        :param computeDetailedBalance: Compute the asymmetric flux of the
+            discretization
+        :type computeDetailedBalance: bool
+
+        :returns: dict -- Results of the replicate, with the dG line of the
+            pmf ("deltaG"), the asymmetric flux ("detailedBalance") and the
+            centers, volumes and pmf of the clusters ("clusters", "volumes",
+            "gpmf")
+    """
+    data = _bootstrapData
+    trajectories = [data.trajectories[i] for i in indices]
+    if clusteringIterations > 0:
+        centers, _ = kmeans.lloydIterations(lambda: iter(trajectories), data.clusterCenters, clusteringIterations, data.tolerance)
+        dtrajs = [kmeans.assignCenters(traj, centers)[0] for traj in trajectories]
+    else:
+        centers = data.clusterCenters
+        dtrajs = [data.dtrajs[i] for i in indices]
+    centers, dtrajs = removeLowPopulatedClusters(trajectories, centers, dtrajs, clusterCountsThreshold)
+
+    model = markovModel.MarkovModel(lagtime)
+    model.estimate(dtrajs)
+    pi, clusters = computeDeltaG.ensure_connectivity(model, centers)
+    # the voxels of each trajectory are only added once, even if it is
+    # sampled several times
+    voxels = np.unique(np.vstack([data.voxels[i] for i in np.unique(indices)]), axis=0)
+    volumes = computeDeltaG.assign_voxel_volumes(clusters, computeDeltaG.fill_voxel_columns(voxels), data.bins, data.d)
+    gpmf, string = computeDeltaG.calculate_pmf(volumes, pi)
+    results = {"deltaG": string, "clusters": clusters, "volumes": volumes, "gpmf": gpmf, "detailedBalance": None}
+    if computeDetailedBalance:
+        results["detailedBalance"] = getAsymmetricFlux(dtrajs, lagtime, centers.shape[0])
+    return results
+
+
+def _runReplicate(args):
+    return runReplicate(*args)
+
+
+def runBootstrap(data, samples, lagtime, clusteringIterations=10, clusterCountsThreshold=0, computeDetailedBalance=False, nProcessors=None):
+    """
+        Run the bootstrap replicates in a pool of processes that share the
+        loaded trajectories
+
+        :param data: Trajectories and clustering shared by the replicates
+        :type data: :py:class:`.BootstrapData`
+        :param samples: Indices of the trajectories of each replicate
+        :type samples: list
+        :param lagtime: Lagtime of the MSM
+        :type lagtime: int
+        :param clusteringIterations: Maximum number of Lloyd iterations to
+            refine the centers of each replicate
+        :type clusteringIterations: int
+        :param clusterCountsThreshold: Minimum number of snapshots of a cluster
+        :type clusterCountsThreshold: int
+        :param computeDetailedBalance: Compute the asymmetric flux of each
+            replicate
+        :type computeDetailedBalance: bool
+        :param nProcessors: Number of processes, if None all the available
+            cpus are used
+        :type nProcessors: int
+
+        :returns: list -- Results of each replicate, as returned by
+            :py:func:`.runReplicate`
+    """
+    tasks = [(indices, lagtime, clusteringIterations, clusterCountsThreshold, computeDetailedBalance) for indices in samples]
+    if nProcessors is None:
+        nProcessors = utilities.getCpuCount()
+    nProcessors = min(max(1, nProcessors), len(tasks))
+    if not PARALELLIZATION or nProcessors == 1:
+        _setBootstrapData(data)
+        return [_runReplicate(task) for task in tasks]
+    pool = mp.Pool(nProcessors, initializer=_setBootstrapData, initargs=(data,))
+    try:
+        results = pool.map(_runReplicate, tasks)
+    finally:
+        pool.close()
+        pool.join()
+    return results
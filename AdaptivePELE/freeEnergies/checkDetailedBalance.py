@@ -5,7 +5,7 @@ import argparse
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy import linalg
+from AdaptivePELE.freeEnergies import utilitiesFreeEnergies
 
 FOLDER = "discretized"
 CLUSTER_CENTERS = "clusterCenters.dat"
@@ -168,10 +168,7 @@ def main(folder, countsThreshold, lagtime, printFigs=False):
         # plotMatrix(6, r'$P_{ij}, P_{ii} = 0 \forall i$', transitionsWithoutDiagonal,cmap)
         pass
 
-    # p_i * P_ij
-    detailedBalanceComponents = np.copy(transitions)
-    for i in range(len(detailedBalanceComponents)):
-        detailedBalanceComponents[i] = np.multiply(populations[i], transitions[i])
+    detailedBalanceComponents, detailedBalanceComponentsAbsoluteDifference, detailedBalanceComponentsAverage, frobeniusAvg = utilitiesFreeEnergies.computeAsymmetricFlux(populations, transitions)
 
     if printFigs:
         # barPlot(1, 'Population', populations)
@@ -180,9 +177,6 @@ def main(folder, countsThreshold, lagtime, printFigs=False):
         plotMatrix(3, r'$\pi_i P_{ij}$', detailedBalanceComponents, cmap)
         # plt.savefig("db_flux.eps")
 
-    detailedBalanceComponentsAbsoluteDifference = np.absolute(detailedBalanceComponents - detailedBalanceComponents.T) / 2.  # factor 2 to avoid the metric to go from 0 to 2, but from 0 to 1
-    detailedBalanceComponentsAverage = np.multiply(detailedBalanceComponents + detailedBalanceComponents.T, 0.5)
-    frobeniusAvg = linalg.norm(detailedBalanceComponentsAbsoluteDifference) / linalg.norm(detailedBalanceComponentsAverage)
     print("|semidiff| / |average|", frobeniusAvg)
 
     np.seterr(divide='ignore', invalid='ignore')
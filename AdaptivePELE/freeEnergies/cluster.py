@@ -114,7 +114,7 @@ def loadTrajFiles(trajectoryFolder, trajectory_basename):
     files = glob.glob(trajectoryBasename)
     x = len(files)*[0]
     for i, f in enumerate(files):
-        currentX = np.loadtxt(f, ndmin=2)[:, 1:]
+        currentX = utilities.loadExtractedCoordinates(f)[:, 1:]
         x[i] = currentX
     if not x:
         raise ValueError("Didn't find any trajectory files in the specified path!!!")
@@ -13,16 +13,28 @@ import sys
 import itertools
 import argparse
 import numpy as np
+from scipy.spatial import cKDTree
 try:
     import cPickle
 except ImportError:
     import pickle as cPickle
-from pyemma.coordinates.clustering import AssignCenters
+PYEMMA = True
+try:
+    from pyemma.coordinates.clustering import AssignCenters
+except ImportError:
+    PYEMMA = False
 from AdaptivePELE.freeEnergies import utils
 from AdaptivePELE.freeEnergies.utilitiesFreeEnergies import getStationaryDistr, getSortedEigen
+from AdaptivePELE.utilities import utilities
+
+
+# number of points or voxels processed at once in the volume estimation
+CHUNK_SIZE = 100000
 
 
 def assignNewTrajectories(trajs, clusterCenters):
+    if not PYEMMA:
+        raise utilities.UnsatisfiedDependencyException("Pyemma module is necessary to assign the trajectories to the clusters")
     assign = AssignCenters(clusterCenters)
     dTrajs = assign.assign(trajs)
     return dTrajs
@@ -121,7 +133,7 @@ def ensure_connectivity(MSMObject, allClusters):
 def gather_coordinates(originalFilenames):
     originalCoordinates = []
     for originalFilename in originalFilenames:
-        trajOriginalCoordinates = list(np.loadtxt(originalFilename, ndmin=2)[:, 1:])
+        trajOriginalCoordinates = list(utilities.loadExtractedCoordinates(originalFilename)[:, 1:])
         if np.random.random() < 0.0:
             # Add artificial points nearby to improve volume estimation, set
             # randomly since its very slow
@@ -149,9 +161,11 @@ def create_box(clusters, originalCoordinates, d):
 
     # Rounded floor and ceiling in intervals of "d" (e.g., floor of 1.73 with d = 0.5, will be 1.5 instead of 1.0, in order to optimize box creation.
     # An extra box is included in the ceiling, so that all the points are contained in the range given by arange
-    bins = np.array([np.arange(np.floor(minval[i]) + d*int((minval[i] - np.floor(minval[i]))/d),
-                               np.ceil(maxval[i]) + d*(int((maxval[i] - np.ceil(maxval[i]))/d) + 1),
-                               d) for i in range(3)])
+    # the edges of each dimension may have different lengths, so they are
+    # returned as a list
+    bins = [np.arange(np.floor(minval[i]) + d*int((minval[i] - np.floor(minval[i]))/d),
+                      np.ceil(maxval[i]) + d*(int((maxval[i] - np.ceil(maxval[i]))/d) + 1),
+                      d) for i in range(3)]
     return bins
 
 
@@ -214,44 +228,132 @@ def calculate_microstate_volumes(clusters, originalCoordinates, bins, d):
     return microstateVolume
 
 
-def calculate_microstate_volumes_new(clusters, originalCoordinates, bins, d):
+def get_voxel_indices(coordinates, bins):
     """
-        Estimate the clusters volumes using a cubic discretization of volumes
+        Get the indices of the voxel of each point, binned as in
+        np.histogramdd, discarding the points outside the box
+
+        :param coordinates: Coordinates of the points
+        :type coordinates: np.ndarray
+        :param bins: Edges of the voxels in each dimension
+        :type bins: list
+
+        :returns: np.ndarray -- Indices of the voxel of each point
     """
-    numberOfClusters = clusters.shape[0]
-    print("Number of clusters", numberOfClusters)
+    indices = np.empty((coordinates.shape[0], len(bins)), dtype=int)
+    inside = np.ones(coordinates.shape[0], dtype=bool)
+    for axis, edges in enumerate(bins):
+        values = coordinates[:, axis]
+        axisIndices = np.searchsorted(edges, values, side="right") - 1
+        # the last edge belongs to the last voxel
+        axisIndices[values == edges[-1]] = len(edges) - 2
+        inside &= (axisIndices >= 0) & (axisIndices < len(edges) - 1)
+        indices[:, axis] = axisIndices
+    return indices[inside]
+
+
+def get_occupied_voxels(originalCoordinates, bins):
+    """
+        Get the voxels that contain at least one point, reading the
+        trajectories in chunks so that the memory depends on the number of
+        occupied voxels and not on the size of the box
 
-    allCoords = []
-    # The coordinates array is built through lists in order to be able to
-    # process trajectories of different lenght
+        :param originalCoordinates: Coordinates of the trajectories
+        :type originalCoordinates: list
+        :param bins: Edges of the voxels in each dimension
+        :type bins: list
+
+        :returns: np.ndarray -- Indices of the occupied voxels, sorted
+    """
+    nDimensions = len(bins)
+    voxels = np.zeros((0, nDimensions), dtype=int)
+    pending = []
+    nPending = 0
     for coord in originalCoordinates:
-        allCoords.extend(coord[:, :3].tolist())
-    allCoords = np.array(allCoords)
-
-    histogram, _ = np.histogramdd(allCoords, bins=bins)
-
-    centers_trajs = []
-    for i, matrix in enumerate(histogram):
-        centers_x = []
-        x_val = bins[0][i]
-        for j, row in enumerate(matrix):
-            y_val = bins[1][j]
-            indices, = np.nonzero(row)
-            if indices.size > 0:
-                init = indices[0]
-                end = indices[-1]
-                centers_x.extend([[x_val, y_val, bins[2][zi]] for zi in range(init, end+1)])
-        if len(centers_x):
-            centers_trajs.append(np.array(centers_x))
-
-    dtrajs = assignNewTrajectories(centers_trajs, clusters[:, :3])
+        for start in range(0, coord.shape[0], CHUNK_SIZE):
+            chunk = np.asarray(coord[start:start+CHUNK_SIZE, :nDimensions], dtype=float)
+            pending.append(np.unique(get_voxel_indices(chunk, bins), axis=0))
+            nPending += pending[-1].shape[0]
+            if nPending > CHUNK_SIZE:
+                voxels = np.unique(np.vstack([voxels] + pending), axis=0)
+                pending = []
+                nPending = 0
+    return np.unique(np.vstack([voxels] + pending), axis=0)
+
+
+def fill_voxel_columns(voxels):
+    """
+        Add the voxels between the lowest and highest occupied voxels of
+        each column along the last dimension
+
+        :param voxels: Indices of the occupied voxels, sorted
+        :type voxels: np.ndarray
+
+        :returns: np.ndarray -- Indices of the filled voxels
+    """
+    if voxels.shape[0] == 0:
+        return voxels
+    # the voxels are sorted, so those of each column are contiguous
+    columns = voxels[:, :-1]
+    starts = np.flatnonzero(np.concatenate(([True], np.any(columns[1:] != columns[:-1], axis=1))))
+    ends = np.append(starts[1:], voxels.shape[0]) - 1
+    lowest = voxels[starts, -1]
+    lengths = voxels[ends, -1] - lowest + 1
+    filled = np.repeat(voxels[starts], lengths, axis=0)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    filled[:, -1] = np.repeat(lowest, lengths) + offsets
+    return filled
+
+
+def calculate_microstate_volumes_new(clusters, originalCoordinates, bins, d):
+    """
+        Estimate the clusters volumes using a cubic discretization of volumes.
+        Only the occupied voxels, and those between occupied voxels along the
+        last dimension, are built and assigned to their closest cluster
+        center
+
+        :param clusters: Cluster centers
+        :type clusters: np.ndarray
+        :param originalCoordinates: Coordinates of the trajectories
+        :type originalCoordinates: list
+        :param bins: Edges of the voxels in each dimension
+        :type bins: list
+        :param d: Side of the voxels
+        :type d: float
+
+        :returns: np.ndarray -- Volume of each cluster
+    """
+    print("Number of clusters", clusters.shape[0])
+
+    voxels = fill_voxel_columns(get_occupied_voxels(originalCoordinates, bins))
+    return assign_voxel_volumes(clusters, voxels, bins, d)
+
+
+def assign_voxel_volumes(clusters, voxels, bins, d):
+    """
+        Add the volume of each voxel to its closest cluster center
+
+        :param clusters: Cluster centers
+        :type clusters: np.ndarray
+        :param voxels: Indices of the voxels
+        :type voxels: np.ndarray
+        :param bins: Edges of the voxels in each dimension
+        :type bins: list
+        :param d: Side of the voxels
+        :type d: float
+
+        :returns: np.ndarray -- Volume of each cluster
+    """
+    numberOfClusters = clusters.shape[0]
+    tree = cKDTree(clusters[:, :len(bins)])
     microstateVolume = np.zeros(numberOfClusters)
-    for traj in dtrajs:
-        counts, _ = np.histogram(traj, bins=np.arange(-0.5, numberOfClusters))
-        microstateVolume += counts
+    for start in range(0, voxels.shape[0], CHUNK_SIZE):
+        chunk = voxels[start:start+CHUNK_SIZE]
+        # each voxel is represented by its lowest corner
+        corners = np.column_stack([np.asarray(edges)[chunk[:, axis]] for axis, edges in enumerate(bins)])
+        _, assignment = tree.query(corners)
+        microstateVolume += np.bincount(assignment, minlength=numberOfClusters)
     microstateVolume *= d**3
-    # provisional return for debugging and testing script
-    # return microstateVolume, centers_trajs, dtrajs
     return microstateVolume
 
 
@@ -288,15 +390,17 @@ def calculate_pmf(microstateVolume, pi, divide_volume=False):
     # Initialize string variable in case loop is not accessed
     string = ""
 
-    bound_vols = []
-    for upperGpmfValue in upperGpmfValues:
-        bindingVolume = 0
-        for g, volume in zip(gpmf, microstateVolume):
-            if g <= upperGpmfValue:
-                bindingVolume += np.exp(-beta * g) * volume
-        bound_vols.append(bindingVolume)
-        deltaG = -deltaW - kb*T*np.log(bindingVolume/1661)
-        string = "%.1f\t%.3f\t%.3f\t%.3f\t%.3f" % (upperGpmfValue, deltaG, deltaW, bindingVolume, -kb*T*np.log(bindingVolume/1661))
+    # the binding volume of each upper value is the cumulative sum of the
+    # weighted volumes of the clusters sorted by pmf
+    order = np.argsort(gpmf)
+    weightedVolumes = np.exp(-beta * gpmf[order]) * microstateVolume[order]
+    cumulativeVolumes = np.concatenate(([0], np.cumsum(weightedVolumes)))
+    bound_vols = cumulativeVolumes[np.searchsorted(gpmf[order], upperGpmfValues, side="right")]
+    with np.errstate(divide="ignore"):
+        volumeContributions = -kb*T*np.log(bound_vols/1661)
+    deltaGs = -deltaW + volumeContributions
+    for upperGpmfValue, deltaG, bindingVolume, volumeContribution in zip(upperGpmfValues, deltaGs, bound_vols, volumeContributions):
+        string = "%.1f\t%.3f\t%.3f\t%.3f\t%.3f" % (upperGpmfValue, deltaG, deltaW, bindingVolume, volumeContribution)
         print(string)
     differences = np.diff(bound_vols)
     if np.mean(np.abs(differences[-3:])) > 1:
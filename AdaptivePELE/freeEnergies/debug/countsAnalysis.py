@@ -1,6 +1,6 @@
 import pyemma
-import pickle
 import numpy as np
+from AdaptivePELE.utilities import utilities
 
 
 def inout(i):
@@ -15,8 +15,7 @@ def updown(i, down):
     print "from conjugate", C[:,i].sum() - C[down,i].sum() - C[i,i]
     print "to conjugate", C[i,:].sum() - C[i,down].sum() - C[i,i]
 
-with open("MSM_object_0.pkl", 'rb') as f:
-    msmObj = pickle.load(f)
+msmObj = utilities.readClusteringObject("MSM_object_0.pkl")
 
 C = msmObj.count_matrix_full
 
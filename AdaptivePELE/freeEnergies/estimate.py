@@ -8,6 +8,7 @@ import matplotlib.pyplot as plt
 import pyemma.msm as msm
 import pyemma.plots as mplt
 import numpy as np
+from AdaptivePELE.freeEnergies import utilitiesFreeEnergies
 
 
 class MSM:
@@ -35,6 +36,7 @@ class MSM:
         self.dtrajs = dtrajs
         self.stationaryDistributionFilename = "stationaryDistribution.dat"
         self.numPCCA = None
+        self.autoCorrelation = None
 
     def estimate(self, lagtime=None, lagtimes=None, numberOfITS=-1):
         self.lagtime = lagtime
@@ -98,9 +100,31 @@ class MSM:
             its_object = msm.its(self.dtrajs, lags=self.lagtimes, errors=itsErrors)
             mplt.plot_implied_timescales(its_object, outfile=self.itsOutput, nits=self.numberOfITS)
             plt.savefig("its.png")
+            self.calculateAutoCorrelation()
         if self.lagtime is not None:
             return self.lagtime
 
+    def calculateAutoCorrelation(self, limit=np.exp(-1)):
+        """ Calculate the autocorrelation of the states at the lagtimes of
+        the implied time-scales and print, for each lagtime, the number of
+        states that are still correlated, as a quick check of the lagtimes
+        before estimating the MSM
+
+        limit: value of the autocorrelation considered uncorrelated
+        """
+        lagtimes = sorted(self.lagtimes)
+        nclusters = max(np.max(dtraj) for dtraj in self.dtrajs)+1
+        self.autoCorrelation = utilitiesFreeEnergies.calculateAutoCorrelation(lagtimes, self.dtrajs, nclusters)
+        print("Lagtime  Correlated states")
+        for lagtime, correlated in zip(lagtimes, np.sum(self.autoCorrelation > limit, axis=0)):
+            print("%7d  %d" % (lagtime, correlated))
+        correlationTimes = utilitiesFreeEnergies.getCorrelationTimes(self.autoCorrelation, lagtimes, limit=limit)
+        if np.any(correlationTimes == -1):
+            print("Correlation time not achieved at lagtime %d" % lagtimes[-1])
+        else:
+            print("Correlation time of all states achieved at lagtime %d" % correlationTimes.max())
+        return self.autoCorrelation
+
     def _calculateITS_old(self):
         is_converged = False
         # its
@@ -120,6 +144,7 @@ class MSM:
                 its_object = msm.its(self.dtrajs, lags=self.lagtimes, errors=itsErrors)
                 mplt.plot_implied_timescales(its_object, outfile=self.itsOutput, nits=self.numberOfITS)
                 plt.savefig("its.png")
+                self.calculateAutoCorrelation()
             if self.lagtime is not None:
                 return self.lagtime
             while True:
@@ -11,10 +11,11 @@ from AdaptivePELE.freeEnergies import cluster
 from AdaptivePELE.freeEnergies import ownBuildMSM
 from AdaptivePELE.freeEnergies import computeDeltaG
 from AdaptivePELE.freeEnergies import checkDetailedBalance
+from AdaptivePELE.freeEnergies import bootstrapDG
 
 
 class Parameters:
-    def __init__(self, ntrajs, length, lagtime, nclusters, nruns, useAllTrajInFirstRun, computeDetailedBalance, trajWildcard, folderWithTraj, lagtimes=None, skipFirstSteps=0, clusterCountsThreshold=0, clusteringStride=1):
+    def __init__(self, ntrajs, length, lagtime, nclusters, nruns, useAllTrajInFirstRun, computeDetailedBalance, trajWildcard, folderWithTraj, lagtimes=None, skipFirstSteps=0, clusterCountsThreshold=0, clusteringStride=1, inMemoryBootstrap=False, nProcessors=None):
         # If ntrajs/length = None, all trajs/lengths will be used
         self.trajWildcard = trajWildcard
         self.folderWithTraj = folderWithTraj
@@ -32,6 +33,10 @@ class Parameters:
         self.skipFirstSteps = skipFirstSteps
         self.clusterCountsThreshold = clusterCountsThreshold
         self.clusteringStride = clusteringStride
+        # run the replicates in parallel over trajectories loaded once,
+        # instead of copying them and running the whole pipeline for each
+        self.inMemoryBootstrap = inMemoryBootstrap
+        self.nProcessors = nProcessors
 
 
 def __rm(filename):
@@ -119,7 +124,7 @@ def copyWorkingTrajectories(fileWildcard, length=None, ntrajs=None, bootstrap=Tr
     for i, trajFile in enumerate(trajFiles):
         dst = __getDstName(bootstrap, i, trajFile)
         writenFiles.append(dst)
-        traj = utilities.loadtxtfile(trajFile)
+        traj = utilities.loadExtractedCoordinates(trajFile)
         if length is None:
             traj_len = len(traj)  # so that later eveything is copied
         else:
@@ -206,7 +211,7 @@ def getCentersInfo(clusterCenters, trajs, files, dtrajs):
 
 def getRepresentativePDBs(filesWildcard, run):
     files = glob.glob(filesWildcard)
-    trajs = [utilities.loadtxtfile(f)[:, 1:] for f in files]
+    trajs = [utilities.loadExtractedCoordinates(f)[:, 1:] for f in files]
     cl = cluster.Cluster(0, "", "")
     cl.clusterCenters = utilities.loadtxtfile(cl.clusterCentersFile)
     dtrajs = cl.assignNewTrajectories(trajs)
@@ -234,6 +239,8 @@ def estimateDG(parameters, cleanupClusterCentersAtStart=False):
 
         Documentation needs to be expanded, but the code style aims to help readability
     """
+    if parameters.inMemoryBootstrap:
+        return estimateDGInMemory(parameters)
 
     workingControlFile = "control_MSM.conf"
     origFilesWildcard = os.path.join(parameters.folderWithTraj, parameters.trajWildcard)
@@ -269,6 +276,14 @@ def estimateDG(parameters, cleanupClusterCentersAtStart=False):
         # of windows that are not closed, which consumes a lot of memory (not
         # sure how much exactly)
         plt.close("all")
+    return writeResultsSummary(parameters, deltaGs, detailedBalance)
+
+
+def writeResultsSummary(parameters, deltaGs, detailedBalance):
+    """
+        Print the dG and asymmetric fluxes of the runs and write them, with
+        their mean and standard deviation, to results_summary.txt
+    """
     # PLOT RESULTS
     # FIX TO WORK WITH NONES
     # print("clusters: %d, ntrajs: %d, trajLength: %d, lagtime: # % d"%(parameters.nclusters, parameters.ntrajs, parameters.length, # parameters.lagtime))
@@ -297,6 +312,46 @@ def estimateDG(parameters, cleanupClusterCentersAtStart=False):
 
     return meanDG, stdDG, meanDB, stdDB
 
+
+def estimateDGInMemory(parameters, clusteringIterations=10, seed=None):
+    """
+        Estimates the absolute binding free energy using the parameters in
+        the Parameters object, as estimateDG, but loading the trajectories
+        once and running the replicates in parallel. The replicates resample
+        the trajectories in memory, start their clustering from the
+        clustering of all the trajectories and estimate the MSM from their
+        count matrix, without writing intermediate files
+
+        :param parameters: Parameters of the estimation
+        :type parameters: :py:class:`.Parameters`
+        :param clusteringIterations: Maximum number of Lloyd iterations to
+            refine the centers of each replicate
+        :type clusteringIterations: int
+        :param seed: Seed of the random number generators
+        :type seed: int
+
+        :returns: float, float, float, float -- Mean and standard deviation of
+            the dG and the asymmetric flux
+    """
+    origFilesWildcard = os.path.join(parameters.folderWithTraj, parameters.trajWildcard)
+    trajectories, _ = bootstrapDG.loadTrajectories(origFilesWildcard, parameters.length, parameters.skipFirstSteps)
+    data = bootstrapDG.BootstrapData(trajectories, parameters.nclusters, seed=seed)
+    samples = bootstrapDG.getBootstrapSamples(len(trajectories), parameters.nruns, parameters.ntrajs, parameters.useAllTrajInFirstRun, seed=seed)
+    results = bootstrapDG.runBootstrap(data, samples, parameters.lagtime, clusteringIterations=clusteringIterations, clusterCountsThreshold=parameters.clusterCountsThreshold, computeDetailedBalance=parameters.computeDetailedBalance, nProcessors=parameters.nProcessors)
+
+    deltaGs = []
+    detailedBalance = []
+    for i, result in enumerate(results):
+        deltaGs.append(result["deltaG"])
+        if parameters.computeDetailedBalance:
+            detailedBalance.append(result["detailedBalance"])
+        pmf_xyzg = np.hstack((result["clusters"], np.expand_dims(result["gpmf"], axis=1)))
+        np.savetxt("clusterCenters_%d.dat" % i, result["clusters"], fmt="%.5f")
+        np.savetxt("volumeOfClusters_%d.dat" % i, result["volumes"])
+        np.savetxt("pmf_xyzg_%d.dat" % i, pmf_xyzg)
+        computeDeltaG.writePDB(pmf_xyzg, title="clusters_%d.pdb" % i)
+    return writeResultsSummary(parameters, deltaGs, detailedBalance)
+
 if __name__ == "__main__":
     params = Parameters(ntrajs=None, length=None, lagtime=25, nclusters=100,
                         nruns=1, skipFirstSteps=0, useAllTrajInFirstRun=True,
@@ -1,6 +1,5 @@
 # coding: utf-8
 from __future__ import absolute_import, division, print_function, unicode_literals
-from builtins import range
 import os
 import re
 import sys
@@ -44,22 +43,30 @@ EXTRA_ATOMS_CENTRAL = {u"ALA": u"empty", u"VAL": u"empty", u"LEU": u"CG", u"ILE"
 
 
 class Constants(object):
-    def __init__(self):
+    def __init__(self, binaryFormat=False):
+        # in binary format the coordinates are written as .npy files, and as
+        # .npz files once the rejected steps are repeated (see
+        # utilities.loadExtractedCoordinates)
+        if binaryFormat:
+            self.extension = ".npy"
+            self.baseGatheredFilename = "traj_*.np[yz]"
+        else:
+            self.extension = ".dat"
+            self.baseGatheredFilename = "traj_*.dat"
         self.extractedTrajectoryFolder = "%s/extractedCoordinates"
         self.baseExtractedTrajectoryName = "coord_"
         self.reportName = '*report_'
-        self.baseGatheredFilename = "traj_*.dat"
         self.outputTrajectoryFolder = "%s/repeatedExtractedCoordinates"
         self.ligandTrajectoryFolder = "ligand_trajs"
         self.ligandTrajectoryBasename = os.path.join(self.ligandTrajectoryFolder, "traj_ligand_%s.pdb")
         self.gatherTrajsFolder = "allTrajs"
-        self.gatherTrajsFilename = os.path.join(self.gatherTrajsFolder, "traj_%s_%s.dat")
+        self.gatherTrajsFilename = os.path.join(self.gatherTrajsFolder, "traj_%s_%s" + self.extension)
         self.gatherNonRepeatedFolder = os.path.join(self.gatherTrajsFolder, "extractedCoordinates")
-        self.gatherNonRepeatedTrajsFilename = os.path.join(self.gatherNonRepeatedFolder, "traj_%s_%s.dat")
+        self.gatherNonRepeatedTrajsFilename = os.path.join(self.gatherNonRepeatedFolder, "traj_%s_%s" + self.extension)
 
 
 class ParamsHandler(object):
-    def __init__(self, folderWithTrajs, atom_id, lig_name, total_steps, sequential, writeLigandTrajectory, set_number, protein_CA, noRepeat, numProcessors, parallelize, topol, sidechains, sidechains_folder, CM, use_extra_atoms, CM_mode, dihedrals, dihedrals_projection):
+    def __init__(self, folderWithTrajs, atom_id, lig_name, total_steps, sequential, writeLigandTrajectory, set_number, protein_CA, noRepeat, numProcessors, parallelize, topol, sidechains, sidechains_folder, CM, use_extra_atoms, CM_mode, dihedrals, dihedrals_projection, binaryFormat=False):
         self.folder_name = folderWithTrajs
         self.atomIds = atom_id
         self.lig_resname = lig_name
@@ -79,6 +86,7 @@ class ParamsHandler(object):
         self.cm_mode = CM_mode
         self.dihedrals = dihedrals
         self.dihedrals_projection = dihedrals_projection
+        self.binaryFormat = binaryFormat
         if self.contact_map and self.cm_mode == "p-lig" and self.lig_resname == "":
             raise ValueError("Ligand resname needed for protein-ligand contact map")
         if self.contact_map and self.cm_mode not in VALID_CM_MODES:
@@ -115,9 +123,10 @@ def parseArguments():
     parser.add_argument("--dihedrals", action="store_true", help="Flag to activate dihedral angles calculations")
     parser.add_argument("--dihedrals_projection", action="store_true", help="Flag to project dihedral angles calculations into their cos and sin")
     parser.add_argument("--cm_mode", default="p-lig", help="Type of contact map to create (p-lig for protein-ligand or p-p protein-protein)")
+    parser.add_argument("--binary", action="store_true", help="Flag to write the coordinates in binary numpy files instead of text files, the rejected steps are stored as an index of the repeated snapshots")
     args = parser.parse_args()
 
-    return args.folderWithTrajs, args.atomIds, args.resname, args.proteinCA, args.enforceSequential, args.writeLigandTrajectory, args.totalSteps, args.setNum, args.noRepeat, args.numProcessors, args.top, args.sidechains, args.sidechains_folder, args.serial, args.contact_map, args.extra_atoms, args.cm_mode, args.dihedrals, args.dihedrals_projection
+    return args.folderWithTrajs, args.atomIds, args.resname, args.proteinCA, args.enforceSequential, args.writeLigandTrajectory, args.totalSteps, args.setNum, args.noRepeat, args.numProcessors, args.top, args.sidechains, args.sidechains_folder, args.serial, args.contact_map, args.extra_atoms, args.cm_mode, args.dihedrals, args.dihedrals_projection, args.binary
 
 
 def loadAllResnameAtomsInPdb(filename, params):
@@ -145,9 +154,9 @@ def extractFilenumber(filename):
     return number
 
 
-def getOutputFilename(directory, filename, baseOutputFilename):
+def getOutputFilename(directory, filename, baseOutputFilename, extension=".dat"):
     filenumber = extractFilenumber(filename)
-    return os.path.join(directory, baseOutputFilename+filenumber+".dat")
+    return os.path.join(directory, baseOutputFilename+filenumber+extension)
 
 
 def extractContactMapCoordinatesPDB(allCoordinates, params):
@@ -210,12 +219,16 @@ def getAtomCoord(allCoordinates, lig_resname, atom_Ids):
 
 
 def writeToFile(COMs, outputFilename):
-    with open(outputFilename, 'w') as f:
-        for i, line in enumerate(COMs):
-            f.write(str(i) + ' ')
-            for i in range(len(line) - 1):
-                f.write(str(line[i]) + ' ')
-            f.write(str(line[-1]) + '\n')
+    utilities.writeExtractedCoordinates(COMs, outputFilename)
+
+
+def exportToText(inputFilename, outputFilename):
+    """
+        Write a file of extracted coordinates (in any of the formats read by
+        utilities.loadExtractedCoordinates) as a text file
+    """
+    coordinates = utilities.loadExtractedCoordinates(inputFilename)
+    utilities.writeExtractedCoordinates(coordinates[:, 1:], outputFilename)
 
 
 def extractIndexesTopology_CM(topology, lig_resname, CM_mode, use_extra_atoms):
@@ -300,7 +313,7 @@ def writeFilenameExtractedCoordinates(filename, params, pathFolder, constants, t
         if params.dihedrals_projection:
             coords = projectDihedrals(coords)
         outputFilename = getOutputFilename(constants.extractedTrajectoryFolder, filename,
-                                           constants.baseExtractedTrajectoryName)
+                                           constants.baseExtractedTrajectoryName, getExtension(params))
         writeToFile(coords, outputFilename % pathFolder)
         return
     ext = utilities.getFileExtension(filename)
@@ -333,10 +346,17 @@ def writeFilenameExtractedCoordinates(filename, params, pathFolder, constants, t
         raise ValueError("Unrecongnized file extension for %s" % filename)
 
     outputFilename = getOutputFilename(constants.extractedTrajectoryFolder, filename,
-                                       constants.baseExtractedTrajectoryName)
+                                       constants.baseExtractedTrajectoryName, getExtension(params))
     writeToFile(coords, outputFilename % pathFolder)
 
 
+def getExtension(params):
+    if params.binaryFormat:
+        return ".npy"
+    else:
+        return ".dat"
+
+
 def writeFilenamesExtractedCoordinates(pathFolder, params, constants, pool=None):
     if not os.path.exists(constants.extractedTrajectoryFolder % pathFolder):
         os.makedirs(constants.extractedTrajectoryFolder % pathFolder)
@@ -399,47 +419,50 @@ def parseResname(atom_Ids, lig_resname, CM, CM_mode, dihedrals):
     return lig_resname
 
 
-def buildFullTrajectory(steps, trajectory, numtotalSteps, inputTrajectory):
-    completeTrajectory = []
-    counter = 0
-    if len(trajectory) > 0:
-        sthWrongInTraj = False
-        for i in range(len(steps) - 1):
-            repeated = steps[i+1, 0] - steps[i, 0]
-            for _ in range(repeated):
-                try:
-                    snapshot = trajectory[steps[i, 1]].split()
-                except IndexError:
-                    print("sth wrong in trajectory %s. This is likely to disagreement between report and trajectory files. Please, fix it manually" % inputTrajectory)
-                    sthWrongInTraj = True
-                    break
-                snapshot[0] = str(counter)
-                snapshot = ' '.join(snapshot)
-                completeTrajectory.append(snapshot)
-                counter += 1
-
-        if sthWrongInTraj:
-            return completeTrajectory
-
-        if numtotalSteps == 0:
-            iterations = range(1)
-        else:
-            # PELE write the initial structure as step 0, so an extra step is
-            # always needed
-            iterations = range(numtotalSteps + 1 - counter)
+def buildRepeatIndex(steps, numSnapshots, numtotalSteps, inputTrajectory):
+    """
+        Build the index of the accepted snapshot of each step of a
+        trajectory, repeating the snapshot of the rejected steps
+
+        :param steps: Step and number of accepted steps of each accepted
+            snapshot (as in the report)
+        :type steps: np.ndarray
+        :param numSnapshots: Number of snapshots of the trajectory
+        :type numSnapshots: int
+        :param numtotalSteps: Total number of steps of the trajectory
+        :type numtotalSteps: int
+        :param inputTrajectory: Name of the trajectory
+        :type inputTrajectory: str
+
+        :returns: np.ndarray -- Index of the snapshot of each step
+    """
+    if numSnapshots == 0:
+        return np.zeros(0, dtype=int)
+    repeated = np.maximum(np.diff(steps[:, 0]), 0)
+    repeats = np.repeat(steps[:-1, 1], repeated)
+    valid = repeats < numSnapshots
+    if not valid.all():
+        print("sth wrong in trajectory %s. This is likely to disagreement between report and trajectory files. Please, fix it manually" % inputTrajectory)
+        return repeats[valid]
+    if numtotalSteps == 0:
+        iterations = 1
+    else:
+        # PELE write the initial structure as step 0, so an extra step is
+        # always needed
+        iterations = max(0, numtotalSteps + 1 - repeats.size)
+    return np.concatenate((repeats, np.full(iterations, numSnapshots-1, dtype=repeats.dtype)))
 
-        snapshot = trajectory[-1].split()
-        for i in iterations:
-            snapshot[0] = str(counter)
-            completeTrajectory.append(' '.join(snapshot))
-            counter += 1
 
-    return completeTrajectory
+def buildFullTrajectory(steps, trajectory, numtotalSteps, inputTrajectory):
+    repeats = buildRepeatIndex(steps, len(trajectory), numtotalSteps, inputTrajectory)
+    # replace the snapshot number of each line by the step number
+    snapshots = [line[line.find(' '):] for line in trajectory]
+    return [str(counter) + snapshots[snapshot] for counter, snapshot in enumerate(repeats)]
 
 
 def repeatExtractedSnapshotsInTrajectory(inputTrajectory, constants, numtotalSteps):
     extractedTrajFolder, trajFilename = os.path.split(inputTrajectory)
-    trajectoryNumber = re.sub(r'\.dat$', '', trajFilename)
+    trajectoryNumber, extension = os.path.splitext(trajFilename)
     trajectoryNumber = re.sub(constants.baseExtractedTrajectoryName, '', trajectoryNumber)
 
     origDataFolder = re.sub(constants.extractedTrajectoryFolder % "", "", extractedTrajFolder)
@@ -448,13 +471,21 @@ def repeatExtractedSnapshotsInTrajectory(inputTrajectory, constants, numtotalSte
     except IndexError:
         sys.exit("Couldn't find file that matches: %s" % os.path.join(origDataFolder, constants.reportName + trajectoryNumber))
 
+    acceptedSteps = utilities.readReportFile(reportFile)[:, 1:3].astype(int)
+
+    if extension == ".npy":
+        # the accepted snapshots are stored with the index of the snapshot
+        # of each step, instead of repeating them
+        trajectory = utilities.loadExtractedCoordinates(inputTrajectory)
+        repeats = buildRepeatIndex(acceptedSteps, trajectory.shape[0], numtotalSteps, inputTrajectory)
+        if repeats.size > 0:
+            outputFilename = os.path.join(constants.outputTrajectoryFolder % origDataFolder, constants.baseExtractedTrajectoryName + trajectoryNumber + '.npz')
+            utilities.writeExtractedCoordinates(trajectory[:, 1:], outputFilename, repeats=repeats)
+        return
+
     with open(inputTrajectory) as f:
         trajectory = f.read().splitlines()
 
-    acceptedSteps = np.loadtxt(reportFile, dtype='int', comments='#', usecols=(1, 2))
-    if len(acceptedSteps.shape) < 2:
-        acceptedSteps = acceptedSteps[np.newaxis, :]
-
     fullTrajectory = buildFullTrajectory(acceptedSteps, trajectory, numtotalSteps, inputTrajectory)
 
     if len(fullTrajectory) > 0:
@@ -498,7 +529,9 @@ def copyTrajectories(traj_names, destFolderTempletized, folderName, setNumber=0,
             setNumber = folderName
         if epochNum is not None and epochNum != ".":
             setNumber = epochNum
-        shutil.copyfile(inputTrajectory, destFolderTempletized % (setNumber, trajectoryNumber))
+        # keep the extension of the trajectory, text or binary
+        destination = os.path.splitext(destFolderTempletized % (setNumber, trajectoryNumber))[0]
+        shutil.copyfile(inputTrajectory, destination + utilities.getFileExtension(inputTrajectory))
 
 
 def gatherTrajs(constants, folder_name, setNumber, non_Repeat, epochNum=None):
@@ -584,9 +617,9 @@ def get_epoch_traj_num(filename):
     return epoch, traj_num
 
 
-def main(folder_name=".", atom_Ids="", lig_resname="", numtotalSteps=0, enforceSequential_run=0, writeLigandTrajectory=True, setNumber=0, protein_CA=0, non_Repeat=False, nProcessors=None, parallelize=True, topology=None, sidechains=False, sidechain_folder=".", cm=False, use_extra_atoms=False, CM_mode="p-lig", calc_dihedrals=False, dihedrals_projection=False):
-    params = ParamsHandler(folder_name, atom_Ids, lig_resname, numtotalSteps, enforceSequential_run, writeLigandTrajectory, setNumber, protein_CA, non_Repeat, nProcessors, parallelize, topology, sidechains, sidechain_folder, cm, use_extra_atoms, CM_mode, calc_dihedrals, dihedrals_projection)
-    constants = Constants()
+def main(folder_name=".", atom_Ids="", lig_resname="", numtotalSteps=0, enforceSequential_run=0, writeLigandTrajectory=True, setNumber=0, protein_CA=0, non_Repeat=False, nProcessors=None, parallelize=True, topology=None, sidechains=False, sidechain_folder=".", cm=False, use_extra_atoms=False, CM_mode="p-lig", calc_dihedrals=False, dihedrals_projection=False, binaryFormat=False):
+    params = ParamsHandler(folder_name, atom_Ids, lig_resname, numtotalSteps, enforceSequential_run, writeLigandTrajectory, setNumber, protein_CA, non_Repeat, nProcessors, parallelize, topology, sidechains, sidechain_folder, cm, use_extra_atoms, CM_mode, calc_dihedrals, dihedrals_projection, binaryFormat)
+    constants = Constants(binaryFormat)
 
     if params.topology is not None:
         params.topology = utilities.getTopologyObject(params.topology)
@@ -633,5 +666,5 @@ def main(folder_name=".", atom_Ids="", lig_resname="", numtotalSteps=0, enforceS
 
 
 if __name__ == "__main__":
-    folder, atomIds, resname, proteinCA, enforceSequential, writeLigandTraj, totalSteps, setNum, nonRepeat, n_processors, top, side_chains, sideChain_folder, serial, contact_map, extra_atoms, cm_mode, dihedral_angles, dihedrals_proj = parseArguments()
-    main(folder, atomIds, resname, totalSteps, enforceSequential, writeLigandTraj, setNum, proteinCA, nonRepeat, n_processors, topology=top, sidechains=side_chains, sidechain_folder=sideChain_folder, parallelize=(not serial), cm=contact_map, use_extra_atoms=extra_atoms, CM_mode=cm_mode, calc_dihedrals=dihedral_angles, dihedrals_projection=dihedrals_proj)
+    folder, atomIds, resname, proteinCA, enforceSequential, writeLigandTraj, totalSteps, setNum, nonRepeat, n_processors, top, side_chains, sideChain_folder, serial, contact_map, extra_atoms, cm_mode, dihedral_angles, dihedrals_proj, binary = parseArguments()
+    main(folder, atomIds, resname, totalSteps, enforceSequential, writeLigandTraj, setNum, proteinCA, nonRepeat, n_processors, topology=top, sidechains=side_chains, sidechain_folder=sideChain_folder, parallelize=(not serial), cm=contact_map, use_extra_atoms=extra_atoms, CM_mode=cm_mode, calc_dihedrals=dihedral_angles, dihedrals_projection=dihedrals_proj, binaryFormat=binary)
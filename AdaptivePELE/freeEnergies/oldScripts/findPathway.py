@@ -1,6 +1,5 @@
 import time
 import os
-import pickle
 import argparse
 import json
 from AdaptivePELE.atomset import RMSDCalculator
@@ -10,6 +9,7 @@ from AdaptivePELE.spawning import spawning, densitycalculator
 from AdaptivePELE.analysis import analyseClustering
 from AdaptivePELE.simulation import simulationrunner
 import AdaptivePELE.adaptiveSampling as adaptiveSampling
+from AdaptivePELE.utilities import utilities
 
 
 def parseArgs():
@@ -217,8 +217,7 @@ def clusterTrajectories(resname, trajFolder, clusteringObject,
                                       symmetries=symmetries)
 
     if os.path.exists(clusteringObject):
-        with open(clusteringObject, "r") as f:
-            ClOrd = pickle.load(f)
+        ClOrd = utilities.readClusteringObject(clusteringObject)
     else:
         allFolders = os.listdir(trajFolder)
         Epochs = [epoch for epoch in allFolders if epoch.isdigit()]
@@ -1,6 +1,11 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 import numpy as np
 from scipy import linalg
+from AdaptivePELE.utilities import utilities
+
+# maximum number of elements of the one-hot matrix transformed at once when
+# computing the autocorrelation with the FFT
+FFT_BLOCK_SIZE = 2**24
 
 
 def getSortedEigen(T):
@@ -12,3 +17,170 @@ def getSortedEigen(T):
 def getStationaryDistr(lowestEigenvector):
     absStationary = np.abs(lowestEigenvector)
     return absStationary / absStationary.sum()
+
+
+def computeAsymmetricFlux(populations, transitions):
+    """
+        Compute the deviation from detailed balance of the fluxes between
+        clusters
+
+        :param populations: Normalized population of each cluster
+        :type populations: np.ndarray
+        :param transitions: Transition probabilities
+        :type transitions: np.ndarray
+
+        :returns: np.ndarray, np.ndarray, np.ndarray, float -- Fluxes, absolute
+            semidifference and average of the fluxes in both directions, and
+            ratio of the norms of the semidifference and the average
+    """
+    # p_i * P_ij
+    detailedBalanceComponents = populations[:, np.newaxis]*transitions
+    detailedBalanceComponentsAbsoluteDifference = np.absolute(detailedBalanceComponents - detailedBalanceComponents.T) / 2.  # factor 2 to avoid the metric to go from 0 to 2, but from 0 to 1
+    detailedBalanceComponentsAverage = np.multiply(detailedBalanceComponents + detailedBalanceComponents.T, 0.5)
+    frobeniusAvg = linalg.norm(detailedBalanceComponentsAbsoluteDifference) / linalg.norm(detailedBalanceComponentsAverage)
+    return detailedBalanceComponents, detailedBalanceComponentsAbsoluteDifference, detailedBalanceComponentsAverage, frobeniusAvg
+
+
+def iterDtrajs(dtrajs):
+    """
+        Iterate over a set of discretized trajectories, loading them one at
+        a time when they are given as files
+
+        :param dtrajs: Discretized trajectories or names of the files where
+            they are stored
+        :type dtrajs: list
+
+        :returns: iterator -- Arrays with the states of each trajectory
+    """
+    for dtraj in dtrajs:
+        if isinstance(dtraj, np.ndarray):
+            yield dtraj.astype(int, copy=False).ravel()
+        else:
+            yield np.atleast_1d(utilities.loadtxtfile(dtraj, dtype=int)).ravel()
+
+
+def lagCoincidences(traj, lagtimes, nclusters):
+    """
+        Count, for each state and lagtime, the frames of a trajectory that are
+        in the state and are still in it after the lagtime. All the lagtimes
+        are obtained at once from the autocorrelation of the indicator
+        function of each state computed with the FFT, unless there are few
+        lagtimes, in which case it is cheaper to compare the trajectory with
+        its shifted copy for each of them
+
+        :param traj: Discretized trajectory
+        :type traj: np.ndarray
+        :param lagtimes: Lagtimes
+        :type lagtimes: np.ndarray
+        :param nclusters: Number of states
+        :type nclusters: int
+
+        :returns: np.ndarray -- Matrix with the counts of each state (rows)
+            and lagtime (columns)
+    """
+    Nt = traj.size
+    coincidences = np.zeros((nclusters, len(lagtimes)))
+    states = np.flatnonzero(np.bincount(traj, minlength=nclusters))
+    nfft = 1
+    while nfft < 2*Nt:
+        nfft *= 2
+    if len(lagtimes)*Nt <= states.size*nfft*np.log2(nfft):
+        for il, lagtime in enumerate(lagtimes):
+            origin = traj[:Nt-lagtime]
+            same = origin == traj[lagtime:]
+            coincidences[:, il] = np.bincount(origin[same], minlength=nclusters)
+        return coincidences
+    # the one-hot matrix is built for blocks of states to bound the memory
+    blockSize = max(1, FFT_BLOCK_SIZE//nfft)
+    for start in range(0, states.size, blockSize):
+        block = states[start:start+blockSize]
+        indicator = (traj == block[:, np.newaxis]).astype(float)
+        transform = np.fft.rfft(indicator, n=nfft, axis=1)
+        correlation = np.fft.irfft(transform*np.conj(transform), n=nfft, axis=1)
+        coincidences[block] = np.rint(correlation[:, lagtimes])
+    return coincidences
+
+
+def calculateAutoCorrelation(lagtimes, dtrajs, nclusters):
+    """
+        Calculate the autocorrelation of the indicator function of each state
+        of a discretization. The trajectories are processed one at a time,
+        accumulating the sums that the autocorrelation depends on, so they
+        can be given as files and are not loaded together
+
+        :param lagtimes: Lagtimes at which to calculate the autocorrelation
+        :type lagtimes: list
+        :param dtrajs: Discretized trajectories or names of the files where
+            they are stored
+        :type dtrajs: list
+        :param nclusters: Number of states
+        :type nclusters: int
+
+        :returns: np.ndarray -- Autocorrelation of each state (rows) at each
+            lagtime (columns)
+    """
+    lagtimes = np.asarray(lagtimes, dtype=int)
+    nLags = lagtimes.size
+    maxLag = lagtimes.max()
+    order = np.argsort(lagtimes)
+    # number of frames of each state, and of each state at the end and
+    # beginning of the trajectories that are left out at each lagtime
+    C = np.zeros(nclusters)
+    tailCounts = np.zeros((nclusters, nLags))
+    headCounts = np.zeros((nclusters, nLags))
+    coincidences = np.zeros((nclusters, nLags))
+    M = np.zeros(nLags)
+    N = 0
+    for traj in iterDtrajs(dtrajs):
+        Nt = traj.size
+        if Nt < maxLag:
+            raise ValueError("Lagtime specified are too big for the trajectories!")
+        N += Nt
+        M += Nt-lagtimes
+        C += np.bincount(traj, minlength=nclusters)
+        tail = np.zeros(nclusters)
+        head = np.zeros(nclusters)
+        previous = 0
+        for il in order:
+            lagtime = lagtimes[il]
+            tail += np.bincount(traj[Nt-lagtime:Nt-previous], minlength=nclusters)
+            head += np.bincount(traj[previous:lagtime], minlength=nclusters)
+            tailCounts[:, il] += tail
+            headCounts[:, il] += head
+            previous = lagtime
+        coincidences += lagCoincidences(traj, lagtimes, nclusters)
+    mean = C/N
+    var = (N*C-C**2)/(N*(N-1))
+    # sum over the frames of (x_i-mean)*(x_{i+lag}-mean), with x the
+    # indicator function of the state
+    origins = C[:, np.newaxis]-tailCounts
+    destinations = C[:, np.newaxis]-headCounts
+    autoCorr = coincidences-mean[:, np.newaxis]*(origins+destinations)+(mean**2)[:, np.newaxis]*M
+    with np.errstate(divide="ignore", invalid="ignore"):
+        autoCorr /= M
+        autoCorr /= var[:, np.newaxis]
+    return autoCorr
+
+
+def getCorrelationTimes(autoCorr, lagtimes, limit=np.exp(-1)):
+    """
+        Get the first lagtime at which the autocorrelation of each state
+        falls below a limit
+
+        :param autoCorr: Autocorrelation of each state (rows) at each
+            lagtime (columns)
+        :type autoCorr: np.ndarray
+        :param lagtimes: Lagtimes of the autocorrelation, in increasing order
+        :type lagtimes: list
+        :param limit: Value of the autocorrelation considered uncorrelated
+        :type limit: float
+
+        :returns: np.ndarray -- Correlation time of each state, -1 for the
+            states still correlated at the largest lagtime
+    """
+    # the states never visited have undefined autocorrelation, and are
+    # considered uncorrelated
+    below = ~(autoCorr > limit)
+    correlationTimes = np.asarray(lagtimes)[np.argmax(below, axis=1)]
+    correlationTimes[~below.any(axis=1)] = -1
+    return correlationTimes
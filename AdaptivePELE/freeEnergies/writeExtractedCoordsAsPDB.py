@@ -6,6 +6,7 @@
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 from AdaptivePELE.freeEnergies import computeDeltaG as dg
+from AdaptivePELE.utilities import utilities
 import sys
 import numpy as np
 import os
@@ -21,7 +22,7 @@ files = sys.argv[2:]
 print("files", files)
 
 for filename in files:
-    content = np.loadtxt(filename)
+    content = utilities.loadExtractedCoordinates(filename)
 
     length = content.shape[0]
 
@@ -7,6 +7,7 @@ from AdaptivePELE.tests import testClustering as tClustering
 from AdaptivePELE.tests import testAdaptiveSampling as tAdaptive
 from AdaptivePELE.tests import testThresholdcalculator as tThreshold
 from AdaptivePELE.tests import testDensityCalculator as tDensity
+from AdaptivePELE.tests import testSynchronization as tSync
 from AdaptivePELE.tests import testMD as tMD
 from AdaptivePELE.tests import testMD_CUDA as tMD_CUDA
 try:
@@ -19,7 +20,7 @@ def parse_args():
     desc = ("Run testing suite. Possible options are:\na  -- Run all tests\n"
             "at -- Run atomset tests\ns  -- Run spawning tests\nth -- Run threshold "
             "calculator tests\nd  -- Run density tests\nc  -- Run clustering tests\n"
-            "Ad -- Run adaptive integration tests\nMD -- Run adaptive MD tests\nMD_CUDA"
+            "Ad -- Run adaptive integration tests\nsy -- Run synchronization tests\nMD -- Run adaptive MD tests\nMD_CUDA"
             " -- Run adaptive MD tests with CUDA\nR -- Run reporter tests\n")
     parser = argparse.ArgumentParser(description=desc, formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument("--run", default=None, nargs="*", help="Tests to run")
@@ -32,7 +33,7 @@ def parse_args():
 def main(run, exclude):
     testSuite = unittest.TestSuite()
     if run is None:
-        run = ["at", "s", "th", "d", "c", "Ad", "MD", "MD_CUDA", "R"]
+        run = ["at", "s", "th", "d", "c", "sy", "Ad", "MD", "MD_CUDA", "R"]
     to_run = set(run)-set(exclude)
 
     if "at" in to_run or "a" in to_run:
@@ -50,6 +51,9 @@ def main(run, exclude):
     if "c" in to_run or "a" in to_run:
         print("Will run clustering tests")
         testSuite.addTest(unittest.makeSuite(tClustering.clusteringTest))
+    if "sy" in to_run or "a" in to_run:
+        print("Will run synchronization tests")
+        testSuite.addTest(unittest.makeSuite(tSync.synchronizationTest))
     if "Ad" in to_run or "a" in to_run:
         print("Will run integration tests")
         testSuite.addTest(unittest.makeSuite(tAdaptive.TestadaptiveSampling))
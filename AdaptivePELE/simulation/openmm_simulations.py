@@ -610,6 +610,14 @@ def runProductionSimulation(equilibrationFiles, workerNumber, outputDir, seed, p
         simulation.reporters.append(app.StateDataReporter(sys.stdout, frequency, step=True))
     simulation.step(simulation_length)
     stateData.close()
+    # make sure that the trajectory is completely written before marking it
+    # as finished
+    for reporter in simulation.reporters:
+        if hasattr(reporter, "close"):
+            reporter.close()
+    del simulation
+    with open(os.path.join(outputDir, constants.finishedTrajectoryTemplate % workerNumber), "w") as fw:
+        fw.write("%s\n" % os.path.basename(trajName))
 
 
 def getLastStep(reportfile):
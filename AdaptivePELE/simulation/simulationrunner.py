@@ -111,6 +111,8 @@ class SimulationParameters:
         self.constraintsNVT = 5
         self.constraintsNPT = 0.5
         self.maxDevicesPerReplica = None
+        self.synchronizationBackend = "files"
+        self.asynchronousSpawning = False
         self.forcefield = "ff99SB"
         self.customparamspath = None
         self.format = None
@@ -152,6 +154,23 @@ class SimulationRunner:
         """
         return self.parameters.numReplicas
 
+    def getSynchronizationBackend(self):
+        """
+            Return the backend used to synchronize the replicas, only useful
+            for MD simulations
+        """
+        return self.parameters.synchronizationBackend
+
+    def supportsAsynchronousSpawning(self):
+        """
+            Return whether the trajectories can be started one at a time with
+            startTrajectory, so that each processor can start a new trajectory
+            as soon as its previous one finishes
+
+            :returns: bool -- Whether the asynchronous spawning is supported
+        """
+        return False
+
     def hasExitCondition(self):
         """
             Check if an exit condition has been set
@@ -398,7 +417,7 @@ class PeleSimulation(SimulationRunner):
         # identified and we proceed to extract the corresponding center of mass
         trajNum = int(metrics[SASAcluster, -2])
         snapshotNum = int(metrics[SASAcluster, -1])
-        snapshot = utilities.getSnapshots(os.path.join(outputFolder, self.parameters.trajectoryName % trajNum))[snapshotNum]
+        snapshot = utilities.getSnapshot(os.path.join(outputFolder, self.parameters.trajectoryName % trajNum), snapshotNum)
         with suppress_stdout():
             snapshotPDB = atomset.PDB()
             snapshotPDB.initialise(snapshot, resname=resname, chain=reschain, resnum=resnum, topology=topologies.getTopology(epoch, trajNum))
@@ -752,7 +771,7 @@ class PeleSimulation(SimulationRunner):
         nTrajs = len(utilities.getReportList(trajWildcard.rsplit("_", 1)[0]+"*"))
         data = []
         for i in range(1, nTrajs):
-            report = utilities.loadtxtfile(reportWildcard % i)
+            report = utilities.readReportFile(reportWildcard % i)
             snapshots = utilities.getSnapshots(trajWildcard % i)
             for nSnap, (line, snapshot) in enumerate(zip(report, snapshots)):
                 conformation = atomset.PDB()
@@ -846,7 +865,7 @@ class PeleSimulation(SimulationRunner):
 
         for i in range(1, nTrajs):
             indices.append(rowIndex)
-            report = utilities.loadtxtfile(reportWildcard % i)
+            report = utilities.readReportFile(reportWildcard % i)
             if similarityColumn is None:
                 snapshots = utilities.getSnapshots(trajWildcard % i)
                 report_values = []
@@ -1229,25 +1248,25 @@ class MDSimulation(SimulationRunner):
         endTime = time.time()
         print("Ligand preparation took %.2f sec" % (endTime - startTime))
 
-    def runSimulation(self, epoch, outputPathConstants, initialStructuresAsString, topologies, reportFileName, processManager):
+    def getStartingStructures(self, epoch, outputPathConstants, initialStructuresAsString):
         """
-            Run a MD simulation using OpenMM
+            Load the prmtop files and get the structure from which each
+            trajectory of the epoch starts
 
             :param epoch: number of the epoch
             :type epoch: int
             :param outputPathConstants: Contains outputPath-related constants
             :type outputPathConstants: :py:class:`.OutputPathConstants`
-            :param initialStructures: Name of the initial structures to copy
-            :type initialStructures: str
-            :param topologies: Topology object containing the set of topologies needed for the simulation
-            :type topologies: :py:class:`.Topology`
-            :param reportFileName: Name of the report file
-            :type reportFileName: str
-            :param processManager: Object to synchronize the possibly multiple processes
-            :type processManager: :py:class:`.ProcessesManager`
+            :param initialStructuresAsString: Name of the initial structures to copy
+            :type initialStructuresAsString: str
+
+            :returns: list, list -- Starting structure of each trajectory and
+                checkpoints of each trajectory if the epoch is restarted (None
+                otherwise)
         """
         outputDir = outputPathConstants.epochOutputPathTempletized % epoch
         structures_to_run = initialStructuresAsString.split(":")
+        checkpoints = None
         if self.restart:
             if self.parameters.constraints is not None:
                 # load fixed constraints
@@ -1266,6 +1285,66 @@ class MDSimulation(SimulationRunner):
         # To follow the same order as PELE (important for processor mapping)
         structures_to_run = structures_to_run[1:]+[structures_to_run[0]]
         structures_to_run = [structure for i, structure in zip(range(self.parameters.processors), itertools.cycle(structures_to_run))]
+        return structures_to_run, checkpoints
+
+    def supportsAsynchronousSpawning(self):
+        """
+            Return whether the trajectories can be started one at a time with
+            startTrajectory, so that each processor can start a new trajectory
+            as soon as its previous one finishes
+
+            :returns: bool -- Whether the asynchronous spawning is supported
+        """
+        # with several replicas each one runs its own pool of trajectories
+        return self.parameters.numReplicas == 1
+
+    def startTrajectory(self, pool, epoch, trajNum, structure, outputPathConstants, topologies, reportFileName, checkpoint=None):
+        """
+            Start a single trajectory of an epoch in a pool of workers
+
+            :param pool: Pool of workers where to run the trajectory
+            :type pool: :py:class:`multiprocessing.Pool`
+            :param epoch: number of the epoch
+            :type epoch: int
+            :param trajNum: Number of the trajectory
+            :type trajNum: int
+            :param structure: Structure from which the trajectory starts
+            :type structure: str
+            :param outputPathConstants: Contains outputPath-related constants
+            :type outputPathConstants: :py:class:`.OutputPathConstants`
+            :param topologies: Topology object containing the set of topologies needed for the simulation
+            :type topologies: :py:class:`.Topology`
+            :param reportFileName: Name of the report file
+            :type reportFileName: str
+            :param checkpoint: Checkpoint from which to restart the trajectory
+            :type checkpoint: str
+
+            :returns: :py:class:`multiprocessing.pool.AsyncResult` -- Result of the trajectory
+        """
+        outputDir = outputPathConstants.epochOutputPathTempletized % epoch
+        startingFiles = (self.prmtopFiles[topologies.getTopologyIndex(epoch, trajNum)], structure)
+        seed = self.parameters.seed + epoch * self.parameters.processors
+        return pool.apply_async(sim.runProductionSimulation, args=(startingFiles, trajNum-1, outputDir, seed, self.parameters, reportFileName, checkpoint, self.parameters.ligandName, 0, self.parameters.trajsPerReplica, epoch, checkpoint is not None))
+
+    def runSimulation(self, epoch, outputPathConstants, initialStructuresAsString, topologies, reportFileName, processManager):
+        """
+            Run a MD simulation using OpenMM
+
+            :param epoch: number of the epoch
+            :type epoch: int
+            :param outputPathConstants: Contains outputPath-related constants
+            :type outputPathConstants: :py:class:`.OutputPathConstants`
+            :param initialStructures: Name of the initial structures to copy
+            :type initialStructures: str
+            :param topologies: Topology object containing the set of topologies needed for the simulation
+            :type topologies: :py:class:`.Topology`
+            :param reportFileName: Name of the report file
+            :type reportFileName: str
+            :param processManager: Object to synchronize the possibly multiple processes
+            :type processManager: :py:class:`.ProcessesManager`
+        """
+        outputDir = outputPathConstants.epochOutputPathTempletized % epoch
+        structures_to_run, checkpoints = self.getStartingStructures(epoch, outputPathConstants, initialStructuresAsString)
         structures_to_run = processManager.getStructureListPerReplica(structures_to_run, self.parameters.trajsPerReplica)
         startingFilesPairs = [(self.prmtopFiles[topologies.getTopologyIndex(epoch, structure[0]+1)], structure[1]) for structure in structures_to_run]
         utilities.print_unbuffered("Starting OpenMM Production Run of %d steps..." % self.parameters.productionLength)
@@ -1483,7 +1562,7 @@ class MetricMultipleTrajsExitCondition:
             :returns: bool -- Returns True if the exit condition has been met
         """
         for j in range(1, self.nProcessors):
-            report = utilities.loadtxtfile(os.path.join(outputFolder, self.report % j))
+            report = utilities.readReportFile(os.path.join(outputFolder, self.report % j))
             if self.condition(report[:, self.metricCol], self.metricValue):
                 self.trajsFound += 1
         return self.trajsFound >= self.numTrajs
@@ -1569,6 +1648,8 @@ class RunnerBuilder:
             params.trajsPerReplica = int(params.processors/params.numReplicas)
             assert params.trajsPerReplica*params.numReplicas == params.processors, "Number of trajectories requested does not match the number of replicas"
             params.maxDevicesPerReplica = paramsBlock.get(blockNames.SimulationParams.maxDevicesPerReplica)
+            params.synchronizationBackend = paramsBlock.get(blockNames.SimulationParams.synchronizationBackend, "files")
+            params.asynchronousSpawning = paramsBlock.get(blockNames.SimulationParams.asynchronousSpawning, False)
             params.runEquilibration = True
             params.equilibrationLengthNVT = paramsBlock.get(blockNames.SimulationParams.equilibrationLengthNVT, 200000)
             params.equilibrationLengthNPT = paramsBlock.get(blockNames.SimulationParams.equilibrationLengthNPT, 500000)
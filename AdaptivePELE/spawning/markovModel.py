@@ -0,0 +1,276 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import numpy as np
+import scipy.linalg
+import scipy.sparse
+from scipy.sparse import csgraph
+from scipy.sparse import linalg as sparseLinalg
+
+# below this number of states the eigenvectors are computed with dense
+# matrices, the sparse solvers need at least a few states more than the
+# number of eigenvalues requested
+DENSE_STATES = 100
+
+
+def countTransitions(dtrajs, lagtime, nstates):
+    """
+        Count the transitions observed in a set of discretized trajectories
+        with a sliding window
+
+        :param dtrajs: Discretized trajectories
+        :type dtrajs: list
+        :param lagtime: Lagtime of the transitions
+        :type lagtime: int
+        :param nstates: Number of states
+        :type nstates: int
+
+        :returns: scipy.sparse.csr_matrix -- Count matrix
+    """
+    origins = [dtraj[:-lagtime] for dtraj in dtrajs if len(dtraj) > lagtime]
+    destinations = [dtraj[lagtime:] for dtraj in dtrajs if len(dtraj) > lagtime]
+    if not origins:
+        return scipy.sparse.csr_matrix((nstates, nstates))
+    origins = np.concatenate(origins)
+    destinations = np.concatenate(destinations)
+    # duplicated entries are summed when converting to csr
+    return scipy.sparse.coo_matrix((np.ones(origins.size), (origins, destinations)), shape=(nstates, nstates)).tocsr()
+
+
+def transitionOperators(counts, alpha, w):
+    """
+        Build the linear operators of the transition matrix P = (C+alpha)/w
+        and its transpose, without building the dense matrix, which is the
+        sum of the sparse counts and a rank-one matrix
+
+        :param counts: Count matrix
+        :type counts: scipy.sparse.csr_matrix
+        :param alpha: Pseudocount added to each element of the count matrix
+        :type alpha: float
+        :param w: Sum of each row of the count matrix plus pseudocounts
+        :type w: np.ndarray
+
+        :returns: LinearOperator, LinearOperator -- Operators of the transition
+            matrix and its transpose
+    """
+    countsT = counts.T.tocsr()
+    n = counts.shape[0]
+
+    def matvec(v):
+        v = np.ravel(v)
+        return (counts.dot(v)+alpha*v.sum())/w
+
+    def rmatvec(u):
+        u = np.ravel(u)/w
+        return countsT.dot(u)+alpha*u.sum()
+    return sparseLinalg.LinearOperator((n, n), matvec=matvec, dtype=float), sparseLinalg.LinearOperator((n, n), matvec=rmatvec, dtype=float)
+
+
+def getSecondEigenvectors(counts, alpha, w):
+    """
+        Get the second largest eigenvalue of the transition matrix
+        P = (C+alpha)/w and its left and right eigenvectors
+
+        :param counts: Count matrix
+        :type counts: scipy.sparse.csr_matrix
+        :param alpha: Pseudocount added to each element of the count matrix
+        :type alpha: float
+        :param w: Sum of each row of the count matrix plus pseudocounts
+        :type w: np.ndarray
+
+        :returns: float, np.ndarray, np.ndarray -- Eigenvalue, left and right
+            eigenvectors
+    """
+    n = counts.shape[0]
+    if n < DENSE_STATES:
+        P = (counts.toarray()+alpha)/w[:, np.newaxis]
+        eigvalues, left, right = scipy.linalg.eig(P, left=True, right=True)
+        # sort by decreasing real part
+        second = np.lexsort((-eigvalues.imag, -eigvalues.real))[1]
+        return np.real(eigvalues[second]), np.real(left[:, second]), np.real(right[:, second])
+    P, PT = transitionOperators(counts, alpha, w)
+    eigvalues, right = sparseLinalg.eigs(P, k=2, which="LR")
+    second = np.argsort(-eigvalues.real)[1]
+    eigenvalue = np.real(eigvalues[second])
+    eigvaluesLeft, left = sparseLinalg.eigs(PT, k=2, which="LR")
+    secondLeft = np.argmin(np.abs(eigvaluesLeft-eigvalues[second]))
+    return eigenvalue, np.real(left[:, secondLeft]), np.real(right[:, second])
+
+
+class MarkovModel(object):
+    """
+        Markov state model with a sparse count matrix that is updated only
+        with the transitions not seen in previous estimations. The reversible
+        transition matrix is estimated with the same maximum likelihood
+        approach as :py:func:`.buildRevTransitionMatrix`, iterating over the
+        non-zero elements of the count matrix and starting from the previous
+        estimation when the states have not changed.
+
+        It exposes the attributes of the PyEMMA models used in the spawning
+        and free energy calculations (nstates_full, active_set,
+        connected_sets, stationary_distribution and count_matrix_full)
+    """
+    def __init__(self, lagtime, tolerance=1e-10, maxIterations=100000):
+        """
+            :param lagtime: Lagtime of the model
+            :type lagtime: int
+            :param tolerance: Maximum change in the stationary distribution
+                for the estimation to be considered converged
+            :type tolerance: float
+            :param maxIterations: Maximum number of iterations of the estimation
+            :type maxIterations: int
+        """
+        self.lagtime = lagtime
+        self.tolerance = tolerance
+        self.maxIterations = maxIterations
+        self.nstates_full = 0
+        self.countMatrix = scipy.sparse.csr_matrix((0, 0))
+        self.dtrajs = []
+        self.connected_sets = []
+        self.active_set = np.zeros(0, dtype=int)
+        self.stationary_distribution = np.zeros(0)
+        self.transition_matrix = scipy.sparse.csr_matrix((0, 0))
+        self.warmStart = False
+        self.iterations = 0
+
+    def __getstate__(self):
+        # the discretized trajectories are not stored, a loaded model will
+        # count all the transitions again in its next estimation
+        state = {"lagtime": self.lagtime, "tolerance": self.tolerance,
+                 "maxIterations": self.maxIterations, "nstates_full": self.nstates_full,
+                 "countMatrix": self.countMatrix, "connected_sets": self.connected_sets,
+                 "active_set": self.active_set, "stationary_distribution": self.stationary_distribution,
+                 "transition_matrix": self.transition_matrix, "warmStart": self.warmStart,
+                 "iterations": self.iterations}
+        return state
+
+    def __setstate__(self, state):
+        self.lagtime = state['lagtime']
+        self.tolerance = state.get('tolerance', 1e-10)
+        self.maxIterations = state.get('maxIterations', 100000)
+        self.nstates_full = state.get('nstates_full', 0)
+        self.countMatrix = state.get('countMatrix', scipy.sparse.csr_matrix((0, 0)))
+        self.dtrajs = []
+        self.connected_sets = state.get('connected_sets', [])
+        self.active_set = state.get('active_set', np.zeros(0, dtype=int))
+        self.stationary_distribution = state.get('stationary_distribution', np.zeros(0))
+        self.transition_matrix = state.get('transition_matrix', scipy.sparse.csr_matrix((0, 0)))
+        self.warmStart = state.get('warmStart', False)
+        self.iterations = state.get('iterations', 0)
+
+    @property
+    def count_matrix_full(self):
+        """
+            Dense count matrix of all the states
+        """
+        return self.countMatrix.toarray()
+
+    def estimate(self, dtrajs):
+        """
+            Update the model with a set of discretized trajectories. If the
+            trajectories used in the previous estimation are unchanged at the
+            beginning of the new ones, only the new transitions are counted,
+            otherwise (e.g. if the states have been reassigned) all the
+            transitions are counted again
+
+            :param dtrajs: Discretized trajectories
+            :type dtrajs: list
+        """
+        dtrajs = [np.asarray(dtraj, dtype=np.intp) for dtraj in dtrajs]
+        nstates = max([dtraj.max()+1 for dtraj in dtrajs if dtraj.size] or [0])
+        if self.isExtension(dtrajs):
+            # the transitions ending in the new frames of the trajectories
+            # already counted, and those of the new trajectories
+            newFrames = [new[max(0, len(old)-self.lagtime):] for old, new in zip(self.dtrajs, dtrajs)]
+            newFrames.extend(dtrajs[len(self.dtrajs):])
+            nstates = max(nstates, self.nstates_full)
+            self.countMatrix.resize((nstates, nstates))
+            self.countMatrix = self.countMatrix + countTransitions(newFrames, self.lagtime, nstates)
+        else:
+            self.countMatrix = countTransitions(dtrajs, self.lagtime, nstates)
+            self.warmStart = False
+        self.nstates_full = nstates
+        self.dtrajs = dtrajs
+        self.estimateTransitionMatrix()
+
+    def isExtension(self, dtrajs):
+        """
+            Check whether the trajectories of the previous estimation are the
+            beginning of a set of trajectories
+
+            :param dtrajs: Discretized trajectories
+            :type dtrajs: list
+
+            :returns: bool -- Whether the new trajectories extend the previous ones
+        """
+        if not self.dtrajs or len(dtrajs) < len(self.dtrajs):
+            return False
+        for old, new in zip(self.dtrajs, dtrajs):
+            if len(new) < len(old) or not np.array_equal(new[:len(old)], old):
+                return False
+        return True
+
+    def computeConnectedSets(self):
+        """
+            Compute the strongly connected sets of states, sorted by
+            decreasing size
+        """
+        nsets, labels = csgraph.connected_components(self.countMatrix, directed=True, connection="strong")
+        sets = [np.flatnonzero(labels == label) for label in range(nsets)]
+        self.connected_sets = sorted(sets, key=lambda states: (-states.size, states[0]))
+        self.active_set = self.connected_sets[0] if self.connected_sets else np.zeros(0, dtype=int)
+
+    def estimateTransitionMatrix(self):
+        """
+            Estimate the reversible transition matrix and the stationary
+            distribution of the largest connected set
+        """
+        previousActiveSet = self.active_set
+        self.computeConnectedSets()
+        n = self.active_set.size
+        counts = self.countMatrix[self.active_set][:, self.active_set].tocsr()
+        if counts.nnz == 0 or n == 1:
+            self.stationary_distribution = np.ones(n)/max(n, 1)
+            self.transition_matrix = scipy.sparse.identity(n, format="csr")
+            self.warmStart = False
+            return
+        rowCounts = np.asarray(counts.sum(axis=1)).ravel()
+        symmetric = (counts+counts.T).tocoo()
+        rows, cols, countsSum = symmetric.row, symmetric.col, symmetric.data
+        if self.warmStart and np.array_equal(previousActiveSet, self.active_set):
+            # the iterations only depend on the stationary distribution, so
+            # they start from the previous estimation
+            pi = self.stationary_distribution
+        else:
+            pi = np.bincount(rows, weights=countsSum, minlength=n)
+            pi /= pi.sum()
+
+        def update(pi):
+            # fixed point of the reversible maximum likelihood estimator
+            X = countsSum/(rowCounts[rows]/pi[rows]+rowCounts[cols]/pi[cols])
+            newPi = np.bincount(rows, weights=X, minlength=n)
+            return newPi/newPi.sum()
+
+        self.iterations = 0
+        while self.iterations < self.maxIterations:
+            # the convergence of the fixed point iterations is accelerated
+            # extrapolating two of them (SQUAREM), in logarithmic scale to
+            # keep the probabilities positive
+            pi1 = update(pi)
+            self.iterations += 1
+            if np.abs(pi1-pi).max() < self.tolerance:
+                pi = pi1
+                break
+            pi2 = update(pi1)
+            self.iterations += 1
+            logPi, logPi1, logPi2 = np.log(pi), np.log(pi1), np.log(pi2)
+            residual = logPi1-logPi
+            curvature = logPi2-2*logPi1+logPi
+            step = min(-np.linalg.norm(residual)/max(np.linalg.norm(curvature), 1e-300), -1.0)
+            extrapolated = logPi-2*step*residual+step**2*curvature
+            extrapolated = np.exp(extrapolated-extrapolated.max())
+            pi = update(extrapolated/extrapolated.sum())
+            self.iterations += 1
+        X = countsSum/(rowCounts[rows]/pi[rows]+rowCounts[cols]/pi[cols])
+        x = np.bincount(rows, weights=X, minlength=n)
+        self.warmStart = True
+        self.stationary_distribution = x/x.sum()
+        self.transition_matrix = scipy.sparse.csr_matrix((X/x[rows], (rows, cols)), shape=(n, n))
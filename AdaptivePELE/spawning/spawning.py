@@ -8,25 +8,22 @@ import random
 import numpy as np
 import scipy.optimize as optim
 import subprocess
+from collections import OrderedDict
 import PPP.main as ppp
 from abc import abstractmethod
-from scipy.linalg import lu, solve
+import scipy.sparse
 from AdaptivePELE.constants import blockNames
 from AdaptivePELE.constants import constants
 from AdaptivePELE.utilities import utilities
 from AdaptivePELE.spawning import spawningTypes
 from AdaptivePELE.spawning import densitycalculator
+from AdaptivePELE.spawning import markovModel
+from AdaptivePELE.freeEnergies import computeDeltaG as computedG
 try:
     # Check if the basestring type if available, this will fail in python3
     basestring
 except NameError:
     basestring = str
-PYEMMA = True
-try:
-    import pyemma.msm as msm
-    from AdaptivePELE.freeEnergies import computeDeltaG as computedG
-except ImportError:
-    PYEMMA = False
 MATPLOTLIB = True
 try:
     import matplotlib.pyplot as plt
@@ -354,13 +351,20 @@ class SpawningCalculator:
         tmpInitialStructuresTemplate = outputPathConstants.tmpInitialStructuresTemplate
         counts = 0
         procMapping = []
+        # the structures are chosen serially to keep the sampling of the
+        # alternative structures and the mapping, but each distinct structure
+        # is written once and linked to the rest of its files
+        structureFiles = OrderedDict()
         for i, cluster in enumerate(clustering.clusters.clusters):
             for _ in range(int(degeneracyOfRepresentatives[i])):
                 outputFilename = tmpInitialStructuresTemplate % (iteration, counts)
                 print('Writing to ', outputFilename, 'cluster', i)
-                procMapping.append(cluster.writeSpawningStructure(outputFilename))
+                spawnStruct, trajPosition = cluster.getSpawningStructure()
+                procMapping.append(trajPosition)
+                structureFiles.setdefault(id(spawnStruct), (spawnStruct, []))[1].append(outputFilename)
 
                 counts += 1
+        utilities.writeStructures(list(structureFiles.values()))
         #protonate here?
         print("counts & cluster centers", counts, np.where(np.array(degeneracyOfRepresentatives) > 0)[0].size)
         return counts, procMapping
@@ -517,10 +521,8 @@ class IndependentRunsCalculator(SpawningCalculator):
         trajWildcard = os.path.join(outputPathConstants.epochOutputPathTempletized, constants.trajectoryBasename)
         trajectories = utilities.getReportList(trajWildcard % (iteration-1))
         for num, trajectory in enumerate(trajectories):
-            snapshots = utilities.getSnapshots(trajectory)
-            lastSnapshot = snapshots[-1]
-            nSnapshots = len(snapshots)
-            del snapshots
+            lastSnapshot = utilities.getSnapshot(trajectory, -1)
+            nSnapshots = utilities.getNumberOfSnapshots(trajectory)
 
             numTraj = utilities.getReportNum(trajectory)
             outputFilename = outputPathConstants.tmpInitialStructuresTemplate % (iteration, num)
@@ -566,9 +568,7 @@ class IndependentMetricCalculator(SpawningCalculator):
         for num in range(len(trajectories)):
             reportFilename = os.path.join(outputPathConstants.epochOutputPathTempletized % (iteration-1),
                                           "%s_%d" % (self.parameters.reportFilename, num+1))
-            metric_array = np.genfromtxt(reportFilename, missing_values="--", filling_values=0)
-            if len(metric_array.shape) < 2:
-                metric_array = metric_array[np.newaxis, :]
+            metric_array = utilities.readReportFile(reportFilename)
             trajectory = utilities.getReportList("%s_%d.*" % (trajWildcard % (iteration-1), num+1))
             assert len(trajectory) == 1, "Too many trajectories found in IndependentMetricCalculator"
             trajectory = trajectory[0]
@@ -576,9 +576,7 @@ class IndependentMetricCalculator(SpawningCalculator):
                 snapshot_ind = np.argmin(metric_array[:, self.parameters.reportCol])
             else:
                 snapshot_ind = np.argmax(metric_array[:, self.parameters.reportCol])
-            snapshots = utilities.getSnapshots(trajectory)
-            snapshot = snapshots[snapshot_ind]
-            del snapshots
+            snapshot = utilities.getSnapshot(trajectory, snapshot_ind)
 
             numTraj = int(os.path.splitext(trajectory.rsplit("_", 1)[-1])[0])
             outputFilename = outputPathConstants.tmpInitialStructuresTemplate % (iteration, num)
@@ -1194,8 +1192,6 @@ class NullSpawningCalculator(SpawningCalculator):
 class MSMCalculator(SpawningCalculator):
 
     def __init__(self, parameters):
-        if not PYEMMA:
-            raise utilities.UnsatisfiedDependencyException("Pyemma module is necessary to use MSM based spawning")
         SpawningCalculator.__init__(self)
         self.type = "BaseClass"  # change for abstract attribute
         self.parameters = parameters
@@ -1203,7 +1199,8 @@ class MSMCalculator(SpawningCalculator):
 
     def estimateMSM(self, dtrajs, outputPathConstants, currentEpoch):
         """
-            Estimate and MSM using PyEMMA
+            Estimate an MSM, updating the one of the previous epoch with the
+            new transitions when possible (see :py:class:`.MarkovModel`)
 
             :param dtrajs: Discretized trajectories to estimate the Markov model
             :type dtrajs: np.ndarray
@@ -1214,7 +1211,9 @@ class MSMCalculator(SpawningCalculator):
 
             :return: object -- Object containing the estimated MSM
         """
-        self.MSM = msm.estimate_markov_model(dtrajs, self.parameters.lagtime)
+        if self.MSM is None:
+            self.MSM = markovModel.MarkovModel(self.parameters.lagtime)
+        self.MSM.estimate(dtrajs)
         if outputPathConstants is not None and currentEpoch is not None:
             utilities.writeObject(outputPathConstants.MSMObjectEpoch % currentEpoch, self.MSM)
 
@@ -1235,7 +1234,7 @@ class MSMCalculator(SpawningCalculator):
         # need clusters for this step
         pi, clusters = computedG.ensure_connectivity(self.MSM, clusters)
         d = 0.75
-        originalFilenames = glob.glob(os.path.join(outputPathConstants.allTrajsPath, "*traj*.dat"))
+        originalFilenames = [filename for filename in glob.glob(os.path.join(outputPathConstants.allTrajsPath, "*traj*.*")) if utilities.getFileExtension(filename) in utilities.EXTRACTED_COORDINATES_EXTENSIONS]
         originalCoordinates = computedG.gather_coordinates(originalFilenames)
         bins = computedG.create_box(clusters, originalCoordinates, d)
         microstateVolume = computedG.calculate_microstate_volumes_new(clusters, originalCoordinates, bins, d)
@@ -1269,7 +1268,7 @@ class MSMCalculator(SpawningCalculator):
             epoch, traj, snapshot = cl.trajPosition
             report_filename = utilities.getReportList(os.path.join(outputPathConstants.epochOutputPathTempletized % epoch, "*report*_%d" % traj))[0]
 
-            report_values = utilities.loadtxtfile(report_filename)
+            report_values = utilities.readReportFile(report_filename)
             sasa.append(report_values[snapshot, self.parameters.sasaColumn])
         return sasa
 
@@ -1359,8 +1358,7 @@ class ProbabilityMSMCalculator(MSMCalculator):
         nclusters = self.MSM.nstates_full
         # distribute seeds using the MSM
         probabilities = np.zeros(nclusters)
-        for i, index in enumerate(self.MSM.active_set):
-            probabilities[index] = self.MSM.stationary_distribution[i]
+        probabilities[self.MSM.active_set] = self.MSM.stationary_distribution
         if self.parameters.condition == blockNames.SpawningParams.minValue:
             sortedProbs = np.argsort(probabilities)
             probabilities = 1 - probabilities
@@ -1400,7 +1398,7 @@ class MetastabilityMSMCalculator(MSMCalculator):
         self.estimateMSM(clusters.dtrajs, outputPathConstants, currentEpoch)
         nclusters = self.MSM.nstates_full
         # distribute seeds using the MSM
-        counts = self.MSM.count_matrix_full
+        counts = self.MSM.countMatrix
         metastability = counts.diagonal()/counts.sum()
 
         if self.parameters.condition == blockNames.SpawningParams.minValue:
@@ -1424,26 +1422,30 @@ class UncertaintyMSMCalculator(MSMCalculator):
         self.MSM = None
 
     def calculate_q(self, counts, nclusters):
+        """
+            Calculate the contribution of each state to the uncertainty of
+            the second eigenvalue of the transition matrix estimated with
+            pseudocounts, P = (C+alpha)/w
+
+            :param counts: Count matrix
+            :type counts: np.ndarray or scipy.sparse matrix
+            :param nclusters: Number of states
+            :type nclusters: int
+
+            :returns: np.ndarray, np.ndarray -- Uncertainty contribution and
+                number of counts (with pseudocounts) of each state
+        """
         alpha = 1/float(nclusters)
-        U_counts = counts + alpha
-        w = U_counts.sum(axis=1)
-        P = U_counts / w[:, np.newaxis]
-        eigvalues, _ = np.linalg.eig(P)
-        eigvalues.sort()
-        eigvalues = eigvalues[::-1]
-        ek = np.zeros(nclusters)
-        ek[nclusters-1] = 1.0
-        A = P - np.real(eigvalues[1])*np.eye(nclusters)
-        perm, L, U = lu(A.T)
-        x = solve(L.T, ek)
-        xa = solve(U[:-1, :-1], -U[:-1, -1])
-        xa = np.array(xa.tolist()+[1.0])
-        norm_factor = xa.dot(perm.dot(x))
-        si = np.outer(xa, perm.dot(x))/norm_factor
-        q = []
-        for i in range(nclusters):
-            q.append(si[i].dot((np.diag(P[i])-np.outer(P[i], P[i])).dot(si[i])))
-        return np.array(q), w
+        counts = scipy.sparse.csr_matrix(counts, dtype=float)
+        w = np.asarray(counts.sum(axis=1)).ravel() + alpha*nclusters
+        _, left, right = markovModel.getSecondEigenvectors(counts, alpha, w)
+        # the sensitivity of the eigenvalue to P[i, j] is
+        # left[i]*right[j]/(left.right), and the uncertainty of each row
+        # follows the variance of a multinomial distribution
+        P, _ = markovModel.transitionOperators(counts, alpha, w)
+        variance = P.dot(right**2)-P.dot(right)**2
+        q = (left/left.dot(right))**2*variance
+        return q, w
 
     def calculate(self, clusters, trajToDistribute, currentEpoch=None, outputPathConstants=None):
         """
@@ -1464,7 +1466,7 @@ class UncertaintyMSMCalculator(MSMCalculator):
         self.estimateMSM(clusters.dtrajs, outputPathConstants, currentEpoch)
         nclusters = self.MSM.nstates_full
         # distribute seeds using the MSM
-        counts = self.MSM.count_matrix_full
+        counts = self.MSM.countMatrix
         q, w = self.calculate_q(counts, nclusters)
         score = (q/(w+1))-(q/(w+1+trajToDistribute))
         score /= score.sum()
@@ -1,11 +1,33 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 import unittest
-import pickle
 import shutil
 import os
 import AdaptivePELE.adaptiveSampling as adaptiveSampling
 import AdaptivePELE.atomset.atomset as atomset
 from AdaptivePELE.clustering import clustering
+from AdaptivePELE.constants import constants
+from AdaptivePELE.simulation import simulationrunner
+from AdaptivePELE.spawning import spawning
+from AdaptivePELE.utilities import utilities
+
+
+def copyTrajectory(origin, outputDir, trajNum):
+    shutil.copy("tests/data/aspirin_data/traj_%d.pdb" % origin, os.path.join(outputDir, "traj_%d.pdb" % trajNum))
+    shutil.copy("tests/data/aspirin_data/ain_report_%d" % origin, os.path.join(outputDir, "ain_report_%d" % trajNum))
+    with open(os.path.join(outputDir, constants.finishedTrajectoryTemplate % trajNum), "w") as fw:
+        fw.write("traj_%d.pdb\n" % trajNum)
+
+
+class CopySimulation(simulationrunner.SimulationRunner):
+    """
+        Simulation that copies the aspirin trajectories, to test the
+        asynchronous spawning
+    """
+    def getStartingStructures(self, epoch, outputPathConstants, initialStructuresAsString):
+        return initialStructuresAsString.split(":"), None
+
+    def startTrajectory(self, pool, epoch, trajNum, structure, outputPathConstants, topologies, reportFileName, checkpoint=None):
+        return pool.apply_async(copyTrajectory, args=(7 + trajNum % 2, outputPathConstants.epochOutputPathTempletized % epoch, trajNum))
 
 
 class TestadaptiveSampling(unittest.TestCase):
@@ -19,8 +41,7 @@ class TestadaptiveSampling(unittest.TestCase):
         # goldenPathObject = os.path.join(goldenPath, "%d/clustering/object.pkl")
         outputPathObject = os.path.join(outputPath, "%d/clustering/object.pkl")
         for i in range(2, 3):
-            with open(outputPathObject % i, 'rb') as f2:
-                outputCluster = pickle.load(f2)
+            outputCluster = utilities.readClusteringObject(outputPathObject % i)
             # with open(goldenPathObject % i, 'rb') as f:
             #     goldenCluster = pickle.load(f)
             # outputCluster.clusters.printClusters()
@@ -248,3 +269,65 @@ class TestadaptiveSampling(unittest.TestCase):
         self.check_succesful_simulation(output_path, 2)
         # cleanup
         shutil.rmtree(output_path)
+
+    def testPipelinedClustering(self):
+        output_path = "tmp_test_pipelined/%d"
+        epoch_folder = output_path % 0
+        if not os.path.exists(epoch_folder):
+            os.makedirs(epoch_folder)
+        for i, num in enumerate([7, 8]):
+            shutil.copy("tests/data/aspirin_data/traj_%d.pdb" % num, os.path.join(epoch_folder, "traj_%d.pdb" % (i+1)))
+            shutil.copy("tests/data/aspirin_data/ain_report_%d" % num, os.path.join(epoch_folder, "ain_report_%d" % (i+1)))
+        params = {"type": "rmsd", "params": {"ligandResname": "AIN", "contactThresholdDistance": 8}}
+        goldenClustering = clustering.ClusteringBuilder().buildClustering(params, "ain_report", 3)
+        goldenClustering.cluster([os.path.join(epoch_folder, "traj*")], epoch=0)
+        clusteringObject = clustering.ClusteringBuilder().buildClustering(params, "ain_report", 3)
+        pipeline = adaptiveSampling.PipelinedClustering(clusteringObject, 0, output_path, None, 2, maxPollTime=0.1)
+        # only the first trajectory is finished during the simulation
+        with open(os.path.join(epoch_folder, ".finished_1"), "w") as fw:
+            fw.write("traj_1.pdb\n")
+        while not pipeline.clustered:
+            pipeline.thread.join(0.1)
+        pipeline.finish()
+        self.assertEqual(pipeline.clustered, [os.path.join(epoch_folder, "traj_1.pdb")])
+        self.assertEqual(clusteringObject.clusters.getNumberClusters(), goldenClustering.clusters.getNumberClusters())
+        for goldCl, outCl in zip(goldenClustering.clusters.clusters, clusteringObject.clusters.clusters):
+            self.assertEqual(outCl, goldCl)
+            self.assertEqual(outCl.elements, goldCl.elements)
+        # cleanup
+        shutil.rmtree("tmp_test_pipelined")
+
+    def testAsynchronousSimulation(self):
+        output_path = "tmp_test_async"
+        outputPathConstants = constants.OutputPathConstants(output_path)
+        outputPathConstants.buildTmpFolderConstants(os.path.join(output_path, "tmp"))
+        utilities.makeFolder(os.path.join(output_path, "tmp"))
+        params = simulationrunner.SimulationParameters()
+        params.processors = 2
+        params.iterations = 3
+        spawningParams = spawning.SpawningParams()
+        spawningParams.reportFilename = "ain_report"
+        spawningCalculator = spawning.InverselyProportionalToPopulationCalculator(spawningParams)
+        clusteringMethod = clustering.ClusteringBuilder().buildClustering({"type": "rmsd", "params": {"ligandResname": "AIN", "contactThresholdDistance": 8}}, "ain_report", 3)
+        topologies = utilities.Topology(outputPathConstants.topologies)
+        utilities.makeFolder(outputPathConstants.topologies)
+        topologies.setTopologies(["tests/data/ain_native_fixed.pdb"], cleanFiles=False)
+        topologies.topologyMap[0] = [0, 0]
+        asynchronousSimulation = adaptiveSampling.AsynchronousSimulation(CopySimulation(params), spawningCalculator, clusteringMethod, outputPathConstants, topologies, False, pollTime=0.01)
+        asynchronousSimulation.run(0, "initial_0.pdb:initial_1.pdb")
+        nSnapshots = sum(len(utilities.getSnapshots("tests/data/aspirin_data/traj_%d.pdb" % i)) for i in (7, 8))
+        self.assertEqual(sum(cluster.elements for cluster in clusteringMethod), 3*nSnapshots)
+        self.assertTrue(os.path.exists(outputPathConstants.clusteringOutputObject % 2))
+        for epoch in range(3):
+            self.assertTrue(os.path.exists(os.path.join(outputPathConstants.clusteringOutputDir % epoch, "summary.txt")))
+        for epoch in range(1, 3):
+            mapping = utilities.readProcessorMappingFromDisk(outputPathConstants.epochOutputPathTempletized % epoch, "processorMapping.txt")
+            self.assertEqual(len(mapping), 2)
+            for origin_epoch, origin_traj, origin_snapshot in mapping:
+                self.assertLess(origin_epoch, epoch)
+                self.assertIn(origin_traj, (1, 2))
+            self.assertEqual(topologies.topologyMap[epoch], [0, 0])
+            for structureNum in range(2):
+                self.assertTrue(os.path.exists(outputPathConstants.tmpInitialStructuresTemplate % (epoch, structureNum)))
+        # cleanup
+        shutil.rmtree(output_path)
@@ -1,6 +1,7 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 from io import open
 import os
+import pickle
 import unittest
 import mdtraj
 import numpy as np
@@ -306,6 +307,63 @@ ATOM      5  CB  CYS A   2       8.108  20.445  11.030  1.00 16.53           C
         self.assertEqual(RMSD02, RMSD20)
         self.assertEqual(RMSD21, RMSD12)
 
+    def test_RMSD_shared_template(self):
+        # preparation
+        pdb_0 = atomset.PDB()
+        pdb_0.initialise("tests/data/symmetries/cluster_0.pdb", resname='AEN')
+        pdb_1 = atomset.PDB()
+        pdb_1.initialise("tests/data/symmetries/cluster_1.pdb", resname='AEN')
+        pdb_2 = atomset.PDB()
+        pdb_2.initialiseFromTemplate(pdb_0, pdb_1.coords, None, False)
+        symmetries3PTB = [{"3225:C3:AEN": "3227:C5:AEN", "3224:C2:AEN": "3228:C6:AEN"},
+                          {"3230:N1:AEN": "3231:N2:AEN"}]
+        RMSDCalc = RMSDCalculator.RMSDCalculator(symmetries3PTB)
+        # function to test
+        RMSD = RMSDCalc.computeRMSD(pdb_0, pdb_2)
+        # assertion
+        self.assertIs(pdb_2.atomList, pdb_0.atomList)
+        self.assertIs(RMSDCalc.referenceAtomList, pdb_0.atomList)
+        self.assertAlmostEqual(RMSD, RMSDCalculator.RMSDCalculator(symmetries3PTB).computeRMSD(pdb_0, pdb_1))
+        # removing an atom does not modify the structures sharing the template
+        del pdb_2[pdb_2.atomList[0]]
+        self.assertEqual(len(pdb_2), 8)
+        self.assertEqual(len(pdb_0), 9)
+        self.assertEqual(len(pdb_0.atomIndex), 9)
+
+    def test_RMSD_to_many(self):
+        # preparation
+        pdbs = []
+        for i in range(3):
+            pdb = atomset.PDB()
+            pdb.initialise("tests/data/symmetries/cluster_%d.pdb" % i, resname='AEN')
+            pdbs.append(pdb)
+        symmetries3PTB = [{"3225:C3:AEN": "3227:C5:AEN", "3224:C2:AEN": "3228:C6:AEN"},
+                          {"3230:N1:AEN": "3231:N2:AEN"}]
+        RMSDCalc = RMSDCalculator.RMSDCalculator(symmetries3PTB)
+        # function to test
+        RMSDs = RMSDCalc.computeRMSDToMany(pdbs[1], pdbs)
+        # assertion
+        goldenRMSDs = [RMSDCalculator.RMSDCalculator(symmetries3PTB).computeRMSD(pdb, pdbs[1]) for pdb in pdbs]
+        np.testing.assert_array_almost_equal(RMSDs, goldenRMSDs)
+        self.assertEqual(RMSDs[1], 0.0)
+
+    def test_RMSD_to_coordinates(self):
+        # preparation
+        pdbs = []
+        for i in range(3):
+            pdb = atomset.PDB()
+            pdb.initialise("tests/data/symmetries/cluster_%d.pdb" % i, resname='AEN')
+            pdbs.append(pdb)
+        symmetries3PTB = [{"3225:C3:AEN": "3227:C5:AEN", "3224:C2:AEN": "3228:C6:AEN"},
+                          {"3230:N1:AEN": "3231:N2:AEN"}]
+        RMSDCalc = RMSDCalculator.RMSDCalculator(symmetries3PTB)
+        # function to test
+        RMSDs = RMSDCalc.computeRMSDToCoordinates(pdbs[1], np.array([pdb.coords for pdb in pdbs]))
+        # assertion
+        goldenRMSDs = [RMSDCalculator.RMSDCalculator(symmetries3PTB).computeRMSD(pdb, pdbs[1]) for pdb in pdbs]
+        np.testing.assert_array_almost_equal(RMSDs, goldenRMSDs)
+        self.assertEqual(RMSDs[1], 0.0)
+
     def testPDB_contacts(self):
         # preparation
         pdb_native = atomset.PDB()
@@ -422,6 +480,33 @@ ATOM      5  CB  CYS A   2       8.108  20.445  11.030  1.00 16.53           C
         self.assertEqual(atom, pdb.getAtom(atomId))
         pdb[atomId] = None
         self.assertEqual(None, pdb.getAtom(atomId))
+        newAtom = atomset.Atom(u"HETATM  100  C99 AEN L   1      1.000   2.000   3.000  1.00  0.00           C")
+        pdb[newAtom.id] = newAtom
+        self.assertEqual(len(pdb), 10)
+        self.assertEqual(pdb.atomList[-1], newAtom.id)
+        np.testing.assert_array_equal(pdb.coords[-1], [1.0, 2.0, 3.0])
+        self.assertEqual(pdb.atomNames[-1], u"C99")
+        self.assertEqual(len(pdb.masses), 10)
+        self.assertTrue(pdb.heavyFlags[-1])
+        self.assertRaises(KeyError, pdb.__setitem__, u"missing", None)
+
+    def test_PDB_coords(self):
+        pdb = atomset.PDB()
+        pdb.initialise("tests/data/symmetries/cluster_1.pdb", resname='AEN')
+        self.assertEqual(pdb.coords.shape, (9, 3))
+        for i, atomId in enumerate(pdb.atomList):
+            atom = pdb.getAtom(atomId)
+            self.assertEqual(pdb.atomIndex[atomId], i)
+            np.testing.assert_array_equal(pdb.coords[i], [atom.x, atom.y, atom.z])
+        newCoords = pdb.coords + 1.0
+        pdb.updateCoords(newCoords)
+        np.testing.assert_array_equal(pdb.coords, newCoords)
+        atom = pdb.getAtom(pdb.atomList[0])
+        np.testing.assert_array_equal(newCoords[0], [atom.x, atom.y, atom.z])
+        pdb_copy = pickle.loads(pickle.dumps(pdb, protocol=2))
+        np.testing.assert_array_equal(pdb.coords, pdb_copy.coords)
+        self.assertEqual(pdb.atoms, pdb_copy.atoms)
+        self.assertAlmostEqual(pdb.getCOM()[0], pdb_copy.getCOM()[0])
 
     def test_write_XTC_to_pdb(self):
         golden = "tests/data/ain_native_fixed.pdb"
@@ -625,3 +710,104 @@ ATOM      5  CB  CYS A   2       8.108  20.445  11.030  1.00 16.53           C
         self.assertEqual(atom, xtc.getAtom(atomId))
         xtc[atomId] = None
         self.assertEqual(None, xtc.getAtom(atomId))
+
+    def test_PDB_trajectory_reader(self):
+        trajectory = "tests/data/protein_protein_data/trajectory_3.pdb"
+        with open(trajectory, "r") as inputFile:
+            goldenSnapshots = inputFile.read().split("ENDMDL")[:-1]
+        reader = utilities.PDBTrajectoryReader(trajectory)
+        self.assertEqual(goldenSnapshots, list(reader))
+        self.assertEqual(len(goldenSnapshots), len(reader))
+        self.assertEqual(goldenSnapshots[-1], reader[-1])
+        self.assertEqual(goldenSnapshots[2], reader[2])
+
+        snapshots = utilities.getSnapshots(trajectory, True)
+        pdbs = list(utilities.iterSnapshotPDBs(trajectory, chain="B"))
+        self.assertEqual(len(snapshots), len(pdbs))
+        for snapshot, pdb in zip(snapshots, pdbs):
+            goldenPDB = atomset.PDB()
+            goldenPDB.initialise(snapshot, chain="B")
+            self.assertEqual(goldenPDB.atomList, pdb.atomList)
+            self.assertEqual(goldenPDB.pdb, pdb.pdb)
+            np.testing.assert_array_equal(goldenPDB.coords, pdb.coords)
+            self.assertAlmostEqual(goldenPDB.getCOM()[0], pdb.getCOM()[0])
+        # the snapshots after the first one reuse its selection template
+        self.assertIs(pdbs[1].atomList, pdbs[-1].atomList)
+
+    def test_get_single_snapshot(self):
+        for trajectory in ["tests/data/protein_protein_data/trajectory_3.pdb", "tests/data/restart_1/0/trajectory_2.dcd"]:
+            snapshots = utilities.getSnapshots(trajectory)
+            self.assertEqual(len(snapshots), utilities.getNumberOfSnapshots(trajectory))
+            for index in (-1, 0, 2):
+                if trajectory.endswith(".pdb"):
+                    self.assertEqual(snapshots[index], utilities.getSnapshot(trajectory, index))
+                else:
+                    np.testing.assert_array_equal(snapshots[index], utilities.getSnapshot(trajectory, index))
+        self.assertRaises(IndexError, utilities.getSnapshot, "tests/data/restart_1/0/trajectory_2.dcd", 5)
+
+    def test_PDB_selection_template_XTC(self):
+        golden = "tests/data/ain_native_fixed.pdb"
+        topology = utilities.getTopologyFile(golden)
+        frame = 10*mdtraj.load("tests/data/ain_native_fixed.xtc", top=golden).xyz[0]
+        xtc = atomset.PDB()
+        xtc.initialise(frame, resname="AIN", topology=topology)
+        # the second frame reuses the selection of the first one
+        displacedFrame = frame + 1.0
+        xtc_displaced = atomset.PDB()
+        xtc_displaced.initialise(displacedFrame, resname="AIN", topology=topology)
+        golden_pdb = atomset.PDB()
+        golden_pdb.initialise(golden, resname="AIN")
+        self.assertEqual(xtc.atomList, xtc_displaced.atomList)
+        self.assertEqual(golden_pdb.atomList, xtc_displaced.atomList)
+        np.testing.assert_array_almost_equal(xtc.coords+1.0, xtc_displaced.coords)
+        self.assertEqual(xtc_displaced.pdb, xtc_displaced.join_PDB_lines(topology, displacedFrame))
+        xtc_pickled = pickle.loads(pickle.dumps(xtc))
+        self.assertEqual(xtc.pdb, xtc_pickled.pdb)
+        xtc_all = atomset.PDB()
+        xtc_all.initialise(frame, topology=topology)
+        self.assertGreater(len(xtc_all), len(xtc))
+
+    def test_contact_map_cell_list(self):
+        randomState = np.random.RandomState(0)
+        ligandCoords = 10*randomState.rand(15, 3)
+        proteinCoords = 40*randomState.rand(300, 3)-10
+        distances2 = ((ligandCoords[:, np.newaxis, :]-proteinCoords[np.newaxis, :, :])**2).sum(axis=2)
+        contactMap, contactsMask = atomset.computeContactMap(ligandCoords, proteinCoords, 36.0, 64.0)
+        np.testing.assert_array_equal((distances2-36.0) < 0.1, contactMap)
+        np.testing.assert_array_equal(((distances2-64.0) < 0.1).any(axis=0), contactsMask)
+        np.testing.assert_array_equal(contactsMask, atomset.computeContactsMask(ligandCoords, proteinCoords, 64.0))
+
+    def test_PDB_extract_selection(self):
+        snapshots = utilities.getSnapshots("tests/data/aspirin_data/traj_7.pdb", True)
+        for snapshot in snapshots:
+            pdb = atomset.PDB()
+            pdb.initialise(snapshot, resname="AIN")
+            # the second snapshot reuses the selection of the first one
+            alphaCarbons = pdb.extractSelection(type="CM")
+            goldenAlphaCarbons = atomset.PDB()
+            goldenAlphaCarbons.initialise(snapshot, type="CM")
+            self.assertEqual(goldenAlphaCarbons.atomList, alphaCarbons.atomList)
+            np.testing.assert_array_equal(goldenAlphaCarbons.coords, alphaCarbons.coords)
+
+    def test_packed_contact_map(self):
+        randomState = np.random.RandomState(0)
+        contactMap1 = randomState.rand(5, 130) < 0.3
+        contactMap2 = contactMap1.copy()
+        contactMap2[[0, 3]] = contactMap1[[3, 0]]
+        contactMap2[1, :20] = ~contactMap2[1, :20]
+        packedContactMap1 = sym.PackedContactMap(contactMap1)
+        packedContactMap2 = pickle.loads(pickle.dumps(sym.PackedContactMap(contactMap2)))
+        np.testing.assert_array_equal(contactMap2, packedContactMap2.unpack())
+        self.assertEqual(contactMap2.sum(), packedContactMap2.nContacts)
+
+        symmetryEvaluator = sym.SymmetryContactMapEvaluator([{"0": "3"}])
+        symmetryEvaluator.symToRowMap = {"0": 0, "3": 3}
+        permutedContactMap1 = contactMap1[[3, 1, 2, 0, 4]]
+        np.testing.assert_array_equal(permutedContactMap1, symmetryEvaluator.buildOptimalPermutationContactMap(packedContactMap1, packedContactMap2))
+        goldenJaccard = 1-float((permutedContactMap1 & contactMap2).sum())/(permutedContactMap1 | contactMap2).sum()
+        goldenDifference = (permutedContactMap1 ^ contactMap2).sum()/(0.5*(contactMap1.sum()+contactMap2.sum()))
+        goldenCorrelation = 1-(np.corrcoef(permutedContactMap1.reshape(-1), contactMap2.reshape(-1))[0, 1]+1)/2.0
+        self.assertAlmostEqual(goldenJaccard, symmetryEvaluator.evaluateJaccard(packedContactMap1, packedContactMap2))
+        self.assertAlmostEqual(goldenDifference, symmetryEvaluator.evaluateDifferenceDistance(packedContactMap1, packedContactMap2))
+        self.assertAlmostEqual(goldenCorrelation, symmetryEvaluator.evaluateCorrelation(packedContactMap1, packedContactMap2))
+        self.assertAlmostEqual(goldenJaccard, symmetryEvaluator.evaluateJaccard(contactMap1, contactMap2))
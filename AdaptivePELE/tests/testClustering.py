@@ -1,6 +1,15 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import glob
+import json
+import pickle
+import shutil
 import unittest
-from AdaptivePELE.clustering import clustering
+import numpy as np
+from AdaptivePELE.atomset import atomset, RMSDCalculator
+from AdaptivePELE.clustering import clustering, kmeans
+from AdaptivePELE.utilities import utilities, profiler
+from AdaptivePELE.freeEnergies import extractCoords
 
 
 class clusteringTest(unittest.TestCase):
@@ -32,6 +41,35 @@ class clusteringTest(unittest.TestCase):
         self.assertEqual(allClusters[0].elements, goldenElementsCluster1)
         self.assertEqual(allClusters[1].elements, goldenElementsCluster2)
 
+    def test_parallel_preprocessing(self):
+        trajNames = ["tests/data/aspirin_data/traj*"]
+        clusteringParams = [{"type": "rmsd",
+                             "params": {"ligandResname": "AIN",
+                                        "contactThresholdDistance": 8}},
+                            {"type": "contactMap",
+                             "params": {"ligandResname": "AIN",
+                                        "contactThresholdDistance": 8,
+                                        "similarityEvaluator": "Jaccard"},
+                             "thresholdCalculator": {"type": "constant",
+                                                     "params": {"value": 0.15}}}]
+        for params in clusteringParams:
+            serialClustering = clustering.ClusteringBuilder().buildClustering(params, "ain_report", 3)
+            serialClustering.setProcessors(2)
+            serialClustering.cluster(trajNames)
+
+            params["params"]["parallelPreprocessing"] = True
+            parallelClustering = clustering.ClusteringBuilder().buildClustering(params, "ain_report", 3)
+            parallelClustering.setProcessors(2)
+            parallelClustering.cluster(trajNames)
+
+            self.assertFalse(serialClustering.parallelPreprocessing)
+            self.assertEqual(len(parallelClustering), len(serialClustering))
+            for parallelCluster, serialCluster in zip(parallelClustering, serialClustering):
+                self.assertEqual(parallelCluster.elements, serialCluster.elements)
+                self.assertAlmostEqual(parallelCluster.getMetric(), serialCluster.getMetric(), 5)
+                self.assertAlmostEqual(parallelCluster.contacts, serialCluster.contacts, 5)
+                self.assertEqual(parallelCluster.pdb, serialCluster.pdb)
+
     def test_cluster_accumulative(self):
         # preparation
         clusteringParams = {"type": "contactMap",
@@ -104,6 +142,389 @@ class clusteringTest(unittest.TestCase):
         # self.assertAlmostEqual(CMEvaluator.getInnerLimit(cluster1_4), 10)
         # self.assertAlmostEqual(CMEvaluator.getInnerLimit(cluster2_4), 4)
 
+    def test_centroid_cell_list(self):
+        # preparation
+        np.random.seed(0)
+        centroids = np.random.uniform(-20, 20, size=(200, 3))
+        innerLimits = np.random.uniform(1, 25, size=200)
+        cellList = clustering.CentroidCellList()
+        for centroid, innerLimit in zip(centroids, innerLimits):
+            cellList.addCentroid(centroid.tolist(), innerLimit)
+        cellList = pickle.loads(pickle.dumps(cellList, protocol=2))
+
+        # function to test
+        for point in np.random.uniform(-25, 25, size=(50, 3)):
+            candidates = cellList.getCandidates(point.tolist())
+
+            # assertion
+            golden = np.where(((centroids-point)**2).sum(axis=1) <= innerLimits)[0]
+            self.assertEqual(candidates, sorted(candidates))
+            self.assertTrue(set(golden).issubset(candidates))
+
+    def test_alternative_structures(self):
+        # preparation
+        np.random.seed(0)
+        evaluator = clustering.ContactsClusteringEvaluator(RMSDCalculator.RMSDCalculator())
+        altStructures = clustering.AltStructures()
+        structures = []
+        for i in range(300):
+            pdb = atomset.PDB()
+            pdb.initialise("tests/data/ain_native_fixed.pdb", resname="AIN")
+            pdb.coords = np.ascontiguousarray(pdb.coords+np.random.normal(scale=0.4, size=pdb.coords.shape))
+            structures.append(pdb)
+
+        # function to test
+        for i, pdb in enumerate(structures):
+            distances = [evaluator.isElement(pdb, subCluster, "AIN", 0, "", 8)[1] for subCluster in altStructures.subClusters]
+            np.testing.assert_array_almost_equal(evaluator.computeDistances(pdb, altStructures.subClusters, "AIN", 0, "", 8), distances)
+            altStructures.addStructure(pdb, 1.5, "AIN", 0, "", 8, evaluator, (0, 1, i))
+
+            # assertion
+            self.assertLessEqual(altStructures.sizePQ(), 2*altStructures.limitSize)
+            for position, slot in enumerate(altStructures.heap):
+                self.assertEqual(altStructures.heapPositions[slot], position)
+                self.assertEqual(altStructures.priorities[slot][0], altStructures.subClusters[slot].elements)
+                for child in (2*position+1, 2*position+2):
+                    if child < len(altStructures.heap):
+                        self.assertGreaterEqual(altStructures.priorities[slot], altStructures.priorities[altStructures.heap[child]])
+            np.testing.assert_array_equal(altStructures.getCoordinates(), [subCluster.pdb.coords for subCluster in altStructures.subClusters])
+        golden = sorted(altStructures.priorities)[:altStructures.limitSize]
+        goldenSubClusters = [subCluster for subCluster, priority in zip(altStructures.subClusters, altStructures.priorities) if priority in golden]
+        altStructures.cleanPQ()
+        self.assertEqual(sorted(altStructures.priorities), golden)
+        # the sub-clusters kept stay in their order, with their coordinates
+        self.assertEqual(altStructures.subClusters, goldenSubClusters)
+        np.testing.assert_array_equal(altStructures.getCoordinates(), [subCluster.pdb.coords for subCluster in altStructures.subClusters])
+        self.assertEqual(sorted(altStructures.heap), list(range(altStructures.sizePQ())))
+        center = atomset.PDB()
+        spawnStructure, trajPosition = altStructures.altSpawnSelection((1000, center))
+        self.assertTrue(spawnStructure is center or trajPosition in [subCluster.trajPosition for subCluster in altStructures.subClusters])
+        # simulations written with the previous list of tuples
+        oldAltStructures = clustering.AltStructures.__new__(clustering.AltStructures)
+        oldAltStructures.__setstate__({"altStructPQ": [(subCluster.elements, subCluster) for subCluster in altStructures.subClusters], "limitSize": 10})
+        self.assertEqual(oldAltStructures.subClusters, altStructures.subClusters)
+        self.assertEqual(oldAltStructures.index, altStructures.sizePQ()-1)
+        self.assertEqual(altStructures.priorities[altStructures.heap[0]], max(altStructures.priorities))
+        np.testing.assert_array_equal(oldAltStructures.getCoordinates(), altStructures.getCoordinates())
+
+    def test_align_to_cluster(self):
+        # preparation
+        with open("tests/data/symmetries/cluster_1.pdb") as f:
+            lines = f.read().split("\n")
+        ligandLines = [i for i, line in enumerate(lines) if line[17:20] == "AEN" and line[76:78].strip() != "H"]
+        # swap the first two ligand atoms, which are also renumbered
+        goldenLines = list(lines)
+        goldenLines[ligandLines[0]], goldenLines[ligandLines[1]] = lines[ligandLines[1]], lines[ligandLines[0]]
+        shiftedLines = list(goldenLines)
+        for i in ligandLines:
+            shiftedLines[i] = shiftedLines[i][:6] + str(int(shiftedLines[i][6:11])+1).rjust(5) + shiftedLines[i][11:]
+        clusterPDB = atomset.PDB()
+        clusterPDB.initialise("\n".join(lines), resname="AEN")
+        pdb = atomset.PDB()
+        pdb.initialise("\n".join(shiftedLines), resname="AEN")
+        # another snapshot with the same template
+        snapshotPDB = atomset.PDB()
+        snapshotPDB.initialiseFromTemplate(pdb, pdb.coords, None, False)
+
+        # function to test
+        rows = clustering.getAtomAlignment(pdb, clusterPDB)
+        clustering.alignToCluster(clusterPDB, pdb)
+
+        # assertion
+        self.assertIs(pdb.atomList, clusterPDB.atomList)
+        np.testing.assert_array_equal(pdb.coords, clusterPDB.coords)
+        self.assertEqual(pdb.pdb, "\n".join(goldenLines))
+        # the alignment is reused for the structures with the same template
+        self.assertIs(clustering.getAtomAlignment(snapshotPDB, clusterPDB), rows)
+
+    def test_align_to_cluster_different_atoms(self):
+        # preparation
+        with open("tests/data/symmetries/cluster_1.pdb") as f:
+            lines = f.read().split("\n")
+        ligandLines = [i for i, line in enumerate(lines) if line[17:20] == "AEN" and line[76:78].strip() != "H"]
+        # the cluster lacks the first ligand atom, and the atoms of the
+        # snapshot are renumbered
+        clusterLines = [line for i, line in enumerate(lines) if i != ligandLines[0]]
+        shiftedLines = list(lines)
+        for i in ligandLines:
+            shiftedLines[i] = shiftedLines[i][:6] + str(int(shiftedLines[i][6:11])+1).rjust(5) + shiftedLines[i][11:]
+        clusterPDB = atomset.PDB()
+        clusterPDB.initialise("\n".join(clusterLines), resname="AEN")
+        pdb = atomset.PDB()
+        pdb.initialise("\n".join(shiftedLines), resname="AEN")
+        fullPDB = atomset.PDB()
+        fullPDB.initialise("\n".join(lines), resname="AEN")
+
+        # function to test
+        # the snapshot keeps only the atoms of the cluster, as the previous
+        # positional renaming did
+        clustering.alignToCluster(clusterPDB, pdb)
+
+        # assertion
+        self.assertEqual(pdb.atomList, clusterPDB.atomList)
+        np.testing.assert_array_equal(pdb.coords, clusterPDB.coords)
+        # the atom left out keeps its serial in the pdb contents
+        self.assertEqual(pdb.pdb.split("\n")[ligandLines[0]], shiftedLines[ligandLines[0]])
+        # a snapshot with less atoms than the cluster can not be aligned
+        self.assertRaises(ValueError, clustering.getAtomAlignment, clusterPDB, fullPDB)
+
+    def test_clustering_checkpoint(self):
+        # preparation
+        clusteringParams = {"type": "rmsd",
+                            "params": {"ligandResname": "AIN",
+                                       "contactThresholdDistance": 8}}
+        clusteringInstance = clustering.ClusteringBuilder().buildClustering(clusteringParams, "ain_report", 3)
+        clusteringInstance.cluster(["tests/data/aspirin_data/traj*"])
+        tmpFolder = "tmp_test_checkpoint"
+        objectPaths = [os.path.join(tmpFolder, str(i), "clustering", "object.pkl") for i in range(4)]
+        for objectPath in objectPaths:
+            utilities.makeFolder(os.path.dirname(objectPath))
+
+        # function to test
+        clusteringInstance.writeClusteringObject(objectPaths[0])
+        loadedClustering = utilities.readClusteringObject(objectPaths[0])
+        loadedClustering.writeClusteringObject(objectPaths[1])
+        reloadedClustering = utilities.readClusteringObject(objectPaths[1])
+        # a different structure at the same position, as after a restart
+        newPDB = atomset.PDB()
+        newPDB.initialise(loadedClustering[1].pdb.pdb, resname="AIN")
+        loadedClustering[0].pdb = newPDB
+        loadedClustering.writeClusteringObject(objectPaths[2])
+        replacedClustering = utilities.readClusteringObject(objectPaths[2])
+        oldClustering = utilities.readClusteringObject("tests/data/3ptb_data/object_test_bk.pkl")
+        # the structures of the first checkpoint are removed, the next
+        # checkpoint writes them again
+        for segmentFile in glob.glob(os.path.join(os.path.dirname(objectPaths[0]), "*.*")):
+            if not segmentFile.endswith(".pkl"):
+                os.remove(segmentFile)
+        reloadedClustering.writeClusteringObject(objectPaths[3])
+        restoredClustering = utilities.readClusteringObject(objectPaths[3])
+
+        # assertion
+        # the second checkpoint does not write the structures again
+        self.assertEqual(os.listdir(os.path.dirname(objectPaths[1])), ["object.pkl"])
+        self.assertEqual(len(reloadedClustering), len(clusteringInstance))
+        for cluster, reloadedCluster in zip(clusteringInstance, reloadedClustering):
+            self.assertEqual(cluster.pdb.pdb, reloadedCluster.pdb.pdb)
+            np.testing.assert_array_equal(cluster.pdb.coords, reloadedCluster.pdb.coords)
+            self.assertEqual(cluster.elements, reloadedCluster.elements)
+        self.assertEqual(replacedClustering[0].pdb.pdb, clusteringInstance[1].pdb.pdb)
+        np.testing.assert_array_equal(replacedClustering[0].pdb.coords, newPDB.coords)
+        self.assertEqual(replacedClustering[1].pdb.pdb, clusteringInstance[1].pdb.pdb)
+        self.assertGreater(len(oldClustering), 0)
+        self.assertRaises(IOError, utilities.readClusteringObject, objectPaths[1])
+        for cluster, restoredCluster in zip(clusteringInstance, restoredClustering):
+            self.assertEqual(cluster.pdb.pdb, restoredCluster.pdb.pdb)
+            np.testing.assert_array_equal(cluster.pdb.coords, restoredCluster.pdb.coords)
+        shutil.rmtree(tmpFolder)
+
+    def test_conformation_network(self):
+        # preparation
+        network = clustering.ConformationNetwork()
+        network.add_node(0, parent='root', epoch=0)
+        for node, parent in [(1, 0), (2, 1), (3, 1), (4, 3)]:
+            network.add_node(node, parent=parent, epoch=1)
+            network.add_edge(parent, node)
+            network.add_edge(parent, node)
+            network.add_edge(node, 0)
+        goldenTransitions = np.zeros((5, 5))
+        goldenTransitions[[0, 1, 1, 3], [1, 2, 3, 4]] = 2
+        goldenTransitions[1:, 0] = 1
+
+        # function to test
+        networks = [network, pickle.loads(pickle.dumps(network))]
+        if clustering.NETWORK:
+            # previous versions stored the network as a networkx DiGraph
+            oldNetwork = clustering.ConformationNetwork.__new__(clustering.ConformationNetwork)
+            oldNetwork.__setstate__({"network": network.toNetworkx()})
+            networks.append(oldNetwork)
+
+        # assertion
+        for conformationNetwork in networks:
+            np.testing.assert_array_equal(conformationNetwork.getTransitionMatrix().toarray(), goldenTransitions)
+            parents, children = conformationNetwork.getFDT()
+            np.testing.assert_array_equal(parents, [0, 1, 1, 3])
+            np.testing.assert_array_equal(children, [1, 2, 3, 4])
+            self.assertEqual(conformationNetwork.createPathwayToCluster(4), [0, 1, 3, 4])
+
+    def test_load_report_file(self):
+        # preparation
+        tmpFolder = "tmp_test_report_index"
+        utilities.makeFolder(tmpFolder)
+        reportFilename = os.path.join(tmpFolder, "report_1")
+        with open("tests/data/aspirin_data/ain_report_7") as f:
+            lines = f.read().splitlines()
+        # repeat the last accepted step, as a rejected step would do
+        with open(reportFilename, "w") as f:
+            f.write("\n".join(lines + [lines[-1], lines[-1]]) + "\n")
+        goldenMetrics = utilities.loadtxtfile("tests/data/aspirin_data/ain_report_7")
+
+        # function to test
+        metrics = clustering.loadReportFile(reportFilename)
+        cachedMetrics = clustering.loadReportFile(reportFilename)
+        # a new index reads the binary cache instead of the report
+        diskCachedMetrics = utilities.ReportIndex().getReport(reportFilename)[1]
+
+        # assertion
+        np.testing.assert_array_equal(metrics, goldenMetrics)
+        np.testing.assert_array_equal(diskCachedMetrics, goldenMetrics)
+        self.assertIs(metrics, cachedMetrics)
+        self.assertFalse(metrics.flags.writeable)
+        self.assertEqual(utilities.getReportColumns(reportFilename)[:3], ["#Task", "Step", "AcceptedSteps"])
+        self.assertTrue(os.path.exists(os.path.join(tmpFolder, utilities.ReportIndex.cacheFolder, "report_1.npy")))
+        shutil.rmtree(tmpFolder)
+
+    def test_report_index_cache(self):
+        # preparation
+        tmpFolder = "tmp_test_report_index_cache"
+        utilities.makeFolder(tmpFolder)
+        for i in range(1, 4):
+            shutil.copy("tests/data/aspirin_data/ain_report_7", os.path.join(tmpFolder, "report_%d" % i))
+        firstIndex = utilities.ReportIndex(maxReports=2)
+        secondIndex = utilities.ReportIndex(maxReports=2)
+
+        # function to test
+        # both indices load their manifest before the other one writes it
+        firstIndex.getReport(os.path.join(tmpFolder, "report_1"))
+        secondIndex.getReport(os.path.join(tmpFolder, "report_2"))
+        firstIndex.getReport(os.path.join(tmpFolder, "report_3"))
+        # the report cached by the other index is read from its binary cache
+        firstIndex.parseReport = None
+        firstIndex.getReport(os.path.join(tmpFolder, "report_2"))
+
+        # assertion
+        self.assertEqual(len(firstIndex.reports), 2)
+        self.assertNotIn(os.path.abspath(os.path.join(tmpFolder, "report_1")), firstIndex.reports)
+        cacheFolder = os.path.join(tmpFolder, utilities.ReportIndex.cacheFolder)
+        with open(os.path.join(cacheFolder, utilities.ReportIndex.manifestFile)) as f:
+            self.assertEqual(sorted(json.load(f)), ["report_1", "report_2", "report_3"])
+        self.assertEqual(glob.glob(os.path.join(cacheFolder, "*.tmp")), [])
+        # evicted reports are read again from the binary cache
+        np.testing.assert_array_equal(firstIndex.getReport(os.path.join(tmpFolder, "report_1"))[0], utilities.loadtxtfile("tests/data/aspirin_data/ain_report_7"))
+        shutil.rmtree(tmpFolder)
+
+    def test_profiler(self):
+        # preparation
+        tmpFolder = "tmp_test_profiler"
+        utilities.makeFolder(tmpFolder)
+        profileFilename = os.path.join(tmpFolder, "profiling_0.json")
+        clusteringBuilder = clustering.ClusteringBuilder()
+        clusteringParams = {"type": "rmsd",
+                            "params": {"ligandResname": "AIN",
+                                       "contactThresholdDistance": 8}}
+        clusteringInstance = clusteringBuilder.buildClustering(clusteringParams,
+                                                               "ain_report", 3)
+
+        # function to test
+        profiler.PROFILER.enable()
+        try:
+            profiler.PROFILER.startEpoch(0)
+            with profiler.PROFILER.phase("clustering"):
+                clusteringInstance.cluster(["tests/data/aspirin_data/traj*"])
+            profiler.PROFILER.writeEpoch(profileFilename)
+        finally:
+            profiler.PROFILER.enable(False)
+        with open(profileFilename) as f:
+            profile = json.load(f)
+
+        # assertion
+        nSnapshots = sum(cluster.elements for cluster in clusteringInstance.clusters.clusters)
+        phases = profile["phases"]
+        self.assertEqual(profile["epoch"], 0)
+        self.assertEqual(phases["clustering"]["calls"], 1)
+        self.assertEqual(phases["clustering.compare"]["calls"], nSnapshots)
+        # one more call to find the end of each trajectory
+        self.assertEqual(phases["clustering.parse"]["calls"], nSnapshots+len(glob.glob("tests/data/aspirin_data/traj*")))
+        self.assertGreater(phases["clustering"]["peakRSS"], 0)
+        self.assertGreater(phases["clustering"]["readBytes"], 0)
+        self.assertLessEqual(phases["clustering.compare"]["wall"]+phases["clustering.parse"]["wall"], phases["clustering"]["wall"])
+        self.assertIs(profiler.PROFILER.phase("clustering"), profiler.NULL_PHASE)
+
+        # the pipelined clustering does not profile the snapshots
+        profiler.PROFILER.enable()
+        try:
+            profiler.PROFILER.startEpoch(1)
+            clusteringInstance.startEpoch(1)
+            clusteringInstance.clusterTrajectory(sorted(glob.glob("tests/data/aspirin_data/traj*"))[0], profilePhases=False)
+            self.assertEqual(profiler.PROFILER.records, {})
+        finally:
+            profiler.PROFILER.enable(False)
+        shutil.rmtree(tmpFolder)
+
+    def test_streaming_kmeans(self):
+        # preparation
+        tmpFolder = "tmp_test_kmeans"
+        randomState = np.random.RandomState(1)
+        centers = np.array([[0.0, 0.0, 0.0], [10.0, 0.0, 0.0], [0.0, 10.0, 0.0]])
+        trajectories = [centers[i % 3]+randomState.normal(size=(50, 3)) for i in range(6)]
+        store = kmeans.CoordinateStore(tmpFolder)
+        for trajNum, trajectory in enumerate(trajectories[:3]):
+            store.addTrajectory(0, trajNum+1, trajectory)
+        kmeansClustering = kmeans.MiniBatchKMeans(3, seed=0)
+
+        # function to test
+        kmeansClustering.update(store)
+        firstCenters = kmeansClustering.clusterCenters.copy()
+        firstDtrajs = [dtraj.copy() for dtraj in kmeansClustering.dtrajs]
+        for trajNum, trajectory in enumerate(trajectories[3:]):
+            store.addTrajectory(1, trajNum+1, trajectory)
+        kmeansClustering.update(store)
+
+        # assertion
+        self.assertTrue(store.hasTrajectory(1, 3))
+        self.assertFalse(store.hasTrajectory(1, 4))
+        loadedStore = pickle.loads(pickle.dumps(store))
+        self.assertTrue(loadedStore.hasTrajectory(0, 2))
+        self.assertFalse(loadedStore.hasTrajectory(2, 1))
+        np.testing.assert_array_equal(np.asarray(store.getTrajectory(4)), trajectories[4])
+        # the clusters are the means of the three groups of snapshots
+        order = [np.argmin(np.linalg.norm(firstCenters-center, axis=1)) for center in centers]
+        for i in range(3):
+            np.testing.assert_array_almost_equal(firstCenters[order[i]], np.mean(trajectories[i], axis=0))
+            np.testing.assert_array_almost_equal(kmeansClustering.clusterCenters[order[i]], np.mean(np.concatenate(trajectories[i::3]), axis=0))
+        # previous discretized trajectories are kept and new ones are
+        # assigned to the nearest center
+        self.assertEqual(len(kmeansClustering.dtrajs), 6)
+        for dtraj, firstDtraj in zip(kmeansClustering.dtrajs, firstDtrajs):
+            np.testing.assert_array_equal(dtraj, firstDtraj)
+        for i, trajectory in enumerate(trajectories):
+            distances = np.linalg.norm(trajectory[:, np.newaxis]-kmeansClustering.clusterCenters, axis=2)
+            np.testing.assert_array_equal(kmeansClustering.dtrajs[i], np.argmin(distances, axis=1))
+        shutil.rmtree(tmpFolder)
+
+    def test_extracted_coordinates_formats(self):
+        # preparation
+        tmpFolder = "tmp_test_extracted_coordinates"
+        coordinates = np.random.RandomState(2).rand(4, 3)
+        # the snapshots are repeated for the rejected steps and the last one
+        # until the end of the epoch (10 steps plus the initial structure)
+        report = "#Task Step AcceptedSteps\n1 0 0\n1 3 1\n1 4 2\n1 7 3\n"
+        goldenRepeats = [0, 0, 0, 1, 2, 2, 2, 3, 3, 3, 3]
+        constants = extractCoords.Constants()
+        fullTrajectories = []
+        for extension in (".dat", ".npy"):
+            folder = os.path.join(tmpFolder, extension[1:])
+            utilities.makeFolder(constants.extractedTrajectoryFolder % folder)
+            utilities.makeFolder(constants.outputTrajectoryFolder % folder)
+            with open(os.path.join(folder, "report_1"), "w") as f:
+                f.write(report)
+            extractCoords.writeToFile(coordinates, os.path.join(constants.extractedTrajectoryFolder % folder, "coord_1" + extension))
+
+            # function to test
+            extractCoords.repeatExtractedSnapshotsInFolder(folder, constants, 10)
+            fullTrajectories.append(glob.glob(os.path.join(constants.outputTrajectoryFolder % folder, "coord_1.*"))[0])
+
+        # assertion
+        self.assertEqual(utilities.getFileExtension(fullTrajectories[1]), ".npz")
+        textTrajectory = utilities.loadExtractedCoordinates(fullTrajectories[0])
+        binaryTrajectory = utilities.loadExtractedCoordinates(fullTrajectories[1])
+        np.testing.assert_array_equal(textTrajectory, binaryTrajectory)
+        np.testing.assert_array_equal(binaryTrajectory[:, 0], np.arange(len(goldenRepeats)))
+        np.testing.assert_array_equal(binaryTrajectory[:, 1:], coordinates[goldenRepeats])
+        # only the accepted snapshots are stored
+        self.assertEqual(utilities.loadExtractedCoordinates(fullTrajectories[1], expandRepeats=False).shape, (4, 4))
+        shutil.rmtree(tmpFolder)
+
     def testCluster_protein_protein(self):
         # preparation
         clusteringBuilder = clustering.ClusteringBuilder()
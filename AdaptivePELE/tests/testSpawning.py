@@ -1,9 +1,20 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import shutil
+import tempfile
 import unittest
 import numpy as np
+import scipy.linalg
+import scipy.sparse
 import AdaptivePELE.spawning.spawning as spawning
 from AdaptivePELE.clustering import clustering
+from AdaptivePELE.constants import constants
 from AdaptivePELE.spawning import densitycalculator
+from AdaptivePELE.spawning import markovModel
+from AdaptivePELE.freeEnergies import utils
+from AdaptivePELE.freeEnergies import computeDeltaG
+from AdaptivePELE.freeEnergies import utilitiesFreeEnergies
+from AdaptivePELE.freeEnergies import bootstrapDG
 
 
 def calculateTransitions(counts):
@@ -229,6 +240,32 @@ class TestSpawningCalculator(unittest.TestCase):
 
         self.assertEqual(degeneracy, golden)
 
+    def testWriteSpawningInitialStructures(self):
+        params = {"type": "rmsd", "params": {"ligandResname": "AIN", "contactThresholdDistance": 8}}
+        clusteringObject = clustering.ClusteringBuilder().buildClustering(params, "ain_report", 3)
+        clusteringObject.cluster(["tests/data/aspirin_data/traj*"])
+        degeneracy = [0 for _ in range(clusteringObject.getNumberClusters())]
+        degeneracy[0] = 3
+        degeneracy[-1] = 2
+        tmpFolder = tempfile.mkdtemp()
+        try:
+            outputPathConstants = constants.OutputPathConstants(tmpFolder)
+            outputPathConstants.buildTmpFolderConstants(tmpFolder)
+            calculator = spawning.SameWeightDegeneracyCalculator(spawning.SpawningParams())
+            counts, procMapping = calculator.writeSpawningInitialStructures(outputPathConstants, degeneracy, clusteringObject, 1)
+            spawningClusters = [clusteringObject.getCluster(0)]*3+[clusteringObject.getCluster(len(degeneracy)-1)]*2
+            self.assertEqual(counts, 5)
+            self.assertEqual(procMapping, [cluster.trajPosition for cluster in spawningClusters])
+            for i, cluster in enumerate(spawningClusters):
+                with open(outputPathConstants.tmpInitialStructuresTemplate % (1, i)) as f:
+                    self.assertEqual(f.read(), cluster.pdb.get_pdb_string())
+            # rewriting a structure must not modify the ones linked to it
+            clusteringObject.getCluster(len(degeneracy)-1).writeSpawningStructure(outputPathConstants.tmpInitialStructuresTemplate % (1, 0))
+            with open(outputPathConstants.tmpInitialStructuresTemplate % (1, 1)) as f:
+                self.assertEqual(f.read(), clusteringObject.getCluster(0).pdb.get_pdb_string())
+        finally:
+            shutil.rmtree(tmpFolder)
+
     def testVariableEpsilonCalculator(self):
         params = spawning.SpawningParams()
         params.epsilon = 0.5
@@ -372,6 +409,129 @@ class TestSpawningCalculator(unittest.TestCase):
         np.testing.assert_almost_equal(calc_q, golden_q)
         np.testing.assert_array_equal(degeneracy, golden)
 
+    def testMarkovModelIncremental(self):
+        np.random.seed(0)
+        counts = np.random.randint(1, 20, size=(8, 8))
+        dtrajs = generateDTrajs(counts)
+        firstEpoch = [dtraj[:len(dtraj)//2] for dtraj in dtrajs[:-1]]
+        MSM = markovModel.MarkovModel(1)
+        MSM.estimate(firstEpoch)
+        self.assertTrue(MSM.isExtension(dtrajs))
+        MSM.estimate(dtrajs)
+        np.testing.assert_array_equal(MSM.count_matrix_full, counts)
+        np.testing.assert_array_equal(MSM.active_set, np.arange(8))
+        golden = utils.buildRevTransitionMatrix(counts.astype(float))
+        np.testing.assert_array_almost_equal(MSM.transition_matrix.toarray(), golden)
+        np.testing.assert_array_almost_equal(MSM.stationary_distribution.dot(golden), MSM.stationary_distribution)
+        # reassigned states count all the transitions again
+        MSM.estimate([(dtraj+1) % 8 for dtraj in dtrajs])
+        np.testing.assert_array_equal(MSM.count_matrix_full, np.roll(np.roll(counts, 1, axis=0), 1, axis=1))
+
+    def testMSMUncertaintySparse(self):
+        # chain of states with a barrier in the middle
+        nstates = 2*markovModel.DENSE_STATES
+        counts = np.zeros((nstates, nstates))
+        for i in range(nstates-1):
+            counts[i, i+1] = counts[i+1, i] = 1 if i == nstates//2 else 20
+        counts[np.arange(nstates), np.arange(nstates)] = 50
+        params = spawning.SpawningParams()
+        MSMP = spawning.UncertaintyMSMCalculator(params)
+        q, w = MSMP.calculate_q(scipy.sparse.csr_matrix(counts), nstates)
+        # dense calculation
+        alpha = 1.0/nstates
+        P = (counts+alpha)/(counts.sum(axis=1)+alpha*nstates)[:, np.newaxis]
+        eigvalues, left, right = scipy.linalg.eig(P, left=True, right=True)
+        second = np.argsort(-eigvalues.real)[1]
+        left, right = np.real(left[:, second]), np.real(right[:, second])
+        sensitivity = np.outer(left, right)/left.dot(right)
+        golden_q = [sensitivity[i].dot((np.diag(P[i])-np.outer(P[i], P[i])).dot(sensitivity[i])) for i in range(nstates)]
+        np.testing.assert_allclose(q, golden_q, rtol=1e-6, atol=1e-12*max(golden_q))
+        np.testing.assert_array_almost_equal(w, counts.sum(axis=1)+1)
+
+    def testMicrostateVolumes(self):
+        # preparation
+        randomState = np.random.RandomState(3)
+        trajectories = [randomState.normal(size=(200, 3))*2, randomState.normal(size=(100, 3))+[6, 0, 0]]
+        clusters = np.array([[0.0, 0.0, 0.0], [2.0, 2.0, 2.0], [6.0, 0.0, 0.0]])
+        d = 0.75
+        bins = computeDeltaG.create_box(clusters, trajectories, d)
+        # dense estimation: voxels between the lowest and highest occupied
+        # voxels of each (x, y) column assigned to the closest cluster
+        histogram, _ = np.histogramdd(np.concatenate(trajectories), bins=bins)
+        goldenVolumes = np.zeros(3)
+        for i, j in zip(*np.nonzero(histogram.sum(axis=2))):
+            occupied = np.flatnonzero(histogram[i, j])
+            for k in range(occupied[0], occupied[-1]+1):
+                corner = np.array([bins[0][i], bins[1][j], bins[2][k]])
+                goldenVolumes[np.argmin(np.linalg.norm(clusters-corner, axis=1))] += d**3
+        pi = np.array([0.5, 0.3, 0.2])
+
+        # function to test
+        volumes = computeDeltaG.calculate_microstate_volumes_new(clusters, trajectories, bins, d)
+        gpmf, string = computeDeltaG.calculate_pmf(volumes, pi)
+
+        # assertion
+        np.testing.assert_array_almost_equal(volumes, goldenVolumes)
+        kb = 0.0019872041
+        beta = 1/(kb*300)
+        # with less than 10 clusters the depth of the pmf is its mean
+        deltaW = gpmf.mean()
+        upperGpmfValue = np.arange(0, deltaW, 0.25)[-1]
+        bindingVolume = np.sum((np.exp(-beta*gpmf)*volumes)[gpmf <= upperGpmfValue])
+        goldenString = "%.1f\t%.3f\t%.3f\t%.3f\t%.3f" % (upperGpmfValue, -deltaW-kb*300*np.log(bindingVolume/1661), deltaW, bindingVolume, -kb*300*np.log(bindingVolume/1661))
+        self.assertEqual(string, goldenString)
+
+    def testAutoCorrelation(self):
+        # preparation
+        np.random.seed(1)
+        nclusters = 6
+        # trajectories with repeated states so that they are correlated
+        dtrajs = [np.repeat(np.random.randint(nclusters, size=n), 5) for n in (80, 60, 100)]
+        tmpFolder = tempfile.mkdtemp()
+        dtrajFiles = []
+        for i, dtraj in enumerate(dtrajs):
+            dtrajFiles.append(os.path.join(tmpFolder, "traj_%d.disctraj" % i))
+            np.savetxt(dtrajFiles[-1], dtraj, fmt="%d")
+
+        try:
+            for lagtimes in (list(range(1, 300, 20)), list(range(300))):
+                goldenAutoCorr = utils.calculateAutoCorrelation(lagtimes, dtrajs, nclusters, len(lagtimes))
+
+                # function to test
+                autoCorr = utilitiesFreeEnergies.calculateAutoCorrelation(lagtimes, dtrajFiles, nclusters)
+
+                # assertion
+                np.testing.assert_array_almost_equal(autoCorr, goldenAutoCorr)
+            correlationTimes = utilitiesFreeEnergies.getCorrelationTimes(autoCorr, lagtimes)
+            np.testing.assert_array_equal(correlationTimes, np.argmax(autoCorr <= np.exp(-1), axis=1))
+        finally:
+            shutil.rmtree(tmpFolder)
+
+    def testBootstrapReplicates(self):
+        # preparation
+        np.random.seed(1)
+        trajectories = [np.cumsum(np.random.normal(scale=0.5, size=(300, 3)), axis=0) for _ in range(6)]
+        data = bootstrapDG.BootstrapData(trajectories, 8, seed=1)
+        samples = bootstrapDG.getBootstrapSamples(len(trajectories), 3, seed=2)
+        # golden values of the first replicate, which uses all the trajectories
+        model = markovModel.MarkovModel(5)
+        model.estimate(data.dtrajs)
+        pi, clusters = computeDeltaG.ensure_connectivity(model, data.clusterCenters)
+        goldenVolumes = computeDeltaG.calculate_microstate_volumes_new(clusters, trajectories, data.bins, data.d)
+        _, goldenString = computeDeltaG.calculate_pmf(goldenVolumes, pi)
+
+        # function to test
+        results = bootstrapDG.runBootstrap(data, samples, 5, clusteringIterations=0, computeDetailedBalance=True, nProcessors=1)
+        resultsParallel = bootstrapDG.runBootstrap(data, samples, 5, clusteringIterations=0, computeDetailedBalance=True, nProcessors=2)
+
+        # assertion
+        np.testing.assert_array_equal(samples[0], np.arange(len(trajectories)))
+        np.testing.assert_array_almost_equal(results[0]["volumes"], goldenVolumes)
+        self.assertEqual(results[0]["deltaG"], goldenString)
+        for result, resultParallel in zip(results, resultsParallel):
+            self.assertEqual(result["deltaG"], resultParallel["deltaG"])
+            self.assertAlmostEqual(result["detailedBalance"], resultParallel["detailedBalance"])
+
 
 def main():
     return unittest.main(exit=False)
@@ -0,0 +1,82 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import multiprocessing as mp
+from AdaptivePELE.utilities import synchronization
+
+
+def runReplica(outputPath, nReplicas, nBarriers, backend, delay):
+    # every replica writes a file before each barrier and checks after it
+    # that the files of all replicas are there
+    try:
+        processManager = synchronization.ProcessesManager(outputPath, nReplicas, backend)
+        for step in range(nBarriers):
+            with open(os.path.join(outputPath, "step_%d_%d" % (step, processManager.id)), "w"):
+                pass
+            time.sleep(delay*processManager.id)
+            processManager.barrier()
+            for replica in range(nReplicas):
+                if not os.path.exists(os.path.join(outputPath, "step_%d_%d" % (step, replica))):
+                    os._exit(2)
+        processManager.close()
+    except Exception:
+        os._exit(1)
+    os._exit(0)
+
+
+class synchronizationTest(unittest.TestCase):
+    def setUp(self):
+        self.outputPath = tempfile.mkdtemp(prefix="adaptive_sync_test_")
+
+    def tearDown(self):
+        shutil.rmtree(self.outputPath, ignore_errors=True)
+
+    def runBarriers(self, backend, nReplicas=3, nBarriers=5, delay=0.0):
+        context = mp.get_context("fork")
+        processes = [context.Process(target=runReplica, args=(self.outputPath, nReplicas, nBarriers, backend, delay)) for _ in range(nReplicas)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(120)
+        exitCodes = [process.exitcode for process in processes]
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        return exitCodes
+
+    def testBackoff(self):
+        backoff = synchronization.Backoff(initialTime=0.001, maxTime=0.004)
+        sleepTimes = []
+        for _ in range(4):
+            sleepTimes.append(backoff.sleepTime)
+            backoff.sleep()
+        self.assertEqual(sleepTimes, [0.001, 0.002, 0.004, 0.004])
+        backoff.reset()
+        self.assertEqual(backoff.sleepTime, 0.001)
+
+    def testBarriersFiles(self):
+        self.assertEqual(self.runBarriers(synchronization.ProcessesManager.FILES), [0, 0, 0])
+
+    def testBarriersSocket(self):
+        self.assertEqual(self.runBarriers(synchronization.ProcessesManager.SOCKET), [0, 0, 0])
+        self.assertFalse(os.path.exists(os.path.join(self.outputPath, "synchronization", "coordinator.sock")))
+
+    def testBarriersSocketLateReplicas(self):
+        # the master reaches the last barrier first, it has to wait for the
+        # other replicas to leave it before stopping the coordinator
+        self.assertEqual(self.runBarriers(synchronization.ProcessesManager.SOCKET, delay=0.05), [0, 0, 0])
+
+    def testCoordinatorMalformedMessage(self):
+        address = os.path.join(self.outputPath, "coordinator.sock")
+        coordinator = synchronization.SynchronizationCoordinator([1], address)
+        connection = synchronization.socket.socket(synchronization.socket.AF_UNIX, synchronization.socket.SOCK_STREAM)
+        connection.connect(address)
+        connection.sendall(b"STATUS notapid WAITING-1\nWAIT\nSTATUS 1 WAITING-1\nWAIT WAITING-1\n")
+        connection.settimeout(10)
+        self.assertEqual(connection.recv(4096), b"DONE WAITING-1\n")
+        connection.close()
+        coordinator.stop()
+        self.assertFalse(os.path.exists(address))
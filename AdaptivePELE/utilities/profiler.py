@@ -0,0 +1,278 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import sys
+import json
+import time
+try:
+    import resource
+    RESOURCE = True
+except ImportError:
+    RESOURCE = False
+
+# file with the I/O counters of the process (only in Linux)
+PROC_IO_FILE = "/proc/self/io"
+# size of the blocks reported by getrusage
+BLOCK_SIZE = 512
+
+
+def getCPUTime():
+    """
+        Get the CPU time (user and system) used by the process and its
+        finished children, so that the time of the simulations run as
+        subprocesses is included
+
+        :returns: float -- CPU time (in seconds)
+    """
+    times = os.times()
+    return times[0]+times[1]+times[2]+times[3]
+
+
+def getPeakRSS():
+    """
+        Get the peak resident set size of the process
+
+        :returns: int -- Peak resident set size (in bytes), 0 if it is not
+            available
+    """
+    if not RESOURCE:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak
+    # the rest of the platforms report it in kilobytes
+    return peak*1024
+
+
+def getIOCounters():
+    """
+        Get the bytes read and written by the process. In Linux all the
+        reads and writes are counted, including those served by the page
+        cache, otherwise only the blocks read and written to disk
+
+        :returns: int, int -- Bytes read and written
+    """
+    try:
+        with open(PROC_IO_FILE) as f:
+            counters = dict(line.split(":") for line in f if ":" in line)
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (IOError, OSError, KeyError, ValueError):
+        pass
+    if not RESOURCE:
+        return 0, 0
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_inblock*BLOCK_SIZE, usage.ru_oublock*BLOCK_SIZE
+
+
+class PhaseRecord(object):
+    """
+        Resources accumulated by all the calls of a phase
+    """
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peakRSS = 0
+        self.readBytes = 0
+        self.writtenBytes = 0
+
+    def toDict(self):
+        """
+            :returns: dict -- Resources of the phase
+        """
+        return {"calls": self.calls, "wall": self.wall, "cpu": self.cpu,
+                "peakRSS": self.peakRSS, "readBytes": self.readBytes,
+                "writtenBytes": self.writtenBytes}
+
+
+class Phase(object):
+    """
+        Context manager that measures the resources used by a phase and adds
+        them to the record of the profiler
+
+        :param profiler: Profiler where the phase is recorded
+        :type profiler: :py:class:`.Profiler`
+        :param name: Name of the phase
+        :type name: str
+        :param resources: Whether to measure the peak memory and the I/O,
+            which is more expensive than measuring the times, or only the
+            wall and CPU times
+        :type resources: bool
+    """
+    def __init__(self, profiler, name, resources=True):
+        self.profiler = profiler
+        self.name = name
+        self.resources = resources
+        self.initWall = 0.0
+        self.initCPU = 0.0
+        self.initIO = (0, 0)
+
+    def __enter__(self):
+        if self.resources:
+            self.initIO = getIOCounters()
+        self.initCPU = getCPUTime()
+        self.initWall = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.time()-self.initWall
+        cpu = getCPUTime()-self.initCPU
+        if self.resources:
+            readBytes, writtenBytes = getIOCounters()
+            self.profiler.addRecord(self.name, wall, cpu, getPeakRSS(), readBytes-self.initIO[0], writtenBytes-self.initIO[1])
+        else:
+            self.profiler.addRecord(self.name, wall, cpu)
+        return False
+
+
+class NullPhase(object):
+    """
+        Context manager that does nothing, used when the profiler is disabled
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_PHASE = NullPhase()
+
+
+class Profiler(object):
+    """
+        Profiler of the phases of the adaptive sampling epochs. Each phase
+        accumulates the wall and CPU time, the peak resident memory and the
+        bytes read and written in all its calls during the epoch, and the
+        records are written as a JSON file at the end of the epoch.
+
+        Phases can be nested, e.g. the report parsing happens during the
+        clustering and the spawning, so the time of a phase may be included
+        in others. When the profiler is disabled the phases do nothing
+    """
+    def __init__(self, enabled=False):
+        """
+            :param enabled: Whether to record the phases
+            :type enabled: bool
+        """
+        self.enabled = enabled
+        self.epoch = None
+        self.records = {}
+        self.initWall = time.time()
+
+    def enable(self, enabled=True):
+        """
+            Enable or disable the recording of the phases
+
+            :param enabled: Whether to record the phases
+            :type enabled: bool
+        """
+        self.enabled = enabled
+
+    def startEpoch(self, epoch):
+        """
+            Discard the records and start the profile of an epoch
+
+            :param epoch: Epoch number
+            :type epoch: int
+        """
+        self.epoch = epoch
+        self.records = {}
+        self.initWall = time.time()
+
+    def phase(self, name, resources=True):
+        """
+            Get a context manager that records a phase
+
+            :param name: Name of the phase
+            :type name: str
+            :param resources: Whether to measure the peak memory and the
+                I/O, for phases with many short calls only the times should
+                be measured
+            :type resources: bool
+
+            :returns: :py:class:`.Phase` -- Context manager of the phase
+        """
+        if not self.enabled:
+            return NULL_PHASE
+        return Phase(self, name, resources)
+
+    def timeIterator(self, name, iterable):
+        """
+            Record the time spent getting the elements of an iterable (e.g.
+            reading and parsing the snapshots of a trajectory lazily), but
+            not the time spent processing them
+
+            :param name: Name of the phase
+            :type name: str
+            :param iterable: Iterable to time
+            :type iterable: iterable
+
+            :returns: iterator -- Iterator over the same elements
+        """
+        if not self.enabled:
+            return iterable
+        return self._timeIterator(name, iterable)
+
+    def _timeIterator(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            with Phase(self, name, resources=False):
+                try:
+                    element = next(iterator)
+                except StopIteration:
+                    return
+            yield element
+
+    def addRecord(self, name, wall, cpu, peakRSS=0, readBytes=0, writtenBytes=0):
+        """
+            Add a call to the record of a phase
+
+            :param name: Name of the phase
+            :type name: str
+            :param wall: Wall time of the call (in seconds)
+            :type wall: float
+            :param cpu: CPU time of the call (in seconds)
+            :type cpu: float
+            :param peakRSS: Peak resident set size at the end of the call (in bytes)
+            :type peakRSS: int
+            :param readBytes: Bytes read during the call
+            :type readBytes: int
+            :param writtenBytes: Bytes written during the call
+            :type writtenBytes: int
+        """
+        record = self.records.get(name)
+        if record is None:
+            record = self.records[name] = PhaseRecord()
+        record.calls += 1
+        record.wall += wall
+        record.cpu += cpu
+        record.peakRSS = max(record.peakRSS, peakRSS)
+        record.readBytes += readBytes
+        record.writtenBytes += writtenBytes
+
+    def getProfile(self):
+        """
+            Get the profile of the current epoch
+
+            :returns: dict -- Epoch, process id, wall time since the start
+                of the epoch, peak resident memory and resources of each phase
+        """
+        return {"epoch": self.epoch, "pid": os.getpid(), "wall": time.time()-self.initWall,
+                "peakRSS": getPeakRSS(),
+                "phases": dict((name, record.toDict()) for name, record in self.records.items())}
+
+    def writeEpoch(self, filename):
+        """
+            Write the profile of the current epoch as a JSON file
+
+            :param filename: Name of the file
+            :type filename: str
+        """
+        with open(filename, "w") as fw:
+            json.dump(self.getProfile(), fw, indent=4, sort_keys=True)
+            fw.write("\n")
+
+
+# profiler of the adaptive sampling, disabled unless the profiling parameter
+# of the control file is set
+PROFILER = Profiler()
@@ -3,7 +3,13 @@ import time
 import glob
 import fcntl
 import errno
+import shutil
+import select
+import socket
+import tempfile
+import threading
 from AdaptivePELE.utilities import utilities
+from AdaptivePELE.utilities import profiler
 
 try:
     ProcessLookupError
@@ -11,16 +17,327 @@ except NameError:
     ProcessLookupError = OSError
 
 
+class Backoff(object):
+    """
+        Sleep with exponentially increasing times, so that short waits are
+        detected quickly while long waits do not keep polling the filesystem
+
+        :param initialTime: Time of the first sleep (in seconds)
+        :type initialTime: float
+        :param maxTime: Maximum time of a sleep (in seconds)
+        :type maxTime: float
+    """
+    def __init__(self, initialTime=0.01, maxTime=1.0):
+        self.initialTime = initialTime
+        self.maxTime = maxTime
+        self.sleepTime = initialTime
+
+    def reset(self):
+        """
+            Go back to the initial sleep time
+        """
+        self.sleepTime = self.initialTime
+
+    def sleep(self):
+        """
+            Sleep and double the time of the next sleep
+        """
+        time.sleep(self.sleepTime)
+        self.sleepTime = min(2*self.sleepTime, self.maxTime)
+
+
+class FileSynchronization(object):
+    """
+        Synchronization through the lock file: every process adds its status
+        to the file and polls it until all processes have reached the status
+        of the barrier
+
+        :param manager: Processes manager that uses the backend
+        :type manager: :py:class:`.ProcessesManager`
+    """
+    def __init__(self, manager):
+        self.manager = manager
+
+    def setStatus(self, status):
+        """
+            Add the status of the process to the lock file
+
+            :param status: Status of the process
+            :type status: str
+        """
+        manager = self.manager
+        file_lock = open(manager.lockFile, "r+")
+        if manager.lock_available:
+            fcntl.lockf(file_lock, fcntl.LOCK_EX)
+        manager.lockInfo = manager.getLockInfo(file_lock)
+        manager.lockInfo[manager.pid][1].add(status)
+        manager.writeLockInfo(file_lock)
+        if manager.lock_available:
+            fcntl.lockf(file_lock, fcntl.LOCK_UN)
+        file_lock.close()
+
+    def waitForStatus(self, status):
+        """
+            Poll the lock file until all processes have reached the status
+
+            :param status: Status of the barrier
+            :type status: str
+        """
+        manager = self.manager
+        backoff = Backoff(maxTime=manager.sleepTime)
+        while True:
+            if manager.isSynchronized(status):
+                return
+            backoff.sleep()
+            file_lock = open(manager.lockFile, "r+")
+            if manager.lock_available:
+                fcntl.lockf(file_lock, fcntl.LOCK_EX)
+            manager.lockInfo = manager.getLockInfo(file_lock)
+            if manager.lock_available:
+                fcntl.lockf(file_lock, fcntl.LOCK_UN)
+            file_lock.close()
+
+    def close(self):
+        """
+            Release the resources of the backend
+        """
+        pass
+
+
+class SynchronizationCoordinator(object):
+    """
+        Server run by the master process in a background thread. It keeps the
+        statuses sent by all processes and answers the processes waiting for
+        a status once all of them have reached it. It listens on a unix
+        socket, so only the processes of the same node (and with permissions
+        on the socket file) can connect to it
+
+        :param pids: Pids of the processes to synchronize
+        :type pids: list
+        :param address: Path of the unix socket
+        :type address: str
+    """
+    def __init__(self, pids, address):
+        self.statuses = dict((pid, set()) for pid in pids)
+        # statuses whose barrier has been released for each process
+        self.answered = dict((pid, set()) for pid in pids)
+        self.waiting = {}
+        self.buffers = {}
+        self.pids = {}
+        self.pid = os.getpid()
+        self.address = address
+        self.closing = False
+        if os.path.exists(address):
+            # socket remaining from a previous simulation
+            os.remove(address)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(address)
+        os.chmod(address, 0o600)
+        self.server.listen(len(self.statuses))
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def isSynchronized(self, status):
+        """
+            Return whether all processes have reached a status
+
+            :param status: Status of the barrier
+            :type status: str
+
+            :returns: bool -- Whether all processes are synchronized
+        """
+        return all(status in statuses for statuses in self.statuses.values())
+
+    def isFinished(self):
+        """
+            Return whether all processes have been answered for all the
+            statuses they have sent
+
+            :returns: bool -- Whether no process is waiting for the
+                coordinator
+        """
+        return all(self.statuses[pid] <= self.answered.get(pid, set()) for pid in self.statuses)
+
+    def release(self, status):
+        """
+            Answer the processes waiting for a status if all the processes
+            have reached it
+
+            :param status: Status of the barrier
+            :type status: str
+        """
+        if status not in self.waiting or not self.isSynchronized(status):
+            return
+        message = ("DONE %s\n" % status).encode()
+        for connection in self.waiting.pop(status):
+            try:
+                connection.sendall(message)
+            except socket.error:
+                pass
+            if connection in self.pids:
+                self.answered.setdefault(self.pids[connection], set()).add(status)
+
+    def processMessage(self, connection, message):
+        """
+            Process a message sent by a process, malformed messages are
+            ignored
+
+            :param connection: Connection with the process
+            :type connection: socket.socket
+            :param message: Message received
+            :type message: bytes
+        """
+        try:
+            fields = message.decode().split(" ", 2)
+            if fields[0] == "STATUS":
+                pid, status = int(fields[1]), fields[2]
+            elif fields[0] == "WAIT":
+                status = fields[1]
+            else:
+                raise ValueError("unknown message type")
+        except (IndexError, ValueError) as exc:
+            utilities.print_unbuffered("Ignoring malformed synchronization message %r (%s)" % (message, exc))
+            return
+        if fields[0] == "STATUS":
+            self.pids[connection] = pid
+            self.statuses.setdefault(pid, set()).add(status)
+            self.release(status)
+        else:
+            self.waiting.setdefault(status, []).append(connection)
+            self.release(status)
+
+    def serve(self):
+        """
+            Accept connections and process the messages of the processes.
+            Once the master process has closed its backend, keep serving
+            until all processes have been answered or all of them have
+            disconnected
+        """
+        connections = [self.server]
+        while not self.closing or not (len(connections) == 1 or self.isFinished()):
+            readable, _, _ = select.select(connections, [], [], 1.0)
+            for connection in readable:
+                if connection is self.server:
+                    client, _ = self.server.accept()
+                    connections.append(client)
+                    self.buffers[client] = b""
+                    continue
+                try:
+                    data = connection.recv(4096)
+                except socket.error:
+                    data = b""
+                if not data:
+                    connections.remove(connection)
+                    del self.buffers[connection]
+                    self.pids.pop(connection, None)
+                    connection.close()
+                    continue
+                self.buffers[connection] += data
+                while b"\n" in self.buffers[connection]:
+                    message, self.buffers[connection] = self.buffers[connection].split(b"\n", 1)
+                    self.processMessage(connection, message)
+        for connection in connections:
+            connection.close()
+        try:
+            os.remove(self.address)
+        except OSError:
+            pass
+
+    def stop(self):
+        """
+            Wait until the coordinator is no longer needed by any process and
+            stop it
+        """
+        self.closing = True
+        self.thread.join()
+
+
+class SocketSynchronization(object):
+    """
+        Synchronization through a coordinator run by the master process. The
+        path of the unix socket of the coordinator is published in the
+        synchronization folder, and every process sends its statuses through
+        a connection to it and blocks on that connection until the
+        coordinator releases the barrier, so no process polls the filesystem
+        while waiting. All the processes have to run in the same node
+
+        :param manager: Processes manager that uses the backend
+        :type manager: :py:class:`.ProcessesManager`
+        :param address: Path of the unix socket of the coordinator
+        :type address: str
+    """
+    def __init__(self, manager, address):
+        self.manager = manager
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.settimeout(60)
+        try:
+            self.connection.connect(address)
+        except socket.error as exc:
+            self.connection.close()
+            raise ValueError("Could not connect to the synchronization coordinator at %s (%s), the socket synchronization backend requires all the replicas to run in the same node, use the files backend otherwise" % (address, exc))
+        self.connection.settimeout(None)
+        self.buffer = b""
+
+    def setStatus(self, status):
+        """
+            Send the status of the process to the coordinator
+
+            :param status: Status of the process
+            :type status: str
+        """
+        self.manager.lockInfo[self.manager.pid][1].add(status)
+        self.connection.sendall(("STATUS %d %s\n" % (self.manager.pid, status)).encode())
+
+    def waitForStatus(self, status):
+        """
+            Block until the coordinator notifies that all processes have
+            reached the status
+
+            :param status: Status of the barrier
+            :type status: str
+        """
+        self.connection.sendall(("WAIT %s\n" % status).encode())
+        expected = ("DONE %s" % status).encode()
+        while True:
+            while b"\n" in self.buffer:
+                message, self.buffer = self.buffer.split(b"\n", 1)
+                if message == expected:
+                    return
+            data = self.connection.recv(4096)
+            if not data:
+                raise ValueError("Lost the connection with the synchronization coordinator, the master process might have died")
+            self.buffer += data
+
+    def close(self):
+        """
+            Close the connection with the coordinator, the master process
+            waits until the coordinator has answered all the processes
+        """
+        self.connection.close()
+        if self.manager.coordinator is not None:
+            self.manager.coordinator.stop()
+            self.manager.coordinator = None
+
+
 class ProcessesManager:
     """
         Object that sinchronizes multiple adaptivePELE instances, designed to
         be able to use multiple nodes of a gpu cluster
+
+        The barriers are implemented by a synchronization backend, either
+        polling the lock file (files) or a coordinator run by the master
+        process (socket), which requires all processes to run in the same
+        node. The files backend is also used when the coordinator can not be
+        started
     """
     RUNNING = "RUNNING"
     WAITING = "WAITING"
     INIT = "INIT"
+    SOCKET = "socket"
+    FILES = "files"
 
-    def __init__(self, output_path, num_replicas):
+    def __init__(self, output_path, num_replicas, backend=FILES):
         self.syncFolder =  os.path.join(os.path.abspath(output_path), "synchronization")
         utilities.makeFolder(self.syncFolder)
         self.lockFile = os.path.join(self.syncFolder,  "syncFile.lock")
@@ -36,6 +353,11 @@ class ProcessesManager:
         self.writeProcessInfo()
         self.initLockFile()
         self.syncStep = 0
+        # list of (barrier name, seconds spent waiting) of the barriers
+        self.barrierTimes = []
+        self.coordinator = None
+        self.coordinatorTmpFolder = None
+        self.backend = self.createBackend(backend)
 
     def __len__(self):
         # define the size of the ProcessesManager object as the number of
@@ -89,13 +411,14 @@ class ProcessesManager:
             Initialize and write the information for the current process
 
         """
+        backoff = Backoff(maxTime=self.sleepTime)
         while True:
             processes = glob.glob(os.path.join(self.syncFolder, "*.proc"))
             processes.sort()
             if len(processes) > self.nReplicas:
                 raise utilities.ImproperParameterValueException("More processors files than replicas found, this could be due to wrong number of replicas chosen in the control file or files remaining from previous that were not clean properly")
             if len(processes) != self.nReplicas:
-                time.sleep(self.sleepTime)
+                backoff.sleep()
                 continue
             # only reach this block if all processes have written their own
             # files
@@ -106,6 +429,7 @@ class ProcessesManager:
                     self.id = i
             break
         file_lock = open(self.lockFile, "r+")
+        backoff.reset()
         while True:
             if self.lock_available:
                 # if the filesystem does not support locks but only one replica
@@ -126,6 +450,74 @@ class ProcessesManager:
                 if sorted(list(lock_info)) == sorted(list(self.lockInfo)):
                     file_lock.close()
                     return
+                backoff.sleep()
+
+    def getCoordinatorFile(self):
+        """
+            Return the path of the file with the address of the coordinator
+
+            :returns: str -- Path of the coordinator file
+        """
+        return os.path.join(self.syncFolder, "coordinator.address")
+
+    def getCoordinatorSocket(self):
+        """
+            Return the path of the unix socket of the coordinator. Unix socket
+            paths are limited to around 100 characters, so if the path in the
+            synchronization folder is too long the socket is created in a
+            temporary folder
+
+            :returns: str -- Path of the socket
+        """
+        address = os.path.join(self.syncFolder, "coordinator.sock")
+        if len(address) < 100:
+            return address
+        self.coordinatorTmpFolder = tempfile.mkdtemp(prefix="adaptive_sync_")
+        return os.path.join(self.coordinatorTmpFolder, "coordinator.sock")
+
+    def createBackend(self, backend):
+        """
+            Create the synchronization backend. The master process starts the
+            coordinator and publishes its address (or that the files backend
+            has to be used) so that all processes choose the same backend
+
+            :param backend: Requested backend (socket or files)
+            :type backend: str
+
+            :returns: object -- Synchronization backend
+        """
+        if backend not in (self.SOCKET, self.FILES):
+            raise utilities.ImproperParameterValueException("Unknown synchronization backend %s, the options are %s and %s" % (backend, self.SOCKET, self.FILES))
+        if self.nReplicas == 1 or backend == self.FILES:
+            return FileSynchronization(self)
+        master_pid = min(self.lockInfo, key=lambda pid: self.lockInfo[pid][0])
+        coordinator_file = self.getCoordinatorFile()
+        if self.isMaster():
+            try:
+                self.coordinator = SynchronizationCoordinator(list(self.lockInfo), self.getCoordinatorSocket())
+                address = self.coordinator.address
+            except socket.error as exc:
+                utilities.print_unbuffered("Could not start the synchronization coordinator (%s), falling back to the files backend" % exc)
+                address = self.FILES
+            tmp_file = "%s.%d" % (coordinator_file, self.pid)
+            with open(tmp_file, "w") as fw:
+                fw.write("%d %s\n" % (master_pid, address))
+            os.rename(tmp_file, coordinator_file)
+        # wait for the address of the coordinator of this run, the file might
+        # remain from a previous simulation
+        backoff = Backoff(maxTime=self.sleepTime)
+        while True:
+            try:
+                with open(coordinator_file) as fr:
+                    fields = fr.read().rstrip("\n").split(" ", 1)
+            except IOError:
+                fields = []
+            if len(fields) == 2 and int(fields[0]) == master_pid:
+                break
+            backoff.sleep()
+        if fields[1] == self.FILES:
+            return FileSynchronization(self)
+        return SocketSynchronization(self, fields[1])
 
     def getLockInfo(self, file_descriptor):
         """
@@ -175,15 +567,7 @@ class ProcessesManager:
             :type status: str
         """
         self.status = status
-        file_lock = open(self.lockFile, "r+")
-        if self.lock_available:
-            fcntl.lockf(file_lock, fcntl.LOCK_EX)
-        self.lockInfo = self.getLockInfo(file_lock)
-        self.lockInfo[self.pid][1].add(self.status)
-        self.writeLockInfo(file_lock)
-        if self.lock_available:
-            fcntl.lockf(file_lock, fcntl.LOCK_UN)
-        file_lock.close()
+        self.backend.setStatus(status)
 
     def getStatus(self):
         """
@@ -212,17 +596,11 @@ class ProcessesManager:
     def synchronize(self, status):
         """
             Create a barrier-like situation to wait for all processes to finish
+
+            :param status: Status of the barrier
+            :type status: str
         """
-        while True:
-            if self.isSynchronized(status):
-                return
-            file_lock = open(self.lockFile, "r+")
-            if self.lock_available:
-                fcntl.lockf(file_lock, fcntl.LOCK_EX)
-            self.lockInfo = self.getLockInfo(file_lock)
-            if self.lock_available:
-                fcntl.lockf(file_lock, fcntl.LOCK_UN)
-            file_lock.close()
+        self.backend.waitForStatus(status)
 
     def allRunning(self):
         """
@@ -295,5 +673,30 @@ class ProcessesManager:
             Create a barrier
         """
         status = self.getBarrierName()
-        self.setStatus(status)
-        self.synchronize(status)
+        initTime = time.time()
+        with profiler.PROFILER.phase("barrierWait"):
+            self.setStatus(status)
+            self.synchronize(status)
+        self.barrierTimes.append((status, time.time()-initTime))
+
+    def close(self):
+        """
+            Release the resources of the synchronization backend, the master
+            process waits until all processes have left the last barrier
+        """
+        self.backend.close()
+        if self.coordinatorTmpFolder is not None:
+            shutil.rmtree(self.coordinatorTmpFolder, ignore_errors=True)
+            self.coordinatorTmpFolder = None
+
+    def getBarrierTimes(self):
+        """
+            Return the time spent in the barriers
+
+            :returns: float, float -- Total and maximum time (in seconds)
+                spent waiting in a barrier
+        """
+        times = [elapsed for _, elapsed in self.barrierTimes]
+        if not times:
+            return 0.0, 0.0
+        return sum(times), max(times)
@@ -4,10 +4,14 @@ import ast
 import sys
 import glob
 import json
+import mmap
 import errno
+import fcntl
 import socket
 import shutil
 import string
+import tempfile
+import collections
 from builtins import range
 import six
 from six import reraise as raise_
@@ -26,11 +30,18 @@ except ImportError:
     import pickle
 from AdaptivePELE.atomset import RMSDCalculator, atomset
 from AdaptivePELE.freeEnergies import utils
+from AdaptivePELE.utilities import profiler
 try:
     import multiprocessing as mp
+    from multiprocessing.pool import ThreadPool
     PARALELLIZATION = True
 except ImportError:
     PARALELLIZATION = False
+try:
+    import pandas as pd
+    PANDAS = True
+except ImportError:
+    PANDAS = False
 
 
 class UnsatisfiedDependencyException(Exception):
@@ -265,6 +276,11 @@ def makeFolder(outputDir):
             raise
 
 
+# trajectory formats whose files can read a single frame
+SEEKABLE_TRAJECTORY_FILES = {".xtc": md.formats.XTCTrajectoryFile, ".trr": md.formats.TRRTrajectoryFile,
+                             ".dcd": md.formats.DCDTrajectoryFile}
+
+
 def getSnapshots(trajectoryFile, verbose=False, topology=None, use_pdb=False):
     """
         Gets the snapshots
@@ -279,17 +295,9 @@ def getSnapshots(trajectoryFile, verbose=False, topology=None, use_pdb=False):
     # topology parameter is ignored, just here for compatibility purposes
     ext = getFileExtension(trajectoryFile)
     if ext == ".pdb" or use_pdb:
-        with open(trajectoryFile, "r") as inputFile:
-            inputFileContent = inputFile.read()
-
-        snapshots = inputFileContent.split("ENDMDL")
-        if len(snapshots) > 1:
-            snapshots = snapshots[:-1]
-        if not verbose:
-            return snapshots
-
-        remarkInfo = "REMARK 000 File created using PELE++\nREMARK source            : %s\nREMARK original model nr : %d\nREMARK First snapshot is 1, not 0 (as opposed to report)\n%s"
-        snapshotsWithInfo = [remarkInfo % (trajectoryFile, i+1, snapshot) for i, snapshot in enumerate(snapshots)]
+        # read one model at a time, so that the whole file is never held in
+        # memory along with the snapshots
+        snapshotsWithInfo = list(PDBTrajectoryReader(trajectoryFile, verbose))
     elif ext == ".xtc":
         with md.formats.XTCTrajectoryFile(trajectoryFile) as f:
             snapshotsWithInfo, _, _, _ = f.read()
@@ -316,6 +324,267 @@ def getSnapshots(trajectoryFile, verbose=False, topology=None, use_pdb=False):
     return snapshotsWithInfo
 
 
+def getSnapshot(trajectoryFile, index, topology=None, use_pdb=False):
+    """
+        Read a single snapshot of a trajectory, the same as
+        getSnapshots(trajectoryFile)[index], without reading the rest of the
+        trajectory. The last snapshot of pdb trajectories is found scanning
+        the file backwards and the other formats seek the frame
+
+        :param trajectoryFile: Trajectory filename
+        :type trajectoryFile: str
+        :param index: Index of the snapshot (negative indices count from the end)
+        :type index: int
+        :param topology: Topology for non-pdb trajectories
+        :type topology: list
+        :param use_pdb: Whether to read the file as a pdb trajectory
+        :type use_pdb: bool
+
+        :returns: str or numpy.Array -- Snapshot
+    """
+    index = int(index)
+    ext = getFileExtension(trajectoryFile)
+    if ext == ".pdb" or use_pdb:
+        reader = PDBTrajectoryReader(trajectoryFile)
+        if index == -1:
+            return reader.getLastSnapshot()
+        return reader[index]
+    elif ext in SEEKABLE_TRAJECTORY_FILES:
+        with SEEKABLE_TRAJECTORY_FILES[ext](trajectoryFile) as f:
+            nFrames = len(f)
+            if not -nFrames <= index < nFrames:
+                raise IndexError("Snapshot %d out of range for trajectory %s with %d snapshots" % (index, trajectoryFile, nFrames))
+            f.seek(index % nFrames)
+            snapshot = f.read(n_frames=1)[0][0]
+        if ext != ".dcd":
+            # formats xtc and trr are by default in nm, so we convert them to A
+            snapshot *= 10
+        return snapshot
+    else:
+        return getSnapshots(trajectoryFile, topology=topology)[index]
+
+
+def getNumberOfSnapshots(trajectoryFile, use_pdb=False):
+    """
+        Get the number of snapshots of a trajectory without reading them
+
+        :param trajectoryFile: Trajectory filename
+        :type trajectoryFile: str
+        :param use_pdb: Whether to read the file as a pdb trajectory
+        :type use_pdb: bool
+
+        :returns: int -- Number of snapshots
+    """
+    ext = getFileExtension(trajectoryFile)
+    if ext == ".pdb" or use_pdb:
+        return len(PDBTrajectoryReader(trajectoryFile))
+    elif ext in SEEKABLE_TRAJECTORY_FILES:
+        with SEEKABLE_TRAJECTORY_FILES[ext](trajectoryFile) as f:
+            return len(f)
+    else:
+        return len(getSnapshots(trajectoryFile))
+
+
+class PDBTrajectoryReader(object):
+    """
+        Lazy reader of multi-model pdb trajectories. The snapshots are read
+        from the file one model at a time and are the same as the ones
+        returned by getSnapshots (the contents between ENDMDL records)
+    """
+    remarkInfo = "REMARK 000 File created using PELE++\nREMARK source            : %s\nREMARK original model nr : %d\nREMARK First snapshot is 1, not 0 (as opposed to report)\n%s"
+    modelEndPattern = re.compile(b"^ENDMDL", re.MULTILINE)
+
+    def __init__(self, trajectoryFile, verbose=False):
+        """
+            :param trajectoryFile: Trajectory filename
+            :type trajectoryFile: str
+            :param verbose: Add the REMARK header to the snapshots
+            :type verbose: bool
+        """
+        self.trajectoryFile = trajectoryFile
+        self.verbose = verbose
+        # byte offsets (start, end) of each model, only built when random
+        # access to the snapshots is needed
+        self.modelOffsets = None
+
+    def __iter__(self):
+        for i, model in enumerate(self.iterModels()):
+            yield self.formatSnapshot(model, i)
+
+    def __len__(self):
+        if self.modelOffsets is None:
+            self.buildIndex()
+        return len(self.modelOffsets)
+
+    def __getitem__(self, index):
+        if self.modelOffsets is None:
+            self.buildIndex()
+        start, end = self.modelOffsets[index]
+        with open(self.trajectoryFile, "rb") as inputFile:
+            inputFile.seek(start)
+            model = inputFile.read(end-start)
+        return self.formatSnapshot(model, index % len(self.modelOffsets))
+
+    def iterModels(self):
+        """
+            Iterate over the raw contents of the models of the trajectory,
+            reading the file line by line
+
+            :returns: iterator -- Contents of each model as bytes
+        """
+        lines = []
+        foundEnd = False
+        with open(self.trajectoryFile, "rb") as inputFile:
+            for line in inputFile:
+                if line.startswith(b"ENDMDL"):
+                    yield b"".join(lines)
+                    foundEnd = True
+                    # the rest of the ENDMDL line belongs to the next model
+                    lines = [line[6:]]
+                else:
+                    lines.append(line)
+        if not foundEnd:
+            yield b"".join(lines)
+
+    def mapFile(self, inputFile):
+        """
+            Map the trajectory file in memory for read-only access
+
+            :param inputFile: Trajectory file object
+            :type inputFile: file
+            :returns: mmap.mmap -- Contents of the file (bytes if the file is empty)
+        """
+        try:
+            return mmap.mmap(inputFile.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can not be mapped
+            return b""
+
+    def buildIndex(self):
+        """
+            Scan the trajectory once to find the byte offsets of each model
+        """
+        self.modelOffsets = []
+        start = 0
+        with open(self.trajectoryFile, "rb") as inputFile:
+            contents = self.mapFile(inputFile)
+            for match in self.modelEndPattern.finditer(contents):
+                self.modelOffsets.append((start, match.start()))
+                start = match.start() + 6
+            if not self.modelOffsets:
+                self.modelOffsets.append((0, len(contents)))
+            if isinstance(contents, mmap.mmap):
+                contents.close()
+
+    def findModelEnd(self, contents, end):
+        """
+            Find the last ENDMDL record that starts before a position
+
+            :param contents: Contents of the trajectory
+            :type contents: mmap.mmap
+            :param end: Position before which to search
+            :type end: int
+            :returns: int -- Position of the ENDMDL record (-1 if not found)
+        """
+        while True:
+            end = contents.rfind(b"ENDMDL", 0, end)
+            if end <= 0 or contents[end-1:end] == b"\n":
+                return end
+
+    def getLastSnapshot(self):
+        """
+            Read the last snapshot scanning the trajectory backwards from its
+            end, so that only the last model is read
+
+            :returns: str -- Last snapshot
+        """
+        with open(self.trajectoryFile, "rb") as inputFile:
+            contents = self.mapFile(inputFile)
+            end = self.findModelEnd(contents, len(contents))
+            if end == -1:
+                model = contents[:]
+            else:
+                start = self.findModelEnd(contents, end)
+                if start == -1:
+                    model = contents[:end]
+                else:
+                    model = contents[start+6:end]
+            if isinstance(contents, mmap.mmap):
+                contents.close()
+        # the number of the model is only needed for the REMARK header
+        modelNum = len(self)-1 if self.verbose else None
+        return self.formatSnapshot(model, modelNum)
+
+    def formatSnapshot(self, model, modelNum):
+        """
+            Decode the contents of a model, adding the REMARK header if the
+            reader is verbose
+
+            :param model: Contents of the model
+            :type model: bytes
+            :param modelNum: Index of the model in the trajectory
+            :type modelNum: int
+            :returns: str -- Snapshot
+        """
+        snapshot = model.decode("utf-8")
+        if not self.verbose:
+            return snapshot
+        return self.remarkInfo % (self.trajectoryFile, modelNum+1, snapshot)
+
+    def iterPDBs(self, heavyAtoms=True, resname="", resnum=0, chain=""):
+        """
+            Iterate over the snapshots of the trajectory as PDB objects with
+            the selected atoms. The selection is resolved in the first
+            snapshot into the lines that contain the selected atoms, the
+            following snapshots only parse the coordinates of those lines as
+            long as they hold the same atoms, otherwise they are fully parsed
+            (see :py:meth:`.PDB.initialiseFromContents`)
+
+            :param heavyAtoms: Whether to consider only heavy atoms
+            :type heavyAtoms: bool
+            :param resname: Residue name to select
+            :type resname: str
+            :param resnum: Residue number to select
+            :type resnum: int
+            :param chain: Chain to select
+            :type chain: str
+            :returns: iterator -- :py:class:`.PDB` of each snapshot
+        """
+        for i, model in enumerate(self.iterModels()):
+            pdb = atomset.PDB()
+            pdb.initialiseFromContents(self.formatSnapshot(model, i), heavyAtoms=heavyAtoms, resname=resname, resnum=resnum, chain=chain)
+            yield pdb
+
+
+def iterSnapshotPDBs(trajectoryFile, heavyAtoms=True, resname="", resnum=0, chain="", topology=None):
+    """
+        Iterate over the snapshots of a trajectory as PDB objects with the
+        selected atoms, reading pdb trajectories one model at a time
+
+        :param trajectoryFile: Trajectory filename
+        :type trajectoryFile: str
+        :param heavyAtoms: Whether to consider only heavy atoms
+        :type heavyAtoms: bool
+        :param resname: Residue name to select
+        :type resname: str
+        :param resnum: Residue number to select
+        :type resnum: int
+        :param chain: Chain to select
+        :type chain: str
+        :param topology: Topology for non-pdb trajectories
+        :type topology: list
+        :returns: iterator -- :py:class:`.PDB` of each snapshot
+    """
+    if getFileExtension(trajectoryFile) == ".pdb":
+        for pdb in PDBTrajectoryReader(trajectoryFile, verbose=True).iterPDBs(heavyAtoms=heavyAtoms, resname=resname, resnum=resnum, chain=chain):
+            yield pdb
+    else:
+        for snapshot in getSnapshots(trajectoryFile, True, topology=topology):
+            pdb = atomset.PDB()
+            pdb.initialise(snapshot, heavyAtoms=heavyAtoms, resname=resname, resnum=resnum, chain=chain, topology=topology)
+            yield pdb
+
+
 def getTrajNum(trajFilename):
     """
         Gets the trajectory number
@@ -458,9 +727,213 @@ def getRMSD(traj, nativePDB, resname, reschain, resnum, symmetries, topology=Non
     return rmsds
 
 
+class CheckpointStore(object):
+    """
+        Append-only store of the structures of a clustering object, so that
+        each checkpoint of the object only writes the structures that were not
+        written by the previous ones. Each checkpoint writes a segment in the
+        folder of the pickled object with the pdb contents one after the other
+        (structures.bin), the coordinates and frames of the structures
+        concatenated by rows (coordinates.npy and frames.npy) and a table with
+        the kind, (epoch, trajectory, snapshot), offset and size of each
+        element (index.npy). The pickled object refers to the elements by
+        their segment (relative to the object), offset and size, and the
+        arrays are memory-mapped when loaded. A stored element is only reused
+        by a later checkpoint if the structure still holds the same object
+        that was written or loaded, so a different structure found at the
+        same position (e.g. after a restart) is written again. The elements
+        whose segment no longer exists are also written again, but a
+        checkpoint can only be read while the segments it refers to exist, so
+        the clustering folders of the previous epochs must be kept (use
+        readClusteringObject to read the checkpoints)
+    """
+    contentsFile = "structures.bin"
+    arrayFiles = {"coords": "coordinates.npy", "frame": "frames.npy"}
+    indexFile = "index.npy"
+    indexDtype = [("kind", "S6"), ("epoch", np.int64), ("trajectory", np.int64),
+                  ("snapshot", np.int64), ("offset", np.int64), ("size", np.int64)]
+
+    def __init__(self):
+        # {(kind, (epoch, trajectory, snapshot)): (segment, offset, size)}
+        self.index = {}
+        # {(kind, (epoch, trajectory, snapshot)): element written or loaded}
+        self.elements = {}
+        self.segments = {}
+
+    def __getstate__(self):
+        # the stored elements are found again when loading the object
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def write(self, filename, objectToWrite, structures, protocol=2):
+        """
+            Write a checkpoint of an object, storing the contents and
+            coordinates of the structures not stored by previous checkpoints
+            in a new segment
+
+            :param filename: Path of the pickled object
+            :type filename: str
+            :param objectToWrite: Object to write
+            :type objectToWrite: object
+            :param structures: Pairs of (epoch, trajectory, snapshot) and the
+                PDB found at that position, whose elements are stored
+            :type structures: list
+            :param protocol: Pickle protocol
+            :type protocol: int
+        """
+        folder = os.path.dirname(os.path.abspath(filename))
+        contents = []
+        arrays = {kind: [] for kind in self.arrayFiles}
+        sizes = {u"pdb": 0, u"coords": 0, u"frame": 0}
+        newElements = []
+        references = {}
+        # only the elements of the current structures are kept, so that the
+        # store does not hold the elements of removed clusters
+        index = {}
+        elements = {}
+        existingSegments = {}
+        for key, PDB in structures:
+            key = tuple(int(position) for position in key)
+            state = PDB.__getstate__()
+            for kind in (u"pdb", u"coords", u"frame"):
+                value = state[kind]
+                if value is None or not len(value):
+                    continue
+                if id(value) in references:
+                    continue
+                location = index.get((kind, key))
+                if location is None or not isSameElement(elements[(kind, key)], value):
+                    location = self.index.get((kind, key))
+                    # the segment of the folder, if any, is going to be
+                    # overwritten
+                    if location is None or location[0] == folder or not isSameElement(self.elements[(kind, key)], value) or not self.segmentExists(location[0], kind, existingSegments):
+                        if kind == u"pdb":
+                            contents.append(value.encode("utf-8") if isinstance(value, six.text_type) else value)
+                            size = len(contents[-1])
+                        else:
+                            arrays[kind].append(value)
+                            size = len(value)
+                        location = (folder, sizes[kind], size)
+                        sizes[kind] += size
+                        newElements.append((kind.encode("ascii"),) + key + location[1:])
+                    if (kind, key) not in index:
+                        index[(kind, key)] = location
+                        elements[(kind, key)] = value
+                references[id(value)] = (kind, key, location)
+        self.index = index
+        self.elements = elements
+        if contents:
+            with open(os.path.join(folder, self.contentsFile), "wb") as f:
+                for PDBContents in contents:
+                    f.write(PDBContents)
+        for kind, arrayFile in self.arrayFiles.items():
+            if arrays[kind]:
+                np.save(os.path.join(folder, arrayFile), np.concatenate(arrays[kind]))
+        if newElements:
+            np.save(os.path.join(folder, self.indexFile), np.array(newElements, dtype=self.indexDtype))
+
+        def persistentId(obj):
+            reference = references.get(id(obj))
+            if reference is None:
+                return None
+            kind, key, (segment, offset, size) = reference
+            return (kind, key, os.path.relpath(segment, folder), offset, size)
+        with open(filename, "wb") as f:
+            pickler = pickle.Pickler(f, protocol)
+            pickler.persistent_id = persistentId
+            pickler.dump(objectToWrite)
+
+    def segmentExists(self, segment, kind, existingSegments):
+        """
+            Check whether the file of a segment that holds the elements of a
+            kind exists, e.g. it may have been removed with the clustering
+            folder of a previous epoch
+
+            :param segment: Folder of the segment
+            :type segment: str
+            :param kind: Kind of the elements (pdb, coords or frame)
+            :type kind: str
+            :param existingSegments: Files already checked, and whether they exist
+            :type existingSegments: dict
+            :returns: bool -- Whether the file of the segment exists
+        """
+        path = os.path.join(segment, self.contentsFile if kind == u"pdb" else self.arrayFiles[kind])
+        if path not in existingSegments:
+            existingSegments[path] = os.path.exists(path)
+        return existingSegments[path]
+
+    def loadElement(self, folder, reference):
+        """
+            Load an element referred by a pickled object
+
+            :param folder: Folder of the pickled object
+            :type folder: str
+            :param reference: Kind, (epoch, trajectory, snapshot), segment,
+                offset and size of the element
+            :type reference: tuple
+            :returns: str or numpy.Array -- The pdb contents or coordinates
+        """
+        kind, key, segment, offset, size = reference
+        segment = os.path.normpath(os.path.join(folder, segment))
+        if not self.segmentExists(segment, kind, {}):
+            raise IOError("The checkpoint in %s refers to structures stored in %s, which does not exist. The checkpoints need the clustering folders of the previous epochs" % (folder, segment))
+        if kind == u"pdb":
+            element = self.getSegmentFile(segment, self.contentsFile, np.uint8)[offset:offset+size].tobytes().decode("utf-8")
+        else:
+            element = self.getSegmentFile(segment, self.arrayFiles[kind])[offset:offset+size]
+        self.index[(kind, tuple(key))] = (segment, offset, size)
+        self.elements[(kind, tuple(key))] = element
+        return element
+
+    def getSegmentFile(self, segment, fileName, dtype=None):
+        """
+            Get a memory-mapped file of a segment, the stored arrays are
+            mapped copy-on-write since the structures need writable arrays
+
+            :param segment: Folder of the segment
+            :type segment: str
+            :param fileName: Name of the file
+            :type fileName: str
+            :param dtype: Type of the elements of the file (None for npy files)
+            :type dtype: type
+            :returns: numpy.Array -- Memory-mapped file
+        """
+        path = os.path.join(segment, fileName)
+        if path not in self.segments:
+            if dtype is None:
+                self.segments[path] = np.load(path, mmap_mode="c")
+            else:
+                self.segments[path] = np.memmap(path, dtype=dtype, mode="r")
+        return self.segments[path]
+
+
+def isSameElement(element, value):
+    """
+        Check whether a value of a structure is an element of a
+        :py:class:`.CheckpointStore`, either the same object or an array over
+        the same memory (loaded coordinates are converted to contiguous
+        arrays, which gives a new array object over the same buffer)
+
+        :param element: Element written or loaded by the store
+        :type element: str or numpy.Array
+        :param value: Value of the structure
+        :type value: str or numpy.Array
+        :returns: bool -- Whether the value is the stored element
+    """
+    if element is value:
+        return True
+    if not isinstance(element, np.ndarray) or not isinstance(value, np.ndarray):
+        return False
+    return (element.__array_interface__["data"][0] == value.__array_interface__["data"][0] and
+            element.shape == value.shape and element.dtype == value.dtype)
+
+
 def readClusteringObject(clusteringObjectPath):
     """
-        Reads and returns a clustering object
+        Reads and returns a clustering object, either a whole pickled object
+        or a checkpoint of a :py:class:`.CheckpointStore`
 
         :param clusteringObjectPath: Clustering object path
         :type clusteringObjectPath: str
@@ -469,16 +942,24 @@ def readClusteringObject(clusteringObjectPath):
 
         :returns: :py:class:`.Clustering` -- clusteringObject
     """
+    store = CheckpointStore()
+    folder = os.path.dirname(os.path.abspath(clusteringObjectPath))
     with open(clusteringObjectPath, 'rb') as f:
+        if six.PY2:
+            unpickler = pickle.Unpickler(f)
+        elif six.PY3:
+            # make python3 able to read python2-written pickles
+            unpickler = pickle.Unpickler(f, encoding="latin")
+        unpickler.persistent_load = lambda reference: store.loadElement(folder, reference)
         try:
-            if six.PY2:
-                return pickle.load(f)
-            elif six.PY3:
-                # make python3 able to read python2-written pickles
-                return pickle.load(f, encoding="latin")
+            clusteringObject = unpickler.load()
         except EOFError:
             t, v, tb = sys.exc_info()
             raise_(t, v, tb)
+    if isinstance(getattr(clusteringObject, "checkpointStore", None), CheckpointStore):
+        # keep track of the stored structures for the next checkpoints
+        clusteringObject.checkpointStore = store
+    return clusteringObject
 
 
 def ensure_connectivity_msm(msm):
@@ -649,14 +1130,13 @@ def getMetricsFromReportsInEpoch(reportName, outputFolder, nTrajs):
     """
     metrics = []
     for i in range(1, nTrajs):
-        report = np.loadtxt(os.path.join(outputFolder, reportName % i))
-        if len(report.shape) < 2:
-            metrics.append(report.tolist()+[i, 0])
-        else:
-            traj_line = np.array([i] * report.shape[0])
-            snapshot_line = np.array(range(report.shape[0]))
-            metrics.extend(np.hstack((report, traj_line[:, np.newaxis], snapshot_line[:, np.newaxis])))
-    return np.array(metrics)
+        report = readReportFile(os.path.join(outputFolder, reportName % i))
+        traj_line = np.full(report.shape[0], i)
+        snapshot_line = np.arange(report.shape[0])
+        metrics.append(np.hstack((report, traj_line[:, np.newaxis], snapshot_line[:, np.newaxis])))
+    if not metrics:
+        return np.array(metrics)
+    return np.vstack(metrics)
 
 
 def getSASAcolumnFromControlFile(JSONdict):
@@ -703,6 +1183,64 @@ def write_mdtraj_object_PDB(conformation, output, topology):
     PDB.writePDB(output)
 
 
+def linkFile(source, destination):
+    """
+        Hard link a file to a new name, copying it if the filesystem does not
+        support hard links. An existing destination is removed first, so that
+        rewriting it does not modify the files linked to it
+
+        :param source: Name of the file to link
+        :type source: str
+        :param destination: New name of the file
+        :type destination: str
+    """
+    if os.path.exists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except (OSError, AttributeError):
+        shutil.copyfile(source, destination)
+
+
+def writeStructureCopies(structure, paths):
+    """
+        Write a structure to a list of files, serialising it only once
+
+        :param structure: Structure to write
+        :type structure: :py:class:`.PDB`
+        :param paths: Names of the files to write
+        :type paths: list
+    """
+    if os.path.exists(paths[0]):
+        os.remove(paths[0])
+    structure.writePDB(paths[0])
+    for path in paths[1:]:
+        linkFile(paths[0], path)
+
+
+def writeStructures(structures, nThreads=8):
+    """
+        Write a set of structures to files using a pool of threads, each
+        structure is serialised once and linked to the rest of its files
+
+        :param structures: Pairs of structure and list of files where to write it
+        :type structures: list
+        :param nThreads: Maximum number of threads used to write
+        :type nThreads: int
+    """
+    nThreads = min(nThreads, len(structures))
+    if nThreads < 2 or not PARALELLIZATION:
+        for structure, paths in structures:
+            writeStructureCopies(structure, paths)
+        return
+    pool = ThreadPool(nThreads)
+    try:
+        pool.map(lambda pair: writeStructureCopies(*pair), structures)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def get_mdtraj_object_PDBstring(conformation, topology):
     """
         Get the pdb string of a snapshot from a xtc trajectory to pdb
@@ -867,6 +1405,319 @@ def loadtxtfile(filename, usecols=None, postprocess=True, dtype=float):
     return metrics
 
 
+# extensions of the files of extracted coordinates, as text or in binary
+# form, see loadExtractedCoordinates
+EXTRACTED_COORDINATES_EXTENSIONS = (".dat", ".npy", ".npz")
+
+
+def loadExtractedCoordinates(filename, expandRepeats=True):
+    """
+        Load the coordinates extracted from a trajectory, with the number of
+        snapshot in the first column. Text files (.dat) are parsed, binary
+        files of a trajectory (.npy) are memory-mapped and binary files of a
+        trajectory with the rejected steps repeated (.npz) store only the
+        accepted snapshots and the index of the snapshot of each step
+
+        :param filename: Name of the file to load
+        :type filename: str
+        :param expandRepeats: Whether to repeat the snapshots of the rejected
+            steps (only for .npz files)
+        :type expandRepeats: bool
+
+        :returns: np.ndarray -- Extracted coordinates
+    """
+    extension = getFileExtension(filename)
+    if extension == ".npy":
+        return np.load(filename, mmap_mode="r")
+    elif extension == ".npz":
+        with np.load(filename) as data:
+            coordinates = data["coordinates"]
+            repeats = data["repeats"]
+        if not expandRepeats:
+            return coordinates
+        fullCoordinates = coordinates[repeats]
+        fullCoordinates[:, 0] = np.arange(repeats.size)
+        return fullCoordinates
+    else:
+        return loadtxtfile(filename)
+
+
+def writeExtractedCoordinates(coordinates, filename, repeats=None):
+    """
+        Write the coordinates extracted from a trajectory, with the number of
+        snapshot in the first column, in the format given by the extension of
+        filename (see loadExtractedCoordinates)
+
+        :param coordinates: Coordinates of each snapshot
+        :type coordinates: np.ndarray
+        :param filename: Name of the file to write
+        :type filename: str
+        :param repeats: Index of the snapshot of each step, only for .npz files
+        :type repeats: np.ndarray
+    """
+    coordinates = np.asarray(coordinates, dtype=float)
+    if coordinates.ndim == 1:
+        coordinates = coordinates.reshape(-1, 1)
+    table = np.hstack((np.arange(coordinates.shape[0]).reshape(-1, 1), coordinates))
+    extension = getFileExtension(filename)
+    if extension == ".npy":
+        np.save(filename, table)
+    elif extension == ".npz":
+        if repeats is None:
+            repeats = np.arange(coordinates.shape[0])
+        np.savez(filename, coordinates=table, repeats=np.asarray(repeats, dtype=int))
+    else:
+        with open(filename, "w") as f:
+            for row in table:
+                f.write("%d %s\n" % (row[0], " ".join([str(value) for value in row[1:]])))
+
+
+def filterRepeatedSteps(metrics, column=2):
+    """
+        Filter the rows of a report repeated by rejected steps, keeping the
+        first row of each accepted step
+
+        :param metrics: Contents of the report file
+        :type metrics: np.ndarray
+        :param column: Column with the accepted steps
+        :type column: int
+        :returns: np.ndarray -- Contents of the report file filtered, the
+            same array if no row is repeated
+    """
+    if metrics.ndim < 2 or metrics.shape[1] <= column:
+        return metrics
+    _, firstRows = np.unique(metrics[:, column], return_index=True)
+    if len(firstRows) == len(metrics):
+        return metrics
+    return metrics[np.sort(firstRows)]
+
+
+class ReportIndex(object):
+    """
+        Index of the report files shared by clustering, spawning, exit
+        conditions and analysis, so that each report is parsed only once.
+        The parsed contents are kept in memory and stored in a binary cache
+        next to the report (a npy file per report in the .reportCache folder,
+        with a manifest of the modification time and size of the parsed
+        reports), and they are only parsed again if the report changes. The
+        cached arrays are read-only and shared by every reader. Only the
+        most recently used reports are kept in memory, the rest are read
+        again from the binary cache when needed
+
+        :param maxReports: Maximum number of reports kept in memory
+        :type maxReports: int
+    """
+    cacheFolder = ".reportCache"
+    manifestFile = "manifest.json"
+    lockFile = "manifest.lock"
+    maxManifests = 64
+
+    def __init__(self, maxReports=2048):
+        self.maxReports = maxReports
+        # {path: ((mtime, size), contents, filteredContents, columns, integerColumns)},
+        # in order of use
+        self.reports = collections.OrderedDict()
+        # {cache folder: manifest}, in order of use
+        self.manifests = collections.OrderedDict()
+
+    def getReport(self, reportFilename):
+        """
+            Get the parsed contents of a report file
+
+            :param reportFilename: Path of the report file
+            :type reportFilename: str
+            :returns: tuple -- Contents, contents with the repeated steps
+                filtered, names of the columns and whether each column holds
+                integers
+        """
+        path = os.path.abspath(reportFilename)
+        fileStat = os.stat(path)
+        version = (fileStat.st_mtime, fileStat.st_size)
+        report = self.reports.pop(path, None)
+        if report is None or report[0] != version:
+            with profiler.PROFILER.phase("reportParsing"):
+                report = self.loadCachedReport(path, version)
+                if report is None:
+                    report = self.parseReport(path, version)
+        self.reports[path] = report
+        while len(self.reports) > self.maxReports:
+            self.reports.popitem(last=False)
+        return report[1:]
+
+    def parseReport(self, path, version):
+        with open(path) as f:
+            header = f.readline()
+            firstLine = f.readline().split()
+        columns = [column.strip() for column in header.split("    ") if column.strip()]
+        integerColumns = [re.match(r"^-?\d+$", value) is not None for value in firstLine]
+        contents = loadtxtfile(path)
+        if not contents.size:
+            # report without any step
+            contents = np.zeros((0, len(columns)))
+        self.storeCachedReport(path, version, contents, columns, integerColumns)
+        return self.buildReport(version, contents, columns, integerColumns)
+
+    def buildReport(self, version, contents, columns, integerColumns):
+        contents.flags.writeable = False
+        filteredContents = filterRepeatedSteps(contents)
+        filteredContents.flags.writeable = False
+        return version, contents, filteredContents, columns, integerColumns
+
+    def readManifest(self, folder):
+        try:
+            with open(os.path.join(folder, self.manifestFile)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def getManifest(self, folder, name):
+        manifest = self.manifests.pop(folder, None)
+        if manifest is None or name not in manifest:
+            # the report might have been cached by another process
+            manifest = self.readManifest(folder)
+        self.manifests[folder] = manifest
+        while len(self.manifests) > self.maxManifests:
+            self.manifests.popitem(last=False)
+        return manifest
+
+    def loadCachedReport(self, path, version):
+        folder = os.path.join(os.path.dirname(path), self.cacheFolder)
+        name = os.path.basename(path)
+        entry = self.getManifest(folder, name).get(name)
+        if entry is None or (entry["mtime"], entry["size"]) != version:
+            return None
+        try:
+            contents = np.load(os.path.join(folder, name + ".npy"))
+        except (IOError, OSError, ValueError):
+            return None
+        return self.buildReport(version, contents, entry["columns"], entry["integerColumns"])
+
+    def storeCachedReport(self, path, version, contents, columns, integerColumns):
+        folder = os.path.join(os.path.dirname(path), self.cacheFolder)
+        name = os.path.basename(path)
+        try:
+            makeFolder(folder)
+            # write to temporary files and move them into place, so that
+            # readers never see partially written files
+            replaceFile(os.path.join(folder, name + ".npy"), lambda f: np.save(f, contents), binary=True)
+            # several replicas may update the manifest of the same folder,
+            # the read-modify-write is done holding its lock
+            with lockedFile(os.path.join(folder, self.lockFile)):
+                manifest = self.readManifest(folder)
+                manifest[name] = {"mtime": version[0], "size": version[1], "columns": columns, "integerColumns": integerColumns}
+                replaceFile(os.path.join(folder, self.manifestFile), lambda f: json.dump(manifest, f))
+        except (IOError, OSError):
+            # the folder may be read-only, the report is only cached in memory
+            return
+        self.manifests.pop(folder, None)
+        self.manifests[folder] = manifest
+
+
+# os.replace is not available in python 2, where os.rename also replaces
+# the destination atomically on POSIX systems
+_replace = getattr(os, "replace", os.rename)
+
+
+def replaceFile(filename, write, binary=False):
+    """
+        Write a file atomically, writing it to a temporary file in the same
+        folder that then replaces the file
+
+        :param filename: Path of the file
+        :type filename: str
+        :param write: Function that writes the contents to a file object
+        :type write: function
+        :param binary: Whether to open the file in binary mode
+        :type binary: bool
+    """
+    fd, tmpFilename = tempfile.mkstemp(dir=os.path.dirname(filename), prefix=os.path.basename(filename), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb" if binary else "w") as f:
+            write(f)
+        _replace(tmpFilename, filename)
+    except BaseException:
+        try:
+            os.remove(tmpFilename)
+        except OSError:
+            pass
+        raise
+
+
+@contextmanager
+def lockedFile(filename):
+    """
+        Hold an exclusive lock on a file (created if it does not exist). If
+        the filesystem does not support locks the block is run without it
+
+        :param filename: Path of the lock file
+        :type filename: str
+    """
+    with open(filename, "a") as f:
+        try:
+            fcntl.lockf(f, fcntl.LOCK_EX)
+            locked = True
+        except (IOError, OSError) as exc:
+            if exc.errno != errno.ENOLCK:
+                raise
+            locked = False
+        try:
+            yield
+        finally:
+            if locked:
+                fcntl.lockf(f, fcntl.LOCK_UN)
+
+
+reportIndex = ReportIndex()
+
+
+def readReportFile(reportFilename, filterRepeated=False):
+    """
+        Read the contents of a report file through the report index, the
+        report is only parsed the first time it is read (see
+        :py:class:`.ReportIndex`)
+
+        :param reportFilename: Path of the report file
+        :type reportFilename: str
+        :param filterRepeated: Whether to filter the rows repeated by rejected steps
+        :type filterRepeated: bool
+        :returns: np.ndarray -- Read-only contents of the report file
+    """
+    contents, filteredContents, _, _ = reportIndex.getReport(reportFilename)
+    if filterRepeated:
+        return filteredContents
+    return contents
+
+
+def getReportColumns(reportFilename):
+    """
+        Get the names of the columns of a report file
+
+        :param reportFilename: Path of the report file
+        :type reportFilename: str
+        :returns: list -- Names of the columns, as written in the header
+    """
+    return reportIndex.getReport(reportFilename)[2]
+
+
+def readReportDataFrame(reportFilename):
+    """
+        Read a report file as a pandas DataFrame through the report index,
+        with the columns named after the header of the report
+
+        :param reportFilename: Path of the report file
+        :type reportFilename: str
+        :returns: pandas.DataFrame -- Contents of the report file
+    """
+    if not PANDAS:
+        raise UnsatisfiedDependencyException("No installation of pandas found. Please, install pandas to read the reports as DataFrames")
+    contents, _, columns, integerColumns = reportIndex.getReport(reportFilename)
+    data = pd.DataFrame(contents, columns=columns[:contents.shape[1]], copy=False)
+    for column, isInteger in zip(data.columns, integerColumns):
+        if isInteger:
+            data[column] = data[column].astype(int)
+    return data
+
+
 def writeNewConstraints(folder, filename, constraints):
     """
         Write the constraints to disk
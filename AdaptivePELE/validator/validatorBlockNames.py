@@ -25,6 +25,8 @@ class GeneralParams:
         "debug": "bool",
         "writeAllClusteringStructures": "bool",
         "nativeStructure": "basestring",
+        "pipelinedClustering": "bool",
+        "profiling": "bool",
     }
 
 
@@ -201,6 +203,8 @@ class SimulationParams:
         "customparamspath": "basestring",
         "numReplicas": "numbers.Real",
         "maxDevicesPerReplica": "numbers.Real",
+        "synchronizationBackend": "basestring",
+        "asynchronousSpawning": "bool",
         "format": "basestring",
         "constraints": "list",
         "boxType": "basestring",
@@ -252,6 +256,7 @@ class clusteringTypes:
         "similarityEvaluator": "basestring",
         "symmetries": "list",
         "alternativeStructure": "bool",
+        "parallelPreprocessing": "bool",
         "nclusters": "numbers.Real",
         "tica": "bool",
         "atom_Ids": "list",
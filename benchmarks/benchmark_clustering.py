@@ -0,0 +1,129 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import time
+import argparse
+import AdaptivePELE
+from AdaptivePELE.clustering import clustering
+from AdaptivePELE.utilities import profiler
+
+DATA_FOLDER = os.path.join(os.path.dirname(AdaptivePELE.__file__), "tests", "data")
+
+# clustering parameters, report name and trajectories of each benchmark case
+CASES = {"rmsd_aspirin": ({"type": "rmsd",
+                           "params": {"ligandResname": "AIN", "contactThresholdDistance": 8}},
+                          "ain_report", ["aspirin_data/traj*"]),
+         "rmsd_protein_protein": ({"type": "rmsd",
+                                   "params": {"ligandChain": "B", "contactThresholdDistance": 8},
+                                   "thresholdCalculator": {"type": "constant", "params": {"value": 4.0}}},
+                                  "report", ["protein_protein_data/traj*"]),
+         "contactMap_aspirin": ({"type": "contactMap",
+                                 "params": {"ligandResname": "AIN", "contactThresholdDistance": 8, "similarityEvaluator": "Jaccard"},
+                                 "thresholdCalculator": {"type": "constant", "params": {"value": 0.15}}},
+                                "ain_report", ["aspirin_data/traj*"])}
+
+
+def parseArguments():
+    desc = "Compare the wall time of the serial and parallel clustering on the test trajectories"
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument("-n", "--nProcessors", type=int, default=4, help="Number of processors to use in the parallel clustering")
+    parser.add_argument("-r", "--repeats", type=int, default=3, help="Number of times each clustering is repeated")
+    parser.add_argument("--cases", nargs="*", default=sorted(CASES), choices=sorted(CASES), help="Benchmark cases to run")
+    args = parser.parse_args()
+    return args.nProcessors, args.repeats, args.cases
+
+
+def runClustering(case, nProcessors):
+    """
+        Cluster the trajectories of a benchmark case
+
+        :param case: Name of the benchmark case
+        :type case: str
+        :param nProcessors: Number of processors to use (None for the serial version)
+        :type nProcessors: int
+        :returns: :py:class:`.Clustering` -- The clustering object
+    """
+    params, report, trajectories = CASES[case]
+    params = dict(params, params=dict(params["params"], parallelPreprocessing=nProcessors is not None))
+    clusteringObject = clustering.ClusteringBuilder().buildClustering(params, report, 3)
+    clusteringObject.setProcessors(nProcessors)
+    clusteringObject.cluster([os.path.join(DATA_FOLDER, traj) for traj in trajectories])
+    return clusteringObject
+
+
+def timeClustering(case, nProcessors, repeats):
+    """
+        Get the best wall time of several clusterings of a benchmark case
+
+        :param case: Name of the benchmark case
+        :type case: str
+        :param nProcessors: Number of processors to use (None for the serial version)
+        :type nProcessors: int
+        :param repeats: Number of repetitions
+        :type repeats: int
+        :returns: float, :py:class:`.Clustering` -- The best wall time and the last clustering object
+    """
+    times = []
+    for _ in range(repeats):
+        initTime = time.time()
+        clusteringObject = runClustering(case, nProcessors)
+        times.append(time.time()-initTime)
+    return min(times), clusteringObject
+
+
+def profileClustering(case):
+    """
+        Profile the serial clustering of a benchmark case
+
+        :param case: Name of the benchmark case
+        :type case: str
+        :returns: dict -- Resources used in each phase of the clustering
+    """
+    profiler.PROFILER.enable()
+    try:
+        profiler.PROFILER.startEpoch(0)
+        runClustering(case, None)
+        return profiler.PROFILER.getProfile()["phases"]
+    finally:
+        profiler.PROFILER.enable(False)
+
+
+class ClusteringSuite(object):
+    """
+        Wall time of the clustering of the test trajectories, serial (None) and
+        with several processors
+    """
+    params = ([None, 2, 4], sorted(CASES))
+    param_names = ["nProcessors", "case"]
+
+    def time_cluster(self, nProcessors, case):
+        runClustering(case, nProcessors)
+
+
+class ClusteringPhasesSuite(object):
+    """
+        Wall time spent parsing the snapshots and comparing them with the
+        clusters in the serial clustering of the test trajectories
+    """
+    params = sorted(CASES)
+    param_names = ["case"]
+    unit = "seconds"
+
+    def track_parse(self, case):
+        return profileClustering(case)["clustering.parse"]["wall"]
+
+    def track_compare(self, case):
+        return profileClustering(case)["clustering.compare"]["wall"]
+
+
+def main(nProcessors, repeats, cases):
+    print("%-22s %10s %10s %8s %s" % ("case", "serial(s)", "parallel(s)", "speedup", "same clusters"))
+    for case in cases:
+        serialTime, serialClustering = timeClustering(case, None, repeats)
+        parallelTime, parallelClustering = timeClustering(case, nProcessors, repeats)
+        same = [cl.elements for cl in serialClustering] == [cl.elements for cl in parallelClustering]
+        print("%-22s %10.3f %10.3f %8.2f %s" % (case, serialTime, parallelTime, serialTime/parallelTime, same))
+
+
+if __name__ == "__main__":
+    n_processors, n_repeats, benchmark_cases = parseArguments()
+    main(n_processors, n_repeats, benchmark_cases)
@@ -0,0 +1,164 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import time
+import argparse
+import numpy as np
+import AdaptivePELE
+from AdaptivePELE.atomset import atomset
+from AdaptivePELE.clustering import kmeans
+from AdaptivePELE.spawning import spawning, markovModel
+from AdaptivePELE.freeEnergies import computeDeltaG
+from AdaptivePELE.utilities import utilities
+
+DATA_FOLDER = os.path.join(os.path.dirname(AdaptivePELE.__file__), "tests", "data")
+
+# the test trajectories are only a few snapshots long, so the ligand
+# trajectories are generated from the position of the ligand in the native
+# structure, diffusing in a harmonic well around it
+NATIVE = ("ain_native_fixed.pdb", "AIN")
+STEP_SIZE = 0.5
+WELL_CONSTANT = 0.01
+LAGTIME = 1
+# (number of trajectories, snapshots per trajectory, number of clusters) of
+# each benchmark case
+CASES = {"small": (16, 500, 100),
+         "medium": (64, 1000, 500),
+         "large": (128, 2000, 1000)}
+MSM_CALCULATORS = ["ProbabilityMSM", "MetastabilityMSM", "UncertaintyMSM", "IndependentMSM"]
+
+
+def parseArguments():
+    desc = "Time the MSM-based spawning calculators and the free energy estimation on ligand trajectories"
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument("-r", "--repeats", type=int, default=3, help="Number of times each calculation is repeated")
+    parser.add_argument("--cases", nargs="*", default=sorted(CASES), choices=sorted(CASES), help="Benchmark cases to run")
+    args = parser.parse_args()
+    return args.repeats, args.cases
+
+
+class ClusteredTrajectories(object):
+    """
+        Ligand trajectories, their cluster centers and discretized
+        trajectories, as the clustering used in the MSM-based spawning
+
+        :param case: Name of the benchmark case
+        :type case: str
+        :param seed: Seed of the random number generator
+        :type seed: int
+    """
+    def __init__(self, case, seed=0):
+        ntrajs, length, nclusters = CASES[case]
+        randomState = np.random.RandomState(seed)
+        native = atomset.PDB()
+        native.initialise(os.path.join(DATA_FOLDER, NATIVE[0]), resname=NATIVE[1])
+        center = np.array(native.getCOM())
+        coordinates = np.empty((ntrajs, length, 3))
+        coordinates[:, 0] = center
+        for i in range(1, length):
+            displacement = randomState.normal(scale=STEP_SIZE, size=(ntrajs, 3))
+            coordinates[:, i] = coordinates[:, i-1]+displacement-WELL_CONSTANT*(coordinates[:, i-1]-center)
+        self.trajectories = list(coordinates)
+        allCoordinates = coordinates.reshape(-1, 3)
+        centers = kmeans.kmeansPlusPlus(allCoordinates[::max(1, allCoordinates.shape[0]//(10*nclusters))], nclusters, randomState)
+        self.clusterCenters, _ = kmeans.lloydIterations(lambda: iter(self.trajectories), centers, 10, 1e-3)
+        self.dtrajs = [kmeans.assignCenters(traj, self.clusterCenters)[0] for traj in self.trajectories]
+
+
+def buildMSMCalculator(calculator):
+    """
+        Build a MSM-based spawning calculator
+
+        :param calculator: Name of the spawning type
+        :type calculator: str
+        :returns: :py:class:`.MSMCalculator` -- Spawning calculator
+    """
+    with utilities.suppress_stdout():
+        return spawning.SpawningAlgorithmBuilder().build({"type": calculator, "params": {"lagtime": LAGTIME}})
+
+
+def estimateDeltaG(data):
+    """
+        Estimate the binding free energy as in :py:func:`.computeDeltaG.main`
+
+        :param data: Clustered ligand trajectories
+        :type data: :py:class:`.ClusteredTrajectories`
+        :returns: str -- dG line of the pmf
+    """
+    d = 0.75
+    model = markovModel.MarkovModel(LAGTIME)
+    model.estimate(data.dtrajs)
+    with utilities.suppress_stdout():
+        pi, clusters = computeDeltaG.ensure_connectivity(model, data.clusterCenters)
+        bins = computeDeltaG.create_box(clusters, data.trajectories, d)
+        microstateVolume = computeDeltaG.calculate_microstate_volumes_new(clusters, data.trajectories, bins, d)
+        _, string = computeDeltaG.calculate_pmf(microstateVolume, pi)
+    return string
+
+
+def timeFunction(function, repeats):
+    """
+        Get the best wall time of several calls of a function
+
+        :param function: Function to time
+        :type function: callable
+        :param repeats: Number of repetitions
+        :type repeats: int
+        :returns: float -- The best wall time
+    """
+    times = []
+    for _ in range(repeats):
+        initTime = time.time()
+        function()
+        times.append(time.time()-initTime)
+    return min(times)
+
+
+class MSMSpawningSuite(object):
+    """
+        Wall time of the MSM-based spawning calculators, estimating the MSM
+        from scratch
+    """
+    params = (sorted(CASES), MSM_CALCULATORS)
+    param_names = ["case", "calculator"]
+
+    def setup(self, case, calculator):
+        self.data = ClusteredTrajectories(case)
+        self.spawningCalculator = buildMSMCalculator(calculator)
+
+    def time_calculate(self, case, calculator):
+        self.spawningCalculator.MSM = None
+        self.spawningCalculator.calculate(self.data, 64)
+
+
+class DeltaGSuite(object):
+    """
+        Wall time of the estimation of the binding free energy from the MSM
+        and the volumes of the clusters
+    """
+    params = sorted(CASES)
+    param_names = ["case"]
+
+    def setup(self, case):
+        self.data = ClusteredTrajectories(case)
+
+    def time_estimateDeltaG(self, case):
+        estimateDeltaG(self.data)
+
+
+def main(repeats, cases):
+    print("%-8s %-18s %10s" % ("case", "calculation", "time(s)"))
+    for case in cases:
+        data = ClusteredTrajectories(case)
+        for calculator in MSM_CALCULATORS:
+            spawningCalculator = buildMSMCalculator(calculator)
+
+            def calculate():
+                spawningCalculator.MSM = None
+                spawningCalculator.calculate(data, 64)
+            print("%-8s %-18s %10.4f" % (case, calculator, timeFunction(calculate, repeats)))
+        print("%-8s %-18s %10.4f" % (case, "computeDeltaG", timeFunction(lambda: estimateDeltaG(data), repeats)))
+
+
+if __name__ == "__main__":
+    n_repeats, benchmark_cases = parseArguments()
+    main(n_repeats, benchmark_cases)
@@ -0,0 +1,156 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import time
+import shutil
+import tempfile
+import argparse
+import AdaptivePELE
+from AdaptivePELE.clustering import clustering
+from AdaptivePELE.spawning import spawning
+from AdaptivePELE.utilities import utilities
+
+DATA_FOLDER = os.path.join(os.path.dirname(AdaptivePELE.__file__), "tests", "data")
+
+# clustering of the test trajectories whose clusters are used in the spawning
+CLUSTERING = ({"type": "rmsd", "params": {"ligandResname": "AIN", "contactThresholdDistance": 8}},
+              "ain_report", ["aspirin_data/traj*"])
+# spawning block of each calculator that uses the clusters (the MSM-based
+# calculators are benchmarked in benchmark_freeEnergies), the simulated
+# annealing calculator can not be built from a control file so its
+# parameters are set directly
+REPORT_PARAMS = {"reportFilename": "ain_report", "metricColumnInReport": 5}
+CALCULATORS = {"sameWeight": {},
+               "independent": {},
+               "independentMetric": {},
+               "inverselyProportional": {},
+               "epsilon": {"epsilon": 0.5},
+               "FAST": {},
+               "variableEpsilon": {"epsilon": 0.5, "varEpsilonType": "linearVariation", "maxEpsilon": 0.75,
+                                   "variationWindow": 8, "maxEpsilonWindow": 2},
+               "simulatedAnnealing": {"T": 1000},
+               "UCB": {},
+               "REAP": {},
+               "null": {}}
+
+
+def parseArguments():
+    desc = "Time the spawning calculators with the clusters of the test trajectories"
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument("-c", "--copies", type=int, default=1000, help="Number of copies of the clusters of the test trajectories")
+    parser.add_argument("-t", "--trajectories", type=int, default=64, help="Number of trajectories to distribute")
+    parser.add_argument("-r", "--repeats", type=int, default=3, help="Number of times each spawning is repeated")
+    parser.add_argument("--calculators", nargs="*", default=sorted(CALCULATORS), choices=sorted(CALCULATORS), help="Spawning calculators to run")
+    args = parser.parse_args()
+    return args.copies, args.trajectories, args.repeats, args.calculators
+
+
+def getClusters(copies):
+    """
+        Cluster the test trajectories and replicate their clusters, so that
+        the spawning is computed over a realistic number of clusters
+
+        :param copies: Number of copies of the clusters
+        :type copies: int
+        :returns: list -- Clusters
+    """
+    params, report, trajectories = CLUSTERING
+    clusteringObject = clustering.ClusteringBuilder().buildClustering(params, report, 3)
+    with utilities.suppress_stdout():
+        clusteringObject.cluster([os.path.join(DATA_FOLDER, traj) for traj in trajectories])
+    # the calculators only read the clusters, so the copies can be shared
+    return clusteringObject.getClusterListForSpawning().clusters*copies
+
+
+def buildCalculator(calculator):
+    """
+        Build a spawning calculator
+
+        :param calculator: Name of the spawning type
+        :type calculator: str
+        :returns: :py:class:`.SpawningCalculator` -- Spawning calculator
+    """
+    params = dict(REPORT_PARAMS)
+    params.update(CALCULATORS[calculator])
+    if calculator == "simulatedAnnealing":
+        spawningParams = spawning.SpawningParams()
+        spawningParams.temperature = params["T"]
+        spawningParams.reportCol = params["metricColumnInReport"]-1
+        spawningParams.decrement = 10
+        return spawning.SimulatedAnnealingCalculator(spawningParams)
+    with utilities.suppress_stdout():
+        return spawning.SpawningAlgorithmBuilder().build({"type": calculator, "params": params})
+
+
+class TemporaryWorkingDirectory(object):
+    """
+        Run in a temporary directory, so that the files that the epsilon
+        calculators write in the working directory (epsilon_values.txt) are
+        removed afterwards
+    """
+    def __enter__(self):
+        self.cwd = os.getcwd()
+        self.folder = tempfile.mkdtemp(prefix="adaptive_benchmark_")
+        os.chdir(self.folder)
+        return self.folder
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.folder, ignore_errors=True)
+        return False
+
+
+def timeSpawning(calculator, clusters, trajectories, repeats):
+    """
+        Get the best wall time of several spawnings of a calculator
+
+        :param calculator: Name of the spawning type
+        :type calculator: str
+        :param clusters: Clusters
+        :type clusters: list
+        :param trajectories: Number of trajectories to distribute
+        :type trajectories: int
+        :param repeats: Number of repetitions
+        :type repeats: int
+        :returns: float -- The best wall time
+    """
+    times = []
+    for _ in range(repeats):
+        spawningCalculator = buildCalculator(calculator)
+        initTime = time.time()
+        spawningCalculator.calculate(clusters, trajectories, 0)
+        times.append(time.time()-initTime)
+    return min(times)
+
+
+class SpawningSuite(object):
+    """
+        Wall time of the spawning calculators with an increasing number of
+        copies of the clusters of the test trajectories
+    """
+    params = ([1, 100, 1000], sorted(CALCULATORS))
+    param_names = ["copies", "calculator"]
+
+    def setup(self, copies, calculator):
+        self.clusters = getClusters(copies)
+        self.spawningCalculator = buildCalculator(calculator)
+        self.workingDirectory = TemporaryWorkingDirectory()
+        self.workingDirectory.__enter__()
+
+    def teardown(self, copies, calculator):
+        self.workingDirectory.__exit__(None, None, None)
+
+    def time_calculate(self, copies, calculator):
+        self.spawningCalculator.calculate(self.clusters, 64, 0)
+
+
+def main(copies, trajectories, repeats, calculators):
+    clusters = getClusters(copies)
+    print("%-22s %10s" % ("calculator", "time(s)"))
+    with TemporaryWorkingDirectory():
+        for calculator in calculators:
+            print("%-22s %10.4f" % (calculator, timeSpawning(calculator, clusters, trajectories, repeats)))
+
+
+if __name__ == "__main__":
+    n_copies, n_trajectories, n_repeats, spawning_calculators = parseArguments()
+    main(n_copies, n_trajectories, n_repeats, spawning_calculators)